@@ -0,0 +1,429 @@
+"""
+Benchmark suite for MRSHw.
+
+Measures hashing throughput, comparison and clustering throughput, digest
+formatting and parsing, list serialization, keyed updates of a list,
+packet matching, lookups on a resident server and an end-to-end `mrsh scan` on synthetic corpora, writes the results as JSON and
+compares them against a stored baseline.
+
+Usage:
+    python bench.py                       # run everything, print JSON
+    python bench.py -o run.json           # save the results
+    python bench.py --save-baseline       # store them as baseline.json
+    python bench.py --baseline baseline.json --tolerance 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import mrsh
+
+import corpus
+
+
+Result = namedtuple('Result', ['name', 'value', 'unit', 'higher_is_better'])
+
+SCHEMA_VERSION = 1
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+MB = 1 << 20
+
+
+class Context:
+    """Parameters shared by the benchmarks of a run."""
+
+    def __init__(self, scale: float, repeat: int, seed: int, workdir: Path):
+        self.scale = scale
+        self.repeat = repeat
+        self.seed = seed
+        self.workdir = workdir
+
+    def n(self, count: int) -> int:
+        """count scaled by the run's scale factor, at least 2."""
+        return max(2, int(count * self.scale))
+
+    def best(self, func: Callable[[], object]) -> float:
+        """Fastest of repeat timed calls of func, in seconds."""
+        times = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+
+def bench_hash(ctx: Context) -> List[Result]:
+    """Hashing throughput of single buffers, of batches and of a stream fed in pieces."""
+    blobs = corpus.random_blobs(ctx.n(8), 4 * MB, ctx.seed)
+    buffers = [data for data, _ in blobs]
+    total = sum(len(data) for data in buffers) / MB
+
+    def stream():
+        hasher = mrsh.Hasher()
+        for data in buffers:
+            view = memoryview(data)
+            for start in range(0, len(view), 64 * 1024):
+                hasher.update(view[start:start + 64 * 1024])
+        hasher.finalize()
+
+    single = ctx.best(lambda: [mrsh.Fingerprint(sample) for sample in blobs])
+    batch = ctx.best(lambda: mrsh.FingerprintList().add_many(buffers))
+    return [
+        Result("hash.fingerprint", total / single, "MB/s", True),
+        Result("hash.add_many", total / batch, "MB/s", True),
+        Result("hash.stream", total / ctx.best(stream), "MB/s", True),
+    ]
+
+
+def bench_compare(ctx: Context) -> List[Result]:
+    """Pairwise comparison throughput, through the list kernels and per Fingerprint."""
+    samples = corpus.mutated_families(ctx.n(20), 10, 256 * 1024, seed=ctx.seed)
+    fpl = mrsh.FingerprintList(samples)
+    count = len(samples)
+    pairs = count * (count - 1) // 2
+
+    fps = [mrsh.Fingerprint(sample) for sample in samples[:50]]
+    single_pairs = len(fps) * len(fps)
+
+    def compare_each():
+        for fp1 in fps:
+            for fp2 in fps:
+                fp1.compare(fp2)
+
+    return [
+        Result("compare.all", pairs / ctx.best(lambda: fpl.compare_all()), "pairs/s", True),
+        Result("compare.all_threshold", pairs / ctx.best(lambda: fpl.compare_all(threshold=50)),
+               "pairs/s", True),
+        Result("compare.with", count * count / ctx.best(lambda: fpl.compare_with(fpl)), "pairs/s", True),
+        Result("compare.fingerprint", single_pairs / ctx.best(compare_each), "pairs/s", True),
+    ]
+
+
+def bench_cluster(ctx: Context) -> List[Result]:
+    """Clustering a list from scratch, and clustering a tenth more on top of it."""
+    samples = corpus.mutated_families(ctx.n(100), 10, 64 * 1024, seed=ctx.seed)
+    split = len(samples) * 9 // 10
+    base = mrsh.FingerprintList(samples[:split])
+    path = ctx.workdir / "cluster.mrsh"
+    base.save(path)
+    count = len(samples) - split
+
+    # only the clustering of the new fingerprints is timed, not their hashing
+    def incremental():
+        fpl = mrsh.FingerprintList.load(path, mmap=False)
+        clusterer = mrsh.FingerprintClusterer(fpl, 40)
+        fpl.add_many([data for data, _ in samples[split:]], [label for _, label in samples[split:]])
+        start = time.perf_counter()
+        clusterer.update()
+        return time.perf_counter() - start
+
+    build = ctx.best(lambda: mrsh.FingerprintClusterer(base, 40))
+    add = min(incremental() for _ in range(ctx.repeat))
+    return [
+        Result("cluster.build", split / build, "fingerprints/s", True),
+        Result("cluster.add", count / add, "fingerprints/s", True),
+    ]
+
+
+def bench_digest(ctx: Context) -> List[Result]:
+    """Formatting and parsing of hex digests."""
+    samples = corpus.mutated_families(ctx.n(20), 10, 256 * 1024, seed=ctx.seed)
+    fpl = mrsh.FingerprintList(samples)
+    fps = [mrsh.Fingerprint(sample) for sample in samples]
+    text = fpl.hexdigest()
+    digests = text.splitlines()
+    count = len(digests)
+
+    return [
+        Result("digest.format_list", count / ctx.best(fpl.hexdigest), "digests/s", True),
+        Result("digest.format", count / ctx.best(lambda: [fp.hexdigest() for fp in fps]), "digests/s", True),
+        Result("digest.parse_list", count / ctx.best(lambda: mrsh.FingerprintList.from_digests(digests)),
+               "digests/s", True),
+        Result("digest.parse", count / ctx.best(lambda: [mrsh.Fingerprint.from_digest(d) for d in digests]),
+               "digests/s", True),
+        Result("digest.compare", count / ctx.best(lambda: mrsh.diff_many(digests[0], digests)),
+               "digests/s", True),
+    ]
+
+
+def bench_store(ctx: Context) -> List[Result]:
+    """Saving and loading lists in the binary store format."""
+    samples = corpus.mutated_families(ctx.n(20), 10, 256 * 1024, seed=ctx.seed)
+    fpl = mrsh.FingerprintList(samples)
+    count = len(samples)
+    path = ctx.workdir / "store.mrsh"
+
+    save = ctx.best(lambda: fpl.save(path))
+    load = ctx.best(lambda: mrsh.FingerprintList.load(path, mmap=False))
+    return [
+        Result("store.save", count / save, "fingerprints/s", True),
+        Result("store.load", count / load, "fingerprints/s", True),
+    ]
+
+
+def bench_mutate(ctx: Context) -> List[Result]:
+    """Lookups, replacements and removals by label in a large list."""
+    samples = corpus.random_blobs(ctx.n(100000), 256, ctx.seed)
+    fpl = mrsh.FingerprintList()
+    fpl.add_many([data for data, _ in samples], labels=[label for _, label in samples], workers=0)
+    labels = [label for _, label in samples[::max(1, len(samples) // 1000)]]
+    updates = [mrsh.Fingerprint(sample) for sample in corpus.random_blobs(len(labels), 4096, ctx.seed + 1)]
+    fpl.find(labels[0])  # builds the label table
+
+    def find():
+        for label in labels:
+            fpl.find(label)
+
+    def replace():
+        for label, fp in zip(labels, updates):
+            fpl.replace(label, fp)
+
+    def reinsert():
+        for label, fp in zip(labels, updates):
+            del fpl[label]
+            fpl.insert(fp, label)
+
+    count = len(labels)
+    return [
+        Result("mutate.find", count / ctx.best(find), "lookups/s", True),
+        Result("mutate.replace", count / ctx.best(replace), "updates/s", True),
+        Result("mutate.reinsert", count / ctx.best(reinsert), "updates/s", True),
+    ]
+
+
+def bench_packet(ctx: Context) -> List[Result]:
+    """Streaming packet matching, with packets of several files interleaved as flows."""
+    files = corpus.random_blobs(ctx.n(20), 1 * MB, ctx.seed)
+    reference = mrsh.FingerprintList(files)
+
+    mtu = 1460
+    packets, flows = [], []
+    for offset in range(0, 256 * 1024, mtu):
+        for data, label in files[:8]:
+            packets.append(data[offset:offset + mtu])
+            flows.append(label)
+
+    def match(batch):
+        matcher = mrsh.PacketMatcher(reference)
+        for start in range(0, len(packets), batch):
+            matcher.match_many(packets[start:start + batch], flows[start:start + batch])
+
+    count = len(packets)
+    return [
+        Result("packet.match", count / ctx.best(lambda: match(1)), "packets/s", True),
+        Result("packet.match_many", count / ctx.best(lambda: match(1024)), "packets/s", True),
+    ]
+
+
+def bench_serve(ctx: Context) -> List[Result]:
+    """Digest lookups answered by a resident LookupServer over a Unix socket."""
+    reference = mrsh.FingerprintList(corpus.random_blobs(ctx.n(200), 256 * 1024, ctx.seed))
+    digests = [mrsh.Fingerprint(sample).hexdigest()
+               for sample in corpus.random_blobs(ctx.n(128), 64 * 1024, ctx.seed + 1)]
+
+    server = mrsh.LookupServer(reference, threshold=20)
+    path = str(ctx.workdir / "serve.sock")
+    loop = asyncio.new_event_loop()
+    listening = threading.Event()
+    task = loop.create_task(server.serve(path=path, ready=lambda address: listening.set()))
+    thread = threading.Thread(target=loop.run_until_complete, args=(task,), daemon=True)
+    thread.start()
+    listening.wait()
+
+    def lookup(client, batch):
+        for start in range(0, len(digests), batch):
+            client.query(digests=digests[start:start + batch])
+
+    try:
+        with mrsh.LookupClient(path=path) as client:
+            count = len(digests)
+            return [
+                Result("serve.lookup", count / ctx.best(lambda: lookup(client, 1)), "digests/s", True),
+                Result("serve.lookup_batch", count / ctx.best(lambda: lookup(client, 64)), "digests/s", True),
+            ]
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+
+
+def bench_scan(ctx: Context) -> List[Result]:
+    """End-to-end `mrsh scan` of a directory in a fresh interpreter."""
+    directory = ctx.workdir / "scan"
+    corpus.write_corpus(corpus.mutated_families(ctx.n(20), 10, 256 * 1024, seed=ctx.seed), directory)
+
+    # The child imports the same mrsh package as this process
+    env = dict(os.environ)
+    package_root = str(Path(mrsh.__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    command = [sys.executable, "-c", "from mrsh.cli import main; main()",
+               "scan", str(directory), "--no-cache", "--threshold", "0"]
+
+    def scan():
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    return [Result("scan.end_to_end", ctx.best(scan), "s", False)]
+
+
+def bench_quality(ctx: Context) -> List[Result]:
+    """
+    Detection scores on the synthetic corpora.
+
+    Not a speed measurement: a change to the hashing or scoring shows up as
+    a change in these numbers, which must then be intended.
+    """
+    samples = corpus.mutated_families(ctx.n(20), 10, 256 * 1024, seed=ctx.seed)
+    fpl = mrsh.FingerprintList(samples)
+    family = [c.score for c in fpl.compare_all() if c.hash1.rsplit("-", 1)[0] == c.hash2.rsplit("-", 1)[0]]
+
+    fragments, containers = corpus.embedded_fragments(ctx.n(20), 1 * MB, 64 * 1024, ctx.seed)
+    embedded = [mrsh.Fingerprint(f).compare(mrsh.Fingerprint(c)) for f, c in zip(fragments, containers)]
+
+    unrelated = mrsh.FingerprintList(corpus.random_blobs(ctx.n(20), 256 * 1024, ctx.seed)).compare_all()
+    return [
+        Result("quality.family_score", statistics.mean(family), "score", True),
+        Result("quality.fragment_score", statistics.mean(embedded), "score", True),
+        Result("quality.unrelated_score", statistics.mean(c.score for c in unrelated), "score", False),
+    ]
+
+
+BENCHMARKS: Dict[str, Callable[[Context], List[Result]]] = {
+    "hash": bench_hash,
+    "compare": bench_compare,
+    "cluster": bench_cluster,
+    "digest": bench_digest,
+    "store": bench_store,
+    "mutate": bench_mutate,
+    "packet": bench_packet,
+    "serve": bench_serve,
+    "scan": bench_scan,
+    "quality": bench_quality,
+}
+
+
+def run(names: List[str], scale: float = 1.0, repeat: int = 5, seed: int = 0) -> dict:
+    """
+    Run benchmarks and collect their results with a description of the machine.
+
+    Args:
+        names: Names of the benchmarks to run, keys of BENCHMARKS
+        scale: Factor applied to the corpus sizes
+        repeat: Timed calls per measurement, the fastest is reported
+        seed: Random seed of the corpora
+
+    Returns:
+        Report as written to the JSON output
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mrsh-bench-") as workdir:
+        ctx = Context(scale, repeat, seed, Path(workdir))
+        for name in names:
+            for result in BENCHMARKS[name](ctx):
+                results[result.name] = {
+                    "value": result.value,
+                    "unit": result.unit,
+                    "higher_is_better": result.higher_is_better,
+                }
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "mrsh_version": mrsh.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "repeat": repeat,
+        "seed": seed,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float) -> List[tuple]:
+    """
+    Compare the results of two reports.
+
+    Args:
+        report: Current report
+        baseline: Report to compare against
+        tolerance: Relative slowdown (or score change) accepted before a
+            result counts as a regression
+
+    Returns:
+        (name, baseline value, value, relative change, regressed) per result
+        present in both reports; a positive change is an improvement
+    """
+    rows = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = result["value"] / base["value"] - 1
+        if not result["higher_is_better"]:
+            change = -change
+        rows.append((name, base["value"], result["value"], change, change < -tolerance))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Benchmark CLI entry point, returns the exit status."""
+    parser = argparse.ArgumentParser(description="MRSHw benchmark suite")
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'Benchmarks to run: {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--output', '-o', metavar='PATH', help='Write the JSON report to PATH')
+    parser.add_argument('--baseline', '-b', metavar='PATH',
+                        help='Compare against a stored report and fail on regressions')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f'Store the report as the baseline ({DEFAULT_BASELINE.name})')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Relative slowdown accepted before failing (default: 0.10)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Corpus size factor (default: 1.0)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed calls per measurement (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed (default: 0)')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    report = run(args.benchmarks or list(BENCHMARKS), args.scale, args.repeat, args.seed)
+    text = json.dumps(report, indent=2)
+
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(text + "\n")
+    if not args.output and not args.save_baseline:
+        print(text)
+
+    for name, result in report["results"].items():
+        print(f"{name:28} {result['value']:14.2f} {result['unit']}", file=sys.stderr)
+
+    if not args.baseline:
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    if (baseline["scale"], baseline["seed"]) != (args.scale, args.seed):
+        print("warning: baseline was run with a different scale or seed", file=sys.stderr)
+
+    regressions = 0
+    print(f"\n{'benchmark':28} {'baseline':>14} {'current':>14} {'change':>8}", file=sys.stderr)
+    for name, base, value, change, regressed in compare_reports(report, baseline, args.tolerance):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:28} {base:14.2f} {value:14.2f} {change:+8.1%}{flag}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Synthetic corpora for the benchmarks.
+
+Every generator is deterministic for a given seed, so two runs of the
+benchmark suite hash and compare exactly the same bytes.
+"""
+
+import random
+from pathlib import Path
+from typing import List, Tuple, Union
+
+# (data, label), as accepted by Fingerprint and FingerprintList
+Sample = Tuple[bytes, str]
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    """size pseudo-random bytes drawn from rng."""
+    if size == 0:
+        return b""
+    return rng.getrandbits(size * 8).to_bytes(size, "little")
+
+
+def random_blobs(count: int, size: int, seed: int = 0) -> List[Sample]:
+    """
+    Unrelated random buffers, the worst case for the Bloom filters.
+
+    Args:
+        count: Number of buffers
+        size: Size of every buffer in bytes
+        seed: Random seed
+
+    Returns:
+        List of (data, label) pairs
+    """
+    rng = random.Random(seed)
+    return [(_random_bytes(rng, size), f"random-{i:05d}") for i in range(count)]
+
+
+def mutate(rng: random.Random, data: bytes, rate: float) -> bytes:
+    """
+    Copy of data with about rate * len(data) edits.
+
+    An edit overwrites, inserts or deletes a short run of bytes, like a
+    recompiled or repacked variant of a binary.
+    """
+    out = bytearray(data)
+    for _ in range(int(len(data) * rate)):
+        if not out:
+            break
+        pos = rng.randrange(len(out))
+        run = rng.randint(1, 16)
+        edit = rng.random()
+        if edit < 0.5:
+            out[pos:pos + run] = _random_bytes(rng, len(out[pos:pos + run]))
+        elif edit < 0.75:
+            out[pos:pos] = _random_bytes(rng, run)
+        else:
+            del out[pos:pos + run]
+    return bytes(out)
+
+
+def mutated_families(families: int, members: int, size: int, rate: float = 0.001,
+                     seed: int = 0) -> List[Sample]:
+    """
+    Families of variants of a random base buffer.
+
+    Args:
+        families: Number of families
+        members: Number of variants per family
+        size: Size of the base buffer in bytes
+        rate: Edits per byte of a variant
+        seed: Random seed
+
+    Returns:
+        List of (data, label) pairs, labelled family-<f>-<m>
+    """
+    rng = random.Random(seed)
+    samples = []
+    for f in range(families):
+        base = _random_bytes(rng, size)
+        samples.extend((mutate(rng, base, rate), f"family-{f:03d}-{m:03d}") for m in range(members))
+    return samples
+
+
+def embedded_fragments(count: int, size: int, fragment_size: int,
+                       seed: int = 0) -> Tuple[List[Sample], List[Sample]]:
+    """
+    Fragments hidden at random offsets of random containers.
+
+    Args:
+        count: Number of fragment/container pairs
+        size: Size of a container in bytes
+        fragment_size: Size of a fragment in bytes, less than size
+        seed: Random seed
+
+    Returns:
+        (fragments, containers), container i holding fragment i
+    """
+    rng = random.Random(seed)
+    fragments, containers = [], []
+    for i in range(count):
+        fragment = _random_bytes(rng, fragment_size)
+        offset = rng.randrange(size - fragment_size)
+        container = (_random_bytes(rng, offset) + fragment +
+                     _random_bytes(rng, size - fragment_size - offset))
+        fragments.append((fragment, f"fragment-{i:05d}"))
+        containers.append((container, f"container-{i:05d}"))
+    return fragments, containers
+
+
+def write_corpus(samples: List[Sample], directory: Union[str, Path]) -> List[Path]:
+    """
+    Write samples to files named after their labels.
+
+    Args:
+        samples: List of (data, label) pairs
+        directory: Directory to write to, created if missing
+
+    Returns:
+        Paths of the written files
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for data, label in samples:
+        path = directory / f"{label}.bin"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
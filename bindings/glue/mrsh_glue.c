@@ -5,49 +5,36 @@
  * Modified by w4term3loon.
  */
 
+#include <ctype.h>
 #include <dirent.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <pthread.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/stat.h>
 #include <unistd.h>
 
-// missing from fingerprintList.h
+// missing from fingerprint.h
 #include <stdio.h>
 
 #include "config.h"
-#include "fingerprintList.h"
+#include "fingerprintIndex.h"
+#include "fingerprintStore.h"
+#include "hashCache.h"
 #include "hashing.h"
 #include "helper.h"
 #include "util.h"
 
-MODES *mode;
+#include "mrsh_glue.h"
 
-/**
- * @brief Initialize global mode configuration structure
- * @note Called automatically at program startup via __attribute__((constructor))
- */
-__attribute__((constructor)) void
-init_modes(void) {
-  mode = (MODES *)malloc(sizeof(MODES));
-  mode->compare = false;
-  mode->gen_compare = false;
-  mode->compareLists = false;
-  mode->file_comparison = false;
-  mode->helpmessage = false;
-  mode->print = false;
-  mode->threshold = 0;
-  mode->recursive = false;
-  mode->path_list_compare = false;
-}
-
-/**
- * @brief Clean up global mode configuration structure
- * @note Called automatically at program exit via __attribute__((destructor))
+/*
+ * Options of the command line tool, still referenced by fingerprintList.c.
+ * Everything in here takes its options per call and never reads them, so
+ * threads can hash and compare with different settings at the same time.
  */
-__attribute__((destructor)) void
-destroy_modes(void) {
-  free((void *)mode);
-  mode = NULL;
-}
+static MODES cli_modes;
+MODES *mode = &cli_modes;
 
 // missing from helper.h
 bool
@@ -61,7 +48,11 @@ is_dir(const char *path);
  */
 FINGERPRINT *
 fp_init(void) {
-  return init_empty_fingerprint();
+  FINGERPRINT *fp = init_empty_fingerprint();
+  // an empty fingerprint can be stored in a list, so give it a name and size
+  fp->file_name[0] = '\0';
+  fp->filesize = 0;
+  return fp;
 }
 
 /**
@@ -120,53 +111,19 @@ fp_init_file(char *filename, const char *label) {
  * @param fingerprint Fingerprint structure to populate with hash values
  * @param byte_buffer Raw bytes to hash
  * @param bytes_size Size of byte buffer
+ * @param packet Hash the bytes as a network packet, leaving out the chunks
+ *        before the first and after the last boundary
  * @return 1 on success
  * @note Uses rolling hash with FNV-64 for block boundaries
  */
 int
-fp_hash_bytes(FINGERPRINT *fingerprint, unsigned char *byte_buffer, unsigned long bytes_size) {
-  short first = 1;
-
-  unsigned int last_block_index = 0;
-  uint64 rValue, hashvalue = 0;
-
-  // we need these arrays for the extended rollhash function
-  uchar window[ROLLING_WINDOW] = {0};
-  uint32 rhData[4] = {0};
-
-  for (unsigned int i = 0; i < bytes_size; i++) {
-
-    // rValue = djb2x(byte_buffer[i],window,i);
-    rValue = roll_hashx(byte_buffer[i], window, rhData);
-
-    if (rValue % BLOCK_SIZE == BLOCK_SIZE - 1) // || chunk_index >= BLOCK_SIZE_MAX)
-    {
-
-#ifdef network
-      if (first == 1) {
-        first = 0;
-        last_block_index = i + 1;
-        if (i + SKIPPED_BYTES < bytes_read)
-          i += SKIPPED_BYTES;
-        continue;
-      }
-#endif
-
-      hashvalue = fnv64Bit(byte_buffer, last_block_index, i); //,current_index, FNV1_64_INIT);
-      add_hash_to_fingerprint(fingerprint, hashvalue);        // printf("%i %llu \n", i, hashvalue);
-
-      last_block_index = i + 1;
-
-      if (i + SKIPPED_BYTES < bytes_size)
-        i += SKIPPED_BYTES;
-    }
-  }
-
-#ifndef network
-  hashvalue = fnv64Bit(byte_buffer, last_block_index, bytes_size - 1);
-  add_hash_to_fingerprint(fingerprint, hashvalue);
-#endif
+fp_hash_bytes(FINGERPRINT *fingerprint, unsigned char *byte_buffer, unsigned long bytes_size,
+              bool packet) {
+  HASH_STATE state;
 
+  hash_state_init_packet(&state, packet);
+  hash_state_update(&state, fingerprint, byte_buffer, bytes_size);
+  hash_state_final(&state, fingerprint);
   return 1;
 }
 
@@ -176,15 +133,16 @@ fp_hash_bytes(FINGERPRINT *fingerprint, unsigned char *byte_buffer, unsigned lon
  * @param byte_buffer Raw bytes to hash
  * @param bytes_size Size of byte buffer
  * @param label Label to assign to this fingerprint
+ * @param packet Hash the bytes as a network packet, see fp_hash_bytes()
  * @return 0 on success
  */
 int
 fp_add_bytes(FINGERPRINT *fp, unsigned char *byte_buffer, unsigned long bytes_size,
-             const char *label) {
+             const char *label, bool packet) {
   strcpy(fp->file_name, label);
   fp->filesize = bytes_size;
 
-  fp_hash_bytes(fp, byte_buffer, bytes_size);
+  fp_hash_bytes(fp, byte_buffer, bytes_size, packet);
   return 0;
 }
 
@@ -193,15 +151,92 @@ fp_add_bytes(FINGERPRINT *fp, unsigned char *byte_buffer, unsigned long bytes_si
  * @param byte_buffer Raw bytes to hash
  * @param bytes_size Size of byte buffer
  * @param label Label to assign to this fingerprint
+ * @param packet Hash the bytes as a network packet, see fp_hash_bytes()
  * @return Pointer to newly created fingerprint
  */
 FINGERPRINT *
-fp_init_bytes(unsigned char *byte_buffer, unsigned long bytes_size, const char *label) {
+fp_init_bytes(unsigned char *byte_buffer, unsigned long bytes_size, const char *label,
+              bool packet) {
   FINGERPRINT *fp = init_empty_fingerprint();
-  fp_add_bytes(fp, byte_buffer, bytes_size, label);
+  fp_add_bytes(fp, byte_buffer, bytes_size, label, packet);
+  return fp;
+}
+
+/**
+ * @brief Incremental hasher: a fingerprint under construction plus the
+ *        streaming hash state, fed piece by piece with fph_update()
+ */
+struct fp_hasher {
+  HASH_STATE state;
+  FINGERPRINT *fp;
+};
+
+/**
+ * @brief Start an incremental hash
+ * @param label Label of the resulting fingerprint (can be NULL for "n/a")
+ * @return Pointer to the new hasher, or NULL on error
+ */
+fp_hasher_t *
+fph_init(const char *label) {
+  fp_hasher_t *hasher = malloc(sizeof(fp_hasher_t));
+  if (!hasher)
+    return NULL;
+
+  hasher->fp = init_empty_fingerprint();
+  snprintf(hasher->fp->file_name, sizeof(hasher->fp->file_name), "%s", label ? label : "n/a");
+  hash_state_init(&hasher->state);
+  return hasher;
+}
+
+/**
+ * @brief Hash the next piece of the input
+ * @param hasher Hasher returned by fph_init()
+ * @param byte_buffer Next bytes of the input
+ * @param bytes_size Number of bytes
+ * @return 0 on success, -1 if the hasher was already finalized
+ * @note Only a fixed-size state is kept between calls; feeding the input in
+ *       pieces gives the same fingerprint as fp_add_bytes() on all of it
+ */
+int
+fph_update(fp_hasher_t *hasher, unsigned char *byte_buffer, unsigned long bytes_size) {
+  if (!hasher || !hasher->fp)
+    return -1;
+
+  hash_state_update(&hasher->state, hasher->fp, byte_buffer, bytes_size);
+  return 0;
+}
+
+/**
+ * @brief Finish the hash and hand over the fingerprint
+ * @param hasher Hasher returned by fph_init()
+ * @return The finished fingerprint (caller frees with fp_destroy()), or NULL
+ *         if the hasher was already finalized
+ */
+FINGERPRINT *
+fph_final(fp_hasher_t *hasher) {
+  if (!hasher || !hasher->fp)
+    return NULL;
+
+  FINGERPRINT *fp = hasher->fp;
+  hash_state_final(&hasher->state, fp);
+  fp->filesize = hasher->state.length;
+  hasher->fp = NULL;
   return fp;
 }
 
+/**
+ * @brief Destroy a hasher and its unfinished fingerprint, if any
+ * @param hasher Hasher to destroy
+ */
+void
+fph_destroy(fp_hasher_t *hasher) {
+  if (hasher) {
+    if (hasher->fp)
+      fingerprint_destroy(hasher->fp);
+    free(hasher);
+  }
+}
+
 /**
  * @brief Convert a fingerprint to its string representation
  * @param fp Fingerprint to convert
@@ -215,12 +250,10 @@ fp_str(FINGERPRINT *fp) {
     return NULL;
   }
 
-  int j;
-  BLOOMFILTER *bf = fp->bf_list;
-
-  size_t metadata_len = strlen(fp->file_name) + 64;         // generous space for numbers
-  size_t hex_len = (fp->amount_of_BF + 1) * FILTERSIZE * 2; // 2 hex chars per byte
-  size_t total_len = metadata_len + hex_len + 10;           // +10 for newlines and safety
+  size_t filters = (size_t)fp->amount_of_BF + 1;
+  size_t metadata_len = strlen(fp->file_name) + 64; // generous space for numbers
+  size_t hex_len = filters * FILTERSIZE * 2;         // 2 hex chars per byte
+  size_t total_len = metadata_len + hex_len + 1;
 
   char *result = malloc(total_len);
   if (!result) {
@@ -228,41 +261,33 @@ fp_str(FINGERPRINT *fp) {
   }
 
   // metadata
-  int pos = snprintf(result, total_len, "%s:%d:%d:%d:", fp->file_name, fp->filesize,
+  int pos = snprintf(result, total_len, "%s:%llu:%d:%d:", fp->file_name, fp->filesize,
                      fp->amount_of_BF + 1, fp->bf_list_last_element->amount_of_blocks);
-  if (pos < 0 || pos >= total_len) {
+  if (pos < 0 || (size_t)pos >= metadata_len) {
     free(result);
     return NULL;
   }
 
   // add BFs
-  while (bf != NULL && pos < total_len - 2) {
-    for (j = 0; j < FILTERSIZE && pos < total_len - 2; j++) {
-      int written = snprintf(result + pos, total_len - pos, "%02X", bf->array[j]);
-      if (written != 2) { // sanity check
-        free(result);
-        return NULL;
-      }
-      pos += 2;
-    }
-    bf = bf->next;
-  }
-
-  // null terminate
-  if (pos < total_len) {
-    result[pos] = '\0';
+  BLOOMFILTER *bf = fp->bf_list;
+  for (size_t i = 0; i < filters && bf != NULL; i++, bf = bf->next) {
+    hex_encode(bf->array, FILTERSIZE, result + pos);
+    pos += FILTERSIZE * 2;
   }
 
+  result[pos] = '\0';
   return result;
 }
 
 /**
  * @brief Initialize an empty fingerprint list
- * @return Pointer to newly allocated empty fingerprint list
+ * @return Pointer to newly allocated empty fingerprint list, or NULL on error
+ * @note The list is backed by a FINGERPRINT_STORE, so all filters of all
+ *       fingerprints live in one contiguous buffer
  */
-FINGERPRINT_LIST *
+FINGERPRINT_STORE *
 fpl_init(void) {
-  return init_empty_fingerprintList();
+  return init_empty_fingerprintStore();
 }
 
 /**
@@ -270,390 +295,2313 @@ fpl_init(void) {
  * @param fpl Fingerprint list to destroy
  */
 void
-fpl_destroy(FINGERPRINT_LIST *fpl) {
-  fingerprintList_destroy(fpl);
+fpl_destroy(FINGERPRINT_STORE *fpl) {
+  fingerprintStore_destroy(fpl);
 }
 
 /**
- * @brief Add all files from a path (file or directory) to fingerprint list
- * @param fpl Fingerprint list to add to
- * @param filename Path to file or directory
- * @param label Optional label prefix for entries (can be NULL)
- * @note If filename is a directory, recursively processes all files within
- * @note Respects global mode->recursive setting for subdirectory traversal
+ * @brief Get the number of fingerprints in a list
+ * @param fpl Fingerprint list
+ * @return Number of fingerprints
  */
-void
-fpl_add_path(FINGERPRINT_LIST *fpl, char *filename, const char *label) {
-  DIR *dir;
-  struct dirent *ent;
-  const int max_path_length = 1024;
+size_t
+fpl_size(FINGERPRINT_STORE *fpl) {
+  return fpl ? fpl->size : 0;
+}
 
-  char *cur_dir = (char *)malloc(max_path_length);
-  getcwd(cur_dir, max_path_length);
+/**
+ * @brief Get the name of a fingerprint in a list
+ * @param fpl Fingerprint list
+ * @param index Position of the fingerprint, below fpl_size()
+ * @return Name of the fingerprint, owned by the list
+ */
+const char *
+fpl_name(FINGERPRINT_STORE *fpl, size_t index) {
+  const STORE_ENTRY *entry = &fpl->entries[index];
+  return STORE_DELETED(entry) ? "" : STORE_NAME(fpl, entry);
+}
 
-  // in case of a dir
-  if (is_dir(filename)) {
-    dir = opendir(filename);
-    chdir(filename);
+/**
+ * @brief Get the file size and filter count of a fingerprint in a list
+ * @param fpl Fingerprint list
+ * @param index Position of the fingerprint, below fpl_size()
+ * @param filesize Receives the size of the hashed data
+ * @param filters Receives the number of Bloom filters
+ */
+void
+fpl_entry_info(FINGERPRINT_STORE *fpl, size_t index, uint64_t *filesize, size_t *filters) {
+  const STORE_ENTRY *entry = &fpl->entries[index];
+  *filesize = entry->filesize;
+  *filters = entry->filter_count;
+}
 
-    // run through all files of the dir
-    while ((ent = readdir(dir)) != NULL) {
+/**
+ * @brief Get the number of live fingerprints in a list
+ * @param fpl Fingerprint list
+ * @return Number of fingerprints, not counting removed ones
+ * @note Removed fingerprints keep their position, so fpl_size() can be larger
+ */
+size_t
+fpl_count(FINGERPRINT_STORE *fpl) {
+  return fpl ? STORE_LIVE(fpl) : 0;
+}
 
-      // if we found a file, generate hash value and add it
-      if (is_file(ent->d_name)) {
-        FILE *file = getFileHandle(ent->d_name);
-        FINGERPRINT *fp = init_fingerprint_for_file(file, ent->d_name);
-        add_new_fingerprint(fpl, fp);
-      }
+/**
+ * @brief Check whether a position holds a fingerprint
+ * @param fpl Fingerprint list
+ * @param index Position to check
+ * @return true if index is below fpl_size() and not removed
+ */
+bool
+fpl_live(FINGERPRINT_STORE *fpl, size_t index) {
+  return fpl && index < fpl->size && !STORE_DELETED(&fpl->entries[index]);
+}
 
-      // when we found a dir and recursive mode is on, go deeper
-      else if (is_dir(ent->d_name) && mode->recursive) {
-        if (strcmp(ent->d_name, ".") == 0 || strcmp(ent->d_name, "..") == 0)
-          continue;
-        fpl_add_path(fpl, ent->d_name, label);
-      }
-    }
-    chdir(cur_dir);
-    closedir(dir);
-  }
+/**
+ * @brief Get the number of removals and replacements a list has seen
+ * @param fpl Fingerprint list
+ * @return Counter that changes whenever a fingerprint is modified in place
+ */
+uint64_t
+fpl_mutations(FINGERPRINT_STORE *fpl) {
+  return fpl ? fpl->mutations : 0;
+}
 
-  // in case we we have only a file
-  else if (is_file(filename)) {
-    FILE *file = getFileHandle(filename);
-    FINGERPRINT *fp = fp_init_file(filename, label);
-    add_new_fingerprint(fpl, fp);
-  }
+// Labels are limited like the names of hashed fingerprints
+#define FPL_LABEL_MAX (sizeof(((FINGERPRINT *)0)->file_name) - 1)
 
-  free(cur_dir);
-  return;
+/**
+ * @brief Limit a label to FPL_LABEL_MAX bytes
+ * @param label Label, or NULL
+ * @param buffer Room for FPL_LABEL_MAX + 1 bytes, used for long labels
+ * @return label itself, or its prefix copied into buffer
+ */
+static const char *
+fpl_label(const char *label, char *buffer) {
+  if (!label || strlen(label) <= FPL_LABEL_MAX)
+    return label;
+  memcpy(buffer, label, FPL_LABEL_MAX);
+  buffer[FPL_LABEL_MAX] = '\0';
+  return buffer;
 }
 
 /**
- * @brief Add raw bytes as a fingerprint to the list
- * @param fpl Fingerprint list to add to
- * @param byte_buffer Raw bytes to hash
- * @param bytes_size Size of byte buffer
- * @param label Label to assign to this fingerprint entry
+ * @brief Find a fingerprint by label
+ * @param fpl Fingerprint list
+ * @param label Label to look up
+ * @return Position of the first fingerprint with the label, or -1 with errno
+ *         ENOENT if there is none, ENOMEM if the label table cannot grow
+ * @note The label table is built on the first lookup, in O(n), and kept up
+ *       to date afterwards, so later lookups take O(1)
  */
-void
-fpl_add_bytes(FINGERPRINT_LIST *fpl, unsigned char *byte_buffer, unsigned long bytes_size,
-              const char *label) {
-  FINGERPRINT *fp = fp_init_bytes(byte_buffer, bytes_size, label);
-  add_new_fingerprint(fpl, fp);
-  return;
+long
+fpl_find(FINGERPRINT_STORE *fpl, const char *label) {
+  char buffer[FPL_LABEL_MAX + 1];
+  size_t index;
+
+  int found = fingerprintStore_find(fpl, fpl_label(label, buffer), &index);
+  if (found <= 0) {
+    errno = found < 0 ? ENOMEM : ENOENT;
+    return -1;
+  }
+  return (long)index;
 }
 
 /**
- * @brief Convert entire fingerprint list to string representation
- * @param fpl Fingerprint list to convert
- * @return Allocated string containing all fingerprints separated by newlines, or NULL on error
- * @note Each line follows format: "filename:filesize:bf_count:blocks:HEXDATA"
- * @note Caller must free returned string with str_free()
+ * @brief Remove a fingerprint
+ * @param fpl Fingerprint list
+ * @param index Position of the fingerprint
+ * @return 0 on success, -1 with errno EINVAL if the position holds no
+ *         fingerprint, ENOMEM on allocation failure
+ * @note The other fingerprints keep their positions; the slot is reused by
+ *       the next fpl_put() that inserts
  */
-char *
-fpl_str(FINGERPRINT_LIST *fpl) {
-  if (!fpl || !fpl->list)
-    return NULL;
-
-  // estimate total length
-  size_t total_len = 0;
-  for (FINGERPRINT *fp = fpl->list; fp; fp = fp->next) {
-    size_t meta = strlen(fp->file_name) + 64;             // filename + ints + colons
-    size_t hex = (fp->amount_of_BF + 1) * FILTERSIZE * 2; // 2 hex chars per byte
-    total_len += meta + hex + 1;                          // +1 for newline or final NUL
+int
+fpl_remove(FINGERPRINT_STORE *fpl, size_t index) {
+  if (!fpl_live(fpl, index)) {
+    errno = EINVAL;
+    return -1;
+  }
+  if (fingerprintStore_remove(fpl, index) != 0) {
+    errno = ENOMEM;
+    return -1;
   }
+  return 0;
+}
 
-  char *result = calloc(1, total_len + 1); // +1 for final NUL
-  if (!result)
-    return NULL;
+/**
+ * @brief Replace a fingerprint, or insert one into a free slot
+ * @param fpl Fingerprint list
+ * @param index Position to replace, or -1 to insert into the most recently
+ *        freed slot (appending if there is none)
+ * @param src List holding the new fingerprint, may be fpl itself
+ * @param j Position of the new fingerprint in src
+ * @param label New label; NULL keeps the label of a replaced fingerprint
+ * @return Position of the fingerprint, or -1 with errno EINVAL for positions
+ *         that hold no fingerprint, ENOMEM on allocation failure
+ * @note Takes O(1) apart from copying the filters
+ */
+long
+fpl_put(FINGERPRINT_STORE *fpl, long index, FINGERPRINT_STORE *src, size_t j, const char *label) {
+  char buffer[FPL_LABEL_MAX + 1];
+  FINGERPRINT_STORE *copy = NULL;
 
-  // fill buffer
-  size_t pos = 0;
-  for (FINGERPRINT *fp = fpl->list; fp; fp = fp->next) {
-    // metadata header
-    int n = snprintf(result + pos, total_len + 1 - pos, "%s:%d:%d:%d:", fp->file_name, fp->filesize,
-                     fp->amount_of_BF + 1, fp->bf_list_last_element->amount_of_blocks);
-    if (n < 0 || (size_t)n >= total_len + 1 - pos) {
-      free(result);
-      return NULL;
-    }
-    pos += n;
-
-    // bloom-filter bytes as hex
-    for (BLOOMFILTER *bf = fp->bf_list; bf; bf = bf->next) {
-      for (int j = 0; j < FILTERSIZE; j++) {
-        if (pos + 2 >= total_len + 1) {
-          result[total_len] = '\0';
-          return result;
-        }
-        int w = snprintf(result + pos, total_len + 1 - pos, "%02X", bf->array[j]);
-        if (w != 2) {
-          free(result);
-          return NULL;
-        }
-        pos += 2;
-      }
-    }
+  if ((index >= 0 && !fpl_live(fpl, (size_t)index)) || !fpl_live(src, j) || (index < 0 && !label)) {
+    errno = EINVAL;
+    return -1;
+  }
+  if (index < 0 && fpl->free_count == 0 && fpl->size >= STORE_LABEL_EMPTY) {
+    errno = ENOMEM;
+    return -1;
+  }
 
-    // newline between entries
-    if (fp->next) {
-      if (pos < total_len)
-        result[pos++] = '\n';
+  // the source entry must not move while it is copied
+  if (src == fpl) {
+    copy = fpl_slice(fpl, j, j + 1);
+    if (!copy) {
+      errno = ENOMEM;
+      return -1;
     }
+    src = copy;
+    j = 0;
   }
 
-  // final NULL
-  result[pos < total_len ? pos : total_len] = '\0';
-  return result;
+  label = fpl_label(label, buffer);
+  long put = index < 0 ? fingerprintStore_insert(fpl, src, j, label)
+                       : fingerprintStore_replace(fpl, (size_t)index, src, j, label);
+  fingerprintStore_destroy(copy);
+  if (put < 0)
+    errno = ENOMEM;
+  return put;
 }
 
 /**
- * @brief Free a string allocated by fp_str() or fpl_str()
- * @param str String to free
- * @note Safe to call with NULL pointer
+ * @brief fpl_put() with a fingerprint as the source
+ * @param fpl Fingerprint list
+ * @param index Position to replace, or -1 to insert
+ * @param fp New fingerprint; it is copied, not taken
+ * @param label New label, NULL keeps the label of a replaced fingerprint
+ * @return Position of the fingerprint, or -1 (errno is set)
  */
-void
-str_free(char *str) {
-  if (str != NULL) {
-    free(str);
+long
+fpl_put_fp(FINGERPRINT_STORE *fpl, long index, FINGERPRINT *fp, const char *label) {
+  FINGERPRINT_STORE *src = init_empty_fingerprintStore();
+  if (!src || add_fingerprint_to_store(src, fp) < 0) {
+    fingerprintStore_destroy(src);
+    errno = ENOMEM;
+    return -1;
   }
-}
-
-typedef struct {
-  char *name1;
-  char *name2;
-  uint8_t score;
-} compare_t;
 
-typedef struct {
-  compare_t *list;
-  size_t size;
-} compare_list_t;
+  long put = fpl_put(fpl, index, src, 0, label);
+  fingerprintStore_destroy(src);
+  return put;
+}
 
 /**
- * @brief Compare fingerprint similarity score between two fingerprints
- * @param fp1 First fingerprint to compare
- * @param fp2 Second fingerprint to compare
- * @return Similarity score as uint8_t (0-100)
+ * @brief Release the memory of removed and replaced fingerprints
+ * @param fpl Fingerprint list
+ * @return 0 on success, -1 on allocation failure (the list is unchanged)
+ * @note Runs automatically once half of the filters are unused; positions
+ *       do not change
  */
-uint8_t
-fp_compare(FINGERPRINT *fp1, FINGERPRINT *fp2) {
-  return (uint8_t)fingerprint_compare(fp1, fp2);
+int
+fpl_compact(FINGERPRINT_STORE *fpl) {
+  return fingerprintStore_compact(fpl);
 }
 
 /**
- * @brief Compare every fingerprint with every other fingerprint in a list
- * @param fpl Fingerprint list to process
- * @param threshold Minimum similarity score to include in results
- * @return Allocated compare_list_t containing all matches above threshold, or NULL on error
- * @note Avoids duplicate comparisons (A vs B, but not B vs A)
- * @note Caller must free returned structure with cl_free()
+ * @brief Copy a range of a fingerprint list into a new list
+ * @param fpl Fingerprint list to copy from
+ * @param start Position of the first fingerprint to copy
+ * @param stop Position after the last fingerprint to copy, at most fpl_size()
+ * @return Pointer to the new fingerprint list, or NULL on allocation failure
+ * @note The fingerprints are copied, so a range of a mapped list can be
+ *       saved on its own
  */
-compare_list_t *
-cl_fpl_all(FINGERPRINT_LIST *fpl, uint8_t threshold) {
-  if (!fpl || fpl->size == 0)
-    return NULL;
-
-  compare_list_t *cl = malloc(sizeof(compare_list_t));
-  if (!cl)
+FINGERPRINT_STORE *
+fpl_slice(FINGERPRINT_STORE *fpl, size_t start, size_t stop) {
+  FINGERPRINT_STORE *slice = init_empty_fingerprintStore();
+  if (!slice)
     return NULL;
 
-  // Maximum possible comparisons: n*(n-1)/2
-  size_t max_size = (fpl->size * (fpl->size - 1)) / 2;
-  cl->list = calloc(max_size, sizeof(compare_t));
-  if (!cl->list) {
-    free(cl);
-    return NULL;
-  }
-
-  size_t count = 0;
-  FINGERPRINT *fp1 = fpl->list;
-
-  while (fp1) {
-    FINGERPRINT *fp2 = fp1->next;
-    while (fp2) {
-      uint8_t score = fp_compare(fp1, fp2);
-      if (score >= threshold) {
-        cl->list[count].name1 = fp1->file_name;
-        cl->list[count].name2 = fp2->file_name;
-        cl->list[count].score = score;
-        count++;
-      }
-      fp2 = fp2->next;
+  for (size_t i = start; i < stop; i++) {
+    if (fingerprintStore_copy(slice, fpl, i, fpl_name(fpl, i)) < 0) {
+      fingerprintStore_destroy(slice);
+      return NULL;
     }
-    fp1 = fp1->next;
   }
-
-  cl->size = count;
-  return cl;
+  return slice;
 }
 
 /**
- * @brief Compare every fingerprint in first list against every fingerprint in second list
- * @param fpl1 First fingerprint list
- * @param fpl2 Second fingerprint list
- * @param threshold Minimum similarity score to include in results
- * @return Allocated compare_list_t containing all cross-matches above threshold, or NULL on error
- * @note Performs full cross-product comparison (size1 * size2 comparisons)
- * @note Caller must free returned structure with cl_free()
+ * @brief Save a fingerprint list in the binary store format
+ * @param fpl Fingerprint list to save
+ * @param path Destination file path
+ * @return 0 on success, errno value on failure
  */
-compare_list_t *
-cl_fpl_vs_fpl(FINGERPRINT_LIST *fpl1, FINGERPRINT_LIST *fpl2, uint8_t threshold) {
-  if (!fpl1 || !fpl2 || fpl1->size == 0 || fpl2->size == 0)
-    return NULL;
-
-  compare_list_t *cl = malloc(sizeof(compare_list_t));
-  if (!cl)
-    return NULL;
+int
+fpl_save(FINGERPRINT_STORE *fpl, const char *path) {
+  if (!fpl || !path)
+    return EINVAL;
+  return fingerprintStore_save(fpl, path) == 0 ? 0 : (errno ? errno : EIO);
+}
 
-  // Maximum possible comparisons: size1 * size2
-  size_t max_size = fpl1->size * fpl2->size;
-  cl->list = calloc(max_size, sizeof(compare_t));
-  if (!cl->list) {
-    free(cl);
+/**
+ * @brief Load a fingerprint list saved with fpl_save()
+ * @param path Source file path
+ * @param use_mmap Non-zero to map the file instead of reading it
+ * @return Pointer to the loaded fingerprint list, or NULL on error (errno is set)
+ * @note A mapped list is compared directly from the page cache; it is copied
+ *       to private memory the first time a fingerprint is added
+ */
+FINGERPRINT_STORE *
+fpl_load(const char *path, int use_mmap) {
+  if (!path) {
+    errno = EINVAL;
     return NULL;
   }
+  return fingerprintStore_load(path, use_mmap);
+}
 
-  size_t count = 0;
-  FINGERPRINT *fp1 = fpl1->list;
-
-  while (fp1) {
-    FINGERPRINT *fp2 = fpl2->list;
-    while (fp2) {
-      uint8_t score = fp_compare(fp1, fp2);
-      if (score >= threshold) {
-        cl->list[count].name1 = fp1->file_name;
-        cl->list[count].name2 = fp2->file_name;
-        cl->list[count].score = score;
-        count++;
-      }
-      fp2 = fp2->next;
-    }
-    fp1 = fp1->next;
-  }
-
-  cl->size = count;
-  return cl;
+/**
+ * @brief Move a fingerprint into the list
+ * @param fpl Fingerprint list to add to
+ * @param fp Fingerprint to copy into the list; destroyed afterwards
+ */
+static void
+fpl_take(FINGERPRINT_STORE *fpl, FINGERPRINT *fp) {
+  add_fingerprint_to_store(fpl, fp);
+  fingerprint_destroy(fp);
 }
 
 /**
- * @brief Compare one fingerprint against all fingerprints in a list
- * @param target Single fingerprint to compare against the list
- * @param fpl Fingerprint list to compare against
- * @param threshold Minimum similarity score to include in results
- * @return Allocated compare_list_t containing all matches above threshold, or NULL on error
- * @note Target fingerprint appears as name1 in all results
- * @note Caller must free returned structure with cl_free()
+ * @brief Persistent fingerprint cache shared by the ingest functions
+ * @note The lock makes a cache usable from several calls at once
  */
-compare_list_t *
-cl_fp_vs_fpl(FINGERPRINT *target, FINGERPRINT_LIST *fpl, uint8_t threshold) {
-  if (!target || !fpl || fpl->size == 0)
+struct hash_cache {
+  HASH_CACHE *cache;
+  char *path;
+  size_t max_entries;
+  uint64_t max_bytes;
+  pthread_mutex_t lock;
+};
+
+/**
+ * @brief Open a fingerprint cache file
+ * @param path Cache file; a missing or invalid file starts an empty cache
+ * @param max_entries Maximum number of fingerprints kept on save, 0 for no limit
+ * @param max_bytes Maximum size of the cache file, 0 for no limit
+ * @return Pointer to the cache, or NULL on allocation failure
+ * @note Caller must close the cache with hc_close()
+ */
+hash_cache_t *
+hc_open(const char *path, size_t max_entries, uint64_t max_bytes) {
+  if (!path)
     return NULL;
 
-  compare_list_t *cl = malloc(sizeof(compare_list_t));
-  if (!cl)
+  hash_cache_t *hc = calloc(1, sizeof(hash_cache_t));
+  if (!hc)
     return NULL;
 
-  cl->list = calloc(fpl->size, sizeof(compare_t));
-  if (!cl->list) {
-    free(cl);
+  hc->path = strdup(path);
+  hc->cache = hashCache_load(path);
+  if (!hc->path || !hc->cache) {
+    free(hc->path);
+    hashCache_destroy(hc->cache);
+    free(hc);
     return NULL;
   }
 
-  size_t count = 0;
-  FINGERPRINT *fp = fpl->list;
-
-  while (fp) {
-    uint8_t score = fp_compare(target, fp);
-    if (score >= threshold) {
-      cl->list[count].name1 = target->file_name;
-      cl->list[count].name2 = fp->file_name;
-      cl->list[count].score = score;
-      count++;
-    }
-    fp = fp->next;
-  }
+  hc->max_entries = max_entries;
+  hc->max_bytes = max_bytes;
+  pthread_mutex_init(&hc->lock, NULL);
+  return hc;
+}
 
-  cl->size = count;
-  return cl;
+/**
+ * @brief Write the cache back to its file, evicting the least recently used
+ *        fingerprints beyond the limits
+ * @param hc Cache to save
+ * @return 0 on success, an errno value on failure
+ */
+int
+hc_save(hash_cache_t *hc) {
+  if (!hc)
+    return EINVAL;
+
+  pthread_mutex_lock(&hc->lock);
+  int err = hashCache_save(hc->cache, hc->path, hc->max_entries, hc->max_bytes) == 0 ? 0 : errno;
+  pthread_mutex_unlock(&hc->lock);
+  return err;
 }
 
 /**
- * @brief Free memory allocated for compare_list_t structure
- * @param cl Compare list to free
+ * @brief Get number of fingerprints in the cache
+ * @param hc Cache to query
+ * @return Number of cached fingerprints, 0 if hc is NULL
+ */
+size_t
+hc_size(hash_cache_t *hc) {
+  if (!hc)
+    return 0;
+
+  pthread_mutex_lock(&hc->lock);
+  size_t size = hc->cache->slot_count;
+  pthread_mutex_unlock(&hc->lock);
+  return size;
+}
+
+/**
+ * @brief Free a cache without saving it
+ * @param hc Cache to free
  * @note Safe to call with NULL pointer
  */
 void
-cl_free(compare_list_t *cl) {
-  if (cl) {
-    free((void *)cl->list);
-    free(cl);
+hc_close(hash_cache_t *hc) {
+  if (hc) {
+    hashCache_destroy(hc->cache);
+    pthread_mutex_destroy(&hc->lock);
+    free(hc->path);
+    free(hc);
   }
 }
 
-// Helper function to convert hex string to byte array
-void
-hex_to_bytes(const char *hex_str, unsigned char *bytes, int byte_count) {
-  for (int i = 0; i < byte_count; i++) {
-    unsigned int temp; // Use a temporary variable of the correct type
-    sscanf(hex_str + 2 * i, "%02X", &temp);
-    bytes[i] = (unsigned char)temp; // Assign the value to the char array
-  }
+/**
+ * @brief Look up a file in the cache
+ * @return Index of the fingerprint in the cache store, or -1 on a miss
+ */
+static long
+hc_lookup(hash_cache_t *hc, const CACHE_KEY *key) {
+  pthread_mutex_lock(&hc->lock);
+  long entry = hashCache_lookup(hc->cache, key);
+  pthread_mutex_unlock(&hc->lock);
+  return entry;
 }
 
-// Parse a fingerprint string back into a FINGERPRINT struct
-// Format: "filename:filesize:number_of_filters:blocks_in_last_filter:HEXDATA"
-FINGERPRINT *
-parse_fingerprint_string(const char *fp_string) {
-  if (!fp_string) {
-    return NULL;
-  }
+/**
+ * @brief Append a cached fingerprint to a list under the given name
+ * @return Index of the new entry in fpl, or -1 on allocation failure
+ */
+static long
+hc_copy(hash_cache_t *hc, long entry, FINGERPRINT_STORE *fpl, const char *name) {
+  pthread_mutex_lock(&hc->lock);
+  long added = fingerprintStore_copy(fpl, hc->cache->store, (size_t)entry, name);
+  pthread_mutex_unlock(&hc->lock);
+  return added;
+}
 
-  FINGERPRINT *fp = init_empty_fingerprint();
-  if (!fp) {
-    return NULL; // Should not happen if init_empty_fingerprint exits on failure
+/**
+ * @brief Remember entry i of a list as the fingerprint of a file
+ */
+static void
+hc_insert(hash_cache_t *hc, const CACHE_KEY *key, FINGERPRINT_STORE *fpl, size_t i) {
+  pthread_mutex_lock(&hc->lock);
+  hashCache_insert(hc->cache, key, fpl, i);
+  pthread_mutex_unlock(&hc->lock);
+}
+
+/**
+ * @brief One file of a directory ingest, in walk order
+ */
+typedef struct {
+  char *path;       // relative to the root directory
+  FINGERPRINT *fp;  // result, NULL if the file could not be hashed
+  long cached;      // cache entry of the file, -1 if it has to be hashed
+  CACHE_KEY key;    // identity of the file when it was opened for hashing
+  int done;
+} ingest_slot_t;
+
+/**
+ * @brief Shared state of a directory ingest
+ * @note The walking thread queues files in a bounded ring; hashing threads
+ *       claim them in order and the walking thread commits finished files to
+ *       the list in walk order, so the result does not depend on the number
+ *       of threads.
+ * @note Cache lookups and inserts happen on the walking thread only; files
+ *       found in the cache are queued as finished and never hashed.
+ */
+typedef struct {
+  FINGERPRINT_STORE *fpl;
+  hash_cache_t *cache;
+  int root; // directory fd every path is relative to
+  int recursive;
+  const char **extensions;
+  size_t extension_count;
+  long added;
+
+  int threaded;
+  ingest_slot_t *slots;
+  size_t capacity;
+  size_t head;  // next file to commit
+  size_t next;  // next file to hash
+  size_t tail;  // number of files queued
+  int closed;   // the walk is finished
+  pthread_mutex_t lock;
+  pthread_cond_t queued;
+  pthread_cond_t hashed;
+} ingest_t;
+
+/**
+ * @brief Hash one file of an ingest
+ * @param root Directory fd the path is relative to
+ * @param path Relative path of the file
+ * @param key Receives the identity of the file as it was opened
+ * @return New fingerprint labelled with the file name, or NULL on error
+ */
+static FINGERPRINT *
+ingest_hash(int root, const char *path, CACHE_KEY *key) {
+  int fd = openat(root, path, O_RDONLY | O_CLOEXEC);
+  if (fd < 0)
+    return NULL;
+
+  struct stat st;
+  FILE *file = fstat(fd, &st) == 0 ? fdopen(fd, "rb") : NULL;
+  if (!file) {
+    close(fd);
+    return NULL;
+  }
+  *key = cache_key_from_stat(&st);
+
+  const char *name = strrchr(path, '/');
+  FINGERPRINT *fp = init_empty_fingerprint();
+  snprintf(fp->file_name, sizeof(fp->file_name), "%s", name ? name + 1 : path);
+  fp->filesize = find_file_size(file);
+  hashFileToFingerprint(fp, file);
+  fclose(file);
+  return fp;
+}
+
+/**
+ * @brief Add a hashed or cached file to the list and remember new hashes
+ * @note Takes ownership of the slot's fingerprint and path
+ */
+static void
+ingest_add(ingest_t *job, ingest_slot_t *slot) {
+  if (slot->cached >= 0) {
+    const char *name = strrchr(slot->path, '/');
+    if (hc_copy(job->cache, slot->cached, job->fpl, name ? name + 1 : slot->path) >= 0)
+      job->added++;
+  } else if (slot->fp) {
+    fpl_take(job->fpl, slot->fp);
+    job->added++;
+    if (job->cache)
+      hc_insert(job->cache, &slot->key, job->fpl, job->fpl->size - 1);
+  }
+  free(slot->path);
+}
+
+/**
+ * @brief Append the next finished file to the list
+ * @note Called with the lock held in threaded mode; the lock is dropped
+ *       while the fingerprint is copied into the list
+ */
+static void
+ingest_commit(ingest_t *job) {
+  ingest_slot_t slot = job->slots[job->head % job->capacity];
+  job->head++;
+
+  if (job->threaded)
+    pthread_mutex_unlock(&job->lock);
+
+  ingest_add(job, &slot);
+
+  if (job->threaded)
+    pthread_mutex_lock(&job->lock);
+}
+
+/**
+ * @brief Queue a file found by the walk; takes ownership of path
+ * @param job Ingest state
+ * @param path Path of the file relative to the root
+ * @param cached Cache entry of the file, or -1 if it has to be hashed
+ */
+static void
+ingest_push(ingest_t *job, char *path, long cached) {
+  if (!job->threaded) {
+    ingest_slot_t slot = {path, NULL, cached};
+    if (cached < 0)
+      slot.fp = ingest_hash(job->root, path, &slot.key);
+    ingest_add(job, &slot);
+    return;
+  }
+
+  pthread_mutex_lock(&job->lock);
+  // wait for room in the queue, committing finished files meanwhile
+  while (job->tail - job->head == job->capacity) {
+    if (job->slots[job->head % job->capacity].done)
+      ingest_commit(job);
+    else
+      pthread_cond_wait(&job->hashed, &job->lock);
+  }
+
+  ingest_slot_t *slot = &job->slots[job->tail % job->capacity];
+  slot->path = path;
+  slot->fp = NULL;
+  slot->cached = cached;
+  slot->done = cached >= 0;
+  job->tail++;
+  if (!slot->done)
+    pthread_cond_signal(&job->queued);
+  pthread_mutex_unlock(&job->lock);
+}
+
+/**
+ * @brief Hashing thread: hash queued files until the walk is finished
+ * @param arg Pointer to the shared ingest_t
+ */
+static void *
+ingest_worker(void *arg) {
+  ingest_t *job = (ingest_t *)arg;
+
+  pthread_mutex_lock(&job->lock);
+  for (;;) {
+    while (job->next == job->tail && !job->closed)
+      pthread_cond_wait(&job->queued, &job->lock);
+    if (job->next == job->tail)
+      break;
+
+    ingest_slot_t *slot = &job->slots[job->next++ % job->capacity];
+    if (slot->done)
+      continue;
+    pthread_mutex_unlock(&job->lock);
+
+    CACHE_KEY key;
+    FINGERPRINT *fp = ingest_hash(job->root, slot->path, &key);
+
+    pthread_mutex_lock(&job->lock);
+    slot->fp = fp;
+    slot->key = key;
+    slot->done = 1;
+    pthread_cond_broadcast(&job->hashed);
+  }
+  pthread_mutex_unlock(&job->lock);
+  return NULL;
+}
+
+/**
+ * @brief Check a file name against the extension filter
+ * @return Non-zero if the lower-cased suffix (".exe") is one of the extensions
+ */
+static int
+ingest_match(const ingest_t *job, const char *name) {
+  if (!job->extensions)
+    return 1;
+
+  // same rule as pathlib's suffix: a leading or trailing dot is no suffix
+  const char *dot = strrchr(name, '.');
+  if (!dot || dot == name || dot[1] == '\0')
+    return 0;
+
+  char suffix[256];
+  size_t i;
+  for (i = 0; dot[i] && i < sizeof(suffix) - 1; i++)
+    suffix[i] = (char)tolower((unsigned char)dot[i]);
+  suffix[i] = '\0';
+
+  for (size_t e = 0; e < job->extension_count; e++) {
+    if (job->extensions[e] && strcmp(job->extensions[e], suffix) == 0)
+      return 1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Join a relative directory path and an entry name
+ * @return Allocated path, or NULL on allocation failure
+ */
+static char *
+ingest_join(const char *prefix, const char *name) {
+  size_t prefix_len = prefix ? strlen(prefix) : 0;
+  size_t name_len = strlen(name);
+  char *path = malloc(prefix_len + name_len + 2);
+  if (!path)
+    return NULL;
+
+  if (prefix_len) {
+    memcpy(path, prefix, prefix_len);
+    path[prefix_len++] = '/';
+  }
+  memcpy(path + prefix_len, name, name_len + 1);
+  return path;
+}
+
+/**
+ * @brief Walk a directory and queue every regular file
+ * @param job Ingest state
+ * @param fd Open directory fd, closed when the walk returns
+ * @param prefix Path of the directory relative to the root ("" for the root)
+ * @note Files and subdirectories are visited in readdir order, depth first;
+ *       symbolic links to files are followed, links to directories are not
+ * @note With a cache every file is stat'ed to look it up, without one the
+ *       entry type from readdir is enough for most files
+ */
+static void
+ingest_walk(ingest_t *job, int fd, const char *prefix) {
+  DIR *dir = fdopendir(fd);
+  if (!dir) {
+    close(fd);
+    return;
+  }
+
+  struct dirent *ent;
+  while ((ent = readdir(dir)) != NULL) {
+    if (strcmp(ent->d_name, ".") == 0 || strcmp(ent->d_name, "..") == 0)
+      continue;
+
+    int is_reg = ent->d_type == DT_REG;
+    int is_sub = ent->d_type == DT_DIR;
+    struct stat st;
+    int have_stat = 0;
+    if (ent->d_type == DT_UNKNOWN || ent->d_type == DT_LNK || (is_reg && job->cache)) {
+      if (fstatat(dirfd(dir), ent->d_name, &st, 0) != 0)
+        continue;
+      have_stat = 1;
+      is_reg = S_ISREG(st.st_mode);
+      is_sub = ent->d_type == DT_UNKNOWN && S_ISDIR(st.st_mode);
+    }
+
+    if (is_reg && ingest_match(job, ent->d_name)) {
+      long cached = -1;
+      if (job->cache && have_stat) {
+        CACHE_KEY key = cache_key_from_stat(&st);
+        cached = hc_lookup(job->cache, &key);
+      }
+
+      char *path = ingest_join(prefix, ent->d_name);
+      if (path)
+        ingest_push(job, path, cached);
+    } else if (is_sub && job->recursive) {
+      char *path = ingest_join(prefix, ent->d_name);
+      int sub = openat(dirfd(dir), ent->d_name, O_RDONLY | O_DIRECTORY | O_NOFOLLOW | O_CLOEXEC);
+      if (path && sub >= 0)
+        ingest_walk(job, sub, path);
+      else if (sub >= 0)
+        close(sub);
+      free(path);
+    }
+  }
+  closedir(dir);
+}
+
+/**
+ * @brief Hash every file below a directory into a fingerprint list
+ * @param fpl Fingerprint list to add to
+ * @param path Directory to walk
+ * @param recursive Non-zero to descend into subdirectories
+ * @param extensions Lower-case suffixes to include (e.g. ".exe"), or NULL for all files
+ * @param extension_count Number of entries in extensions
+ * @param workers Number of hashing threads, 0 or less for one per online CPU
+ * @param queue_size Maximum number of files in flight, 0 or less for 4 per worker
+ * @param cache Fingerprint cache to consult and fill, or NULL
+ * @return Number of files added, or -1 if the directory cannot be opened
+ * @note Entries are labelled with their file name and added in walk order
+ *       for any number of workers; unreadable files are skipped
+ * @note The process working directory is never changed
+ */
+long
+fpl_ingest(FINGERPRINT_STORE *fpl, const char *path, int recursive, const char **extensions,
+           size_t extension_count, int workers, int queue_size, hash_cache_t *cache) {
+  if (!fpl || !path)
+    return -1;
+
+  int root = open(path, O_RDONLY | O_DIRECTORY | O_CLOEXEC);
+  if (root < 0)
+    return -1;
+
+  // the walk gets its own descriptor, the root one stays open for the workers
+  int walk = dup(root);
+  if (walk < 0) {
+    close(root);
+    return -1;
+  }
+
+  if (workers <= 0) {
+    long online = sysconf(_SC_NPROCESSORS_ONLN);
+    workers = online > 0 ? (int)online : 1;
+  }
+
+  ingest_t job = {0};
+  job.fpl = fpl;
+  job.cache = cache;
+  job.root = root;
+  job.recursive = recursive;
+  job.extensions = extensions;
+  job.extension_count = extension_count;
+
+  pthread_t *threads = NULL;
+  size_t started = 0;
+  if (workers > 1) {
+    job.capacity = queue_size > 0 ? (size_t)queue_size : 4 * (size_t)workers;
+    job.slots = calloc(job.capacity, sizeof(ingest_slot_t));
+    threads = malloc(workers * sizeof(pthread_t));
+    if (job.slots && threads) {
+      job.threaded = 1;
+      pthread_mutex_init(&job.lock, NULL);
+      pthread_cond_init(&job.queued, NULL);
+      pthread_cond_init(&job.hashed, NULL);
+      while (started < (size_t)workers &&
+             pthread_create(&threads[started], NULL, ingest_worker, &job) == 0)
+        started++;
+    }
+    // without any hashing thread the walk hashes the files itself
+    if (started == 0)
+      job.threaded = 0;
+  }
+
+  ingest_walk(&job, walk, "");
+
+  if (job.threaded) {
+    pthread_mutex_lock(&job.lock);
+    job.closed = 1;
+    pthread_cond_broadcast(&job.queued);
+    while (job.head < job.tail) {
+      if (job.slots[job.head % job.capacity].done)
+        ingest_commit(&job);
+      else
+        pthread_cond_wait(&job.hashed, &job.lock);
+    }
+    pthread_mutex_unlock(&job.lock);
+
+    for (size_t t = 0; t < started; t++)
+      pthread_join(threads[t], NULL);
+    pthread_mutex_destroy(&job.lock);
+    pthread_cond_destroy(&job.queued);
+    pthread_cond_destroy(&job.hashed);
+  }
+
+  free(threads);
+  free(job.slots);
+  close(root);
+  return job.added;
+}
+
+/**
+ * @brief Add all files from a path (file or directory) to fingerprint list
+ * @param fpl Fingerprint list to add to
+ * @param filename Path to file or directory
+ * @param label Optional label for a single file (can be NULL)
+ * @param recursive Non-zero to descend into the subdirectories of a directory
+ * @param cache Fingerprint cache to consult and fill, or NULL
+ * @note Files of a directory are labelled with their file name
+ */
+void
+fpl_add_path(FINGERPRINT_STORE *fpl, char *filename, const char *label, int recursive,
+             hash_cache_t *cache) {
+  // in case of a dir
+  if (is_dir(filename)) {
+    fpl_ingest(fpl, filename, recursive, NULL, 0, 1, 0, cache);
+  }
+
+  // in case we we have only a file
+  else if (is_file(filename)) {
+    struct stat st;
+    if (!cache || stat(filename, &st) != 0) {
+      fpl_take(fpl, fp_init_file(filename, label));
+      return;
+    }
+
+    CACHE_KEY key = cache_key_from_stat(&st);
+    long cached = hc_lookup(cache, &key);
+    if (cached >= 0) {
+      hc_copy(cache, cached, fpl, label ? label : filename);
+    } else {
+      fpl_take(fpl, fp_init_file(filename, label));
+      hc_insert(cache, &key, fpl, fpl->size - 1);
+    }
+  }
+}
+
+/**
+ * @brief Add raw bytes as a fingerprint to the list
+ * @param fpl Fingerprint list to add to
+ * @param byte_buffer Raw bytes to hash
+ * @param bytes_size Size of byte buffer
+ * @param label Label to assign to this fingerprint entry
+ * @param packet Hash the bytes as a network packet, see fp_hash_bytes()
+ */
+void
+fpl_add_bytes(FINGERPRINT_STORE *fpl, unsigned char *byte_buffer, unsigned long bytes_size,
+              const char *label, bool packet) {
+  fpl_take(fpl, fp_init_bytes(byte_buffer, bytes_size, label, packet));
+  return;
+}
+
+// Buffers hashed before their fingerprints are added to the list; bounds
+// the fingerprints held at once by fpl_add_many()
+#define ADD_MANY_WINDOW 4096
+
+/**
+ * @brief Shared state of one window of fpl_add_many()
+ */
+typedef struct {
+  const unsigned char *const *buffers;
+  const size_t *sizes;
+  const char *const *labels;
+  FINGERPRINT **fps; // result per buffer of the window
+  size_t first;      // first buffer of the window
+  size_t count;      // buffers in the window
+  size_t next;       // claimed atomically by the workers
+  bool packet;       // hash the buffers as network packets
+} add_many_job_t;
+
+/**
+ * @brief Worker loop: hash buffers of the window until none is left
+ * @param arg Pointer to the shared add_many_job_t
+ */
+static void *
+add_many_worker(void *arg) {
+  add_many_job_t *job = (add_many_job_t *)arg;
+
+  for (;;) {
+    size_t i = __atomic_fetch_add(&job->next, 1, __ATOMIC_RELAXED);
+    if (i >= job->count)
+      break;
+
+    size_t k = job->first + i;
+    FINGERPRINT *fp = init_empty_fingerprint();
+    if (fp) {
+      const char *label = job->labels && job->labels[k] ? job->labels[k] : "n/a";
+      snprintf(fp->file_name, sizeof(fp->file_name), "%s", label);
+      fp->filesize = job->sizes[k];
+      fp_hash_bytes(fp, (unsigned char *)job->buffers[k], job->sizes[k], job->packet);
+    }
+    job->fps[i] = fp;
+  }
+  return NULL;
+}
+
+/**
+ * @brief Hash many buffers into a fingerprint list in one call
+ * @param fpl Fingerprint list to add to
+ * @param buffers Start of every buffer
+ * @param sizes Size of every buffer
+ * @param labels Label of every buffer, or NULL to label them all "n/a"
+ * @param count Number of buffers
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @param packet Hash the buffers as network packets, see fp_hash_bytes()
+ * @return Number of fingerprints added, or -1 on allocation failure
+ * @note Buffers are hashed a window at a time across the threads and added
+ *       in their original order, so the list is the same for any number of workers
+ */
+long
+fpl_add_many(FINGERPRINT_STORE *fpl, const unsigned char *const *buffers, const size_t *sizes,
+             const char *const *labels, size_t count, int workers, bool packet) {
+  if (!fpl || (count && (!buffers || !sizes)))
+    return -1;
+
+  if (workers <= 0) {
+    long online = sysconf(_SC_NPROCESSORS_ONLN);
+    workers = online > 0 ? (int)online : 1;
+  }
+
+  size_t window = MIN(count, ADD_MANY_WINDOW);
+  FINGERPRINT **fps = malloc(MAX(window, 1) * sizeof(FINGERPRINT *));
+  size_t nthreads = MIN((size_t)workers, MAX(window, 1)) - 1;
+  pthread_t *threads = nthreads ? malloc(nthreads * sizeof(pthread_t)) : NULL;
+  if (!fps) {
+    free(threads);
+    return -1;
+  }
+
+  add_many_job_t job = {buffers, sizes, labels, fps};
+  job.packet = packet;
+  long added = 0;
+  for (size_t first = 0; first < count; first += window) {
+    job.first = first;
+    job.count = MIN(window, count - first);
+    job.next = 0;
+
+    size_t started = 0;
+    while (threads && started < nthreads &&
+           pthread_create(&threads[started], NULL, add_many_worker, &job) == 0)
+      started++;
+    add_many_worker(&job);
+    for (size_t t = 0; t < started; t++)
+      pthread_join(threads[t], NULL);
+
+    for (size_t i = 0; i < job.count; i++) {
+      if (fps[i]) {
+        fpl_take(fpl, fps[i]);
+        added++;
+      }
+    }
+  }
+
+  free(threads);
+  free(fps);
+  return added;
+}
+
+/**
+ * @brief Hash the slices of one concatenated buffer into a fingerprint list
+ * @param fpl Fingerprint list to add to
+ * @param data Concatenated buffers
+ * @param size Size of data
+ * @param offsets count + 1 ascending offsets; slice i is data[offsets[i]:offsets[i + 1]]
+ * @param count Number of slices
+ * @param labels Label of every slice, or NULL to label them all "n/a"
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @param packet Hash the slices as network packets, see fp_hash_bytes()
+ * @return Number of fingerprints added, or -1 on error (errno is EINVAL for
+ *         offsets that are not ascending or point past the data)
+ * @see fpl_add_many()
+ */
+long
+fpl_add_concat(FINGERPRINT_STORE *fpl, const unsigned char *data, size_t size, const uint64_t *offsets,
+               size_t count, const char *const *labels, int workers, bool packet) {
+  if (!fpl || (count && (!data || !offsets))) {
+    errno = EINVAL;
+    return -1;
+  }
+
+  for (size_t i = 0; i < count; i++) {
+    if (offsets[i] > offsets[i + 1] || offsets[i + 1] > size) {
+      errno = EINVAL;
+      return -1;
+    }
+  }
+
+  const unsigned char **buffers = malloc(MAX(count, 1) * sizeof(unsigned char *));
+  size_t *sizes = malloc(MAX(count, 1) * sizeof(size_t));
+  if (!buffers || !sizes) {
+    free(buffers);
+    free(sizes);
+    errno = ENOMEM;
+    return -1;
+  }
+
+  for (size_t i = 0; i < count; i++) {
+    buffers[i] = data + offsets[i];
+    sizes[i] = (size_t)(offsets[i + 1] - offsets[i]);
+  }
+
+  long added = fpl_add_many(fpl, buffers, sizes, labels, count, workers, packet);
+  if (added < 0)
+    errno = ENOMEM;
+
+  free(buffers);
+  free(sizes);
+  return added;
+}
+
+/**
+ * @brief Upper bound of the digest length of a list entry, without the NUL
+ */
+static size_t
+entry_str_len(FINGERPRINT_STORE *fpl, const STORE_ENTRY *entry) {
+  size_t meta = strlen(STORE_NAME(fpl, entry)) + 64;           // filename + ints + colons
+  return meta + (size_t)entry->filter_count * FILTERSIZE * 2; // 2 hex chars per byte
+}
+
+/**
+ * @brief Write the digest of a list entry
+ * @param fpl Fingerprint list
+ * @param entry Entry of the list
+ * @param out Destination buffer
+ * @param room Size of out, at least entry_str_len() + 1
+ * @return Number of characters written, or -1 if out is too small
+ */
+static long
+entry_str_write(FINGERPRINT_STORE *fpl, const STORE_ENTRY *entry, char *out, size_t room) {
+  // metadata header
+  int n = snprintf(out, room, "%s:%llu:%u:%u:", STORE_NAME(fpl, entry),
+                   (unsigned long long)entry->filesize, entry->filter_count, entry->last_blocks);
+  if (n < 0 || (size_t)n >= room)
+    return -1;
+
+  // bloom-filter bytes as hex, the filters of an entry are contiguous
+  size_t filter_bytes = (size_t)entry->filter_count * FILTERSIZE;
+  if ((size_t)n + filter_bytes * 2 >= room)
+    return -1;
+  hex_encode(STORE_FILTER(fpl, entry->filter_offset), filter_bytes, out + n);
+  out[n + filter_bytes * 2] = '\0';
+  return (long)(n + filter_bytes * 2);
+}
+
+/**
+ * @brief Convert entire fingerprint list to string representation
+ * @param fpl Fingerprint list to convert
+ * @return Allocated string containing all fingerprints separated by newlines, or NULL on error
+ * @note Each line follows format: "filename:filesize:bf_count:blocks:HEXDATA"
+ * @note Removed fingerprints are left out
+ * @note Caller must free returned string with str_free()
+ */
+char *
+fpl_str(FINGERPRINT_STORE *fpl) {
+  if (!fpl || STORE_LIVE(fpl) == 0)
+    return NULL;
+
+  // estimate total length
+  size_t total_len = 0;
+  for (size_t i = 0; i < fpl->size; i++) {
+    if (!STORE_DELETED(&fpl->entries[i]))
+      total_len += entry_str_len(fpl, &fpl->entries[i]) + 1; // +1 for newline or final NUL
+  }
+
+  char *result = calloc(1, total_len + 1); // +1 for final NUL
+  if (!result)
+    return NULL;
+
+  // fill buffer, with a newline between entries
+  size_t pos = 0;
+  for (size_t i = 0; i < fpl->size; i++) {
+    STORE_ENTRY *entry = &fpl->entries[i];
+    if (STORE_DELETED(entry))
+      continue;
+    if (pos > 0)
+      result[pos++] = '\n';
+
+    long n = entry_str_write(fpl, entry, result + pos, total_len + 1 - pos);
+    if (n < 0) {
+      free(result);
+      return NULL;
+    }
+    pos += (size_t)n;
+  }
+
+  result[pos] = '\0';
+  return result;
+}
+
+/**
+ * @brief Convert one fingerprint of a list to its string representation
+ * @param fpl Fingerprint list
+ * @param index Position of the fingerprint
+ * @return Allocated string in the format of fp_str(), or NULL if the
+ *         position holds no fingerprint or on allocation failure
+ * @note Caller must free returned string with str_free()
+ */
+char *
+fpl_entry_str(FINGERPRINT_STORE *fpl, size_t index) {
+  if (!fpl_live(fpl, index))
+    return NULL;
+
+  STORE_ENTRY *entry = &fpl->entries[index];
+  size_t room = entry_str_len(fpl, entry) + 1;
+  char *result = malloc(room);
+  if (result && entry_str_write(fpl, entry, result, room) < 0) {
+    free(result);
+    return NULL;
+  }
+  return result;
+}
+
+/**
+ * @brief Compare one fingerprint of a list with one of another list
+ * @param fpl1 First list
+ * @param i Position in fpl1
+ * @param fpl2 Second list, may be fpl1
+ * @param j Position in fpl2
+ * @param file_comparison Score relative to the larger fingerprint
+ * @return Similarity score 0-100, or -1 if a position holds no fingerprint
+ */
+int
+fpl_entry_compare(FINGERPRINT_STORE *fpl1, size_t i, FINGERPRINT_STORE *fpl2, size_t j,
+                  bool file_comparison) {
+  if (!fpl_live(fpl1, i) || !fpl_live(fpl2, j))
+    return -1;
+  return fingerprintStore_compare(fpl1, i, fpl2, j, file_comparison);
+}
+
+/**
+ * @brief Compare one fingerprint of a list with a fingerprint
+ * @param fpl List
+ * @param i Position in fpl
+ * @param fp Fingerprint
+ * @param file_comparison Score relative to the larger fingerprint
+ * @return Similarity score 0-100, or -1 if the position holds no
+ *         fingerprint or on allocation failure
+ */
+int
+fpl_entry_compare_fp(FINGERPRINT_STORE *fpl, size_t i, FINGERPRINT *fp, bool file_comparison) {
+  if (!fpl_live(fpl, i))
+    return -1;
+
+  // empty fingerprints score 0, as in fp_compare()
+  if (!fp->bf_list)
+    return 0;
+
+  FINGERPRINT_STORE *other = init_empty_fingerprintStore();
+  if (!other || add_fingerprint_to_store(other, fp) < 0) {
+    fingerprintStore_destroy(other);
+    return -1;
+  }
+  int score = fingerprintStore_compare(fpl, i, other, 0, file_comparison);
+  fingerprintStore_destroy(other);
+  return score;
+}
+
+/**
+ * @brief Free a string allocated by fp_str() or fpl_str()
+ * @param str String to free
+ * @note Safe to call with NULL pointer
+ */
+void
+str_free(char *str) {
+  if (str != NULL) {
+    free(str);
+  }
+}
+
+/**
+ * @brief Compare fingerprint similarity score between two fingerprints
+ * @param fp1 First fingerprint to compare
+ * @param fp2 Second fingerprint to compare
+ * @param file_comparison Score relative to the larger fingerprint instead of the smaller one
+ * @return Similarity score as uint8_t (0-100)
+ */
+uint8_t
+fp_compare(FINGERPRINT *fp1, FINGERPRINT *fp2, bool file_comparison) {
+  return (uint8_t)fingerprint_compare(fp1, fp2, file_comparison);
+}
+
+/**
+ * @brief Results produced by a single comparison task
+ * @note With a top-k limit the list is a heap holding the k best matches,
+ *       worst match at the root, once it is full
+ */
+typedef struct {
+  compare_t *list;
+  size_t size;
+  size_t capacity;
+} cl_chunk_t;
+
+/**
+ * @brief Shared state of one (possibly multi-threaded) comparison run
+ * @note The pair space is cut into tasks of (row, column block). Every task
+ *       writes to its own chunk, and chunks are concatenated in task order,
+ *       so the result order never depends on the number of threads.
+ */
+typedef struct {
+  FINGERPRINT_STORE *rows;
+  size_t first_row; // rows first_row .. first_row + nrows - 1 are compared
+  size_t nrows;
+  FINGERPRINT_STORE *cols;
+  size_t ncols;
+  int triangular; // only compare row i against columns j > i
+  uint8_t threshold;
+  size_t top_k; // best matches to keep per row, 0 keeps every match
+  bool file_comparison;
+
+  size_t blocks_per_row;
+  size_t block_width;
+  size_t ntasks;
+  size_t next_task; // claimed atomically by the workers
+  int failed;
+
+  cl_chunk_t *chunks;
+} cl_job_t;
+
+/**
+ * @brief Append a match to a task chunk, growing it when needed
+ * @return 0 on success, -1 on allocation failure
+ */
+static int
+cl_chunk_push(cl_chunk_t *chunk, char *name1, char *name2, uint8_t score, size_t index1,
+              size_t index2) {
+  if (chunk->size == chunk->capacity) {
+    size_t capacity = chunk->capacity ? chunk->capacity * 2 : 16;
+    compare_t *list = realloc(chunk->list, capacity * sizeof(compare_t));
+    if (!list)
+      return -1;
+    chunk->list = list;
+    chunk->capacity = capacity;
+  }
+
+  chunk->list[chunk->size].name1 = name1;
+  chunk->list[chunk->size].name2 = name2;
+  chunk->list[chunk->size].score = score;
+  chunk->list[chunk->size].index1 = index1;
+  chunk->list[chunk->size].index2 = index2;
+  chunk->size++;
+  return 0;
+}
+
+/**
+ * @brief Order of matches within a row: higher score first, then lower column
+ * @return Negative if a ranks before b, positive if after
+ */
+static int
+cl_rank(const compare_t *a, const compare_t *b) {
+  if (a->score != b->score)
+    return a->score > b->score ? -1 : 1;
+  return (a->index2 > b->index2) - (a->index2 < b->index2);
+}
+
+static int
+cl_rank_qsort(const void *a, const void *b) {
+  return cl_rank((const compare_t *)a, (const compare_t *)b);
+}
+
+/**
+ * @brief Restore the heap property below position i (worst match at the root)
+ */
+static void
+cl_heap_sift(compare_t *heap, size_t size, size_t i) {
+  for (;;) {
+    size_t worst = i, left = 2 * i + 1, right = left + 1;
+    if (left < size && cl_rank(&heap[left], &heap[worst]) > 0)
+      worst = left;
+    if (right < size && cl_rank(&heap[right], &heap[worst]) > 0)
+      worst = right;
+    if (worst == i)
+      return;
+
+    compare_t tmp = heap[i];
+    heap[i] = heap[worst];
+    heap[worst] = tmp;
+    i = worst;
+  }
+}
+
+/**
+ * @brief Offer a match to a chunk that keeps only the k best matches
+ * @return 0 on success, -1 on allocation failure
+ * @note Matches are offered in ascending column order, so a match that ties
+ *       with the worst kept one ranks after it and is dropped
+ */
+static int
+cl_chunk_offer(cl_chunk_t *chunk, size_t k, char *name1, char *name2, uint8_t score, size_t index1,
+               size_t index2) {
+  if (chunk->size < k) {
+    if (cl_chunk_push(chunk, name1, name2, score, index1, index2) != 0)
+      return -1;
+    if (chunk->size == k) {
+      for (size_t i = k / 2; i-- > 0;)
+        cl_heap_sift(chunk->list, k, i);
+    }
+    return 0;
+  }
+
+  if (score <= chunk->list[0].score)
+    return 0;
+
+  compare_t *root = &chunk->list[0];
+  root->name1 = name1;
+  root->name2 = name2;
+  root->score = score;
+  root->index1 = index1;
+  root->index2 = index2;
+  cl_heap_sift(chunk->list, k, 0);
+  return 0;
+}
+
+/**
+ * @brief Lowest score a new match of a chunk needs to be kept
+ */
+static int
+cl_chunk_floor(const cl_chunk_t *chunk, size_t k, uint8_t threshold) {
+  if (k && chunk->size == k)
+    return MAX((int)threshold, chunk->list[0].score + 1);
+  return threshold;
+}
+
+/**
+ * @brief Worker loop: claim tasks until the pair space is exhausted
+ * @param arg Pointer to the shared cl_job_t
+ */
+static void *
+cl_job_worker(void *arg) {
+  cl_job_t *job = (cl_job_t *)arg;
+
+  for (;;) {
+    size_t task = __atomic_fetch_add(&job->next_task, 1, __ATOMIC_RELAXED);
+    if (task >= job->ntasks || __atomic_load_n(&job->failed, __ATOMIC_RELAXED))
+      break;
+
+    size_t row = job->first_row + task / job->blocks_per_row;
+    size_t start = (task % job->blocks_per_row) * job->block_width;
+    size_t end = MIN(start + job->block_width, job->ncols);
+    // the best matches of a row are looked for among all other columns
+    if (job->triangular && !job->top_k && start <= row)
+      start = row + 1;
+
+    char *name1 = STORE_NAME(job->rows, &job->rows->entries[row]);
+    cl_chunk_t *chunk = &job->chunks[task];
+    for (size_t j = start; j < end; j++) {
+      if (job->triangular && j == row)
+        continue;
+
+      int floor = cl_chunk_floor(chunk, job->top_k, job->threshold);
+      int score = fingerprintStore_compare_min(job->rows, row, job->cols, j, floor,
+                                               job->file_comparison);
+      if (score < floor)
+        continue;
+
+      char *name2 = STORE_NAME(job->cols, &job->cols->entries[j]);
+      int err = job->top_k
+                    ? cl_chunk_offer(chunk, job->top_k, name1, name2, (uint8_t)score, row, j)
+                    : cl_chunk_push(chunk, name1, name2, (uint8_t)score, row, j);
+      if (err != 0) {
+        __atomic_store_n(&job->failed, 1, __ATOMIC_RELAXED);
+        return NULL;
+      }
+    }
+  }
+  return NULL;
+}
+
+/**
+ * @brief Run a comparison job over a range of rows on a number of native threads
+ * @param rows Fingerprints used as the first operand (name1)
+ * @param first_row First row to compare
+ * @param nrows Number of rows to compare, at least one
+ * @param cols Fingerprints used as the second operand (name2)
+ * @param triangular Non-zero when rows and cols are the same list: row i is
+ *        compared only against columns j > i, or against every j != i with
+ *        a top-k limit
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep per row, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of threads to use, 0 or less for one per online CPU
+ * @return Allocated compare_list_t in row-major order, or NULL on error;
+ *         with a top-k limit the matches of a row are ordered best first
+ * @note Pairs that cannot reach the threshold, or the worst kept match of a
+ *       full top-k heap, are abandoned before they are fully scored
+ * @note The calling thread takes part in the work; when a thread cannot be
+ *       started, the remaining threads simply pick up its share
+ */
+static compare_list_t *
+cl_run_rows(FINGERPRINT_STORE *rows, size_t first_row, size_t nrows, FINGERPRINT_STORE *cols,
+            int triangular, uint8_t threshold, size_t top_k, bool file_comparison, int workers) {
+  size_t ncols = cols->size;
+
+  if (workers <= 0) {
+    long online = sysconf(_SC_NPROCESSORS_ONLN);
+    workers = online > 0 ? (int)online : 1;
+  }
+
+  cl_job_t job = {0};
+  job.rows = rows;
+  job.first_row = first_row;
+  job.nrows = nrows;
+  job.cols = cols;
+  job.ncols = ncols;
+  job.triangular = triangular;
+  job.threshold = threshold;
+  job.top_k = top_k;
+  job.file_comparison = file_comparison;
+
+  // aim for a few tasks per worker so uneven rows still balance out
+  job.blocks_per_row = MAX(1, (4 * (size_t)workers + nrows - 1) / nrows);
+  job.blocks_per_row = MIN(job.blocks_per_row, MAX(1, ncols));
+  job.block_width = (ncols + job.blocks_per_row - 1) / job.blocks_per_row;
+  job.ntasks = nrows * job.blocks_per_row;
+
+  job.chunks = calloc(job.ntasks, sizeof(cl_chunk_t));
+  if (!job.chunks)
+    return NULL;
+
+  size_t nthreads = MIN((size_t)workers, job.ntasks) - 1;
+  pthread_t *threads = NULL;
+  size_t started = 0;
+  if (nthreads > 0 && (threads = malloc(nthreads * sizeof(pthread_t)))) {
+    while (started < nthreads &&
+           pthread_create(&threads[started], NULL, cl_job_worker, &job) == 0)
+      started++;
+  }
+
+  cl_job_worker(&job);
+  for (size_t t = 0; t < started; t++)
+    pthread_join(threads[t], NULL);
+  free(threads);
+
+  compare_list_t *cl = NULL;
+  size_t total = 0;
+  for (size_t t = 0; t < job.ntasks; t++)
+    total += job.chunks[t].size;
+
+  if (!job.failed && (cl = malloc(sizeof(compare_list_t)))) {
+    cl->list = malloc(MAX(total, 1) * sizeof(compare_t));
+    if (cl->list) {
+      size_t count = 0;
+      for (size_t t = 0; t < job.ntasks; t++) {
+        memcpy(cl->list + count, job.chunks[t].list, job.chunks[t].size * sizeof(compare_t));
+        count += job.chunks[t].size;
+
+        // merge the heaps of the column blocks of a row into its k best
+        if (top_k && (t + 1) % job.blocks_per_row == 0) {
+          size_t row_size = 0;
+          for (size_t b = t + 1 - job.blocks_per_row; b <= t; b++)
+            row_size += job.chunks[b].size;
+
+          compare_t *row_list = cl->list + count - row_size;
+          qsort(row_list, row_size, sizeof(compare_t), cl_rank_qsort);
+          count -= row_size - MIN(row_size, top_k);
+        }
+      }
+      cl->size = count;
+    } else {
+      free(cl);
+      cl = NULL;
+    }
+  }
+
+  for (size_t t = 0; t < job.ntasks; t++)
+    free(job.chunks[t].list);
+  free(job.chunks);
+  return cl;
+}
+
+/**
+ * @brief Run a comparison job over all rows, see cl_run_rows()
+ */
+static compare_list_t *
+cl_run(FINGERPRINT_STORE *rows, FINGERPRINT_STORE *cols, int triangular, uint8_t threshold,
+       size_t top_k, bool file_comparison, int workers) {
+  return cl_run_rows(rows, 0, rows->size, cols, triangular, threshold, top_k, file_comparison,
+                     workers);
+}
+
+/**
+ * @brief Compare every fingerprint with every other fingerprint in a list
+ * @param fpl Fingerprint list to process
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep per fingerprint, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated compare_list_t containing all matches above threshold, or NULL on error
+ * @note Avoids duplicate comparisons (A vs B, but not B vs A); with a top-k
+ *       limit every fingerprint is matched against all others instead
+ * @note Result order is the same for any number of workers
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fpl_all(FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k, bool file_comparison,
+           int workers) {
+  if (!fpl || fpl->size == 0)
+    return NULL;
+
+  return cl_run(fpl, fpl, 1, threshold, top_k, file_comparison, workers);
+}
+
+/**
+ * @brief Compare every fingerprint in first list against every fingerprint in second list
+ * @param fpl1 First fingerprint list
+ * @param fpl2 Second fingerprint list
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep per fingerprint of fpl1, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated compare_list_t containing all cross-matches above threshold, or NULL on error
+ * @note Performs full cross-product comparison (size1 * size2 comparisons)
+ * @note Result order is the same for any number of workers
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fpl_vs_fpl(FINGERPRINT_STORE *fpl1, FINGERPRINT_STORE *fpl2, uint8_t threshold, size_t top_k,
+              bool file_comparison, int workers) {
+  if (!fpl1 || !fpl2 || fpl1->size == 0 || fpl2->size == 0)
+    return NULL;
+
+  return cl_run(fpl1, fpl2, 0, threshold, top_k, file_comparison, workers);
+}
+
+/**
+ * @brief Compare one fingerprint against all fingerprints in a list
+ * @param target Single fingerprint to compare against the list
+ * @param fpl Fingerprint list to compare against
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated compare_list_t containing all matches above threshold, or NULL on error
+ * @note Target fingerprint appears as name1 in all results
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fp_vs_fpl(FINGERPRINT *target, FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k,
+             bool file_comparison, int workers) {
+  if (!target || !fpl || fpl->size == 0)
+    return NULL;
+
+  // pack the target so both operands share the store layout
+  FINGERPRINT_STORE *query = init_empty_fingerprintStore();
+  if (!query || add_fingerprint_to_store(query, target) < 0) {
+    fingerprintStore_destroy(query);
+    return NULL;
+  }
+
+  compare_list_t *cl = cl_run(query, fpl, 0, threshold, top_k, file_comparison, workers);
+
+  // names must outlive the temporary store
+  for (size_t i = 0; cl && i < cl->size; i++)
+    cl->list[i].name1 = target->file_name;
+
+  fingerprintStore_destroy(query);
+  return cl;
+}
+
+/**
+ * @brief Build a candidate index over a fingerprint list
+ * @param fpl Fingerprint list to index; must outlive the index
+ * @param bands Number of MinHash bands
+ * @param rows Number of bins per band, bands * rows must not exceed INDEX_BINS
+ * @return Pointer to the new index, or NULL on invalid parameters or error
+ * @note More bands or fewer rows find more similar pairs at the cost of
+ *       more candidates to rescore
+ */
+FINGERPRINT_INDEX *
+fpi_build(FINGERPRINT_STORE *fpl, int bands, int rows) {
+  FINGERPRINT_INDEX *index = init_fingerprintIndex(fpl, bands, rows);
+  if (!index || fingerprintIndex_update(index) < 0) {
+    fingerprintIndex_destroy(index);
+    return NULL;
+  }
+  return index;
+}
+
+/**
+ * @brief Destroy an index; the indexed list is not touched
+ * @param index Index to destroy
+ */
+void
+fpi_destroy(FINGERPRINT_INDEX *index) {
+  fingerprintIndex_destroy(index);
+}
+
+/**
+ * @brief Get the number of indexed fingerprints
+ * @param index Index
+ * @return Number of fingerprints of the list covered by the index
+ */
+size_t
+fpi_size(FINGERPRINT_INDEX *index) {
+  return index ? index->indexed : 0;
+}
+
+/**
+ * @brief Index the fingerprints added to or replaced in the list since the last update
+ * @param index Index to bring up to date
+ * @return Number of fingerprints indexed at the end of the list, or -1 on error
+ * @note Queries do this themselves; calling it first leaves them read-only
+ */
+long
+fpi_update(FINGERPRINT_INDEX *index) {
+  return fingerprintIndex_update(index);
+}
+
+/**
+ * @brief Rescore the index candidates of every query fingerprint exactly
+ * @param index Index to query; fingerprints added to its list since the
+ *        last query are indexed first
+ * @param queries Query fingerprints (name1)
+ * @param triangular Non-zero when queries is the indexed list itself; only
+ *        candidates j > i are compared, as in cl_fpl_all()
+ * @param threshold Minimum similarity score to include in results
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @return Allocated compare_list_t in query order, candidates ascending, or NULL on error
+ * @note A threshold of 0 matches every pair, so it falls back to a full scan
+ */
+static compare_list_t *
+cl_index_run(FINGERPRINT_INDEX *index, FINGERPRINT_STORE *queries, int triangular,
+             uint8_t threshold, bool file_comparison) {
+  if (fingerprintIndex_update(index) < 0)
+    return NULL;
+
+  FINGERPRINT_STORE *store = (FINGERPRINT_STORE *)index->store;
+  if (threshold == 0)
+    return cl_run(queries, store, triangular, threshold, 0, file_comparison, 1);
+
+  cl_chunk_t chunk = {0};
+  uint32_t *candidates = NULL;
+  size_t capacity = 0;
+  int failed = 0;
+
+  for (size_t i = 0; i < queries->size && !failed; i++) {
+    long count = fingerprintIndex_candidates(index, queries, i, &candidates, &capacity);
+    if (count < 0) {
+      failed = 1;
+      break;
+    }
+
+    char *name1 = STORE_NAME(queries, &queries->entries[i]);
+    for (long c = 0; c < count; c++) {
+      size_t j = candidates[c];
+      if (triangular && j <= i)
+        continue;
+
+      int score = fingerprintStore_compare_min(queries, i, store, j, threshold, file_comparison);
+      if (score >= threshold &&
+          cl_chunk_push(&chunk, name1, STORE_NAME(store, &store->entries[j]), (uint8_t)score, i, j) != 0) {
+        failed = 1;
+        break;
+      }
+    }
   }
+  free(candidates);
 
-  char *str_copy = strdup(fp_string);
-  if (!str_copy) {
-    fingerprint_destroy(fp);
+  compare_list_t *cl = failed ? NULL : malloc(sizeof(compare_list_t));
+  if (!cl) {
+    free(chunk.list);
     return NULL;
   }
+  cl->list = chunk.list;
+  cl->size = chunk.size;
+  return cl;
+}
+
+/**
+ * @brief Find the fingerprints of the indexed list similar to a fingerprint
+ * @param index Index to query
+ * @param target Query fingerprint
+ * @param threshold Minimum similarity score to include in results
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @return Allocated compare_list_t with exact scores, or NULL on error
+ * @note Result is the subset of cl_fp_vs_fpl() found through the index
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fpi_fp(FINGERPRINT_INDEX *index, FINGERPRINT *target, uint8_t threshold, bool file_comparison) {
+  if (!index || !target)
+    return NULL;
+
+  FINGERPRINT_STORE *query = init_empty_fingerprintStore();
+  if (!query || add_fingerprint_to_store(query, target) < 0) {
+    fingerprintStore_destroy(query);
+    return NULL;
+  }
+
+  compare_list_t *cl = cl_index_run(index, query, 0, threshold, file_comparison);
+
+  // names must outlive the temporary store
+  for (size_t i = 0; cl && i < cl->size; i++)
+    cl->list[i].name1 = target->file_name;
+
+  fingerprintStore_destroy(query);
+  return cl;
+}
+
+/**
+ * @brief Find the fingerprints of the indexed list similar to those of another list
+ * @param index Index to query
+ * @param fpl Query fingerprints (name1)
+ * @param threshold Minimum similarity score to include in results
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @return Allocated compare_list_t with exact scores, or NULL on error
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fpi_fpl(FINGERPRINT_INDEX *index, FINGERPRINT_STORE *fpl, uint8_t threshold,
+           bool file_comparison) {
+  if (!index || !fpl || fpl->size == 0)
+    return NULL;
+
+  return cl_index_run(index, fpl, 0, threshold, file_comparison);
+}
+
+/**
+ * @brief Find all similar pairs within the indexed list
+ * @param index Index to query
+ * @param threshold Minimum similarity score to include in results
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @return Allocated compare_list_t with exact scores, or NULL on error
+ * @note Result is the subset of cl_fpl_all() found through the index
+ * @note Caller must free returned structure with cl_free()
+ */
+compare_list_t *
+cl_fpi_all(FINGERPRINT_INDEX *index, uint8_t threshold, bool file_comparison) {
+  if (!index || index->store->size == 0)
+    return NULL;
+
+  return cl_index_run(index, (FINGERPRINT_STORE *)index->store, 1, threshold, file_comparison);
+}
+
+/**
+ * @brief Incremental clusterer: single-linkage clusters of a fingerprint
+ *        list at a threshold, kept as a union-find forest over its entries
+ * @note Members of a cluster form a ring through next[], so two clusters
+ *       are merged and a cluster is listed without scanning the list
+ */
+struct fp_clusterer {
+  FINGERPRINT_INDEX *index;
+  uint8_t threshold;
+  bool file_comparison;
+  uint32_t *parent;          // parent of every entry, a root is its own parent
+  uint32_t *size;            // members of the cluster, valid at roots
+  uint32_t *first;           // earliest member (the representative), valid at roots
+  uint32_t *next;            // next member of the same cluster
+  size_t capacity;
+  size_t clustered;          // entries 0..clustered-1 are clustered
+  size_t clusters;
+  uint64_t mutations;        // in-place changes of the list when it was clustered
+  uint32_t *candidates;      // scratch buffer of fingerprintIndex_candidates()
+  size_t candidate_capacity;
+};
+
+/**
+ * @brief Find the root of an entry, halving the path on the way
+ */
+static uint32_t
+fpc_root(fp_clusterer_t *c, uint32_t i) {
+  while (c->parent[i] != i) {
+    c->parent[i] = c->parent[c->parent[i]];
+    i = c->parent[i];
+  }
+  return i;
+}
+
+/**
+ * @brief Merge the clusters of two distinct roots, the smaller under the larger
+ */
+static void
+fpc_union(fp_clusterer_t *c, uint32_t a, uint32_t b) {
+  if (c->size[a] < c->size[b]) {
+    uint32_t t = a;
+    a = b;
+    b = t;
+  }
+  c->parent[b] = a;
+  c->size[a] += c->size[b];
+  c->first[a] = MIN(c->first[a], c->first[b]);
+
+  // splice the two member rings
+  uint32_t t = c->next[a];
+  c->next[a] = c->next[b];
+  c->next[b] = t;
+  c->clusters--;
+}
+
+/**
+ * @brief Make room for the clustering of count entries
+ * @return 0 on success, -1 on allocation failure
+ */
+static int
+fpc_reserve(fp_clusterer_t *c, size_t count) {
+  if (count <= c->capacity)
+    return 0;
+
+  size_t grown = MAX(count, c->capacity * 2);
+  uint32_t **arrays[] = {&c->parent, &c->size, &c->first, &c->next};
+  for (size_t a = 0; a < sizeof(arrays) / sizeof(arrays[0]); a++) {
+    uint32_t *array = realloc(*arrays[a], grown * sizeof(uint32_t));
+    if (!array)
+      return -1;
+    *arrays[a] = array;
+  }
+  c->capacity = grown;
+  return 0;
+}
+
+/**
+ * @brief Start an entry as a cluster of its own
+ */
+static void
+fpc_single(fp_clusterer_t *c, uint32_t i) {
+  c->parent[i] = i;
+  c->size[i] = 1;
+  c->first[i] = i;
+  c->next[i] = i;
+  c->clusters++;
+  c->clustered = (size_t)i + 1;
+}
+
+/**
+ * @brief Create a clusterer over a fingerprint list
+ * @param fpl Fingerprint list to cluster; must outlive the clusterer
+ * @param threshold Minimum similarity score linking two fingerprints, at least 1
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param bands Number of MinHash bands of the candidate index
+ * @param rows Number of bins per band, see fpi_build()
+ * @return Pointer to the new clusterer, or NULL on invalid parameters or error
+ * @note Nothing is clustered until fpc_update() or fpc_restore()
+ */
+fp_clusterer_t *
+fpc_init(FINGERPRINT_STORE *fpl, uint8_t threshold, bool file_comparison, int bands, int rows) {
+  if (!fpl || threshold == 0)
+    return NULL;
+
+  fp_clusterer_t *c = calloc(1, sizeof(fp_clusterer_t));
+  if (!c)
+    return NULL;
+
+  c->index = init_fingerprintIndex(fpl, bands, rows);
+  if (!c->index) {
+    free(c);
+    return NULL;
+  }
+  c->threshold = threshold;
+  c->file_comparison = file_comparison;
+  c->mutations = fpl->mutations;
+  return c;
+}
+
+/**
+ * @brief Destroy a clusterer; the clustered list is not touched
+ * @param clusterer Clusterer to destroy
+ */
+void
+fpc_destroy(fp_clusterer_t *clusterer) {
+  if (clusterer) {
+    fingerprintIndex_destroy(clusterer->index);
+    free(clusterer->parent);
+    free(clusterer->size);
+    free(clusterer->first);
+    free(clusterer->next);
+    free(clusterer->candidates);
+    free(clusterer);
+  }
+}
+
+/**
+ * @brief Check whether the list was modified in place since it was clustered
+ * @param clusterer Clusterer
+ * @return true if a fingerprint of the list was removed or replaced
+ * @note Clusters can only grow, so such a list has to be clustered again
+ */
+bool
+fpc_stale(fp_clusterer_t *clusterer) {
+  return clusterer && clusterer->index->store->mutations != clusterer->mutations;
+}
+
+/**
+ * @brief Cluster the entries added to the list since the last update
+ * @param clusterer Clusterer
+ * @return Number of newly clustered entries, or -1 on error
+ * @note Every new entry is scored only against its index candidates among
+ *       the earlier entries, and only against those not already in its
+ *       cluster, so the cost grows with the new entries times their
+ *       candidates instead of with the size of the list. A pair scoring at
+ *       least the threshold joins its clusters, as in a compare_all() sweep
+ *       over the index.
+ */
+long
+fpc_update(fp_clusterer_t *clusterer) {
+  fp_clusterer_t *c = clusterer;
+  if (!c || fpc_stale(c) || fingerprintIndex_update(c->index) < 0)
+    return -1;
+
+  FINGERPRINT_STORE *store = (FINGERPRINT_STORE *)c->index->store;
+  size_t start = c->clustered;
+  if (fpc_reserve(c, store->size) != 0)
+    return -1;
+
+  for (size_t i = start; i < store->size; i++) {
+    long count = fingerprintIndex_candidates(c->index, store, i, &c->candidates,
+                                             &c->candidate_capacity);
+    if (count < 0)
+      return -1;
+
+    fpc_single(c, (uint32_t)i);
+    for (long k = 0; k < count; k++) {
+      uint32_t j = c->candidates[k];
+      if (j >= i)
+        break;
+
+      uint32_t ri = fpc_root(c, (uint32_t)i), rj = fpc_root(c, j);
+      if (ri == rj)
+        continue;
+
+      // the earlier entry is scored first, as in cl_fpl_all()
+      int score = fingerprintStore_compare_min(store, j, store, i, c->threshold, c->file_comparison);
+      if (score >= c->threshold)
+        fpc_union(c, ri, rj);
+    }
+  }
+  return (long)(store->size - start);
+}
+
+/**
+ * @brief Restore a clustering saved with fpc_labels() without scoring it again
+ * @param clusterer Clusterer that has not clustered anything yet
+ * @param labels Cluster id (representative) of each of the first count entries
+ * @param count Number of labels, at most the size of the list
+ * @return 0 on success, -1 on error (errno is EINVAL for labels that are not
+ *         a clustering of the list)
+ */
+int
+fpc_restore(fp_clusterer_t *clusterer, const uint64_t *labels, size_t count) {
+  fp_clusterer_t *c = clusterer;
+  if (!c || c->clustered || count > c->index->store->size) {
+    errno = EINVAL;
+    return -1;
+  }
+  for (size_t i = 0; i < count; i++) {
+    if (labels[i] > i || labels[labels[i]] != labels[i]) {
+      errno = EINVAL;
+      return -1;
+    }
+  }
+  if (fpc_reserve(c, count) != 0) {
+    errno = ENOMEM;
+    return -1;
+  }
+
+  for (size_t i = 0; i < count; i++) {
+    fpc_single(c, (uint32_t)i);
+    if (labels[i] != i)
+      fpc_union(c, fpc_root(c, (uint32_t)labels[i]), (uint32_t)i);
+  }
+  return 0;
+}
+
+/**
+ * @brief Get the number of clustered entries
+ */
+size_t
+fpc_size(fp_clusterer_t *clusterer) {
+  return clusterer ? clusterer->clustered : 0;
+}
+
+/**
+ * @brief Get the number of clusters
+ */
+size_t
+fpc_count(fp_clusterer_t *clusterer) {
+  return clusterer ? clusterer->clusters : 0;
+}
+
+/**
+ * @brief Get the cluster of an entry
+ * @param clusterer Clusterer
+ * @param item Position of the entry in the list
+ * @return Cluster id, the position of its earliest member, or -1 if the
+ *         entry is not clustered
+ */
+long
+fpc_cluster(fp_clusterer_t *clusterer, size_t item) {
+  if (!clusterer || item >= clusterer->clustered)
+    return -1;
+  return (long)clusterer->first[fpc_root(clusterer, (uint32_t)item)];
+}
+
+static int
+fpc_member_qsort(const void *a, const void *b) {
+  size_t x = *(const size_t *)a, y = *(const size_t *)b;
+  return (x > y) - (x < y);
+}
+
+/**
+ * @brief List the members of the cluster of an entry
+ * @param clusterer Clusterer
+ * @param item Position of any member in the list
+ * @param members Receives the positions of all members in ascending order,
+ *        room for the cluster size is needed (NULL to only count them)
+ * @return Number of members, or -1 if the entry is not clustered
+ */
+long
+fpc_members(fp_clusterer_t *clusterer, size_t item, size_t *members) {
+  fp_clusterer_t *c = clusterer;
+  if (!c || item >= c->clustered)
+    return -1;
 
-  char *saveptr;
-  char *token;
+  uint32_t root = fpc_root(c, (uint32_t)item);
+  if (members) {
+    size_t count = 0;
+    uint32_t member = root;
+    do {
+      members[count++] = member;
+      member = c->next[member];
+    } while (member != root);
+    qsort(members, count, sizeof(size_t), fpc_member_qsort);
+  }
+  return (long)c->size[root];
+}
+
+/**
+ * @brief Get the cluster id of every clustered entry
+ * @param clusterer Clusterer
+ * @param labels Receives fpc_size() cluster ids, see fpc_cluster()
+ */
+void
+fpc_labels(fp_clusterer_t *clusterer, uint64_t *labels) {
+  for (size_t i = 0; clusterer && i < clusterer->clustered; i++)
+    labels[i] = clusterer->first[fpc_root(clusterer, (uint32_t)i)];
+}
+
+/**
+ * @brief Free memory allocated for compare_list_t structure
+ * @param cl Compare list to free
+ * @note Safe to call with NULL pointer
+ */
+void
+cl_free(compare_list_t *cl) {
+  if (cl) {
+    free((void *)cl->list);
+    free(cl);
+  }
+}
+
+// Pairs compared per cursor step; bounds the results a cursor buffers
+#define CL_CURSOR_STEP_PAIRS 65536
+
+/**
+ * @brief Incremental comparison: results are computed a few rows at a time
+ *        and handed out in caller-sized batches
+ */
+struct cl_cursor {
+  FINGERPRINT_STORE *rows;
+  FINGERPRINT_STORE *cols;
+  FINGERPRINT_STORE *owned; // packed query of clc_fp_vs_fpl(), or NULL
+  int triangular;
+  uint8_t threshold;
+  size_t top_k;
+  bool file_comparison;
+  int workers;
+
+  size_t next_row;
+  size_t rows_per_step;
+  compare_list_t *pending; // results of the current step
+  size_t pending_pos;
+};
+
+/**
+ * @brief Create a cursor over the comparison of rows against cols
+ * @return Allocated cursor, or NULL on allocation failure
+ */
+static cl_cursor_t *
+clc_init(FINGERPRINT_STORE *rows, FINGERPRINT_STORE *cols, int triangular, uint8_t threshold,
+         size_t top_k, bool file_comparison, int workers) {
+  cl_cursor_t *cursor = calloc(1, sizeof(cl_cursor_t));
+  if (!cursor)
+    return NULL;
+
+  cursor->rows = rows;
+  cursor->cols = cols;
+  cursor->triangular = triangular;
+  cursor->threshold = threshold;
+  cursor->top_k = top_k;
+  cursor->file_comparison = file_comparison;
+  cursor->workers = workers;
+  cursor->rows_per_step = MAX(1, CL_CURSOR_STEP_PAIRS / MAX(1, cols->size));
+  return cursor;
+}
+
+/**
+ * @brief Cursor over cl_fpl_all()
+ * @param fpl Fingerprint list to process; must not change while the cursor is used
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep per fingerprint, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated cursor, or NULL on error
+ * @note Caller must free returned cursor with clc_free()
+ */
+cl_cursor_t *
+clc_fpl_all(FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k, bool file_comparison,
+            int workers) {
+  if (!fpl)
+    return NULL;
+
+  return clc_init(fpl, fpl, 1, threshold, top_k, file_comparison, workers);
+}
+
+/**
+ * @brief Cursor over cl_fpl_vs_fpl()
+ * @param fpl1 First fingerprint list; must not change while the cursor is used
+ * @param fpl2 Second fingerprint list; must not change while the cursor is used
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep per fingerprint of fpl1, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated cursor, or NULL on error
+ * @note Caller must free returned cursor with clc_free()
+ */
+cl_cursor_t *
+clc_fpl_vs_fpl(FINGERPRINT_STORE *fpl1, FINGERPRINT_STORE *fpl2, uint8_t threshold, size_t top_k,
+               bool file_comparison, int workers) {
+  if (!fpl1 || !fpl2)
+    return NULL;
+
+  return clc_init(fpl1, fpl2, 0, threshold, top_k, file_comparison, workers);
+}
+
+/**
+ * @brief Cursor over cl_fp_vs_fpl()
+ * @param target Single fingerprint to compare against the list; it is copied
+ * @param fpl Fingerprint list to compare against; must not change while the cursor is used
+ * @param threshold Minimum similarity score to include in results
+ * @param top_k Number of best matches to keep, 0 keeps every match
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param workers Number of native threads to use, 0 or less for all CPUs
+ * @return Allocated cursor, or NULL on error
+ * @note Caller must free returned cursor with clc_free()
+ */
+cl_cursor_t *
+clc_fp_vs_fpl(FINGERPRINT *target, FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k,
+              bool file_comparison, int workers) {
+  if (!target || !fpl)
+    return NULL;
+
+  FINGERPRINT_STORE *query = init_empty_fingerprintStore();
+  if (!query || add_fingerprint_to_store(query, target) < 0) {
+    fingerprintStore_destroy(query);
+    return NULL;
+  }
+
+  cl_cursor_t *cursor = clc_init(query, fpl, 0, threshold, top_k, file_comparison, workers);
+  if (!cursor) {
+    fingerprintStore_destroy(query);
+    return NULL;
+  }
+  cursor->owned = query;
+  return cursor;
+}
+
+/**
+ * @brief Fetch the next batch of results from a cursor
+ * @param cursor Cursor to advance
+ * @param out Array receiving up to max results
+ * @param max Capacity of out
+ * @return Number of results written, 0 once the cursor is exhausted, -1 on error
+ * @note Results come in the same order as from the matching cl_* function;
+ *       names point into the lists and stay valid while they do
+ */
+long
+clc_next(cl_cursor_t *cursor, compare_t *out, size_t max) {
+  if (!cursor || !out)
+    return -1;
+
+  size_t count = 0;
+  while (count < max) {
+    compare_list_t *pending = cursor->pending;
+    if (pending && cursor->pending_pos < pending->size) {
+      size_t n = MIN(max - count, pending->size - cursor->pending_pos);
+      memcpy(out + count, pending->list + cursor->pending_pos, n * sizeof(compare_t));
+      cursor->pending_pos += n;
+      count += n;
+      continue;
+    }
+
+    cl_free(cursor->pending);
+    cursor->pending = NULL;
+    cursor->pending_pos = 0;
+
+    size_t nrows = cursor->rows->size;
+    if (cursor->next_row >= nrows || cursor->cols->size == 0)
+      break;
+
+    size_t step = MIN(cursor->rows_per_step, nrows - cursor->next_row);
+    cursor->pending = cl_run_rows(cursor->rows, cursor->next_row, step, cursor->cols,
+                                  cursor->triangular, cursor->threshold, cursor->top_k,
+                                  cursor->file_comparison, cursor->workers);
+    if (!cursor->pending)
+      return -1;
+    cursor->next_row += step;
+  }
+  return (long)count;
+}
+
+/**
+ * @brief Free a cursor and its buffered results
+ * @param cursor Cursor to free
+ * @note Safe to call with NULL pointer
+ */
+void
+clc_free(cl_cursor_t *cursor) {
+  if (cursor) {
+    cl_free(cursor->pending);
+    fingerprintStore_destroy(cursor->owned);
+    free(cursor);
+  }
+}
 
-  // 1. Filename
-  if (!(token = strtok_r(str_copy, ":", &saveptr)))
-    goto error;
-  strncpy(fp->file_name, token, sizeof(fp->file_name) - 1);
-  fp->file_name[sizeof(fp->file_name) - 1] = '\0';
+/**
+ * @brief Fields of a digest, pointing into the digest string
+ */
+typedef struct {
+  const char *name;
+  size_t name_len;
+  uint64_t filesize;
+  uint32_t filter_count;
+  uint16_t last_blocks;
+  const char *hex; // filter_count * FILTERSIZE * 2 hex digits
+} digest_fields_t;
 
-  // 2. Filesize
-  if (!(token = strtok_r(NULL, ":", &saveptr)))
-    goto error;
-  fp->filesize = (unsigned int)strtoul(token, NULL, 10);
+/**
+ * @brief Parse a decimal field ending at a ':'
+ * @param p First digit
+ * @param end The ':' after the field
+ * @param value Receives the value
+ * @return 0 on success, -1 if the field is empty, not a number or too large
+ */
+static int
+parse_decimal(const char *p, const char *end, uint64_t *value) {
+  if (p == end || end - p > 19)
+    return -1;
 
-  // 3. Amount of Bloom Filters
-  if (!(token = strtok_r(NULL, ":", &saveptr)))
-    goto error;
-  fp->amount_of_BF = (unsigned int)strtoul(token, NULL, 10) - 1;
+  uint64_t v = 0;
+  for (; p < end; p++) {
+    if (*p < '0' || *p > '9')
+      return -1;
+    v = v * 10 + (uint64_t)(*p - '0');
+  }
+  *value = v;
+  return 0;
+}
 
-  // 4. Blocks in the last filter
-  if (!(token = strtok_r(NULL, ":", &saveptr)))
-    goto error;
-  int blocks_in_last_filter = atoi(token);
+/**
+ * @brief Split a digest into its fields
+ * @param digest Digest in the format of fp_str():
+ *        "filename:filesize:number_of_filters:blocks_in_last_filter:HEXDATA"
+ * @param len Length of the digest, which need not be NUL-terminated
+ * @param out Receives the fields
+ * @return 0 on success, -1 if the digest is malformed
+ * @note Fields are split from the right, so the file name may contain ':'
+ * @note The hex data is checked for its length only, see hex_decode()
+ */
+static int
+split_digest(const char *digest, size_t len, digest_fields_t *out) {
+  // filesize, number of filters, blocks in the last filter and hex data
+  const char *fields[4];
+  const char *p = digest + len;
+  for (int f = 3; f >= 0; f--) {
+    while (p > digest && p[-1] != ':')
+      p--;
+    if (p == digest)
+      return -1;
+    fields[f] = p;
+    p--; // the separator, end of the previous field
+  }
 
-  // 5. Hex Data
-  if (!(token = strtok_r(NULL, "", &saveptr)))
-    goto error; // Read the rest of the string
+  uint64_t filesize, filter_count, blocks;
+  if (parse_decimal(fields[0], fields[1] - 1, &filesize) != 0 ||
+      parse_decimal(fields[1], fields[2] - 1, &filter_count) != 0 ||
+      parse_decimal(fields[2], fields[3] - 1, &blocks) != 0)
+    return -1;
+  if (filter_count == 0 || filter_count > UINT32_MAX || blocks > MAXBLOCKS)
+    return -1;
 
   // Check if there is enough hex data for the declared number of filters
-  size_t required_len = ((size_t)fp->amount_of_BF + 1) * FILTERSIZE * 2;
-  if (strlen(token) < required_len) {
-    goto error;
+  size_t hex_len = (size_t)(digest + len - fields[3]);
+  if (hex_len / (FILTERSIZE * 2) < filter_count)
+    return -1;
+
+  out->name = digest;
+  out->name_len = (size_t)(p - digest);
+  out->filesize = filesize;
+  out->filter_count = (uint32_t)filter_count;
+  out->last_blocks = (uint16_t)blocks;
+  out->hex = fields[3];
+  return 0;
+}
+
+/**
+ * @brief Parse a digest back into a fingerprint
+ * @param fp_string Digest in the format of fp_str():
+ *        "filename:filesize:number_of_filters:blocks_in_last_filter:HEXDATA"
+ * @return Newly allocated fingerprint, or NULL if the digest is malformed
+ * @note Fields are split from the right, so the file name may contain ':'
+ * @note Caller must free returned fingerprint with fp_destroy()
+ */
+FINGERPRINT *
+parse_fingerprint_string(const char *fp_string) {
+  digest_fields_t d;
+  if (!fp_string || split_digest(fp_string, strlen(fp_string), &d) != 0) {
+    return NULL;
+  }
+
+  FINGERPRINT *fp = init_empty_fingerprint();
+  if (!fp) {
+    return NULL; // Should not happen if init_empty_fingerprint exits on failure
   }
 
+  size_t name_len = MIN(d.name_len, sizeof(fp->file_name) - 1);
+  memcpy(fp->file_name, d.name, name_len);
+  fp->file_name[name_len] = '\0';
+  fp->filesize = d.filesize;
+  fp->amount_of_BF = d.filter_count - 1;
+
   BLOOMFILTER *current_bf = NULL;
   for (unsigned int i = 0; i <= fp->amount_of_BF; i++) {
     if (i == 0) {
@@ -669,29 +2617,79 @@ parse_fingerprint_string(const char *fp_string) {
     }
 
     // Convert hex data for the current filter
-    hex_to_bytes(token + (i * FILTERSIZE * 2), current_bf->array, FILTERSIZE);
+    if (hex_decode(d.hex + (size_t)i * FILTERSIZE * 2, FILTERSIZE, current_bf->array) != 0)
+      goto error;
+    current_bf->bits_set = count_bits_set_to_one_of_BF(current_bf->array);
 
     // Assign block count
     if (i == fp->amount_of_BF) {
-      current_bf->amount_of_blocks = blocks_in_last_filter;
+      current_bf->amount_of_blocks = d.last_blocks;
     } else {
       current_bf->amount_of_blocks = MAXBLOCKS; // Assumes full filter
     }
   }
 
-  free(str_copy);
   return fp;
 
 error:
-  free(str_copy);
   fingerprint_destroy(fp);
   return NULL;
 }
 
+/**
+ * @brief Parse many digests directly into a list
+ * @param fpl Fingerprint list to add to
+ * @param digests Digests in the format of fp_str()
+ * @param lengths Length of every digest, which need not be NUL-terminated
+ * @param count Number of digests
+ * @param invalid Receives the index of the first malformed digest, or count
+ *        if the list could not grow
+ * @return Number of fingerprints added, or -1 on error
+ * @note The filters are decoded straight into the list without building
+ *       intermediate fingerprints. On error the list is left unchanged.
+ */
+long
+fpl_add_digests(FINGERPRINT_STORE *fpl, const char *const *digests, const size_t *lengths,
+                size_t count, size_t *invalid) {
+  size_t first = fpl->size;
+
+  for (size_t i = 0; i < count; i++) {
+    digest_fields_t d;
+    if (split_digest(digests[i], lengths[i], &d) != 0) {
+      *invalid = i;
+      goto error;
+    }
+
+    // names are limited like those of hashed fingerprints
+    size_t name_len = MIN(d.name_len, sizeof(((FINGERPRINT *)0)->file_name) - 1);
+    long index = fingerprintStore_append(fpl, d.name, name_len, d.filesize, d.filter_count,
+                                         d.last_blocks);
+    if (index < 0) {
+      *invalid = count;
+      goto error;
+    }
+
+    uint64_t offset = fpl->entries[index].filter_offset;
+    for (uint32_t k = 0; k < d.filter_count; k++) {
+      unsigned char *filter = STORE_FILTER(fpl, offset + k);
+      if (hex_decode(d.hex + (size_t)k * FILTERSIZE * 2, FILTERSIZE, filter) != 0) {
+        *invalid = i;
+        goto error;
+      }
+      fpl->bits[offset + k] = count_bits_set_to_one_of_BF(filter);
+    }
+  }
+  return (long)count;
+
+error:
+  fingerprintStore_truncate(fpl, first);
+  return -1;
+}
+
 // Main comparison function that operates on fingerprint strings
 // Uses your existing fingerprint_compare function
 int
-str_compare(const char *fp_string1, const char *fp_string2) {
+str_compare(const char *fp_string1, const char *fp_string2, bool file_comparison) {
   if (!fp_string1 || !fp_string2) {
     return 0; // Invalid input
   }
@@ -702,7 +2700,7 @@ str_compare(const char *fp_string1, const char *fp_string2) {
   int score = 0;
   // Only perform comparison if both fingerprints were parsed successfully
   if (fp1 && fp2) {
-    score = fingerprint_compare(fp1, fp2);
+    score = fingerprint_compare(fp1, fp2, file_comparison);
   }
 
   if (fp1) {
@@ -714,3 +2712,30 @@ str_compare(const char *fp_string1, const char *fp_string2) {
 
   return score;
 }
+
+/**
+ * @brief Compare one digest against many
+ * @param fp_string Query digest, parsed once
+ * @param fp_strings Digests to compare the query with
+ * @param count Number of digests in fp_strings
+ * @param file_comparison Score relative to the larger fingerprint of a pair
+ * @param scores Receives count scores; 0 for digests that cannot be parsed
+ * @return 0 on success, -1 if the query cannot be parsed (all scores are 0)
+ */
+int
+str_compare_many(const char *fp_string, const char *const *fp_strings, size_t count,
+                 bool file_comparison, uint8_t *scores) {
+  FINGERPRINT *query = parse_fingerprint_string(fp_string);
+
+  for (size_t i = 0; i < count; i++) {
+    FINGERPRINT *fp = query ? parse_fingerprint_string(fp_strings[i]) : NULL;
+    scores[i] = fp ? (uint8_t)fingerprint_compare(query, fp, file_comparison) : 0;
+    if (fp)
+      fingerprint_destroy(fp);
+  }
+
+  if (!query)
+    return -1;
+  fingerprint_destroy(query);
+  return 0;
+}
@@ -0,0 +1,213 @@
+/*
+ * File:   mrsh_glue.h
+ * Author: w4term3loon
+ *
+ * Binding layer between the MRSHv2 core and the Python extension module.
+ */
+
+#ifndef MRSH_GLUE_H
+#define MRSH_GLUE_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "config.h"
+#include "fingerprint.h"
+#include "fingerprintIndex.h"
+#include "fingerprintStore.h"
+#include "stats.h"
+
+typedef struct fp_hasher fp_hasher_t;
+typedef struct hash_cache hash_cache_t;
+typedef struct cl_cursor cl_cursor_t;
+typedef struct fp_clusterer fp_clusterer_t;
+
+typedef struct {
+  char *name1;
+  char *name2;
+  uint8_t score;
+  size_t index1; // position of name1 in its list
+  size_t index2; // position of name2 in its list
+} compare_t;
+
+typedef struct {
+  compare_t *list;
+  size_t size;
+} compare_list_t;
+
+// Fingerprints
+FINGERPRINT *
+fp_init(void);
+void
+fp_destroy(FINGERPRINT *fp);
+int
+fp_add_file(FINGERPRINT *fp, char *filename, const char *label);
+int
+fp_add_bytes(FINGERPRINT *fp, unsigned char *byte_buffer, unsigned long bytes_size,
+             const char *label, bool packet);
+char *
+fp_str(FINGERPRINT *fp);
+uint8_t
+fp_compare(FINGERPRINT *fp1, FINGERPRINT *fp2, bool file_comparison);
+
+// Incremental hashing
+fp_hasher_t *
+fph_init(const char *label);
+int
+fph_update(fp_hasher_t *hasher, unsigned char *byte_buffer, unsigned long bytes_size);
+FINGERPRINT *
+fph_final(fp_hasher_t *hasher);
+void
+fph_destroy(fp_hasher_t *hasher);
+
+// Fingerprint lists
+FINGERPRINT_STORE *
+fpl_init(void);
+void
+fpl_destroy(FINGERPRINT_STORE *fpl);
+size_t
+fpl_size(FINGERPRINT_STORE *fpl);
+const char *
+fpl_name(FINGERPRINT_STORE *fpl, size_t index);
+void
+fpl_entry_info(FINGERPRINT_STORE *fpl, size_t index, uint64_t *filesize, size_t *filters);
+size_t
+fpl_count(FINGERPRINT_STORE *fpl);
+bool
+fpl_live(FINGERPRINT_STORE *fpl, size_t index);
+uint64_t
+fpl_mutations(FINGERPRINT_STORE *fpl);
+long
+fpl_find(FINGERPRINT_STORE *fpl, const char *label);
+int
+fpl_remove(FINGERPRINT_STORE *fpl, size_t index);
+long
+fpl_put(FINGERPRINT_STORE *fpl, long index, FINGERPRINT_STORE *src, size_t j, const char *label);
+long
+fpl_put_fp(FINGERPRINT_STORE *fpl, long index, FINGERPRINT *fp, const char *label);
+int
+fpl_compact(FINGERPRINT_STORE *fpl);
+FINGERPRINT_STORE *
+fpl_slice(FINGERPRINT_STORE *fpl, size_t start, size_t stop);
+int
+fpl_save(FINGERPRINT_STORE *fpl, const char *path);
+FINGERPRINT_STORE *
+fpl_load(const char *path, int use_mmap);
+long
+fpl_ingest(FINGERPRINT_STORE *fpl, const char *path, int recursive, const char **extensions,
+           size_t extension_count, int workers, int queue_size, hash_cache_t *cache);
+void
+fpl_add_path(FINGERPRINT_STORE *fpl, char *filename, const char *label, int recursive,
+             hash_cache_t *cache);
+void
+fpl_add_bytes(FINGERPRINT_STORE *fpl, unsigned char *byte_buffer, unsigned long bytes_size,
+              const char *label, bool packet);
+long
+fpl_add_many(FINGERPRINT_STORE *fpl, const unsigned char *const *buffers, const size_t *sizes,
+             const char *const *labels, size_t count, int workers, bool packet);
+long
+fpl_add_concat(FINGERPRINT_STORE *fpl, const unsigned char *data, size_t size,
+               const uint64_t *offsets, size_t count, const char *const *labels, int workers,
+               bool packet);
+char *
+fpl_str(FINGERPRINT_STORE *fpl);
+char *
+fpl_entry_str(FINGERPRINT_STORE *fpl, size_t index);
+int
+fpl_entry_compare(FINGERPRINT_STORE *fpl1, size_t i, FINGERPRINT_STORE *fpl2, size_t j,
+                  bool file_comparison);
+int
+fpl_entry_compare_fp(FINGERPRINT_STORE *fpl, size_t i, FINGERPRINT *fp, bool file_comparison);
+void
+str_free(char *str);
+
+// Hash cache
+hash_cache_t *
+hc_open(const char *path, size_t max_entries, uint64_t max_bytes);
+int
+hc_save(hash_cache_t *hc);
+size_t
+hc_size(hash_cache_t *hc);
+void
+hc_close(hash_cache_t *hc);
+
+// Comparisons
+compare_list_t *
+cl_fpl_all(FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k, bool file_comparison,
+           int workers);
+compare_list_t *
+cl_fpl_vs_fpl(FINGERPRINT_STORE *fpl1, FINGERPRINT_STORE *fpl2, uint8_t threshold, size_t top_k,
+              bool file_comparison, int workers);
+compare_list_t *
+cl_fp_vs_fpl(FINGERPRINT *target, FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k,
+             bool file_comparison, int workers);
+void
+cl_free(compare_list_t *cl);
+
+// Candidate index
+FINGERPRINT_INDEX *
+fpi_build(FINGERPRINT_STORE *fpl, int bands, int rows);
+void
+fpi_destroy(FINGERPRINT_INDEX *index);
+size_t
+fpi_size(FINGERPRINT_INDEX *index);
+long
+fpi_update(FINGERPRINT_INDEX *index);
+compare_list_t *
+cl_fpi_fp(FINGERPRINT_INDEX *index, FINGERPRINT *target, uint8_t threshold, bool file_comparison);
+compare_list_t *
+cl_fpi_fpl(FINGERPRINT_INDEX *index, FINGERPRINT_STORE *fpl, uint8_t threshold,
+           bool file_comparison);
+compare_list_t *
+cl_fpi_all(FINGERPRINT_INDEX *index, uint8_t threshold, bool file_comparison);
+
+// Incremental clustering
+fp_clusterer_t *
+fpc_init(FINGERPRINT_STORE *fpl, uint8_t threshold, bool file_comparison, int bands, int rows);
+void
+fpc_destroy(fp_clusterer_t *clusterer);
+bool
+fpc_stale(fp_clusterer_t *clusterer);
+long
+fpc_update(fp_clusterer_t *clusterer);
+int
+fpc_restore(fp_clusterer_t *clusterer, const uint64_t *labels, size_t count);
+size_t
+fpc_size(fp_clusterer_t *clusterer);
+size_t
+fpc_count(fp_clusterer_t *clusterer);
+long
+fpc_cluster(fp_clusterer_t *clusterer, size_t item);
+long
+fpc_members(fp_clusterer_t *clusterer, size_t item, size_t *members);
+void
+fpc_labels(fp_clusterer_t *clusterer, uint64_t *labels);
+
+// Comparison cursors
+cl_cursor_t *
+clc_fpl_all(FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k, bool file_comparison,
+            int workers);
+cl_cursor_t *
+clc_fpl_vs_fpl(FINGERPRINT_STORE *fpl1, FINGERPRINT_STORE *fpl2, uint8_t threshold, size_t top_k,
+               bool file_comparison, int workers);
+cl_cursor_t *
+clc_fp_vs_fpl(FINGERPRINT *target, FINGERPRINT_STORE *fpl, uint8_t threshold, size_t top_k,
+              bool file_comparison, int workers);
+long
+clc_next(cl_cursor_t *cursor, compare_t *out, size_t max);
+void
+clc_free(cl_cursor_t *cursor);
+
+// Digest strings
+FINGERPRINT *
+parse_fingerprint_string(const char *fp_string);
+long
+fpl_add_digests(FINGERPRINT_STORE *fpl, const char *const *digests, const size_t *lengths,
+                size_t count, size_t *invalid);
+int
+str_compare(const char *fp_string1, const char *fp_string2, bool file_comparison);
+int
+str_compare_many(const char *fp_string, const char *const *fp_strings, size_t count,
+                 bool file_comparison, uint8_t *scores);
+
+#endif /* MRSH_GLUE_H */
@@ -0,0 +1,2448 @@
+/*
+ * CPython extension module exposing the binding layer to Python.
+ * Author: w4term3loon
+ *
+ * The types defined here are the native bases of the classes in
+ * mrsh.core, mrsh.index and mrsh.cache. They own the C objects and
+ * implement the hot paths; argument dispatch, validation and
+ * documentation of the public API live in the Python subclasses.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <errno.h>
+#include <string.h>
+
+#include "mrsh_glue.h"
+
+// Registered by mrsh.core through _setup()
+static PyObject *error_type = NULL;
+static PyTypeObject *comparison_type = NULL;
+static PyTypeObject *metadata_type = NULL;
+
+static PyTypeObject FingerprintType;
+static PyTypeObject HasherType;
+static PyTypeObject FingerprintListType;
+static PyTypeObject FingerprintIndexType;
+static PyTypeObject FingerprintClustererType;
+static PyTypeObject HashCacheType;
+static PyTypeObject CompareCursorType;
+
+typedef struct {
+  PyObject_HEAD
+  FINGERPRINT *fp;
+} FingerprintObject;
+
+typedef struct {
+  PyObject_HEAD
+  fp_hasher_t *hasher;
+} HasherObject;
+
+typedef struct {
+  PyObject_HEAD
+  FINGERPRINT_STORE *fpl;
+  Py_ssize_t readers; // calls reading the list with the GIL released
+  bool writing;       // a call is modifying the list with the GIL released
+} FingerprintListObject;
+
+typedef struct {
+  PyObject_HEAD
+  FINGERPRINT_INDEX *fpi;
+  PyObject *fpl;      // indexed list, kept alive by the index
+  Py_ssize_t readers; // queries running with the GIL released
+} FingerprintIndexObject;
+
+typedef struct {
+  PyObject_HEAD
+  fp_clusterer_t *fpc;
+  PyObject *fpl; // clustered list, kept alive by the clusterer
+  bool busy;     // update() is running with the GIL released
+} FingerprintClustererObject;
+
+typedef struct {
+  PyObject_HEAD
+  hash_cache_t *hc;
+} HashCacheObject;
+
+/**
+ * @brief Decoded names of a result set, so every distinct name is only
+ *        converted to a Python string once
+ * @note name1 repeats for the consecutive results of a row; name2 slots are
+ *       indexed by index2 and checked against the name pointer
+ */
+typedef struct {
+  const char *ptr;
+  PyObject *name;
+} name_slot_t;
+
+typedef struct {
+  name_slot_t last1;
+  name_slot_t *slots2;
+  size_t capacity2;
+} name_cache_t;
+
+typedef struct {
+  PyObject_HEAD
+  cl_cursor_t *cursor;
+  PyObject *lists[2]; // lists the cursor reads from, NULL if unused
+  size_t sizes[2];    // their sizes when the cursor was opened
+  uint64_t mutations[2]; // and their in-place changes
+  compare_t *batch;
+  size_t capacity;
+  name_cache_t names;
+} CompareCursorObject;
+
+/**
+ * @brief Raise the registered MRSHwError
+ * @param message Error message
+ * @return NULL, for use in return statements
+ */
+static PyObject *
+raise_error(const char *message) {
+  PyErr_SetString(error_type ? error_type : PyExc_RuntimeError, message);
+  return NULL;
+}
+
+/**
+ * @brief Raise OSError for an errno value
+ * @param err errno value, EIO if 0
+ * @return NULL, for use in return statements
+ */
+static PyObject *
+raise_errno(int err) {
+  errno = err ? err : EIO;
+  return PyErr_SetFromErrno(PyExc_OSError);
+}
+
+/**
+ * @brief Convert a label argument: str (UTF-8 encoded), bytes or None
+ * @param obj Label object
+ * @param out Receives a pointer valid while obj is alive, NULL for None
+ * @return 0 on success, -1 with an exception set
+ */
+static int
+label_arg(PyObject *obj, const char **out) {
+  if (obj == Py_None) {
+    *out = NULL;
+  } else if (PyUnicode_Check(obj)) {
+    *out = PyUnicode_AsUTF8(obj);
+    if (!*out)
+      return -1;
+  } else if (PyBytes_Check(obj)) {
+    *out = PyBytes_AS_STRING(obj);
+  } else {
+    PyErr_Format(PyExc_TypeError, "Label must be str or bytes, not %.200s", Py_TYPE(obj)->tp_name);
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Validate a similarity threshold
+ * @return 0 on success, -1 with an exception set
+ */
+static int
+check_threshold(int threshold) {
+  if (threshold < 0 || threshold > 255) {
+    PyErr_SetString(PyExc_ValueError, "threshold must be between 0 and 255");
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Convert a comparison mode: "fragment" scores a pair relative to its
+ *        smaller fingerprint, "file" relative to the larger one
+ * @param obj Mode string
+ * @param out Receives the file comparison flag (bool)
+ * @return 1 on success, 0 with an exception set, for use with "O&"
+ */
+static int
+mode_arg(PyObject *obj, void *out) {
+  if (PyUnicode_Check(obj)) {
+    if (PyUnicode_CompareWithASCIIString(obj, "fragment") == 0) {
+      *(bool *)out = false;
+      return 1;
+    }
+    if (PyUnicode_CompareWithASCIIString(obj, "file") == 0) {
+      *(bool *)out = true;
+      return 1;
+    }
+  }
+  PyErr_Format(PyExc_ValueError, "mode must be 'fragment' or 'file', not %R", obj);
+  return 0;
+}
+
+/**
+ * @brief Get the native cache of a cache argument
+ * @param obj HashCache or None
+ * @param out Receives the cache, NULL for None
+ * @return 0 on success, -1 with an exception set
+ */
+static int
+cache_arg(PyObject *obj, hash_cache_t **out) {
+  if (obj == Py_None) {
+    *out = NULL;
+    return 0;
+  }
+  if (!PyObject_TypeCheck(obj, &HashCacheType)) {
+    PyErr_SetString(PyExc_TypeError, "cache must be a HashCache or None");
+    return -1;
+  }
+  *out = ((HashCacheObject *)obj)->hc;
+  if (!*out) {
+    raise_error("Hash cache is closed");
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Build an instance of a registered namedtuple type
+ * @param type Tuple subclass without instance dictionary
+ * @param size Number of fields
+ * @return New reference to an empty tuple of the type, or NULL on error
+ * @note The caller fills every item with PyTuple_SET_ITEM()
+ */
+static PyObject *
+new_record(PyTypeObject *type, Py_ssize_t size) {
+  if (!type)
+    return raise_error("Result types are not registered");
+  return type->tp_alloc(type, size);
+}
+
+/**
+ * @brief Decode a name stored in a fingerprint or list
+ * @return New reference to the decoded string, or NULL on error
+ */
+static PyObject *
+decode_name(const char *name) {
+  if (!name)
+    return PyUnicode_FromStringAndSize(NULL, 0);
+  return PyUnicode_DecodeUTF8(name, strlen(name), "replace");
+}
+
+/**
+ * @brief Release the strings held by a name cache
+ */
+static void
+name_cache_clear(name_cache_t *cache) {
+  Py_CLEAR(cache->last1.name);
+  cache->last1.ptr = NULL;
+  for (size_t i = 0; i < cache->capacity2; i++)
+    Py_XDECREF(cache->slots2[i].name);
+  PyMem_Free(cache->slots2);
+  cache->slots2 = NULL;
+  cache->capacity2 = 0;
+}
+
+/**
+ * @brief Look up or decode the name1 of a result
+ * @return Borrowed reference owned by the cache, or NULL on error
+ */
+static PyObject *
+name_cache_name1(name_cache_t *cache, const char *ptr) {
+  if (cache->last1.name && cache->last1.ptr == ptr)
+    return cache->last1.name;
+
+  PyObject *name = decode_name(ptr);
+  if (!name)
+    return NULL;
+  Py_XSETREF(cache->last1.name, name);
+  cache->last1.ptr = ptr;
+  return name;
+}
+
+/**
+ * @brief Look up or decode the name2 of a result
+ * @return Borrowed reference owned by the cache, or NULL on error
+ */
+static PyObject *
+name_cache_name2(name_cache_t *cache, const char *ptr, size_t index) {
+  if (index >= cache->capacity2) {
+    size_t capacity = cache->capacity2 ? cache->capacity2 : 64;
+    while (capacity <= index)
+      capacity *= 2;
+    name_slot_t *slots = PyMem_Realloc(cache->slots2, capacity * sizeof(name_slot_t));
+    if (!slots) {
+      PyErr_NoMemory();
+      return NULL;
+    }
+    memset(slots + cache->capacity2, 0, (capacity - cache->capacity2) * sizeof(name_slot_t));
+    cache->slots2 = slots;
+    cache->capacity2 = capacity;
+  }
+
+  name_slot_t *slot = &cache->slots2[index];
+  if (slot->name && slot->ptr == ptr)
+    return slot->name;
+
+  PyObject *name = decode_name(ptr);
+  if (!name)
+    return NULL;
+  Py_XSETREF(slot->name, name);
+  slot->ptr = ptr;
+  return name;
+}
+
+/**
+ * @brief Append results to a list of Comparison namedtuples
+ * @param out List to append to
+ * @param rows Results to convert
+ * @param count Number of results
+ * @param names Name cache, may be shared between calls
+ * @return 0 on success, -1 with an exception set
+ */
+static int
+append_comparisons(PyObject *out, const compare_t *rows, size_t count, name_cache_t *names) {
+  for (size_t i = 0; i < count; i++) {
+    const compare_t *row = &rows[i];
+    PyObject *name1 = name_cache_name1(names, row->name1);
+    PyObject *name2 = name1 ? name_cache_name2(names, row->name2, row->index2) : NULL;
+    PyObject *record = name2 ? new_record(comparison_type, 3) : NULL;
+    if (!record)
+      return -1;
+
+    Py_INCREF(name1);
+    Py_INCREF(name2);
+    PyTuple_SET_ITEM(record, 0, name1);
+    PyTuple_SET_ITEM(record, 1, name2);
+    PyTuple_SET_ITEM(record, 2, PyLong_FromLong(row->score));
+
+    int err = PyList_Append(out, record);
+    Py_DECREF(record);
+    if (err < 0)
+      return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Convert and free a compare list
+ * @param cl Compare list, NULL for no results
+ * @return New list of Comparison namedtuples, or NULL on error
+ */
+static PyObject *
+comparisons_from_cl(compare_list_t *cl) {
+  PyObject *out = PyList_New(0);
+  if (out && cl && cl->size) {
+    name_cache_t names = {0};
+    if (append_comparisons(out, cl->list, cl->size, &names) < 0)
+      Py_CLEAR(out);
+    name_cache_clear(&names);
+  }
+  cl_free(cl);
+  return out;
+}
+
+/**
+ * @brief Convert a string allocated by the binding layer and free it
+ * @return New reference to the string, "" for NULL
+ */
+static PyObject *
+str_from_glue(char *raw) {
+  if (!raw)
+    return PyUnicode_FromStringAndSize(NULL, 0);
+  PyObject *str = PyUnicode_DecodeUTF8(raw, strlen(raw), "replace");
+  str_free(raw);
+  return str;
+}
+
+/* Fingerprint */
+
+static PyObject *
+Fingerprint_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+  FingerprintObject *self = (FingerprintObject *)type->tp_alloc(type, 0);
+  if (!self)
+    return NULL;
+
+  self->fp = fp_init();
+  if (!self->fp) {
+    Py_DECREF(self);
+    return raise_error("Failed to initialize fingerprint");
+  }
+  return (PyObject *)self;
+}
+
+static void
+Fingerprint_dealloc(FingerprintObject *self) {
+  if (self->fp)
+    fp_destroy(self->fp);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+/**
+ * @brief Wrap a fingerprint in a new instance of a Fingerprint subclass
+ * @param type Class to instantiate, must derive from Fingerprint
+ * @param fp Fingerprint to take over; destroyed on error
+ * @return New reference, or NULL on error
+ */
+static PyObject *
+fingerprint_wrap(PyTypeObject *type, FINGERPRINT *fp) {
+  FingerprintObject *self = (FingerprintObject *)type->tp_alloc(type, 0);
+  if (!self) {
+    fp_destroy(fp);
+    return NULL;
+  }
+  self->fp = fp;
+  return (PyObject *)self;
+}
+
+static PyObject *
+Fingerprint_add_file(FingerprintObject *self, PyObject *args) {
+  PyObject *path, *label_obj;
+  const char *label;
+
+  if (!PyArg_ParseTuple(args, "O&O:_add_file", PyUnicode_FSConverter, &path, &label_obj))
+    return NULL;
+  if (label_arg(label_obj, &label) < 0) {
+    Py_DECREF(path);
+    return NULL;
+  }
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = fp_add_file(self->fp, PyBytes_AS_STRING(path), label);
+  Py_END_ALLOW_THREADS
+  Py_DECREF(path);
+
+  if (err != 0) {
+    PyErr_Format(error_type ? error_type : PyExc_RuntimeError,
+                 "Failed to update fingerprint (error code: %d)", err);
+    return NULL;
+  }
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+Fingerprint_add_bytes(FingerprintObject *self, PyObject *args) {
+  Py_buffer view;
+  PyObject *label_obj;
+  const char *label;
+  int packet = 0;
+
+  if (!PyArg_ParseTuple(args, "y*O|p:_add_bytes", &view, &label_obj, &packet))
+    return NULL;
+  if (label_arg(label_obj, &label) < 0) {
+    PyBuffer_Release(&view);
+    return NULL;
+  }
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = fp_add_bytes(self->fp, view.buf, (unsigned long)view.len, label ? label : "n/a", packet);
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&view);
+
+  if (err != 0) {
+    PyErr_Format(error_type ? error_type : PyExc_RuntimeError,
+                 "Failed to update fingerprint (error code: %d)", err);
+    return NULL;
+  }
+  Py_RETURN_NONE;
+}
+
+/**
+ * @note Vectorcall with the arguments parsed by hand: a plain compare(other)
+ *       is the hottest call of the module
+ */
+static PyObject *
+Fingerprint_compare(FingerprintObject *self, PyObject *const *args, Py_ssize_t nargs,
+                    PyObject *kwnames) {
+  Py_ssize_t nkw = kwnames ? PyTuple_GET_SIZE(kwnames) : 0;
+  PyObject *other = nargs >= 1 ? args[0] : NULL, *mode_obj = nargs == 2 ? args[1] : NULL;
+  bool file_comparison = false;
+
+  if (nargs > 2) {
+    PyErr_Format(PyExc_TypeError, "compare() takes at most 2 positional arguments (%zd given)", nargs);
+    return NULL;
+  }
+  for (Py_ssize_t i = 0; i < nkw; i++) {
+    PyObject *key = PyTuple_GET_ITEM(kwnames, i);
+    PyObject **slot;
+    if (PyUnicode_CompareWithASCIIString(key, "other") == 0) {
+      slot = &other;
+    } else if (PyUnicode_CompareWithASCIIString(key, "mode") == 0) {
+      slot = &mode_obj;
+    } else {
+      PyErr_Format(PyExc_TypeError, "compare() got an unexpected keyword argument %R", key);
+      return NULL;
+    }
+    if (*slot) {
+      PyErr_Format(PyExc_TypeError, "compare() got multiple values for argument %R", key);
+      return NULL;
+    }
+    *slot = args[nargs + i];
+  }
+  if (!other) {
+    PyErr_SetString(PyExc_TypeError, "compare() missing required argument 'other'");
+    return NULL;
+  }
+
+  if (mode_obj && !mode_arg(mode_obj, &file_comparison))
+    return NULL;
+  if (!PyObject_TypeCheck(other, &FingerprintType)) {
+    PyErr_SetString(PyExc_TypeError, "Can only compare with another Fingerprint instance");
+    return NULL;
+  }
+  return PyLong_FromLong(fp_compare(self->fp, ((FingerprintObject *)other)->fp, file_comparison));
+}
+
+static PyObject *
+Fingerprint_hexdigest(FingerprintObject *self, PyObject *Py_UNUSED(ignored)) {
+  return str_from_glue(fp_str(self->fp));
+}
+
+static PyObject *
+Fingerprint_metadata(FingerprintObject *self, PyObject *Py_UNUSED(ignored)) {
+  FINGERPRINT *fp = self->fp;
+  PyObject *record = new_record(metadata_type, 3);
+  if (!record)
+    return NULL;
+
+  PyObject *name = PyUnicode_DecodeUTF8(fp->file_name, strnlen(fp->file_name, sizeof(fp->file_name)),
+                                        "replace");
+  PyObject *size = PyLong_FromUnsignedLongLong(fp->filesize);
+  PyObject *filters = PyLong_FromUnsignedLong(fp->amount_of_BF);
+  PyTuple_SET_ITEM(record, 0, name);
+  PyTuple_SET_ITEM(record, 1, size);
+  PyTuple_SET_ITEM(record, 2, filters);
+  if (!name || !size || !filters)
+    Py_CLEAR(record);
+  return record;
+}
+
+static PyObject *
+Fingerprint_from_digest(PyTypeObject *cls, PyObject *digest) {
+  Py_ssize_t len;
+
+  if (!PyUnicode_Check(digest)) {
+    PyErr_Format(PyExc_TypeError, "Digest must be str, not %.200s", Py_TYPE(digest)->tp_name);
+    return NULL;
+  }
+  const char *s = PyUnicode_AsUTF8AndSize(digest, &len);
+  if (!s)
+    return NULL;
+
+  FINGERPRINT *fp = strlen(s) == (size_t)len ? parse_fingerprint_string(s) : NULL;
+  if (!fp) {
+    PyErr_SetString(PyExc_ValueError, "Invalid fingerprint digest");
+    return NULL;
+  }
+  return fingerprint_wrap(cls, fp);
+}
+
+static PyMethodDef Fingerprint_methods[] = {
+  {"_add_file", (PyCFunction)Fingerprint_add_file, METH_VARARGS,
+   "_add_file(path, label)\n--\n\nHash a file into the fingerprint."},
+  {"_add_bytes", (PyCFunction)Fingerprint_add_bytes, METH_VARARGS,
+   "_add_bytes(data, label, packet=False)\n--\n\n"
+   "Hash a bytes-like object into the fingerprint, as a network packet if packet is true."},
+  {"compare", (PyCFunction)(void (*)(void))Fingerprint_compare, METH_FASTCALL | METH_KEYWORDS,
+   "compare(other, mode='fragment')\n--\n\n"
+   "Compare this fingerprint with another.\n\n"
+   "Args:\n"
+   "    other: Another Fingerprint instance\n"
+   "    mode: 'fragment' scores relative to the smaller fingerprint, which\n"
+   "        finds a fragment inside a larger file; 'file' scores relative to\n"
+   "        the larger one, which measures whole-file similarity\n\n"
+   "Returns:\n"
+   "    Similarity score (0-100, where 100 is identical)\n\n"
+   "Raises:\n"
+   "    TypeError: If other is not a Fingerprint instance\n"
+   "    ValueError: If mode is not 'fragment' or 'file'"},
+  {"hexdigest", (PyCFunction)Fingerprint_hexdigest, METH_NOARGS,
+   "hexdigest()\n--\n\n"
+   "Get the hexadecimal digest of the fingerprint.\n\n"
+   "Returns:\n"
+   "    Hexadecimal string representation of the fingerprint"},
+  {"metadata", (PyCFunction)Fingerprint_metadata, METH_NOARGS,
+   "metadata()\n--\n\n"
+   "Get metadata about the fingerprint.\n\n"
+   "Returns:\n"
+   "    Metadata namedtuple containing name, size, and filter count"},
+  {"_from_digest", (PyCFunction)Fingerprint_from_digest, METH_O | METH_CLASS,
+   "_from_digest(digest)\n--\n\nParse a digest into a new fingerprint, raising ValueError if it is invalid."},
+  {NULL}
+};
+
+static PyTypeObject FingerprintType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.Fingerprint",
+  .tp_doc = "Native fingerprint.",
+  .tp_basicsize = sizeof(FingerprintObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+  .tp_new = Fingerprint_new,
+  .tp_dealloc = (destructor)Fingerprint_dealloc,
+  .tp_methods = Fingerprint_methods,
+};
+
+/* Hasher */
+
+static void
+Hasher_dealloc(HasherObject *self) {
+  fph_destroy(self->hasher);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int
+Hasher_init(HasherObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"label", NULL};
+  PyObject *label_obj = NULL;
+  const char *label = "n/a";
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O:Hasher", kwlist, &label_obj))
+    return -1;
+  if (label_obj && label_arg(label_obj, &label) < 0)
+    return -1;
+
+  fp_hasher_t *hasher = fph_init(label);
+  if (!hasher) {
+    raise_error("Failed to initialize hasher");
+    return -1;
+  }
+  fph_destroy(self->hasher);
+  self->hasher = hasher;
+  return 0;
+}
+
+static PyObject *
+Hasher_update(HasherObject *self, PyObject *data) {
+  Py_buffer view;
+
+  if (PyUnicode_Check(data) || !PyObject_CheckBuffer(data)) {
+    PyErr_Format(PyExc_TypeError, "Unsupported data type: %R", (PyObject *)Py_TYPE(data));
+    return NULL;
+  }
+  if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE) < 0)
+    return NULL;
+
+  int err = -1;
+  if (self->hasher) {
+    Py_BEGIN_ALLOW_THREADS
+    err = fph_update(self->hasher, view.buf, (unsigned long)view.len);
+    Py_END_ALLOW_THREADS
+  }
+  PyBuffer_Release(&view);
+
+  if (err != 0)
+    return raise_error("Cannot update a finalized hasher");
+  Py_INCREF(self);
+  return (PyObject *)self;
+}
+
+static PyObject *
+Hasher_finalize(HasherObject *self, PyObject *cls) {
+  if (!PyType_Check(cls) || !PyType_IsSubtype((PyTypeObject *)cls, &FingerprintType)) {
+    PyErr_SetString(PyExc_TypeError, "cls must be a Fingerprint class");
+    return NULL;
+  }
+
+  FINGERPRINT *fp = self->hasher ? fph_final(self->hasher) : NULL;
+  if (!fp)
+    return raise_error("Hasher already finalized");
+  return fingerprint_wrap((PyTypeObject *)cls, fp);
+}
+
+static PyMethodDef Hasher_methods[] = {
+  {"update", (PyCFunction)Hasher_update, METH_O,
+   "update(data)\n--\n\n"
+   "Hash the next piece of the input.\n\n"
+   "Args:\n"
+   "    data: Next bytes of the input, any object supporting the buffer\n"
+   "        protocol\n\n"
+   "Returns:\n"
+   "    Self for method chaining\n\n"
+   "Raises:\n"
+   "    MRSHwError: If the hasher was already finalized"},
+  {"_finalize", (PyCFunction)Hasher_finalize, METH_O,
+   "_finalize(cls)\n--\n\nFinish the hash into a new instance of cls."},
+  {NULL}
+};
+
+static PyTypeObject HasherType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.Hasher",
+  .tp_doc = "Native incremental hasher.",
+  .tp_basicsize = sizeof(HasherObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+  .tp_new = PyType_GenericNew,
+  .tp_init = (initproc)Hasher_init,
+  .tp_dealloc = (destructor)Hasher_dealloc,
+  .tp_methods = Hasher_methods,
+};
+
+/* FingerprintList */
+
+/**
+ * @brief Check that no other thread is modifying a list
+ * @return 0 if the list can be read, -1 with BufferError set
+ * @note Calls that keep the GIL only need this check to read a list
+ */
+static int
+list_check_read(FingerprintListObject *self) {
+  if (self->writing) {
+    PyErr_SetString(PyExc_BufferError, "FingerprintList is being modified by another thread");
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Check that no other thread is using a list
+ * @return 0 if the list can be modified, -1 with BufferError set
+ * @note Like a resized bytearray with exports, a list read with the GIL
+ *       released cannot be modified until the readers are done
+ */
+static int
+list_check_write(FingerprintListObject *self) {
+  if (self->writing || self->readers) {
+    PyErr_SetString(PyExc_BufferError, "FingerprintList is in use by another thread");
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Take a list for reading with the GIL released
+ * @return 0 on success, -1 with BufferError set
+ * @note Must be paired with list_release()
+ */
+static int
+list_acquire(FingerprintListObject *self) {
+  if (list_check_read(self) < 0)
+    return -1;
+  self->readers++;
+  return 0;
+}
+
+static void
+list_release(FingerprintListObject *self) {
+  self->readers--;
+}
+
+/**
+ * @brief Take a list for modifying with the GIL released
+ * @return 0 on success, -1 with BufferError set
+ * @note Must be paired with list_end_write()
+ */
+static int
+list_begin_write(FingerprintListObject *self) {
+  if (list_check_write(self) < 0)
+    return -1;
+  self->writing = true;
+  return 0;
+}
+
+static void
+list_end_write(FingerprintListObject *self) {
+  self->writing = false;
+}
+
+static PyObject *
+FingerprintList_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+  FingerprintListObject *self = (FingerprintListObject *)type->tp_alloc(type, 0);
+  if (!self)
+    return NULL;
+
+  self->fpl = fpl_init();
+  if (!self->fpl) {
+    Py_DECREF(self);
+    return raise_error("Failed to initialize fingerprint list");
+  }
+  return (PyObject *)self;
+}
+
+static void
+FingerprintList_dealloc(FingerprintListObject *self) {
+  if (self->fpl)
+    fpl_destroy(self->fpl);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+FingerprintList_add_path(FingerprintListObject *self, PyObject *args) {
+  PyObject *path, *label_obj, *cache_obj;
+  const char *label;
+  int recursive;
+  hash_cache_t *cache;
+
+  if (!PyArg_ParseTuple(args, "O&OpO:_add_path", PyUnicode_FSConverter, &path, &label_obj, &recursive,
+                        &cache_obj))
+    return NULL;
+  if (label_arg(label_obj, &label) < 0 || cache_arg(cache_obj, &cache) < 0 ||
+      list_begin_write(self) < 0) {
+    Py_DECREF(path);
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  fpl_add_path(self->fpl, PyBytes_AS_STRING(path), label, recursive, cache);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+  Py_DECREF(path);
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+FingerprintList_add_bytes(FingerprintListObject *self, PyObject *args) {
+  Py_buffer view;
+  PyObject *label_obj;
+  const char *label;
+  int packet = 0;
+
+  if (!PyArg_ParseTuple(args, "y*O|p:_add_bytes", &view, &label_obj, &packet))
+    return NULL;
+  if (label_arg(label_obj, &label) < 0 || list_begin_write(self) < 0) {
+    PyBuffer_Release(&view);
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  fpl_add_bytes(self->fpl, view.buf, (unsigned long)view.len, label ? label : "n/a", packet);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+  PyBuffer_Release(&view);
+  Py_RETURN_NONE;
+}
+
+/**
+ * @brief Convert a sequence of labels for the batch functions
+ * @param labels_obj Sequence of str or bytes, or None
+ * @param count Expected number of labels
+ * @param seq Receives the sequence keeping the labels alive (NULL for None)
+ * @param out Receives the allocated label array (NULL for None)
+ * @return 0 on success, -1 with an exception set
+ */
+static int
+labels_arg(PyObject *labels_obj, Py_ssize_t count, PyObject **seq, const char ***out) {
+  *seq = NULL;
+  *out = NULL;
+  if (labels_obj == Py_None)
+    return 0;
+
+  *seq = PySequence_Fast(labels_obj, "labels must be a sequence");
+  if (!*seq)
+    return -1;
+
+  Py_ssize_t size = PySequence_Fast_GET_SIZE(*seq);
+  if (size != count) {
+    PyErr_Format(PyExc_ValueError, "Expected %zd labels, got %zd", count, size);
+    Py_CLEAR(*seq);
+    return -1;
+  }
+
+  *out = PyMem_Malloc((count ? count : 1) * sizeof(char *));
+  if (!*out) {
+    PyErr_NoMemory();
+    Py_CLEAR(*seq);
+    return -1;
+  }
+
+  PyObject **items = PySequence_Fast_ITEMS(*seq);
+  for (Py_ssize_t i = 0; i < count; i++) {
+    if (label_arg(items[i], &(*out)[i]) < 0) {
+      PyMem_Free(*out);
+      *out = NULL;
+      Py_CLEAR(*seq);
+      return -1;
+    }
+  }
+  return 0;
+}
+
+static PyObject *
+FingerprintList_add_many(FingerprintListObject *self, PyObject *args) {
+  PyObject *buffers_obj, *labels_obj, *seq, *label_seq = NULL;
+  const char **labels = NULL;
+  int workers, packet = 0;
+
+  if (!PyArg_ParseTuple(args, "OOi|p:_add_many", &buffers_obj, &labels_obj, &workers, &packet))
+    return NULL;
+
+  seq = PySequence_Fast(buffers_obj, "buffers must be a sequence");
+  if (!seq)
+    return NULL;
+
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+  PyObject **items = PySequence_Fast_ITEMS(seq);
+  const unsigned char **pointers = PyMem_Malloc((count ? count : 1) * sizeof(unsigned char *));
+  size_t *sizes = PyMem_Malloc((count ? count : 1) * sizeof(size_t));
+  Py_buffer *views = PyMem_Calloc(count ? count : 1, sizeof(Py_buffer));
+  Py_ssize_t acquired = 0;
+  long added = -1;
+
+  if (!pointers || !sizes || !views) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  // bytes are read in place, other buffers stay locked until the end
+  for (; acquired < count; acquired++) {
+    PyObject *item = items[acquired];
+    if (PyBytes_Check(item)) {
+      pointers[acquired] = (const unsigned char *)PyBytes_AS_STRING(item);
+      sizes[acquired] = (size_t)PyBytes_GET_SIZE(item);
+      continue;
+    }
+    if (PyUnicode_Check(item) || !PyObject_CheckBuffer(item)) {
+      PyErr_Format(PyExc_TypeError, "Unsupported buffer type: %R", (PyObject *)Py_TYPE(item));
+      goto done;
+    }
+    if (PyObject_GetBuffer(item, &views[acquired], PyBUF_SIMPLE) < 0)
+      goto done;
+    pointers[acquired] = views[acquired].buf;
+    sizes[acquired] = (size_t)views[acquired].len;
+  }
+
+  if (labels_arg(labels_obj, count, &label_seq, &labels) < 0 || list_begin_write(self) < 0)
+    goto done;
+
+  Py_BEGIN_ALLOW_THREADS
+  added = fpl_add_many(self->fpl, pointers, sizes, labels, (size_t)count, workers, packet);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+
+  if (added < 0)
+    raise_error("Failed to hash buffers");
+
+done:
+  for (Py_ssize_t i = 0; views && i < acquired; i++) {
+    if (views[i].obj)
+      PyBuffer_Release(&views[i]);
+  }
+  PyMem_Free(pointers);
+  PyMem_Free(sizes);
+  PyMem_Free(views);
+  PyMem_Free(labels);
+  Py_XDECREF(label_seq);
+  Py_DECREF(seq);
+
+  if (added < 0)
+    return NULL;
+  return PyLong_FromLong(added);
+}
+
+static PyObject *
+FingerprintList_add_concat(FingerprintListObject *self, PyObject *args) {
+  Py_buffer data, offsets;
+  PyObject *labels_obj, *label_seq = NULL, *result = NULL;
+  const char **labels = NULL;
+  int workers, packet = 0;
+
+  if (!PyArg_ParseTuple(args, "y*y*Oi|p:_add_concat", &data, &offsets, &labels_obj, &workers,
+                        &packet))
+    return NULL;
+
+  Py_ssize_t count = offsets.len / (Py_ssize_t)sizeof(uint64_t) - 1;
+  if (offsets.len % sizeof(uint64_t) != 0 || count < 0) {
+    PyErr_SetString(PyExc_ValueError, "offsets must hold one entry more than there are buffers");
+    goto done;
+  }
+  if (labels_arg(labels_obj, count, &label_seq, &labels) < 0 || list_begin_write(self) < 0)
+    goto done;
+
+  long added;
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  added = fpl_add_concat(self->fpl, data.buf, (size_t)data.len, offsets.buf, (size_t)count, labels,
+                         workers, packet);
+  err = errno;
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+
+  if (added >= 0)
+    result = PyLong_FromLong(added);
+  else if (err == EINVAL)
+    PyErr_SetString(PyExc_ValueError, "offsets must be ascending and within the buffer");
+  else
+    PyErr_Format(error_type ? error_type : PyExc_RuntimeError, "Failed to hash buffers: %s",
+                 strerror(err));
+
+done:
+  PyMem_Free(labels);
+  Py_XDECREF(label_seq);
+  PyBuffer_Release(&data);
+  PyBuffer_Release(&offsets);
+  return result;
+}
+
+static PyObject *
+FingerprintList_add_digests(FingerprintListObject *self, PyObject *digests_obj) {
+  PyObject *seq, *result = NULL;
+
+  seq = PySequence_Fast(digests_obj, "digests must be a sequence");
+  if (!seq)
+    return NULL;
+
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+  PyObject **items = PySequence_Fast_ITEMS(seq);
+  const char **digests = PyMem_Malloc((count ? count : 1) * sizeof(char *));
+  size_t *lengths = PyMem_Malloc((count ? count : 1) * sizeof(size_t));
+  if (!digests || !lengths) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  for (Py_ssize_t i = 0; i < count; i++) {
+    Py_ssize_t len;
+    if (!PyUnicode_Check(items[i])) {
+      PyErr_Format(PyExc_TypeError, "Digests must be str, not %.200s", Py_TYPE(items[i])->tp_name);
+      goto done;
+    }
+    digests[i] = PyUnicode_AsUTF8AndSize(items[i], &len);
+    if (!digests[i])
+      goto done;
+    lengths[i] = (size_t)len;
+  }
+
+  if (list_begin_write(self) < 0)
+    goto done;
+
+  long added;
+  size_t invalid = 0;
+  Py_BEGIN_ALLOW_THREADS
+  added = fpl_add_digests(self->fpl, digests, lengths, (size_t)count, &invalid);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+
+  if (added >= 0)
+    result = PyLong_FromLong(added);
+  else if (invalid < (size_t)count)
+    PyErr_Format(PyExc_ValueError, "Invalid fingerprint digest at position %zu", invalid);
+  else
+    PyErr_NoMemory();
+
+done:
+  PyMem_Free(digests);
+  PyMem_Free(lengths);
+  Py_DECREF(seq);
+  return result;
+}
+
+static PyObject *
+FingerprintList_ingest(FingerprintListObject *self, PyObject *args) {
+  PyObject *path, *extensions_obj, *cache_obj, *seq = NULL, *result = NULL;
+  const char **extensions = NULL;
+  Py_ssize_t count = 0;
+  int recursive, workers, queue_size;
+  hash_cache_t *cache;
+
+  if (!PyArg_ParseTuple(args, "O&pOiiO:_ingest", PyUnicode_FSConverter, &path, &recursive,
+                        &extensions_obj, &workers, &queue_size, &cache_obj))
+    return NULL;
+  if (cache_arg(cache_obj, &cache) < 0)
+    goto done;
+
+  if (extensions_obj != Py_None) {
+    seq = PySequence_Fast(extensions_obj, "extensions must be a sequence");
+    if (!seq)
+      goto done;
+    count = PySequence_Fast_GET_SIZE(seq);
+    extensions = PyMem_Malloc((count ? count : 1) * sizeof(char *));
+    if (!extensions) {
+      PyErr_NoMemory();
+      goto done;
+    }
+    for (Py_ssize_t i = 0; i < count; i++) {
+      if (label_arg(PySequence_Fast_GET_ITEM(seq, i), &extensions[i]) < 0 || !extensions[i]) {
+        if (!PyErr_Occurred())
+          PyErr_SetString(PyExc_TypeError, "extensions must be str or bytes");
+        goto done;
+      }
+    }
+  }
+
+  if (list_begin_write(self) < 0)
+    goto done;
+
+  long added;
+  Py_BEGIN_ALLOW_THREADS
+  added = fpl_ingest(self->fpl, PyBytes_AS_STRING(path), recursive, extensions, (size_t)count,
+                     workers, queue_size, cache);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+  result = PyLong_FromLong(added);
+
+done:
+  PyMem_Free(extensions);
+  Py_XDECREF(seq);
+  Py_DECREF(path);
+  return result;
+}
+
+static PyObject *
+FingerprintList_hexdigest(FingerprintListObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (list_acquire(self) < 0)
+    return NULL;
+
+  char *raw;
+  Py_BEGIN_ALLOW_THREADS
+  raw = fpl_str(self->fpl);
+  Py_END_ALLOW_THREADS
+  list_release(self);
+  return str_from_glue(raw);
+}
+
+static PyObject *
+FingerprintList_size(FingerprintListObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (list_check_read(self) < 0)
+    return NULL;
+  return PyLong_FromSize_t(fpl_size(self->fpl));
+}
+
+static PyObject *
+FingerprintList_names(FingerprintListObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (list_check_read(self) < 0)
+    return NULL;
+
+  size_t size = fpl_size(self->fpl);
+  PyObject *names = PyList_New((Py_ssize_t)size);
+  if (!names)
+    return NULL;
+
+  for (size_t i = 0; i < size; i++) {
+    PyObject *name = decode_name(fpl_name(self->fpl, i));
+    if (!name) {
+      Py_DECREF(names);
+      return NULL;
+    }
+    PyList_SET_ITEM(names, (Py_ssize_t)i, name);
+  }
+  return names;
+}
+
+static PyObject *
+FingerprintList_slice(FingerprintListObject *self, PyObject *args) {
+  Py_ssize_t start, stop;
+
+  if (!PyArg_ParseTuple(args, "nn:_slice", &start, &stop) || list_acquire(self) < 0)
+    return NULL;
+  if (start < 0 || stop < start || (size_t)stop > fpl_size(self->fpl)) {
+    list_release(self);
+    PyErr_SetString(PyExc_IndexError, "slice out of range");
+    return NULL;
+  }
+
+  FINGERPRINT_STORE *fpl;
+  Py_BEGIN_ALLOW_THREADS
+  fpl = fpl_slice(self->fpl, (size_t)start, (size_t)stop);
+  Py_END_ALLOW_THREADS
+  list_release(self);
+
+  if (!fpl)
+    return PyErr_NoMemory();
+
+  FingerprintListObject *slice = (FingerprintListObject *)Py_TYPE(self)->tp_alloc(Py_TYPE(self), 0);
+  if (!slice) {
+    fpl_destroy(fpl);
+    return NULL;
+  }
+  slice->fpl = fpl;
+  return (PyObject *)slice;
+}
+
+static PyObject *
+FingerprintList_save(FingerprintListObject *self, PyObject *arg) {
+  PyObject *path;
+  if (!PyUnicode_FSConverter(arg, &path))
+    return NULL;
+  if (list_acquire(self) < 0) {
+    Py_DECREF(path);
+    return NULL;
+  }
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = fpl_save(self->fpl, PyBytes_AS_STRING(path));
+  Py_END_ALLOW_THREADS
+  list_release(self);
+  Py_DECREF(path);
+
+  if (err != 0)
+    return raise_errno(err);
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+FingerprintList_load(PyTypeObject *cls, PyObject *args) {
+  PyObject *path;
+  int use_mmap;
+
+  if (!PyArg_ParseTuple(args, "O&p:_load", PyUnicode_FSConverter, &path, &use_mmap))
+    return NULL;
+
+  FINGERPRINT_STORE *fpl;
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  fpl = fpl_load(PyBytes_AS_STRING(path), use_mmap);
+  err = errno;
+  Py_END_ALLOW_THREADS
+  Py_DECREF(path);
+
+  if (!fpl)
+    return raise_errno(err);
+
+  FingerprintListObject *self = (FingerprintListObject *)cls->tp_alloc(cls, 0);
+  if (!self) {
+    fpl_destroy(fpl);
+    return NULL;
+  }
+  self->fpl = fpl;
+  return (PyObject *)self;
+}
+
+static PyObject *
+FingerprintList_compare(FingerprintListObject *self, PyObject *args) {
+  PyObject *other;
+  int threshold, workers;
+  Py_ssize_t top_k;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "OinO&i:_compare", &other, &threshold, &top_k, mode_arg, &file_comparison,
+                        &workers))
+    return NULL;
+  if (check_threshold(threshold) < 0)
+    return NULL;
+
+  if (list_acquire(self) < 0)
+    return NULL;
+
+  compare_list_t *cl;
+  if (other == Py_None) {
+    Py_BEGIN_ALLOW_THREADS
+    cl = cl_fpl_all(self->fpl, (uint8_t)threshold, (size_t)top_k, file_comparison, workers);
+    Py_END_ALLOW_THREADS
+  } else if (PyObject_TypeCheck(other, &FingerprintType)) {
+    FINGERPRINT *fp = ((FingerprintObject *)other)->fp;
+    Py_BEGIN_ALLOW_THREADS
+    cl = cl_fp_vs_fpl(fp, self->fpl, (uint8_t)threshold, (size_t)top_k, file_comparison, workers);
+    Py_END_ALLOW_THREADS
+  } else if (PyObject_TypeCheck(other, &FingerprintListType)) {
+    FingerprintListObject *list = (FingerprintListObject *)other;
+    if (list_acquire(list) < 0) {
+      list_release(self);
+      return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    cl = cl_fpl_vs_fpl(self->fpl, list->fpl, (uint8_t)threshold, (size_t)top_k, file_comparison,
+                       workers);
+    Py_END_ALLOW_THREADS
+    list_release(list);
+  } else {
+    list_release(self);
+    PyErr_SetString(PyExc_TypeError, "Can only compare with Fingerprint or FingerprintList");
+    return NULL;
+  }
+  list_release(self);
+  return comparisons_from_cl(cl);
+}
+
+static PyObject *
+FingerprintList_cursor(FingerprintListObject *self, PyObject *args) {
+  PyObject *other;
+  int threshold, workers;
+  Py_ssize_t top_k;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "OinO&i:_cursor", &other, &threshold, &top_k, mode_arg, &file_comparison,
+                        &workers))
+    return NULL;
+  if (check_threshold(threshold) < 0 || list_check_read(self) < 0)
+    return NULL;
+  if (PyObject_TypeCheck(other, &FingerprintListType) &&
+      list_check_read((FingerprintListObject *)other) < 0)
+    return NULL;
+
+  CompareCursorObject *cursor = PyObject_GC_New(CompareCursorObject, &CompareCursorType);
+  if (!cursor)
+    return NULL;
+  cursor->cursor = NULL;
+  cursor->lists[0] = cursor->lists[1] = NULL;
+  cursor->sizes[0] = cursor->sizes[1] = 0;
+  cursor->mutations[0] = cursor->mutations[1] = 0;
+  cursor->batch = NULL;
+  cursor->capacity = 0;
+  memset(&cursor->names, 0, sizeof(name_cache_t));
+  PyObject_GC_Track(cursor);
+
+  Py_INCREF(self);
+  cursor->lists[0] = (PyObject *)self;
+  cursor->sizes[0] = fpl_size(self->fpl);
+  cursor->mutations[0] = fpl_mutations(self->fpl);
+
+  if (other == Py_None) {
+    cursor->cursor = clc_fpl_all(self->fpl, (uint8_t)threshold, (size_t)top_k, file_comparison,
+                                 workers);
+  } else if (PyObject_TypeCheck(other, &FingerprintType)) {
+    cursor->cursor = clc_fp_vs_fpl(((FingerprintObject *)other)->fp, self->fpl, (uint8_t)threshold,
+                                   (size_t)top_k, file_comparison, workers);
+  } else if (PyObject_TypeCheck(other, &FingerprintListType)) {
+    FINGERPRINT_STORE *fpl = ((FingerprintListObject *)other)->fpl;
+    Py_INCREF(other);
+    cursor->lists[1] = other;
+    cursor->sizes[1] = fpl_size(fpl);
+    cursor->mutations[1] = fpl_mutations(fpl);
+    cursor->cursor = clc_fpl_vs_fpl(self->fpl, fpl, (uint8_t)threshold, (size_t)top_k,
+                                    file_comparison, workers);
+  } else {
+    Py_DECREF(cursor);
+    PyErr_SetString(PyExc_TypeError, "Can only compare with Fingerprint or FingerprintList");
+    return NULL;
+  }
+
+  if (!cursor->cursor) {
+    Py_DECREF(cursor);
+    return raise_error("Failed to start comparison");
+  }
+  return (PyObject *)cursor;
+}
+
+/**
+ * @brief Validate the position of a fingerprint in a list
+ * @param fpl Fingerprint list
+ * @param index Position
+ * @return 0 if a fingerprint is there, -1 with IndexError set
+ */
+static int
+check_entry(FINGERPRINT_STORE *fpl, Py_ssize_t index) {
+  if (index < 0 || (size_t)index >= fpl_size(fpl)) {
+    PyErr_SetString(PyExc_IndexError, "FingerprintList index out of range");
+    return -1;
+  }
+  if (!fpl_live(fpl, (size_t)index)) {
+    PyErr_Format(PyExc_IndexError, "fingerprint %zd was removed", index);
+    return -1;
+  }
+  return 0;
+}
+
+static Py_ssize_t
+FingerprintList_len(FingerprintListObject *self) {
+  if (list_check_read(self) < 0)
+    return -1;
+  return (Py_ssize_t)fpl_count(self->fpl);
+}
+
+static PyObject *
+FingerprintList_live(FingerprintListObject *self, PyObject *arg) {
+  Py_ssize_t index = PyNumber_AsSsize_t(arg, PyExc_IndexError);
+  if ((index == -1 && PyErr_Occurred()) || list_check_read(self) < 0)
+    return NULL;
+  return PyBool_FromLong(index >= 0 && fpl_live(self->fpl, (size_t)index));
+}
+
+static PyObject *
+FingerprintList_find(FingerprintListObject *self, PyObject *arg) {
+  const char *label;
+  if (label_arg(arg, &label) < 0 || list_check_read(self) < 0)
+    return NULL;
+  if (!label) {
+    PyErr_SetString(PyExc_TypeError, "Label must be str or bytes, not None");
+    return NULL;
+  }
+
+  long index = fpl_find(self->fpl, label);
+  if (index < 0) {
+    if (errno == ENOMEM)
+      return PyErr_NoMemory();
+    Py_RETURN_NONE;
+  }
+  return PyLong_FromLong(index);
+}
+
+static PyObject *
+FingerprintList_remove(FingerprintListObject *self, PyObject *arg) {
+  Py_ssize_t index = PyNumber_AsSsize_t(arg, PyExc_IndexError);
+  if ((index == -1 && PyErr_Occurred()) || list_check_write(self) < 0 || check_entry(self->fpl, index) < 0)
+    return NULL;
+  if (fpl_remove(self->fpl, (size_t)index) != 0)
+    return PyErr_NoMemory();
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+FingerprintList_put(FingerprintListObject *self, PyObject *args) {
+  Py_ssize_t index, position;
+  PyObject *source, *label_obj;
+  const char *label;
+
+  if (!PyArg_ParseTuple(args, "nOnO:_put", &index, &source, &position, &label_obj))
+    return NULL;
+  if (label_arg(label_obj, &label) < 0 || list_check_write(self) < 0)
+    return NULL;
+  if (index < -1) {
+    PyErr_SetString(PyExc_IndexError, "FingerprintList index out of range");
+    return NULL;
+  }
+  if (index >= 0 && check_entry(self->fpl, index) < 0)
+    return NULL;
+  if (index == -1 && !label) {
+    PyErr_SetString(PyExc_ValueError, "A new fingerprint needs a label");
+    return NULL;
+  }
+
+  long put;
+  if (PyObject_TypeCheck(source, &FingerprintListType)) {
+    FINGERPRINT_STORE *src = ((FingerprintListObject *)source)->fpl;
+    if (list_check_read((FingerprintListObject *)source) < 0 || check_entry(src, position) < 0)
+      return NULL;
+    put = fpl_put(self->fpl, (long)index, src, (size_t)position, label);
+  } else if (PyObject_TypeCheck(source, &FingerprintType)) {
+    put = fpl_put_fp(self->fpl, (long)index, ((FingerprintObject *)source)->fp, label);
+  } else {
+    PyErr_SetString(PyExc_TypeError, "Source must be a Fingerprint or FingerprintList");
+    return NULL;
+  }
+
+  if (put < 0)
+    return errno == ENOMEM ? PyErr_NoMemory() : raise_error("Failed to store fingerprint");
+  return PyLong_FromLong(put);
+}
+
+static PyObject *
+FingerprintList_compact(FingerprintListObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (list_begin_write(self) < 0)
+    return NULL;
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = fpl_compact(self->fpl);
+  Py_END_ALLOW_THREADS
+  list_end_write(self);
+  if (err != 0)
+    return PyErr_NoMemory();
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+FingerprintList_mutations(FingerprintListObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (list_check_read(self) < 0)
+    return NULL;
+  return PyLong_FromUnsignedLongLong(fpl_mutations(self->fpl));
+}
+
+static PyObject *
+FingerprintList_entry(FingerprintListObject *self, PyObject *arg) {
+  Py_ssize_t index = PyNumber_AsSsize_t(arg, PyExc_IndexError);
+  if ((index == -1 && PyErr_Occurred()) || list_check_read(self) < 0 || check_entry(self->fpl, index) < 0)
+    return NULL;
+
+  uint64_t filesize;
+  size_t filter_count;
+  fpl_entry_info(self->fpl, (size_t)index, &filesize, &filter_count);
+  PyObject *record = new_record(metadata_type, 3);
+  if (!record)
+    return NULL;
+
+  PyObject *name = decode_name(fpl_name(self->fpl, (size_t)index));
+  PyObject *size = PyLong_FromUnsignedLongLong(filesize);
+  PyObject *filters = PyLong_FromSize_t(filter_count);
+  PyTuple_SET_ITEM(record, 0, name);
+  PyTuple_SET_ITEM(record, 1, size);
+  PyTuple_SET_ITEM(record, 2, filters);
+  if (!name || !size || !filters)
+    Py_CLEAR(record);
+  return record;
+}
+
+static PyObject *
+FingerprintList_entry_hexdigest(FingerprintListObject *self, PyObject *arg) {
+  Py_ssize_t index = PyNumber_AsSsize_t(arg, PyExc_IndexError);
+  if ((index == -1 && PyErr_Occurred()) || list_check_read(self) < 0 || check_entry(self->fpl, index) < 0)
+    return NULL;
+
+  char *raw = fpl_entry_str(self->fpl, (size_t)index);
+  if (!raw)
+    return PyErr_NoMemory();
+  return str_from_glue(raw);
+}
+
+static PyObject *
+FingerprintList_entry_compare(FingerprintListObject *self, PyObject *args) {
+  Py_ssize_t index, position;
+  PyObject *other;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "nOnO&:_entry_compare", &index, &other, &position, mode_arg,
+                        &file_comparison))
+    return NULL;
+  if (list_check_read(self) < 0 || check_entry(self->fpl, index) < 0)
+    return NULL;
+
+  int score;
+  if (PyObject_TypeCheck(other, &FingerprintListType)) {
+    FINGERPRINT_STORE *fpl = ((FingerprintListObject *)other)->fpl;
+    if (list_check_read((FingerprintListObject *)other) < 0 || check_entry(fpl, position) < 0)
+      return NULL;
+    score = fpl_entry_compare(self->fpl, (size_t)index, fpl, (size_t)position, file_comparison);
+  } else if (PyObject_TypeCheck(other, &FingerprintType)) {
+    score = fpl_entry_compare_fp(self->fpl, (size_t)index, ((FingerprintObject *)other)->fp,
+                                 file_comparison);
+  } else {
+    PyErr_SetString(PyExc_TypeError, "Can only compare with a Fingerprint or FingerprintList entry");
+    return NULL;
+  }
+
+  if (score < 0)
+    return raise_error("Comparison failed");
+  return PyLong_FromLong(score);
+}
+
+static PyMethodDef FingerprintList_methods[] = {
+  {"_add_path", (PyCFunction)FingerprintList_add_path, METH_VARARGS,
+   "_add_path(path, label, recursive, cache)\n--\n\nHash a file, or the files of a directory, into the list."},
+  {"_add_bytes", (PyCFunction)FingerprintList_add_bytes, METH_VARARGS,
+   "_add_bytes(data, label, packet=False)\n--\n\n"
+   "Hash a bytes-like object into the list, as a network packet if packet is true."},
+  {"_add_many", (PyCFunction)FingerprintList_add_many, METH_VARARGS,
+   "_add_many(buffers, labels, workers, packet=False)\n--\n\n"
+   "Hash a sequence of buffers into the list, as network packets if packet is true."},
+  {"_add_concat", (PyCFunction)FingerprintList_add_concat, METH_VARARGS,
+   "_add_concat(data, offsets, labels, workers, packet=False)\n--\n\n"
+   "Hash the slices of a buffer given by 64-bit offsets into the list, as network packets "
+   "if packet is true."},
+  {"_add_digests", (PyCFunction)FingerprintList_add_digests, METH_O,
+   "_add_digests(digests)\n--\n\n"
+   "Parse a sequence of digests into the list, raising ValueError if one is invalid."},
+  {"_ingest", (PyCFunction)FingerprintList_ingest, METH_VARARGS,
+   "_ingest(path, recursive, extensions, workers, queue_size, cache)\n--\n\n"
+   "Walk a directory into the list; returns the number of files added or -1."},
+  {"hexdigest", (PyCFunction)FingerprintList_hexdigest, METH_NOARGS,
+   "hexdigest()\n--\n\nGet string representation of all fingerprints, skipping free slots."},
+  {"_size", (PyCFunction)FingerprintList_size, METH_NOARGS,
+   "_size()\n--\n\nNumber of fingerprints in the list."},
+  {"_names", (PyCFunction)FingerprintList_names, METH_NOARGS,
+   "_names()\n--\n\nNames of the fingerprints, in list order."},
+  {"_slice", (PyCFunction)FingerprintList_slice, METH_VARARGS,
+   "_slice(start, stop)\n--\n\nNew list holding copies of the fingerprints start to stop - 1."},
+  {"_save", (PyCFunction)FingerprintList_save, METH_O,
+   "_save(path)\n--\n\nWrite the list in the binary store format, raising OSError on failure."},
+  {"_load", (PyCFunction)FingerprintList_load, METH_VARARGS | METH_CLASS,
+   "_load(path, mmap)\n--\n\nRead a list written by _save(), raising OSError on failure."},
+  {"_compare", (PyCFunction)FingerprintList_compare, METH_VARARGS,
+   "_compare(other, threshold, top_k, mode, workers)\n--\n\n"
+   "Compare the list with itself (other is None), a Fingerprint or a FingerprintList."},
+  {"_cursor", (PyCFunction)FingerprintList_cursor, METH_VARARGS,
+   "_cursor(other, threshold, top_k, mode, workers)\n--\n\nOpen a cursor over the results of _compare()."},
+  {"_live", (PyCFunction)FingerprintList_live, METH_O,
+   "_live(index)\n--\n\nWhether a fingerprint is stored at a position."},
+  {"_find", (PyCFunction)FingerprintList_find, METH_O,
+   "_find(label)\n--\n\nPosition of the first fingerprint with a label, or None."},
+  {"_remove", (PyCFunction)FingerprintList_remove, METH_O,
+   "_remove(index)\n--\n\nRemove the fingerprint at a position, leaving its slot free."},
+  {"_put", (PyCFunction)FingerprintList_put, METH_VARARGS,
+   "_put(index, source, position, label)\n--\n\n"
+   "Replace the fingerprint at index, or insert one into a free slot if index is -1, with a "
+   "copy of a Fingerprint or of the entry of a FingerprintList at position. A label of None "
+   "keeps the label of the replaced fingerprint. Returns the position written."},
+  {"_compact", (PyCFunction)FingerprintList_compact, METH_NOARGS,
+   "_compact()\n--\n\nRelease the memory of removed and replaced fingerprints."},
+  {"_mutations", (PyCFunction)FingerprintList_mutations, METH_NOARGS,
+   "_mutations()\n--\n\nNumber of removals and replacements so far."},
+  {"_entry", (PyCFunction)FingerprintList_entry, METH_O,
+   "_entry(index)\n--\n\nMetadata of the fingerprint at a position."},
+  {"_entry_hexdigest", (PyCFunction)FingerprintList_entry_hexdigest, METH_O,
+   "_entry_hexdigest(index)\n--\n\nDigest of the fingerprint at a position."},
+  {"_entry_compare", (PyCFunction)FingerprintList_entry_compare, METH_VARARGS,
+   "_entry_compare(index, other, position, mode)\n--\n\n"
+   "Score the fingerprint at index against a Fingerprint or the entry of a FingerprintList at "
+   "position."},
+  {NULL}
+};
+
+static PySequenceMethods FingerprintList_as_sequence = {
+  .sq_length = (lenfunc)FingerprintList_len,
+};
+
+static PyTypeObject FingerprintListType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.FingerprintList",
+  .tp_doc = "Native fingerprint list.",
+  .tp_basicsize = sizeof(FingerprintListObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+  .tp_new = FingerprintList_new,
+  .tp_dealloc = (destructor)FingerprintList_dealloc,
+  .tp_as_sequence = &FingerprintList_as_sequence,
+  .tp_methods = FingerprintList_methods,
+};
+
+/* CompareCursor */
+
+static int
+CompareCursor_traverse(CompareCursorObject *self, visitproc visit, void *arg) {
+  Py_VISIT(self->lists[0]);
+  Py_VISIT(self->lists[1]);
+  return 0;
+}
+
+/**
+ * @brief Free the native cursor and drop the lists
+ */
+static int
+CompareCursor_clear(CompareCursorObject *self) {
+  clc_free(self->cursor);
+  self->cursor = NULL;
+  PyMem_Free(self->batch);
+  self->batch = NULL;
+  self->capacity = 0;
+  name_cache_clear(&self->names);
+  Py_CLEAR(self->lists[0]);
+  Py_CLEAR(self->lists[1]);
+  return 0;
+}
+
+static void
+CompareCursor_dealloc(CompareCursorObject *self) {
+  PyObject_GC_UnTrack(self);
+  CompareCursor_clear(self);
+  PyObject_GC_Del(self);
+}
+
+/**
+ * @brief Fetch the next batch of raw results into self->batch
+ * @return Number of results, 0 once exhausted, -1 with an exception set
+ */
+static long
+cursor_fetch(CompareCursorObject *self, Py_ssize_t max) {
+  if (max < 1) {
+    PyErr_SetString(PyExc_ValueError, "batch_size must be a positive number");
+    return -1;
+  }
+  if (!self->cursor)
+    return 0;
+
+  if ((size_t)max > self->capacity) {
+    compare_t *batch = PyMem_Realloc(self->batch, (size_t)max * sizeof(compare_t));
+    if (!batch) {
+      PyErr_NoMemory();
+      return -1;
+    }
+    self->batch = batch;
+    self->capacity = (size_t)max;
+  }
+
+  FingerprintListObject *list1 = (FingerprintListObject *)self->lists[0];
+  FingerprintListObject *list2 = (FingerprintListObject *)self->lists[1];
+  if (list_acquire(list1) < 0)
+    return -1;
+  if (list2 && list_acquire(list2) < 0) {
+    list_release(list1);
+    return -1;
+  }
+
+  for (int l = 0; l < 2; l++) {
+    PyObject *list = self->lists[l];
+    if (!list)
+      continue;
+    FINGERPRINT_STORE *fpl = ((FingerprintListObject *)list)->fpl;
+    const char *changed = NULL;
+    if (fpl_size(fpl) != self->sizes[l])
+      changed = "FingerprintList changed size during iteration";
+    else if (fpl_mutations(fpl) != self->mutations[l])
+      changed = "FingerprintList was modified during iteration";
+    if (changed) {
+      if (list2)
+        list_release(list2);
+      list_release(list1);
+      PyErr_SetString(PyExc_RuntimeError, changed);
+      return -1;
+    }
+  }
+
+  long count;
+  Py_BEGIN_ALLOW_THREADS
+  count = clc_next(self->cursor, self->batch, (size_t)max);
+  Py_END_ALLOW_THREADS
+  if (list2)
+    list_release(list2);
+  list_release(list1);
+
+  if (count < 0) {
+    raise_error("Comparison failed");
+    return -1;
+  }
+  return count;
+}
+
+static PyObject *
+CompareCursor_fetch(CompareCursorObject *self, PyObject *arg) {
+  Py_ssize_t max = PyLong_AsSsize_t(arg);
+  if (max == -1 && PyErr_Occurred())
+    return NULL;
+
+  long count = cursor_fetch(self, max);
+  if (count < 0)
+    return NULL;
+
+  PyObject *out = PyList_New(0);
+  if (out && append_comparisons(out, self->batch, (size_t)count, &self->names) < 0)
+    Py_CLEAR(out);
+  return out;
+}
+
+static PyObject *
+CompareCursor_fetch_columns(CompareCursorObject *self, PyObject *arg) {
+  Py_ssize_t max = PyLong_AsSsize_t(arg);
+  if (max == -1 && PyErr_Occurred())
+    return NULL;
+
+  long count = cursor_fetch(self, max);
+  if (count <= 0) {
+    if (count < 0)
+      return NULL;
+    Py_RETURN_NONE;
+  }
+
+  PyObject *index1 = PyByteArray_FromStringAndSize(NULL, count * (Py_ssize_t)sizeof(size_t));
+  PyObject *index2 = PyByteArray_FromStringAndSize(NULL, count * (Py_ssize_t)sizeof(size_t));
+  PyObject *score = PyByteArray_FromStringAndSize(NULL, count);
+  if (!index1 || !index2 || !score) {
+    Py_XDECREF(index1);
+    Py_XDECREF(index2);
+    Py_XDECREF(score);
+    return NULL;
+  }
+
+  size_t *i1 = (size_t *)PyByteArray_AS_STRING(index1);
+  size_t *i2 = (size_t *)PyByteArray_AS_STRING(index2);
+  uint8_t *s = (uint8_t *)PyByteArray_AS_STRING(score);
+  for (long i = 0; i < count; i++) {
+    i1[i] = self->batch[i].index1;
+    i2[i] = self->batch[i].index2;
+    s[i] = self->batch[i].score;
+  }
+  return Py_BuildValue("(NNN)", index1, index2, score);
+}
+
+static PyObject *
+CompareCursor_close(CompareCursorObject *self, PyObject *Py_UNUSED(ignored)) {
+  CompareCursor_clear(self);
+  Py_RETURN_NONE;
+}
+
+static PyMethodDef CompareCursor_methods[] = {
+  {"fetch", (PyCFunction)CompareCursor_fetch, METH_O,
+   "fetch(max)\n--\n\nNext results as Comparison namedtuples, an empty list once exhausted."},
+  {"fetch_columns", (PyCFunction)CompareCursor_fetch_columns, METH_O,
+   "fetch_columns(max)\n--\n\n"
+   "Next results as (index1, index2, score) bytearrays of size_t, size_t and uint8 values,\n"
+   "None once exhausted."},
+  {"close", (PyCFunction)CompareCursor_close, METH_NOARGS,
+   "close()\n--\n\nRelease the cursor."},
+  {NULL}
+};
+
+static PyTypeObject CompareCursorType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.CompareCursor",
+  .tp_doc = "Incremental comparison opened by FingerprintList._cursor().",
+  .tp_basicsize = sizeof(CompareCursorObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,
+  .tp_dealloc = (destructor)CompareCursor_dealloc,
+  .tp_traverse = (traverseproc)CompareCursor_traverse,
+  .tp_clear = (inquiry)CompareCursor_clear,
+  .tp_methods = CompareCursor_methods,
+};
+
+/* FingerprintIndex */
+
+static int
+FingerprintIndex_traverse(FingerprintIndexObject *self, visitproc visit, void *arg) {
+  Py_VISIT(self->fpl);
+  return 0;
+}
+
+static int
+FingerprintIndex_clear(FingerprintIndexObject *self) {
+  fpi_destroy(self->fpi);
+  self->fpi = NULL;
+  Py_CLEAR(self->fpl);
+  return 0;
+}
+
+static void
+FingerprintIndex_dealloc(FingerprintIndexObject *self) {
+  PyObject_GC_UnTrack(self);
+  FingerprintIndex_clear(self);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+FingerprintIndex_build(FingerprintIndexObject *self, PyObject *args) {
+  PyObject *fpl;
+  int bands, rows;
+
+  if (!PyArg_ParseTuple(args, "O!ii:_build", &FingerprintListType, &fpl, &bands, &rows))
+    return NULL;
+  if (self->readers) {
+    PyErr_SetString(PyExc_BufferError, "FingerprintIndex is in use by another thread");
+    return NULL;
+  }
+  if (list_acquire((FingerprintListObject *)fpl) < 0)
+    return NULL;
+
+  FINGERPRINT_INDEX *fpi;
+  FINGERPRINT_STORE *store = ((FingerprintListObject *)fpl)->fpl;
+  self->readers++;
+  Py_BEGIN_ALLOW_THREADS
+  fpi = fpi_build(store, bands, rows);
+  Py_END_ALLOW_THREADS
+  self->readers--;
+  list_release((FingerprintListObject *)fpl);
+  if (!fpi)
+    return raise_error("Failed to build fingerprint index");
+
+  FingerprintIndex_clear(self);
+  Py_INCREF(fpl);
+  self->fpl = fpl;
+  self->fpi = fpi;
+  Py_RETURN_NONE;
+}
+
+/**
+ * @brief Check that the index was built
+ * @return 0 if it was, -1 with an exception set
+ */
+static int
+index_check(FingerprintIndexObject *self) {
+  if (!self->fpi) {
+    raise_error("Fingerprint index is not built");
+    return -1;
+  }
+  return 0;
+}
+
+/**
+ * @brief Take an index for a query with the GIL released
+ * @return 0 on success, -1 with an exception set
+ * @note The fingerprints added to the indexed list since the last query are
+ *       indexed here, with the GIL held, so concurrent queries only read the
+ *       index; the list cannot change until index_release()
+ */
+static int
+index_acquire(FingerprintIndexObject *self) {
+  if (index_check(self) < 0 || list_acquire((FingerprintListObject *)self->fpl) < 0)
+    return -1;
+  if (fpi_update(self->fpi) < 0) {
+    list_release((FingerprintListObject *)self->fpl);
+    raise_error("Failed to update fingerprint index");
+    return -1;
+  }
+  self->readers++;
+  return 0;
+}
+
+static void
+index_release(FingerprintIndexObject *self) {
+  self->readers--;
+  list_release((FingerprintListObject *)self->fpl);
+}
+
+static Py_ssize_t
+FingerprintIndex_len(FingerprintIndexObject *self) {
+  if (index_check(self) < 0)
+    return -1;
+  return (Py_ssize_t)fpi_size(self->fpi);
+}
+
+static PyObject *
+FingerprintIndex_query(FingerprintIndexObject *self, PyObject *args) {
+  PyObject *query;
+  int threshold;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "OiO&:_query", &query, &threshold, mode_arg, &file_comparison))
+    return NULL;
+  if (check_threshold(threshold) < 0)
+    return NULL;
+  if (!PyObject_TypeCheck(query, &FingerprintType) &&
+      !PyObject_TypeCheck(query, &FingerprintListType)) {
+    PyErr_SetString(PyExc_TypeError, "Can only query with Fingerprint or FingerprintList");
+    return NULL;
+  }
+  if (index_acquire(self) < 0)
+    return NULL;
+
+  compare_list_t *cl;
+  if (PyObject_TypeCheck(query, &FingerprintType)) {
+    FINGERPRINT *fp = ((FingerprintObject *)query)->fp;
+    Py_BEGIN_ALLOW_THREADS
+    cl = cl_fpi_fp(self->fpi, fp, (uint8_t)threshold, file_comparison);
+    Py_END_ALLOW_THREADS
+  } else {
+    FingerprintListObject *list = (FingerprintListObject *)query;
+    if (list_acquire(list) < 0) {
+      index_release(self);
+      return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    cl = cl_fpi_fpl(self->fpi, list->fpl, (uint8_t)threshold, file_comparison);
+    Py_END_ALLOW_THREADS
+    list_release(list);
+  }
+  index_release(self);
+  return comparisons_from_cl(cl);
+}
+
+static PyObject *
+FingerprintIndex_compare_all(FingerprintIndexObject *self, PyObject *args) {
+  int threshold;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "iO&:_compare_all", &threshold, mode_arg, &file_comparison))
+    return NULL;
+  if (check_threshold(threshold) < 0 || index_acquire(self) < 0)
+    return NULL;
+
+  compare_list_t *cl;
+  Py_BEGIN_ALLOW_THREADS
+  cl = cl_fpi_all(self->fpi, (uint8_t)threshold, file_comparison);
+  Py_END_ALLOW_THREADS
+  index_release(self);
+  return comparisons_from_cl(cl);
+}
+
+static PyMethodDef FingerprintIndex_methods[] = {
+  {"_build", (PyCFunction)FingerprintIndex_build, METH_VARARGS,
+   "_build(fpl, bands, rows)\n--\n\nIndex every fingerprint of a list."},
+  {"_query", (PyCFunction)FingerprintIndex_query, METH_VARARGS,
+   "_query(query, threshold, mode)\n--\n\nRescore the candidates of a Fingerprint or FingerprintList."},
+  {"_compare_all", (PyCFunction)FingerprintIndex_compare_all, METH_VARARGS,
+   "_compare_all(threshold, mode)\n--\n\nRescore the candidate pairs within the indexed list."},
+  {NULL}
+};
+
+static PySequenceMethods FingerprintIndex_as_sequence = {
+  .sq_length = (lenfunc)FingerprintIndex_len,
+};
+
+static PyTypeObject FingerprintIndexType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.FingerprintIndex",
+  .tp_doc = "Native candidate index.",
+  .tp_basicsize = sizeof(FingerprintIndexObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_GC,
+  .tp_new = PyType_GenericNew,
+  .tp_dealloc = (destructor)FingerprintIndex_dealloc,
+  .tp_traverse = (traverseproc)FingerprintIndex_traverse,
+  .tp_clear = (inquiry)FingerprintIndex_clear,
+  .tp_as_sequence = &FingerprintIndex_as_sequence,
+  .tp_methods = FingerprintIndex_methods,
+};
+
+/* FingerprintClusterer */
+
+/**
+ * @brief Check that no other thread is updating a clusterer
+ * @return 0 if it can be used, -1 with BufferError set
+ */
+static int
+clusterer_idle(FingerprintClustererObject *self) {
+  if (self->busy) {
+    PyErr_SetString(PyExc_BufferError, "FingerprintClusterer is being updated by another thread");
+    return -1;
+  }
+  return 0;
+}
+
+static int
+FingerprintClusterer_traverse(FingerprintClustererObject *self, visitproc visit, void *arg) {
+  Py_VISIT(self->fpl);
+  return 0;
+}
+
+static int
+FingerprintClusterer_clear(FingerprintClustererObject *self) {
+  fpc_destroy(self->fpc);
+  self->fpc = NULL;
+  Py_CLEAR(self->fpl);
+  return 0;
+}
+
+static void
+FingerprintClusterer_dealloc(FingerprintClustererObject *self) {
+  PyObject_GC_UnTrack(self);
+  FingerprintClusterer_clear(self);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+FingerprintClusterer_init_native(FingerprintClustererObject *self, PyObject *args) {
+  PyObject *fpl;
+  int threshold, bands, rows;
+  bool file_comparison;
+
+  if (!PyArg_ParseTuple(args, "O!iO&ii:_init", &FingerprintListType, &fpl, &threshold, mode_arg,
+                        &file_comparison, &bands, &rows))
+    return NULL;
+  if (check_threshold(threshold) < 0 || clusterer_idle(self) < 0 ||
+      list_check_read((FingerprintListObject *)fpl) < 0)
+    return NULL;
+
+  fp_clusterer_t *fpc = fpc_init(((FingerprintListObject *)fpl)->fpl, (uint8_t)threshold,
+                                 file_comparison, bands, rows);
+  if (!fpc)
+    return raise_error("Failed to create fingerprint clusterer");
+
+  FingerprintClusterer_clear(self);
+  Py_INCREF(fpl);
+  self->fpl = fpl;
+  self->fpc = fpc;
+  Py_RETURN_NONE;
+}
+
+/**
+ * @brief Check that the clusterer was created
+ * @return 0 if it was, -1 with an exception set
+ */
+static int
+clusterer_check(FingerprintClustererObject *self) {
+  if (clusterer_idle(self) < 0)
+    return -1;
+  if (!self->fpc) {
+    raise_error("Fingerprint clusterer is not initialized");
+    return -1;
+  }
+  return 0;
+}
+
+static Py_ssize_t
+FingerprintClusterer_len(FingerprintClustererObject *self) {
+  if (clusterer_check(self) < 0)
+    return -1;
+  return (Py_ssize_t)fpc_count(self->fpc);
+}
+
+static PyObject *
+FingerprintClusterer_update(FingerprintClustererObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (clusterer_check(self) < 0 || list_acquire((FingerprintListObject *)self->fpl) < 0)
+    return NULL;
+  if (fpc_stale(self->fpc)) {
+    list_release((FingerprintListObject *)self->fpl);
+    return raise_error("FingerprintList was modified in place; cluster it again");
+  }
+
+  long added;
+  self->busy = true;
+  Py_BEGIN_ALLOW_THREADS
+  added = fpc_update(self->fpc);
+  Py_END_ALLOW_THREADS
+  self->busy = false;
+  list_release((FingerprintListObject *)self->fpl);
+  if (added < 0)
+    return raise_error("Failed to cluster fingerprints");
+  return PyLong_FromLong(added);
+}
+
+static PyObject *
+FingerprintClusterer_restore(FingerprintClustererObject *self, PyObject *args) {
+  Py_buffer labels;
+
+  if (clusterer_check(self) < 0 || !PyArg_ParseTuple(args, "y*:_restore", &labels))
+    return NULL;
+  if (labels.len % sizeof(uint64_t) != 0) {
+    PyErr_SetString(PyExc_ValueError, "labels must be a buffer of 64-bit integers");
+    PyBuffer_Release(&labels);
+    return NULL;
+  }
+
+  int err = fpc_restore(self->fpc, labels.buf, (size_t)labels.len / sizeof(uint64_t)) < 0 ? errno : 0;
+  PyBuffer_Release(&labels);
+  if (err == EINVAL) {
+    PyErr_SetString(PyExc_ValueError, "labels are not a clustering of the list");
+    return NULL;
+  }
+  if (err)
+    return PyErr_NoMemory();
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+FingerprintClusterer_size(FingerprintClustererObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (clusterer_check(self) < 0)
+    return NULL;
+  return PyLong_FromSize_t(fpc_size(self->fpc));
+}
+
+static PyObject *
+FingerprintClusterer_cluster(FingerprintClustererObject *self, PyObject *arg) {
+  Py_ssize_t item = PyLong_AsSsize_t(arg);
+  if ((item == -1 && PyErr_Occurred()) || clusterer_check(self) < 0)
+    return NULL;
+
+  long cluster = item < 0 ? -1 : fpc_cluster(self->fpc, (size_t)item);
+  if (cluster < 0) {
+    PyErr_Format(PyExc_IndexError, "fingerprint %zd is not clustered", item);
+    return NULL;
+  }
+  return PyLong_FromLong(cluster);
+}
+
+static PyObject *
+FingerprintClusterer_members(FingerprintClustererObject *self, PyObject *arg) {
+  Py_ssize_t item = PyLong_AsSsize_t(arg);
+  if ((item == -1 && PyErr_Occurred()) || clusterer_check(self) < 0)
+    return NULL;
+
+  long count = item < 0 ? -1 : fpc_members(self->fpc, (size_t)item, NULL);
+  if (count < 0) {
+    PyErr_Format(PyExc_IndexError, "fingerprint %zd is not clustered", item);
+    return NULL;
+  }
+
+  size_t *members = PyMem_Malloc((size_t)count * sizeof(size_t));
+  if (!members)
+    return PyErr_NoMemory();
+  fpc_members(self->fpc, (size_t)item, members);
+
+  PyObject *out = PyList_New(count);
+  for (long m = 0; out && m < count; m++) {
+    PyObject *position = PyLong_FromSize_t(members[m]);
+    if (!position) {
+      Py_CLEAR(out);
+      break;
+    }
+    PyList_SET_ITEM(out, m, position);
+  }
+  PyMem_Free(members);
+  return out;
+}
+
+static PyObject *
+FingerprintClusterer_labels(FingerprintClustererObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (clusterer_check(self) < 0)
+    return NULL;
+
+  size_t size = fpc_size(self->fpc);
+  PyObject *out = PyByteArray_FromStringAndSize(NULL, (Py_ssize_t)(size * sizeof(uint64_t)));
+  if (out)
+    fpc_labels(self->fpc, (uint64_t *)PyByteArray_AS_STRING(out));
+  return out;
+}
+
+static PyMethodDef FingerprintClusterer_methods[] = {
+  {"_init", (PyCFunction)FingerprintClusterer_init_native, METH_VARARGS,
+   "_init(fpl, threshold, mode, bands, rows)\n--\n\nStart clustering a list."},
+  {"_update", (PyCFunction)FingerprintClusterer_update, METH_NOARGS,
+   "_update()\n--\n\nCluster the fingerprints added to the list since the last update."},
+  {"_restore", (PyCFunction)FingerprintClusterer_restore, METH_VARARGS,
+   "_restore(labels)\n--\n\nRestore the clustering given by a buffer of 64-bit cluster ids."},
+  {"_size", (PyCFunction)FingerprintClusterer_size, METH_NOARGS,
+   "_size()\n--\n\nNumber of clustered fingerprints."},
+  {"_cluster", (PyCFunction)FingerprintClusterer_cluster, METH_O,
+   "_cluster(item)\n--\n\nCluster id of the fingerprint at a position."},
+  {"_members", (PyCFunction)FingerprintClusterer_members, METH_O,
+   "_members(item)\n--\n\nPositions of the members of the cluster of a fingerprint, ascending."},
+  {"_labels", (PyCFunction)FingerprintClusterer_labels, METH_NOARGS,
+   "_labels()\n--\n\nCluster id of every clustered fingerprint, as a bytearray of 64-bit integers."},
+  {NULL}
+};
+
+static PySequenceMethods FingerprintClusterer_as_sequence = {
+  .sq_length = (lenfunc)FingerprintClusterer_len,
+};
+
+static PyTypeObject FingerprintClustererType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.FingerprintClusterer",
+  .tp_doc = "Native incremental clusterer.",
+  .tp_basicsize = sizeof(FingerprintClustererObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_GC,
+  .tp_new = PyType_GenericNew,
+  .tp_dealloc = (destructor)FingerprintClusterer_dealloc,
+  .tp_traverse = (traverseproc)FingerprintClusterer_traverse,
+  .tp_clear = (inquiry)FingerprintClusterer_clear,
+  .tp_as_sequence = &FingerprintClusterer_as_sequence,
+  .tp_methods = FingerprintClusterer_methods,
+};
+
+/* HashCache */
+
+static void
+HashCache_dealloc(HashCacheObject *self) {
+  hc_close(self->hc);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+HashCache_open(HashCacheObject *self, PyObject *args) {
+  PyObject *path;
+  Py_ssize_t max_entries;
+  unsigned long long max_bytes;
+
+  if (!PyArg_ParseTuple(args, "O&nK:_open", PyUnicode_FSConverter, &path, &max_entries, &max_bytes))
+    return NULL;
+
+  hash_cache_t *hc;
+  Py_BEGIN_ALLOW_THREADS
+  hc = hc_open(PyBytes_AS_STRING(path), (size_t)max_entries, (uint64_t)max_bytes);
+  Py_END_ALLOW_THREADS
+  Py_DECREF(path);
+
+  if (!hc)
+    Py_RETURN_FALSE;
+  hc_close(self->hc);
+  self->hc = hc;
+  Py_RETURN_TRUE;
+}
+
+static PyObject *
+HashCache_save(HashCacheObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (!self->hc)
+    return raise_error("Hash cache is closed");
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = hc_save(self->hc);
+  Py_END_ALLOW_THREADS
+
+  if (err != 0)
+    return raise_errno(err);
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+HashCache_size(HashCacheObject *self, PyObject *Py_UNUSED(ignored)) {
+  if (!self->hc)
+    return raise_error("Hash cache is closed");
+  return PyLong_FromSize_t(hc_size(self->hc));
+}
+
+static PyObject *
+HashCache_close(HashCacheObject *self, PyObject *Py_UNUSED(ignored)) {
+  hc_close(self->hc);
+  self->hc = NULL;
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+HashCache_get_closed(HashCacheObject *self, void *Py_UNUSED(closure)) {
+  return PyBool_FromLong(self->hc == NULL);
+}
+
+static PyMethodDef HashCache_methods[] = {
+  {"_open", (PyCFunction)HashCache_open, METH_VARARGS,
+   "_open(path, max_entries, max_bytes)\n--\n\nLoad a cache file; returns False if it cannot be opened."},
+  {"_save", (PyCFunction)HashCache_save, METH_NOARGS,
+   "_save()\n--\n\nWrite the cache to its file, raising OSError on failure."},
+  {"_size", (PyCFunction)HashCache_size, METH_NOARGS,
+   "_size()\n--\n\nNumber of cached fingerprints."},
+  {"_close", (PyCFunction)HashCache_close, METH_NOARGS,
+   "_close()\n--\n\nRelease the cache without saving it."},
+  {NULL}
+};
+
+static PyGetSetDef HashCache_getset[] = {
+  {"closed", (getter)HashCache_get_closed, NULL, "Whether the cache is closed.", NULL},
+  {NULL}
+};
+
+static PyTypeObject HashCacheType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "mrsh._mrsh.HashCache",
+  .tp_doc = "Native fingerprint cache.",
+  .tp_basicsize = sizeof(HashCacheObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+  .tp_new = PyType_GenericNew,
+  .tp_dealloc = (destructor)HashCache_dealloc,
+  .tp_methods = HashCache_methods,
+  .tp_getset = HashCache_getset,
+};
+
+/* Module */
+
+/**
+ * @brief Check that a type is a tuple subclass that can be filled in place
+ */
+static int
+check_record_type(PyObject *type, const char *name) {
+  if (!PyType_Check(type) || !PyType_IsSubtype((PyTypeObject *)type, &PyTuple_Type) ||
+      ((PyTypeObject *)type)->tp_basicsize != PyTuple_Type.tp_basicsize) {
+    PyErr_Format(PyExc_TypeError, "%s must be a namedtuple class", name);
+    return -1;
+  }
+  return 0;
+}
+
+static PyObject *
+mrsh_setup(PyObject *module, PyObject *args) {
+  PyObject *error, *comparison, *metadata;
+
+  if (!PyArg_ParseTuple(args, "OOO:_setup", &error, &comparison, &metadata))
+    return NULL;
+  if (!PyExceptionClass_Check(error)) {
+    PyErr_SetString(PyExc_TypeError, "error must be an exception class");
+    return NULL;
+  }
+  if (check_record_type(comparison, "comparison") < 0 || check_record_type(metadata, "metadata") < 0)
+    return NULL;
+
+  Py_INCREF(error);
+  Py_XSETREF(error_type, error);
+  Py_INCREF(comparison);
+  Py_XSETREF(comparison_type, (PyTypeObject *)comparison);
+  Py_INCREF(metadata);
+  Py_XSETREF(metadata_type, (PyTypeObject *)metadata);
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+mrsh_str_compare(PyObject *module, PyObject *args) {
+  const char *digest1, *digest2;
+  bool file_comparison = false;
+
+  if (!PyArg_ParseTuple(args, "ss|O&:str_compare", &digest1, &digest2, mode_arg, &file_comparison))
+    return NULL;
+  return PyLong_FromLong(str_compare(digest1, digest2, file_comparison));
+}
+
+static PyObject *
+mrsh_str_compare_many(PyObject *module, PyObject *args) {
+  const char *digest;
+  PyObject *digests_obj, *seq, *result = NULL;
+
+  bool file_comparison = false;
+
+  if (!PyArg_ParseTuple(args, "sO|O&:str_compare_many", &digest, &digests_obj, mode_arg,
+                        &file_comparison))
+    return NULL;
+
+  seq = PySequence_Fast(digests_obj, "digests must be a sequence");
+  if (!seq)
+    return NULL;
+
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+  PyObject **items = PySequence_Fast_ITEMS(seq);
+  const char **digests = PyMem_Malloc((count ? count : 1) * sizeof(char *));
+  uint8_t *scores = PyMem_Malloc(count ? count : 1);
+  if (!digests || !scores) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  for (Py_ssize_t i = 0; i < count; i++) {
+    if (!PyUnicode_Check(items[i])) {
+      PyErr_Format(PyExc_TypeError, "Digests must be str, not %.200s", Py_TYPE(items[i])->tp_name);
+      goto done;
+    }
+    digests[i] = PyUnicode_AsUTF8(items[i]);
+    if (!digests[i])
+      goto done;
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  str_compare_many(digest, digests, (size_t)count, file_comparison, scores);
+  Py_END_ALLOW_THREADS
+
+  result = PyList_New(count);
+  for (Py_ssize_t i = 0; result && i < count; i++)
+    PyList_SET_ITEM(result, i, PyLong_FromLong(scores[i]));
+
+done:
+  PyMem_Free(digests);
+  PyMem_Free(scores);
+  Py_DECREF(seq);
+  return result;
+}
+
+// Field names of MRSH_STATS, in declaration order
+static const char *const stats_fields[] = {
+  "bytes_hashed", "inputs_hashed", "chunks", "filters", "max_filters", "comparisons",
+  "pairs_pruned", "filter_comparisons", "hash_ns", "compare_ns", "io_ns",
+};
+
+static PyObject *
+mrsh_stats(PyObject *module, PyObject *Py_UNUSED(ignored)) {
+  MRSH_STATS snapshot;
+  stats_snapshot(&snapshot);
+
+  const uint64_t *values = (const uint64_t *)&snapshot;
+  PyObject *result = PyDict_New();
+  for (size_t i = 0; result && i < sizeof(stats_fields) / sizeof(stats_fields[0]); i++) {
+    PyObject *value = PyLong_FromUnsignedLongLong(values[i]);
+    if (!value || PyDict_SetItemString(result, stats_fields[i], value) < 0)
+      Py_CLEAR(result);
+    Py_XDECREF(value);
+  }
+  return result;
+}
+
+static PyObject *
+mrsh_stats_enable(PyObject *module, PyObject *arg) {
+  int enabled = PyObject_IsTrue(arg);
+  if (enabled < 0)
+    return NULL;
+
+  PyObject *previous = PyBool_FromLong(stats_enabled);
+  stats_enable(enabled);
+  return previous;
+}
+
+static PyObject *
+mrsh_stats_reset(PyObject *module, PyObject *Py_UNUSED(ignored)) {
+  stats_reset();
+  Py_RETURN_NONE;
+}
+
+static PyMethodDef mrsh_methods[] = {
+  {"_setup", mrsh_setup, METH_VARARGS,
+   "_setup(error, comparison, metadata)\n--\n\n"
+   "Register the exception raised on failures and the namedtuple result types."},
+  {"str_compare", mrsh_str_compare, METH_VARARGS,
+   "str_compare(digest1, digest2, mode='fragment')\n--\n\nCompare two hex digests."},
+  {"str_compare_many", mrsh_str_compare_many, METH_VARARGS,
+   "str_compare_many(digest, digests, mode='fragment')\n--\n\nCompare a hex digest, parsed once, with a sequence of digests."},
+  {"_stats", mrsh_stats, METH_NOARGS,
+   "_stats()\n--\n\nCurrent instrumentation counters as a dict of integers."},
+  {"_stats_enable", mrsh_stats_enable, METH_O,
+   "_stats_enable(enabled)\n--\n\nTurn counter collection on or off, returning the previous state."},
+  {"_stats_reset", mrsh_stats_reset, METH_NOARGS,
+   "_stats_reset()\n--\n\nSet every counter to zero."},
+  {NULL}
+};
+
+static struct PyModuleDef mrsh_module = {
+  PyModuleDef_HEAD_INIT,
+  .m_name = "_mrsh",
+  .m_doc = "Native core of the MRSHw Python bindings.",
+  .m_size = -1,
+  .m_methods = mrsh_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__mrsh(void) {
+  static PyTypeObject *types[] = {
+    &FingerprintType, &HasherType, &FingerprintListType,
+    &FingerprintIndexType, &FingerprintClustererType, &HashCacheType, &CompareCursorType,
+  };
+
+  for (size_t t = 0; t < sizeof(types) / sizeof(types[0]); t++) {
+    if (PyType_Ready(types[t]) < 0)
+      return NULL;
+  }
+
+  PyObject *module = PyModule_Create(&mrsh_module);
+  if (!module)
+    return NULL;
+
+  for (size_t t = 0; t < sizeof(types) / sizeof(types[0]); t++) {
+    const char *name = strrchr(types[t]->tp_name, '.') + 1;
+    Py_INCREF(types[t]);
+    if (PyModule_AddObject(module, name, (PyObject *)types[t]) < 0) {
+      Py_DECREF(types[t]);
+      Py_DECREF(module);
+      return NULL;
+    }
+  }
+
+  // index parameters, so the bindings cannot drift from fingerprintIndex.h
+  if (PyModule_AddIntConstant(module, "INDEX_BINS", INDEX_BINS) < 0 ||
+      PyModule_AddIntConstant(module, "INDEX_DEFAULT_BANDS", INDEX_DEFAULT_BANDS) < 0 ||
+      PyModule_AddIntConstant(module, "INDEX_DEFAULT_ROWS", INDEX_DEFAULT_ROWS) < 0) {
+    Py_DECREF(module);
+    return NULL;
+  }
+  return module;
+}
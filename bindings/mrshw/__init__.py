@@ -12,19 +12,74 @@ __email__ = "ifkovics.barnabas@example.com"
 from .core import (
     Fingerprint,
     FingerprintList,
+    FingerprintView,
+    Hasher,
     hash,
     compare,
     diff,
+    diff_many,
     MRSHwException,
     MRSHwError
 )
+from .index import FingerprintIndex
+from .cluster import FingerprintClusterer
+from .cache import HashCache, set_default_cache, get_default_cache
+from .stats import stats, enable_stats, reset_stats, StatsCollector
+
+# Names of modules that pull in asyncio, multiprocessing or sockets are
+# imported on first use, so that `import mrsh` stays cheap
+_LAZY = {
+    'ahash': 'aio',
+    'set_executor': 'aio',
+    'get_executor': 'aio',
+    'compare_sharded': 'shard',
+    'iter_sharded_results': 'shard',
+    'PacketMatcher': 'packet',
+    'LookupServer': 'server',
+    'LookupClient': 'server',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 __all__ = [
     'Fingerprint',
     'FingerprintList',
+    'FingerprintView',
+    'FingerprintIndex',
+    'FingerprintClusterer',
+    'HashCache',
+    'set_default_cache',
+    'get_default_cache',
+    'Hasher',
     'hash',
+    'ahash',
+    'set_executor',
+    'get_executor',
     'compare',
     'diff',
+    'diff_many',
+    'compare_sharded',
+    'iter_sharded_results',
+    'stats',
+    'enable_stats',
+    'reset_stats',
+    'StatsCollector',
+    'PacketMatcher',
+    'LookupServer',
+    'LookupClient',
     'MRSHwException',
     'MRSHwError',
     '__version__'
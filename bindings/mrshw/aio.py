@@ -0,0 +1,136 @@
+"""
+asyncio support: run hashing and comparisons without blocking the event loop.
+"""
+
+import os
+import asyncio
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional, Union, Tuple, List, Callable, Any
+
+from .core import Fingerprint, FingerprintList, Comparison, BytesLike, _check_batch_size
+
+
+# Native calls release the GIL, so threads hash and compare in parallel
+_executor = None
+_owned_executor = False
+_max_concurrency = None
+
+# Concurrency limit of every running event loop
+_limits = weakref.WeakKeyDictionary()
+
+
+def set_executor(executor: Optional[Executor] = None, max_concurrency: Optional[int] = None) -> None:
+    """
+    Set the executor the asynchronous functions run native calls on.
+
+    Without a call to this function, a thread pool with one thread per CPU
+    is created on first use. An executor created that way is shut down when
+    it is replaced; a passed executor is left to its owner.
+
+    Args:
+        executor: Executor to use, None for the default thread pool
+        max_concurrency: Maximum number of native calls in flight per event
+            loop (None for the number of executor threads, or CPUs)
+
+    Raises:
+        ValueError: If max_concurrency is not a positive number
+    """
+    global _executor, _owned_executor, _max_concurrency
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("max_concurrency must be a positive number or None")
+
+    if _owned_executor:
+        _executor.shutdown(wait=False)
+    _executor = executor
+    _owned_executor = False
+    _max_concurrency = max_concurrency
+    _limits.clear()
+
+
+def get_executor() -> Executor:
+    """Get the executor of the asynchronous functions, creating the default thread pool on first use."""
+    global _executor, _owned_executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="mrsh")
+        _owned_executor = True
+    return _executor
+
+
+def _limit() -> asyncio.Semaphore:
+    """Concurrency limit of the running event loop."""
+    loop = asyncio.get_running_loop()
+    limit = _limits.get(loop)
+    if limit is None:
+        executor = get_executor()
+        size = _max_concurrency or getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+        limit = _limits[loop] = asyncio.Semaphore(size)
+    return limit
+
+
+async def run(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking call on the executor.
+
+    Waits while max_concurrency calls are in flight. Cancelling the caller
+    before the call starts withdraws it; a native call that is already
+    running completes in the background and its result is dropped.
+
+    Args:
+        func: Callable to run, e.g. a bound method of a FingerprintList
+        *args: Positional arguments of func
+        **kwargs: Keyword arguments of func
+
+    Returns:
+        Result of func
+    """
+    async with _limit():
+        return await asyncio.wrap_future(get_executor().submit(func, *args, **kwargs))
+
+
+async def ahash(data: Union[str, BytesLike, Tuple[Union[str, BytesLike], str]]) -> str:
+    """
+    Asynchronous hash(): hash data on the executor.
+
+    Args:
+        data: Data to hash (file path, bytes-like object, or (data, label) tuple)
+
+    Returns:
+        Hexadecimal hash string
+    """
+    fp = await run(Fingerprint, data)
+    return fp.hexdigest()
+
+
+async def _drain(open_cursor: Callable, batch_size: int) -> List[Comparison]:
+    """
+    Collect the results of a comparison cursor batch by batch on the executor.
+
+    Every batch is a separate native call, so a cancelled comparison stops
+    after the batch in flight instead of running to the end.
+    """
+    cursor = open_cursor()
+    future = None
+    try:
+        results = []
+        while True:
+            async with _limit():
+                future = get_executor().submit(cursor.fetch, batch_size)
+                batch = await asyncio.wrap_future(future)
+            if not batch:
+                return results
+            results.extend(batch)
+    finally:
+        if future is not None and not future.done() and not future.cancel():
+            # cancelled while a batch is computed: close once it is done
+            future.add_done_callback(lambda _: cursor.close())
+        else:
+            cursor.close()
+
+
+async def _compare(fpl: FingerprintList, other: Union[Fingerprint, FingerprintList, None],
+                   threshold: int, workers: int, top_k: int, mode: str,
+                   batch_size: int) -> List[Comparison]:
+    """Asynchronous FingerprintList comparison, other is None to compare the list with itself."""
+    batch_size = _check_batch_size(batch_size)
+    return await _drain(lambda: fpl._cursor(other, threshold, top_k, mode, workers), batch_size)
@@ -0,0 +1,170 @@
+"""
+Persistent fingerprint cache to skip re-hashing unchanged files.
+"""
+
+import os
+import atexit
+from typing import Optional, Union
+
+from . import _mrsh as _native
+from .core import MRSHwError
+
+
+# Defaults for the size of a cache file
+DEFAULT_MAX_ENTRIES = 0
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+class HashCache(_native.HashCache):
+    """
+    On-disk cache of file fingerprints.
+
+    A file is identified by its device, inode, size and modification time
+    (in nanoseconds). As long as none of these change, adding the file again
+    copies its cached fingerprint instead of hashing it, so rescanning a
+    mostly unchanged corpus costs little more than a stat() per file. Any
+    change to the file changes its key; the stale fingerprint is never used
+    again and is eventually evicted.
+
+    The cache file is written by save() (and close()), keeping only the most
+    recently used fingerprints that fit max_entries and max_bytes. A missing
+    or unreadable cache file simply starts an empty cache.
+
+    Example:
+        with HashCache("~/.cache/mrsh/hashcache.mrsh") as cache:
+            fpl = FingerprintList()
+            fpl.ingest("/malware/samples", cache=cache)
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 max_bytes: Optional[int] = DEFAULT_MAX_BYTES):
+        """
+        Open a cache file.
+
+        Args:
+            path: Cache file, created on the first save
+            max_entries: Maximum number of fingerprints kept (0 or None for no limit)
+            max_bytes: Maximum size of the cache file (0 or None for no limit)
+
+        Raises:
+            ValueError: If a limit is negative
+            MRSHwError: If the cache cannot be opened
+        """
+        max_entries = max_entries or 0
+        max_bytes = max_bytes or 0
+        if max_entries < 0 or max_bytes < 0:
+            raise ValueError("Cache limits must not be negative")
+
+        self.path = os.path.expanduser(os.fspath(path))
+        if not self._open(self.path, max_entries, max_bytes):
+            raise MRSHwError(f"Failed to open hash cache {self.path}")
+
+    def __enter__(self) -> 'HashCache':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of cached fingerprints."""
+        self._check_open()
+        return self._size()
+
+    def __repr__(self) -> str:
+        """Detailed string representation."""
+        if self.closed:
+            return f"HashCache(path={self.path!r}, closed)"
+        return f"HashCache(path={self.path!r}, size={len(self)})"
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise MRSHwError("Hash cache is closed")
+
+    def save(self) -> None:
+        """
+        Write the cache to its file, evicting the least recently used
+        fingerprints beyond the limits. The file is replaced atomically.
+
+        Raises:
+            MRSHwError: If the file cannot be written
+        """
+        self._check_open()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        try:
+            self._save()
+        except OSError as e:
+            raise MRSHwError(f"Failed to save hash cache to {self.path}: {e.strerror}") from None
+
+    def close(self) -> None:
+        """Save the cache and release it."""
+        if not self.closed:
+            try:
+                self.save()
+            finally:
+                self._close()
+
+
+def default_cache_path() -> str:
+    """
+    Cache file used by the command line interface: $MRSH_CACHE, otherwise
+    hashcache.mrsh in $XDG_CACHE_HOME/mrsh (~/.cache/mrsh).
+    """
+    path = os.environ.get("MRSH_CACHE")
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "mrsh", "hashcache.mrsh")
+
+
+_default_cache = None
+
+
+def set_default_cache(cache: Optional[HashCache]) -> None:
+    """
+    Set the cache used when no cache is passed explicitly.
+
+    FingerprintList.add(), FingerprintList.ingest() and scan_directory() use
+    the default cache unless called with cache=False. Without a call to this
+    function, the MRSH_CACHE environment variable names the default cache
+    file; the default cache is saved when the interpreter exits.
+
+    Args:
+        cache: HashCache to use by default, or None to disable caching
+    """
+    global _default_cache
+    _default_cache = cache if cache is not None else False
+
+
+def get_default_cache() -> Optional[HashCache]:
+    """Get the default cache, opening the one named by MRSH_CACHE on first use."""
+    global _default_cache
+    if _default_cache is None:
+        path = os.environ.get("MRSH_CACHE")
+        _default_cache = HashCache(path) if path else False
+    return _default_cache if _default_cache is not False else None
+
+
+def _save_default_cache() -> None:
+    if isinstance(_default_cache, HashCache) and not _default_cache.closed:
+        try:
+            _default_cache.save()
+        except MRSHwError:
+            pass
+
+
+atexit.register(_save_default_cache)
+
+
+def _resolve_cache(cache: Union[HashCache, bool, None]) -> Optional[HashCache]:
+    """Map a cache argument to the cache to use: None means the default cache."""
+    if cache is None or cache is True:
+        return get_default_cache()
+    if cache is False:
+        return None
+    if not isinstance(cache, HashCache):
+        raise TypeError("cache must be a HashCache, True, False or None")
+    cache._check_open()
+    return cache
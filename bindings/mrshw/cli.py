@@ -3,10 +3,22 @@ Command-line interface for MRSHw.
 """
 
 import argparse
+import asyncio
 import sys
 from pathlib import Path
 from . import hash, compare, __version__
 from .utils import scan_directory
+from .cache import HashCache, default_cache_path
+from .stats import stats, enable_stats
+from .index import DEFAULT_BANDS, DEFAULT_ROWS
+from .server import LookupServer, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_MAX_REQUEST
+
+
+def print_stats(counters, file=sys.stderr):
+    """Print instrumentation counters, one per line."""
+    print("Stats:", file=file)
+    for name, value in counters.items():
+        print(f"  {name}: {value:.6f}" if isinstance(value, float) else f"  {name}: {value}", file=file)
 
 
 def main():
@@ -14,21 +26,28 @@ def main():
     parser = argparse.ArgumentParser(description="MRSH - Malware Resistant Similarity Hashing")
     parser.add_argument('--version', action='version', version=f'MRSH {__version__}')
 
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--stats', action='store_true',
+                        help='Print hashing and comparison counters to stderr when done')
+
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Hash command
-    hash_parser = subparsers.add_parser('hash', help='Generate hash for a file')
+    hash_parser = subparsers.add_parser('hash', parents=[common], help='Generate hash for a file')
     hash_parser.add_argument('file', help='File to hash')
 
     # Compare command
-    compare_parser = subparsers.add_parser('compare', help='Compare two files or hashes')
+    compare_parser = subparsers.add_parser('compare', parents=[common], help='Compare two files or hashes')
     compare_parser.add_argument('input1', help='First file or hash')
     compare_parser.add_argument('input2', help='Second file or hash')
     compare_parser.add_argument('--threshold', '-t', type=int, default=0,
                                help='Similarity threshold')
+    compare_parser.add_argument('--mode', '-m', choices=['fragment', 'file'], default='fragment',
+                               help='Score relative to the smaller (fragment) or larger (file) input')
 
     # Scan command
-    scan_parser = subparsers.add_parser('scan', help='Scan directory for similar files')
+    scan_parser = subparsers.add_parser('scan', parents=[common], help='Scan directory for similar files')
     scan_parser.add_argument('directory', help='Directory to scan')
     scan_parser.add_argument('--recursive', '-r', action='store_true',
                             help='Scan recursively')
@@ -36,6 +55,46 @@ def main():
                             help='Similarity threshold')
     scan_parser.add_argument('--extensions', '-e', nargs='*',
                             help='File extensions to include')
+    scan_parser.add_argument('--mode', '-m', choices=['fragment', 'file'], default='fragment',
+                            help='Score relative to the smaller (fragment) or larger (file) file')
+    scan_parser.add_argument('--workers', '-j', type=int, default=1,
+                            help='Hashing and comparison threads (0 uses all CPUs)')
+    scan_parser.add_argument('--queue-size', type=int, default=0,
+                            help='Files in flight while hashing (0 for 4 per thread)')
+    scan_parser.add_argument('--cache', metavar='PATH', default=None,
+                            help='Hash cache file (default: $MRSH_CACHE or ~/.cache/mrsh/hashcache.mrsh)')
+    scan_parser.add_argument('--no-cache', action='store_true',
+                            help='Hash every file instead of using the hash cache')
+
+    # Serve command
+    serve_parser = subparsers.add_parser('serve', parents=[common],
+                                         help='Keep reference fingerprints in memory and answer lookups')
+    serve_parser.add_argument('source', help='Saved fingerprint list or directory to hash')
+    serve_parser.add_argument('--socket', '-s', metavar='PATH', default=None,
+                             help='Listen on a Unix socket instead of TCP')
+    serve_parser.add_argument('--host', default=DEFAULT_HOST,
+                             help='TCP address to listen on')
+    serve_parser.add_argument('--port', '-p', type=int, default=DEFAULT_PORT,
+                             help='TCP port to listen on')
+    serve_parser.add_argument('--threshold', '-t', type=int, default=0,
+                             help='Default similarity threshold of a lookup')
+    serve_parser.add_argument('--mode', '-m', choices=['fragment', 'file'], default='fragment',
+                             help='Default scoring of a lookup')
+    serve_parser.add_argument('--top-k', '-k', type=int, default=None,
+                             help='Default number of best matches per item')
+    serve_parser.add_argument('--workers', '-j', type=int, default=1,
+                             help='Comparison threads per lookup (0 uses all CPUs)')
+    serve_parser.add_argument('--index', action='store_true',
+                             help='Look up candidates in a MinHash index instead of comparing all '
+                                  '(whole-file lookups only, fragments are mostly missed)')
+    serve_parser.add_argument('--bands', type=int, default=DEFAULT_BANDS,
+                             help='MinHash bands of the index')
+    serve_parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                             help='Bins per band of the index')
+    serve_parser.add_argument('--mmap', action='store_true',
+                             help='Map the saved list instead of reading it')
+    serve_parser.add_argument('--max-request', type=int, default=DEFAULT_MAX_REQUEST,
+                             help='Longest request line accepted, in bytes')
 
     args = parser.parse_args()
 
@@ -43,6 +102,9 @@ def main():
         parser.print_help()
         return
 
+    if args.stats:
+        enable_stats()
+
     try:
         if args.command == 'hash':
             result = hash(args.file)
@@ -54,17 +116,23 @@ def main():
                 from . import Fingerprint
                 fp1 = Fingerprint(args.input1)
                 fp2 = Fingerprint(args.input2)
-                score = fp1.compare(fp2)
+                score = fp1.compare(fp2, args.mode)
                 print(f"Similarity score: {score}")
             else:
                 # Compare hashes
                 from . import diff
-                score = diff(args.input1, args.input2)
+                score = diff(args.input1, args.input2, args.mode)
                 print(f"Difference score: {score}")
 
         elif args.command == 'scan':
-            fpl = scan_directory(args.directory, args.extensions, args.recursive)
-            results = fpl.compare_all(args.threshold)
+            if args.no_cache:
+                fpl = scan_directory(args.directory, args.extensions, args.recursive,
+                                     args.workers, args.queue_size, cache=False)
+            else:
+                with HashCache(args.cache or default_cache_path()) as cache:
+                    fpl = scan_directory(args.directory, args.extensions, args.recursive,
+                                         args.workers, args.queue_size, cache)
+            results = fpl.compare_all(args.threshold, workers=args.workers, mode=args.mode)
 
             if results:
                 print("Similar files found:")
@@ -73,10 +141,27 @@ def main():
             else:
                 print("No similar files found.")
 
+        elif args.command == 'serve':
+            server = LookupServer(args.source, args.threshold, args.mode, args.top_k,
+                                  args.workers, args.index, args.mmap, bands=args.bands,
+                                  rows=args.rows)
+
+            def ready(address):
+                print(f"Serving {server.size} fingerprints on {address}", file=sys.stderr)
+
+            try:
+                asyncio.run(server.serve(args.host, args.port, args.socket, args.max_request, ready))
+            except KeyboardInterrupt:
+                pass
+
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
+    finally:
+        if args.stats:
+            print_stats(stats())
+
 
 if __name__ == '__main__':
     main()
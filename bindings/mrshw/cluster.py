@@ -0,0 +1,203 @@
+"""
+Incremental clustering of fingerprints into families of similar samples.
+"""
+
+import array
+from typing import Dict, List, Optional
+
+from . import _mrsh as _native
+from .core import FingerprintList
+from .index import DEFAULT_BANDS, DEFAULT_ROWS, INDEX_BINS
+
+
+class FingerprintClusterer(_native.FingerprintClusterer):
+    """
+    Single-linkage clusters of a FingerprintList, kept up to date as it grows.
+
+    Two fingerprints scoring at least the threshold belong to the same
+    cluster, and so do their clusters: the clusters are the connected
+    components of the similarity graph. They are kept natively in a
+    union-find forest, so adding fingerprints never redoes the clustering of
+    the ones already clustered. A new fingerprint is scored only against its
+    candidates in a MinHash index (see FingerprintIndex) and only against
+    candidates of clusters it has not joined yet, so adding n fingerprints
+    costs about n times their candidates instead of a sweep over the list.
+    Like the index, a link between two similar fingerprints is missed with a
+    small probability.
+
+    A cluster is identified by its representative, the position in the list
+    of its earliest member. When two clusters merge the earlier
+    representative is kept, so cluster ids only change when a cluster is
+    absorbed by an older one.
+
+    The clusterer keeps a reference to its list. Fingerprints can be added
+    through the clusterer or to the list directly and are clustered on the
+    next update(). Single linkage cannot undo a link, so once a fingerprint
+    of the list is removed or replaced update() raises MRSHwError and the
+    list has to be clustered again by a new clusterer. While update() runs,
+    using the clusterer from another thread raises BufferError, and so does
+    modifying its list.
+
+    Example:
+        corpus = FingerprintList.load("corpus.mrsh", mmap=False)
+        families = FingerprintClusterer(corpus, threshold=60)
+
+        families.add_many(new_samples, labels=new_names, workers=0)
+        for cluster, members in families.clusters(min_size=2).items():
+            print(cluster, len(members))
+    """
+
+    def __init__(self, fpl: Optional[FingerprintList], threshold: int, mode: str = "fragment",
+                 bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS, labels=None):
+        """
+        Cluster a fingerprint list.
+
+        Args:
+            fpl: FingerprintList to cluster, None to start with an empty one
+            threshold: Minimum similarity score (1-255) linking two fingerprints
+            mode: "fragment" or "file" scoring, see Fingerprint
+            bands: Number of MinHash bands of the candidate index
+            rows: Number of bins per band, see FingerprintIndex
+            labels: Cluster ids of the first fingerprints of the list as
+                returned by labels(), restored without scoring them again
+
+        Raises:
+            TypeError: If fpl is not a FingerprintList
+            ValueError: If an argument is out of range, or labels are not a
+                clustering of the list
+            MRSHwError: If the list cannot be clustered
+        """
+        if fpl is None:
+            fpl = FingerprintList()
+        if not isinstance(fpl, FingerprintList):
+            raise TypeError("Can only cluster a FingerprintList")
+        if not 1 <= threshold <= 255:
+            raise ValueError("threshold must be between 1 and 255")
+        if bands < 1 or rows < 1 or bands * rows > INDEX_BINS:
+            raise ValueError(f"bands and rows must be positive with bands * rows <= {INDEX_BINS}")
+
+        self._init(fpl, threshold, mode, bands, rows)
+        self.fpl = fpl
+        self.threshold = threshold
+        self.mode = mode
+
+        if labels is not None:
+            try:
+                self._restore(array.array('Q', labels))
+            except OverflowError:
+                raise ValueError("labels must not be negative") from None
+        self.update()
+
+    # __len__ (the number of clusters) is implemented natively
+
+    def __repr__(self) -> str:
+        """Detailed string representation."""
+        return (f"FingerprintClusterer(size={self._size()}, clusters={len(self)}, "
+                f"threshold={self.threshold})")
+
+    def update(self) -> int:
+        """
+        Cluster the fingerprints added to the list since the last update.
+
+        Returns:
+            Number of newly clustered fingerprints
+
+        Raises:
+            MRSHwError: If the fingerprints cannot be clustered, or the list
+                was modified in place since it was clustered
+        """
+        return self._update()
+
+    def add(self, data, **kwargs) -> 'FingerprintClusterer':
+        """
+        Add data to the list and cluster it.
+
+        Args:
+            data: Data to add, as for FingerprintList.add()
+            **kwargs: Further arguments of FingerprintList.add()
+
+        Returns:
+            Self for method chaining
+        """
+        self.fpl.add(data, **kwargs)
+        self.update()
+        return self
+
+    def add_many(self, buffers, labels: Optional[List[str]] = None, workers: int = 1,
+                 offsets=None, mode: Optional[str] = None) -> 'FingerprintClusterer':
+        """
+        Hash many buffers into the list, see FingerprintList.add_many(), and cluster them.
+
+        Returns:
+            Self for method chaining
+        """
+        self.fpl.add_many(buffers, labels, workers, offsets, mode)
+        self.update()
+        return self
+
+    def cluster_of(self, item: int) -> int:
+        """
+        Get the cluster of a fingerprint.
+
+        A cluster id is the position of a member, so passing an id kept
+        from before a merge gives the id of the cluster it was absorbed by.
+
+        Args:
+            item: Position of the fingerprint in the list
+
+        Returns:
+            Cluster id, the position of the cluster's representative
+
+        Raises:
+            IndexError: If the fingerprint is not clustered
+        """
+        return self._cluster(item)
+
+    def members(self, cluster: int) -> List[int]:
+        """
+        List the members of a cluster.
+
+        Args:
+            cluster: Cluster id, or the position of any member
+
+        Returns:
+            Positions of the members in the list, ascending
+
+        Raises:
+            IndexError: If the fingerprint is not clustered
+        """
+        return self._members(cluster)
+
+    def labels(self) -> array.array:
+        """
+        Get the cluster id of every clustered fingerprint.
+
+        The result can be stored next to the saved list and passed back as
+        the labels argument, which restores the clustering without scoring
+        any pair.
+
+        Returns:
+            array('Q') with the cluster id of every fingerprint, in list order
+        """
+        labels = array.array('Q')
+        labels.frombytes(self._labels())
+        return labels
+
+    def clusters(self, min_size: int = 1) -> Dict[int, List[int]]:
+        """
+        List all clusters.
+
+        Args:
+            min_size: Smallest cluster to include; 2 leaves out the
+                fingerprints that are not similar to any other
+
+        Returns:
+            Dict mapping every cluster id to the positions of its members, ascending
+        """
+        clusters = {}
+        for item, cluster in enumerate(self.labels()):
+            clusters.setdefault(cluster, []).append(item)
+        if min_size > 1:
+            clusters = {cluster: members for cluster, members in clusters.items()
+                        if len(members) >= min_size}
+        return clusters
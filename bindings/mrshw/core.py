@@ -3,10 +3,13 @@ Core MRSHw functionality and classes.
 """
 
 import os
-import ctypes
+import array
+import errno
+import operator
 from collections import namedtuple
-from typing import Union, List, Tuple, Optional
-import importlib.resources
+from typing import Union, List, Tuple, Optional, Any, Iterator
+
+from . import _mrsh as _native
 
 
 class MRSHwException(Exception):
@@ -19,155 +22,131 @@ class MRSHwError(MRSHwException):
     pass
 
 
-# Load the shared library
-def _load_library():
-    lib_name = "libmrsh.so"
-    try:
-        # Python 3.9+: returns a pathlib.Path
-        lib_path = importlib.resources.files(__package__).joinpath(lib_name)
-        return ctypes.CDLL(str(lib_path))
-    except Exception:
-        # Fallbacks if needed
-        for path in (
-            os.path.join(os.path.dirname(__file__), lib_name),
-            os.path.join(os.path.dirname(__file__), "lib", lib_name),
-            lib_name,
-        ):
-            try:
-                return ctypes.CDLL(path)
-            except OSError:
-                pass
-    raise MRSHwError(f"Could not load {lib_name}. Please ensure it's installed correctly.")
-
-lib = _load_library()
-
-
-# C structure definitions
-class _CFingerprint(ctypes.Structure):
-    """Internal C fingerprint structure."""
-    pass
-
-_CFingerprint._fields_ = [
-    ("bf_list", ctypes.c_void_p),
-    ("bf_list_last_element", ctypes.c_void_p),
-    ("next", ctypes.POINTER(_CFingerprint)),
-    ("amount_of_BF", ctypes.c_uint32),
-    ("file_name", ctypes.c_char * 200),
-    ("filesize", ctypes.c_uint32),
-]
-
-
-class _CFingerprintList(ctypes.Structure):
-    """Internal C fingerprint list structure."""
-    _fields_ = [
-        ("list", ctypes.POINTER(_CFingerprint)),
-        ("last_element", ctypes.POINTER(_CFingerprint)),
-        ("size", ctypes.c_long)
-    ]
-
-
-class _CCompare(ctypes.Structure):
-    """Internal C comparison structure."""
-    _fields_ = [
-        ("name1", ctypes.c_char_p),
-        ("name2", ctypes.c_char_p),
-        ("score", ctypes.c_uint8)
-    ]
-
-
-class _CCompareList(ctypes.Structure):
-    """Internal C comparison list structure."""
-    _fields_ = [
-        ("list", ctypes.POINTER(_CCompare)),
-        ("size", ctypes.c_long)
-    ]
-
-
 # Named tuples for return values
 Metadata = namedtuple('Metadata', ['name', 'size', 'filters'])
 Comparison = namedtuple('Comparison', ['hash1', 'hash2', 'score'])
 
+# The native module raises MRSHwError and builds the result tuples itself
+_native._setup(MRSHwError, Comparison, Metadata)
 
-# Function signature definitions
-def _setup_library_functions():
-    """Setup C library function signatures."""
+# Anything supporting the buffer protocol: bytes, bytearray, memoryview, mmap, numpy arrays, ...
+BytesLike = Any
 
-    # Fingerprint functions
-    lib.fp_init.restype = ctypes.POINTER(_CFingerprint)
-    lib.fp_init.argtypes = []
 
-    lib.fp_destroy.restype = None
-    lib.fp_destroy.argtypes = [ctypes.POINTER(_CFingerprint)]
+def _is_bytes_like(data) -> bool:
+    """Check whether data supports the buffer protocol."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return True
+    if isinstance(data, str):
+        return False
+    try:
+        memoryview(data).release()
+        return True
+    except TypeError:
+        return False
 
-    lib.fp_add_file.restype = ctypes.c_int32
-    lib.fp_add_file.argtypes = [ctypes.POINTER(_CFingerprint), ctypes.c_char_p, ctypes.c_char_p]
 
-    lib.fp_add_bytes.restype = ctypes.c_int32
-    lib.fp_add_bytes.argtypes = [ctypes.POINTER(_CFingerprint), ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+def _cache_handle(cache):
+    """Cache to use for a cache argument, or None."""
+    from .cache import _resolve_cache
+    return _resolve_cache(cache)
 
-    lib.fp_compare.restype = ctypes.c_uint8
-    lib.fp_compare.argtypes = [ctypes.POINTER(_CFingerprint), ctypes.POINTER(_CFingerprint)]
 
-    lib.fp_str.restype = ctypes.c_void_p
-    lib.fp_str.argtypes = [ctypes.POINTER(_CFingerprint)]
+def _check_workers(workers: int) -> int:
+    """Validate a worker count passed to the native comparison routines."""
+    if workers < 0:
+        raise ValueError("workers must be 0 (all CPUs) or a positive number")
+    return workers
 
-    # FingerprintList functions
-    lib.fpl_init.restype = ctypes.POINTER(_CFingerprintList)
-    lib.fpl_init.argtypes = []
 
-    lib.fpl_destroy.restype = None
-    lib.fpl_destroy.argtypes = [ctypes.POINTER(_CFingerprintList)]
+def _check_top_k(top_k: Optional[int]) -> int:
+    """Validate a top-k limit; None (no limit) is passed to C as 0."""
+    if top_k is None:
+        return 0
+    if top_k < 1:
+        raise ValueError("top_k must be a positive number or None")
+    return top_k
 
-    lib.fpl_add_path.restype = ctypes.c_int32
-    lib.fpl_add_path.argtypes = [ctypes.POINTER(_CFingerprintList), ctypes.c_char_p, ctypes.c_char_p]
 
-    lib.fpl_add_bytes.restype = ctypes.c_int32
-    lib.fpl_add_bytes.argtypes = [ctypes.POINTER(_CFingerprintList), ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+def _offsets_buffer(offsets):
+    """Offsets as a buffer of 64-bit integers, used in place if it already is one."""
+    try:
+        with memoryview(offsets) as view:
+            if view.itemsize == 8 and view.format.lstrip('@=<') in ('Q', 'q', 'L', 'l') and view.c_contiguous:
+                return offsets
+    except TypeError:
+        pass
+
+    try:
+        return array.array('Q', offsets)
+    except OverflowError:
+        raise ValueError("offsets must not be negative") from None
 
-    lib.fpl_str.restype = ctypes.c_void_p
-    lib.fpl_str.argtypes = [ctypes.POINTER(_CFingerprintList)]
 
-    # Comparison functions
-    lib.cl_fpl_all.restype = ctypes.POINTER(_CCompareList)
-    lib.cl_fpl_all.argtypes = [ctypes.POINTER(_CFingerprintList), ctypes.c_uint8]
+def _compare_columns(columns):
+    """Wrap the (index1, index2, score) columns of a batch in NumPy arrays."""
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("arrays=True requires NumPy") from None
 
-    lib.cl_fpl_vs_fpl.restype = ctypes.POINTER(_CCompareList)
-    lib.cl_fpl_vs_fpl.argtypes = [ctypes.POINTER(_CFingerprintList), ctypes.POINTER(_CFingerprintList), ctypes.c_uint8]
+    index1, index2, score = columns
+    return (np.frombuffer(index1, dtype=np.uintp), np.frombuffer(index2, dtype=np.uintp),
+            np.frombuffer(score, dtype=np.uint8))
 
-    lib.cl_fp_vs_fpl.restype = ctypes.POINTER(_CCompareList)
-    lib.cl_fp_vs_fpl.argtypes = [ctypes.POINTER(_CFingerprint), ctypes.POINTER(_CFingerprintList), ctypes.c_uint8]
 
-    lib.cl_free.restype = None
-    lib.cl_free.argtypes = [ctypes.POINTER(_CCompareList)]
+def _iter_cursor(open_cursor, batch_size: int, arrays: bool):
+    """
+    Drain a native comparison cursor batch by batch.
 
-    # String functions
-    lib.str_free.restype = None
-    lib.str_free.argtypes = [ctypes.c_void_p]
+    The cursor is opened by calling open_cursor on the first next(), so a
+    generator that is never started holds no native resources. Yields
+    Comparison namedtuples, or (index1, index2, score) NumPy arrays per batch
+    with arrays=True. The cursor keeps the fingerprint lists alive and checks
+    them for modification before every batch.
+    """
+    cursor = open_cursor()
+    try:
+        while True:
+            if arrays:
+                columns = cursor.fetch_columns(batch_size)
+                if columns is None:
+                    return
+                yield _compare_columns(columns)
+            else:
+                batch = cursor.fetch(batch_size)
+                if not batch:
+                    return
+                yield from batch
+    finally:
+        cursor.close()
 
-    lib.str_compare.restype = ctypes.c_int32
-    lib.str_compare.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
 
+def _check_batch_size(batch_size: int) -> int:
+    """Validate the number of results fetched from a cursor at a time."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive number")
+    return batch_size
 
-_setup_library_functions()
 
+def _packet_mode(mode: Optional[str]) -> bool:
+    """Validate a hashing mode, True for packet hashing."""
+    if mode is None:
+        return False
+    if mode == "packet":
+        return True
+    raise ValueError(f"mode must be None or 'packet', not {mode!r}")
 
-def _cl_to_list(cl_ptr) -> List[Comparison]:
-    """Convert C comparison list to Python list."""
-    if not cl_ptr:
-        return []
 
-    cl = cl_ptr.contents
-    return [
-        Comparison(
-            cl.list[i].name1.decode() if cl.list[i].name1 else "",
-            cl.list[i].name2.decode() if cl.list[i].name2 else "",
-            cl.list[i].score
-        )
-        for i in range(cl.size)
-    ]
+def _check_packet_data(data, packet: bool) -> None:
+    """Packets are always in memory: reject a path given in packet mode."""
+    if packet and isinstance(data, tuple) and data:
+        data = data[0]
+    if packet and isinstance(data, str):
+        raise ValueError("packet mode only hashes bytes-like data, not paths")
 
 
-class Fingerprint:
+class Fingerprint(_native.Fingerprint):
     """
     MRSHw Fingerprint class for individual file/data hashing.
 
@@ -181,9 +160,22 @@ class Fingerprint:
 
         similarity = fp1.compare(fp2)
         print(f"Similarity score: {similarity}")
+
+    compare(), hexdigest() and metadata() are implemented natively. Like
+    every comparison, compare() takes a mode: "fragment" (the default)
+    scores relative to the smaller fingerprint, which finds a fragment
+    inside a larger file, "file" relative to the larger one, which measures
+    whole-file similarity.
+
+    Binary data can also be hashed as a network packet with mode="packet",
+    the runtime equivalent of building the C tool with -Dnetwork: the
+    chunks before the first and after the last chunk boundary are left out,
+    because a packet cuts them off at arbitrary bytes, so only chunks that
+    also occur in the transferred file end up in the fingerprint.
     """
 
-    def __init__(self, data: Optional[Union[str, bytes, Tuple[Union[str, bytes], str]]] = None):
+    def __init__(self, data: Optional[Union[str, bytes, Tuple[Union[str, bytes], str]]] = None,
+                 mode: Optional[str] = None):
         """
         Initialize a new fingerprint.
 
@@ -192,75 +184,95 @@ class Fingerprint:
                 - str: file path
                 - bytes: binary data
                 - tuple: (data, label) where data is str/bytes and label is str
+            mode: None to hash the data as a whole, "packet" to hash binary
+                data as a network packet
         """
-        self._fp = lib.fp_init()
-        if not self._fp:
-            raise MRSHwError("Failed to initialize fingerprint")
-
         if data is not None:
-            self.update(data)
+            self.update(data, mode)
 
-    def __del__(self):
-        """Cleanup C resources."""
-        if hasattr(self, '_fp') and self._fp:
-            lib.fp_destroy(self._fp)
-
-    def update(self, data: Union[str, bytes, Tuple[Union[str, bytes], str]]) -> 'Fingerprint':
+    def update(self, data: Union[str, BytesLike, Tuple[Union[str, BytesLike], str]],
+               mode: Optional[str] = None) -> 'Fingerprint':
         """
         Update fingerprint with new data.
 
+        Files are hashed from a read-only memory mapping. Binary data can be
+        any object supporting the buffer protocol (bytes, bytearray,
+        memoryview, mmap, numpy arrays, ...); its memory is hashed in place
+        without being copied.
+
         Args:
             data: Data to add. Can be:
                 - str: file path
-                - bytes: binary data  
-                - tuple: (data, label) where data is str/bytes and label is str
+                - bytes-like: binary data
+                - tuple: (data, label) where data is str/bytes-like and label is str
+            mode: None to hash the data as a whole, "packet" to hash binary
+                data as a network packet
 
         Returns:
             Self for method chaining
 
         Raises:
+            ValueError: If the mode is unknown, or a path is given in packet mode
             MRSHwError: If update operation fails
         """
-        err = 0
+        packet = _packet_mode(mode)
+        _check_packet_data(data, packet)
 
         if isinstance(data, str):
-            err = lib.fp_add_file(self._fp, data.encode(), None)
-        elif isinstance(data, bytes):
-            err = lib.fp_add_bytes(self._fp, data, len(data), b"n/a")
+            self._add_file(data, None)
         elif isinstance(data, tuple):
             d, label = data
-            label_bytes = label.encode() if isinstance(label, str) else label
 
             if isinstance(d, str):
-                err = lib.fp_add_file(self._fp, d.encode(), label_bytes)
-            elif isinstance(d, bytes):
-                err = lib.fp_add_bytes(self._fp, d, len(d), label_bytes)
+                self._add_file(d, label)
+            elif _is_bytes_like(d):
+                self._add_bytes(d, label, packet)
             else:
                 raise TypeError(f"Unsupported data type in tuple: {type(d)}")
+        elif _is_bytes_like(data):
+            self._add_bytes(data, b"n/a", packet)
         else:
             raise TypeError(f"Unsupported data type: {type(data)}")
 
-        if err != 0:
-            raise MRSHwError(f"Failed to update fingerprint (error code: {err})")
-
         return self
 
-    def hexdigest(self) -> str:
+    async def aupdate(self, data: Union[str, BytesLike, Tuple[Union[str, BytesLike], str]],
+                      mode: Optional[str] = None) -> 'Fingerprint':
         """
-        Get the hexadecimal digest of the fingerprint.
+        Asynchronous update(): hash the data on the executor of the aio module
+        without blocking the event loop.
+
+        The same fingerprint must not be updated by two calls at once.
+
+        Args:
+            data: Data to add, as for update()
+            mode: None, or "packet" to hash binary data as a network packet
 
         Returns:
-            Hexadecimal string representation of the fingerprint
+            Self for method chaining
         """
-        raw = lib.fp_str(self._fp)
-        if not raw:
-            return ""
+        from .aio import run
+        await run(self.update, data, mode)
+        return self
 
-        try:
-            data = ctypes.string_at(raw)
-            return data.decode('utf-8', errors='replace')
-        finally:
-            lib.str_free(raw)
+    @classmethod
+    def from_digest(cls, digest: str) -> 'Fingerprint':
+        """
+        Create a fingerprint from its hexdigest().
+
+        The digest is parsed once; comparing the result does not parse it
+        again, unlike diff() which parses both digests on every call.
+
+        Args:
+            digest: Digest as returned by hexdigest() or hash()
+
+        Returns:
+            The parsed Fingerprint
+
+        Raises:
+            ValueError: If the digest is malformed
+        """
+        return cls._from_digest(digest)
 
     def __str__(self) -> str:
         """String representation of the fingerprint."""
@@ -271,37 +283,152 @@ class Fingerprint:
         meta = self.metadata()
         return f"Fingerprint(name='{meta.name}', size={meta.size}, filters={meta.filters})"
 
+
+class Hasher(_native.Hasher):
+    """
+    Incremental MRSHw hasher for inputs that do not fit in memory.
+
+    Data is fed piece by piece with update(); only a small fixed-size state
+    is kept between calls, so memory use does not grow with the input. The
+    finished fingerprint is identical to hashing all of the data at once.
+
+    Example:
+        hasher = Hasher("disk.img")
+        with open("disk.img", "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+        fp = hasher.finalize()
+
+    The constructor (with an optional label for the resulting fingerprint)
+    and update() are implemented natively.
+    """
+
+    def finalize(self) -> 'Fingerprint':
+        """
+        Finish the hash.
+
+        Returns:
+            The resulting Fingerprint
+
+        Raises:
+            MRSHwError: If the hasher was already finalized
+        """
+        return self._finalize(Fingerprint)
+
+    def hexdigest(self) -> str:
+        """Finish the hash and return the digest of the fingerprint."""
+        return self.finalize().hexdigest()
+
+
+class FingerprintView:
+    """
+    A fingerprint stored in a FingerprintList, read in place.
+
+    Indexing and iterating a list yield views instead of copies, so looking
+    at an entry of a large list costs nothing until its metadata, digest or
+    score is asked for. A view refers to a position: after the fingerprint
+    there is replaced the view reads the new one, after it is removed every
+    access raises IndexError. copy() detaches the fingerprint from the list.
+
+    Example:
+        fpl = FingerprintList.load("reference.mrsh", mmap=False)
+        sample = fpl["invoice.doc"]
+        print(sample.position, sample.metadata().size)
+        print(sample.compare(Fingerprint("suspect.doc")))
+    """
+
+    __slots__ = ('list', 'position')
+
+    def __init__(self, fpl: 'FingerprintList', position: int):
+        """
+        Refer to a fingerprint of a list.
+
+        Args:
+            fpl: FingerprintList holding the fingerprint
+            position: Position of the fingerprint in the list
+        """
+        self.list = fpl
+        self.position = position
+
+    @property
+    def label(self) -> str:
+        """Label of the fingerprint."""
+        return self.metadata().name
+
     def metadata(self) -> Metadata:
         """
-        Get metadata about the fingerprint.
+        Get the metadata of the fingerprint.
 
         Returns:
-            Metadata namedtuple containing name, size, and filter count
+            Metadata namedtuple (name, size, filters)
+
+        Raises:
+            IndexError: If the fingerprint was removed
+        """
+        return self.list._entry(self.position)
+
+    def hexdigest(self) -> str:
+        """
+        Get the digest of the fingerprint, the same as of a Fingerprint.
+
+        Raises:
+            IndexError: If the fingerprint was removed
         """
-        fp_contents = self._fp.contents
-        name = fp_contents.file_name.rstrip(b'\0').decode('utf-8', errors='replace')
-        return Metadata(name, fp_contents.filesize, fp_contents.amount_of_BF)
+        return self.list._entry_hexdigest(self.position)
 
-    def compare(self, other: 'Fingerprint') -> int:
+    def compare(self, other: Union['Fingerprint', 'FingerprintView'], mode: str = "fragment") -> int:
         """
-        Compare this fingerprint with another.
+        Compare the fingerprint with another one without copying either.
 
         Args:
-            other: Another Fingerprint instance
+            other: Fingerprint or FingerprintView to compare against
+            mode: "fragment" or "file" scoring, see Fingerprint
 
         Returns:
-            Similarity score (0-255, where 0 is identical)
+            Similarity score (0-255)
 
         Raises:
-            TypeError: If other is not a Fingerprint instance
+            IndexError: If a fingerprint was removed
         """
-        if not isinstance(other, Fingerprint):
-            raise TypeError("Can only compare with another Fingerprint instance")
+        if isinstance(other, FingerprintView):
+            return self.list._entry_compare(self.position, other.list, other.position, mode)
+        if isinstance(other, Fingerprint):
+            return self.list._entry_compare(self.position, other, 0, mode)
+        raise TypeError("Can only compare with a Fingerprint or FingerprintView")
+
+    def copy(self) -> 'Fingerprint':
+        """
+        Copy the fingerprint out of the list.
+
+        Returns:
+            A Fingerprint independent of the list
+        """
+        return Fingerprint.from_digest(self.hexdigest())
+
+    def __eq__(self, other) -> bool:
+        """Views are equal when they refer to the same position of the same list."""
+        if not isinstance(other, FingerprintView):
+            return NotImplemented
+        return self.list is other.list and self.position == other.position
+
+    def __hash__(self) -> int:
+        """Hash of the list and position."""
+        return hash((id(self.list), self.position))
+
+    def __str__(self) -> str:
+        """String representation of the fingerprint."""
+        return self.hexdigest()
 
-        return lib.fp_compare(self._fp, other._fp)
+    def __repr__(self) -> str:
+        """Detailed string representation."""
+        if not self.list._live(self.position):
+            return f"FingerprintView(position={self.position}, removed)"
+        meta = self.metadata()
+        return (f"FingerprintView(position={self.position}, name='{meta.name}', size={meta.size}, "
+                f"filters={meta.filters})")
 
 
-class FingerprintList:
+class FingerprintList(_native.FingerprintList):
     """
     MRSHw Fingerprint List for managing multiple fingerprints.
 
@@ -316,134 +443,642 @@ class FingerprintList:
 
         # Compare all fingerprints against each other
         results = fpl.compare_all(threshold=50)
+
+    Fingerprints are also addressed by position or by label, and can be
+    removed and replaced in place:
+
+        fpl["sample.bin"] = b"new contents"     # replace, or insert if new
+        del fpl["old.bin"]                      # frees its slot
+        for fp in fpl:                          # FingerprintView per fingerprint
+            print(fp.position, fp.label)
+
+    Labels are kept in a native hash table, so finding, removing or
+    replacing one fingerprint takes the same time in a list of any size.
+    Positions are stable: removing a fingerprint leaves a free slot behind,
+    which is reused by the next insert(), and the fingerprints after it keep
+    their positions. add() always appends. len() counts the fingerprints,
+    not the free slots, and slots counts the positions, free slots
+    included. Integer keys are positions below slots, so fpl[-1] is the
+    last slot and indexing a free slot raises IndexError; iterating skips
+    free slots. The memory of removed and replaced fingerprints is released
+    automatically once it makes up half of the list, or by compact().
+
+    A label lookup finds the first fingerprint with that label, so labels
+    should be unique for keyed access; add() does not enforce it.
+
+    Lists can be shared between threads. Hashing into a list, comparing it
+    and indexing it run with the GIL released; while such a call reads the
+    list, modifying it from another thread raises BufferError, and while
+    one modifies it, any other use raises BufferError, as with a bytearray
+    that has exports.
     """
 
-    def __init__(self, data: Optional[Union[str, bytes, List, Tuple[Union[str, bytes], str]]] = None):
+    def __init__(self, data: Optional[Union[str, bytes, List, Tuple[Union[str, bytes], str]]] = None,
+                 mode: Optional[str] = None):
         """
         Initialize a new fingerprint list.
 
         Args:
             data: Optional initial data to add
+            mode: None, or "packet" to hash binary data as network packets
         """
-        self._fpl = lib.fpl_init()
-        if not self._fpl:
-            raise MRSHwError("Failed to initialize fingerprint list")
-
         if data is not None:
-            self.add(data)
+            self.add(data, mode=mode)
 
-    def __del__(self):
-        """Cleanup C resources."""
-        if hasattr(self, '_fpl') and self._fpl:
-            lib.fpl_destroy(self._fpl)
-
-    def add(self, data: Union[str, bytes, List, Tuple[Union[str, bytes], str]]) -> 'FingerprintList':
+    def add(self, data: Union[str, BytesLike, List, Tuple[Union[str, BytesLike], str]],
+            cache=None, recursive: bool = False, mode: Optional[str] = None) -> 'FingerprintList':
         """
         Add data to the fingerprint list.
 
+        Files are looked up in the hash cache first and only hashed if they
+        changed since they were cached. A directory path adds the files in
+        it, see ingest().
+
         Args:
             data: Data to add. Can be:
-                - str: file path
-                - bytes: binary data
+                - str: file or directory path
+                - bytes-like: binary data, hashed in place without copying
                 - list: list of items to add
                 - tuple: (data, label) pair
+            cache: HashCache to use, None for the default cache, False for none
+            recursive: Whether directories are added with their subdirectories
+            mode: None to hash the data as a whole, "packet" to hash binary
+                data as network packets, see Fingerprint
 
         Returns:
             Self for method chaining
+
+        Raises:
+            ValueError: If the mode is unknown, or a path is given in packet mode
         """
+        packet = _packet_mode(mode)
+        _check_packet_data(data, packet)
+
         if isinstance(data, str):
-            lib.fpl_add_path(self._fpl, data.encode(), None)
-        elif isinstance(data, bytes):
-            lib.fpl_add_bytes(self._fpl, data, len(data), b"n/a")
+            self._add_path(data, None, recursive, _cache_handle(cache))
         elif isinstance(data, tuple):
             d, label = data
-            label_bytes = label.encode() if isinstance(label, str) else label
 
             if isinstance(d, str):
-                lib.fpl_add_path(self._fpl, d.encode(), label_bytes)
-            elif isinstance(d, bytes):
-                lib.fpl_add_bytes(self._fpl, d, len(d), label_bytes)
+                self._add_path(d, label, recursive, _cache_handle(cache))
+            elif _is_bytes_like(d):
+                self._add_bytes(d, label, packet)
             else:
                 raise TypeError(f"Unsupported data type in tuple: {type(d)}")
         elif isinstance(data, (list, tuple)):
             for item in data:
-                self.add(item)
+                self.add(item, cache, recursive, mode)
+        elif _is_bytes_like(data):
+            self._add_bytes(data, b"n/a", packet)
         else:
             raise TypeError(f"Unsupported input type: {type(data)}")
 
         return self
 
+    async def aadd(self, data: Union[str, BytesLike, List, Tuple[Union[str, BytesLike], str]],
+                   cache=None, recursive: bool = False, mode: Optional[str] = None) -> 'FingerprintList':
+        """
+        Asynchronous add(): hash the data on the executor of the aio module
+        without blocking the event loop.
+
+        The same list must not be modified by two calls at once.
+
+        Args:
+            data: Data to add, as for add()
+            cache: HashCache to use, None for the default cache, False for none
+            recursive: Whether directories are added with their subdirectories
+            mode: None, or "packet" to hash binary data as network packets
+
+        Returns:
+            Self for method chaining
+        """
+        from .aio import run
+        await run(self.add, data, cache, recursive, mode)
+        return self
+
+    def add_many(self, buffers, labels: Optional[List[str]] = None, workers: int = 1,
+                 offsets=None, mode: Optional[str] = None) -> 'FingerprintList':
+        """
+        Hash many in-memory buffers in a single native call.
+
+        All buffers are hashed with the GIL released, spread over `workers`
+        native threads, and added in their original order, so the result is
+        the same as calling add() for every buffer but without the per-item
+        call overhead.
+
+        The buffers are either a sequence of bytes-like objects, or, with
+        offsets, one bytes-like object holding all of them back to back.
+        Item i is then buffers[offsets[i]:offsets[i + 1]], so offsets holds
+        one entry more than there are items. Offsets given as a buffer of
+        64-bit integers (e.g. array('Q') or a NumPy uint64 array) are used
+        without copying.
+
+        Args:
+            buffers: Sequence of bytes-like objects, or one bytes-like object with offsets
+            labels: Label of every buffer (None labels them all "n/a")
+            workers: Number of native threads (0 uses every available CPU)
+            offsets: Ascending slice boundaries into a concatenated buffer
+            mode: None to hash every buffer as a whole, "packet" to hash
+                them as network packets, see Fingerprint
+
+        Returns:
+            Self for method chaining
+
+        Raises:
+            ValueError: If labels or offsets do not match the buffers, or the mode is unknown
+            TypeError: If a buffer is not bytes-like
+            MRSHwError: If the buffers cannot be hashed
+        """
+        workers = _check_workers(workers)
+        packet = _packet_mode(mode)
+
+        if offsets is not None:
+            if not _is_bytes_like(buffers):
+                raise TypeError(f"Unsupported buffer type: {type(buffers)}")
+            self._add_concat(buffers, _offsets_buffer(offsets), labels, workers, packet)
+        else:
+            self._add_many(buffers, labels, workers, packet)
+        return self
+
+    def ingest(self, directory: Union[str, os.PathLike], recursive: bool = True,
+               extensions: Optional[List[str]] = None, workers: int = 1,
+               queue_size: int = 0, cache=None) -> int:
+        """
+        Hash every file below a directory into the list.
+
+        The directory is walked natively without changing the working
+        directory while up to `workers` threads hash the files found so far.
+        At most `queue_size` files are in flight at a time, which bounds the
+        memory held by finished but not yet added fingerprints. Files are
+        added in walk order and labelled with their file name, so the result
+        is the same for any number of workers. Unreadable files are skipped,
+        symbolic links to directories are not followed.
+
+        Files found unchanged in the hash cache are copied from it instead of
+        being hashed, so a rescan of a mostly static tree is bound by the
+        directory walk and stat() calls.
+
+        Args:
+            directory: Directory to walk
+            recursive: Whether to descend into subdirectories
+            extensions: Lower-case suffixes to include (e.g. ['.exe', '.dll']),
+                None for every file
+            workers: Number of hashing threads (0 uses every available CPU)
+            queue_size: Maximum number of files in flight (0 for 4 per worker)
+            cache: HashCache to use, None for the default cache, False for none
+
+        Returns:
+            Number of files added
+
+        Raises:
+            ValueError: If workers or queue_size is negative
+            FileNotFoundError: If the directory cannot be opened
+        """
+        workers = _check_workers(workers)
+        if queue_size < 0:
+            raise ValueError("queue_size must be 0 (automatic) or a positive number")
+
+        added = self._ingest(directory, bool(recursive), extensions, workers, queue_size,
+                             _cache_handle(cache))
+        if added < 0:
+            raise FileNotFoundError(f"Directory not found: {directory}")
+        return added
+
+    # __len__ (the number of fingerprints, not counting free slots) is implemented natively
+
+    @property
+    def slots(self) -> int:
+        """Number of positions, free slots included; integer keys are below it."""
+        return self._size()
+
+    def _position(self, key: Union[int, str, bytes]) -> int:
+        """Position of a fingerprint given by position or label."""
+        if isinstance(key, (str, bytes)):
+            position = self._find(key)
+            if position is None:
+                raise KeyError(key)
+            return position
+
+        position = operator.index(key)
+        if position < 0:
+            position += self._size()
+        if not self._live(position):
+            if 0 <= position < self._size():
+                raise IndexError(f"fingerprint {position} was removed")
+            raise IndexError("FingerprintList index out of range")
+        return position
+
+    def _source(self, data, mode: Optional[str]):
+        """Native source (list or Fingerprint, position) of a fingerprint to store."""
+        if isinstance(data, FingerprintView):
+            return data.list, data.position
+        if isinstance(data, Fingerprint):
+            return data, 0
+
+        source = FingerprintList()
+        source.add(data, mode=mode)
+        if source._size() != 1:
+            raise ValueError("data must hash to exactly one fingerprint")
+        return source, 0
+
+    def __getitem__(self, key: Union[int, str, bytes]) -> FingerprintView:
+        """
+        Get a fingerprint by position or label.
+
+        Integer keys are positions below slots; negative positions count
+        from slots, so they address the same fingerprint as position + slots.
+
+        Raises:
+            IndexError: If no fingerprint is stored at the position, also
+                when the slot there is free
+            KeyError: If no fingerprint has the label
+        """
+        return FingerprintView(self, self._position(key))
+
+    def __setitem__(self, key: Union[int, str, bytes], data) -> None:
+        """
+        Store a fingerprint by position or label.
+
+        A label that is not in the list yet is inserted, see insert();
+        otherwise the fingerprint is replaced and keeps its label, see
+        replace().
+        """
+        if isinstance(key, (str, bytes)) and self._find(key) is None:
+            self.insert(data, key)
+        else:
+            self.replace(key, data)
+
+    def __delitem__(self, key: Union[int, str, bytes]) -> None:
+        """Remove a fingerprint by position or label, see remove()."""
+        self.remove(key)
+
+    def __contains__(self, label) -> bool:
+        """Whether a fingerprint has the label."""
+        if not isinstance(label, (str, bytes)):
+            return False
+        return self._find(label) is not None
+
+    def __iter__(self) -> Iterator[FingerprintView]:
+        """Iterate over views of the fingerprints, in position order, skipping free slots."""
+        for position in range(self._size()):
+            if self._live(position):
+                yield FingerprintView(self, position)
+
+    def find(self, label: Union[str, bytes]) -> Optional[int]:
+        """
+        Find a fingerprint by label.
+
+        The label table is built on the first lookup and kept up to date
+        from then on, so every further lookup takes constant time.
+
+        Args:
+            label: Label of the fingerprint
+
+        Returns:
+            Position of the first fingerprint with the label, None if there is none
+        """
+        return self._find(label)
+
+    def remove(self, key: Union[int, str, bytes]) -> None:
+        """
+        Remove a fingerprint.
+
+        Its slot is left free for insert(); no other fingerprint moves.
+
+        Args:
+            key: Position or label of the fingerprint
+
+        Raises:
+            IndexError: If no fingerprint is stored at the position
+            KeyError: If no fingerprint has the label
+        """
+        self._remove(self._position(key))
+
+    def replace(self, key: Union[int, str, bytes], data, label: Optional[str] = None,
+                mode: Optional[str] = None) -> int:
+        """
+        Replace a fingerprint in place.
+
+        The new fingerprint is written over the old one when it has no more
+        Bloom filters, so replacing a fingerprint does not grow the list.
+
+        Args:
+            key: Position or label of the fingerprint to replace
+            data: New fingerprint: a Fingerprint, a FingerprintView, or data
+                to hash as for add() that yields a single fingerprint
+            label: New label, None to keep the current one
+            mode: None, or "packet" to hash binary data as a network packet
+
+        Returns:
+            Position of the fingerprint, which does not change
+
+        Raises:
+            IndexError: If no fingerprint is stored at the position
+            KeyError: If no fingerprint has the label
+            ValueError: If data does not yield exactly one fingerprint
+        """
+        position = self._position(key)
+        source, index = self._source(data, mode)
+        return self._put(position, source, index, label)
+
+    def insert(self, data, label: Union[str, bytes], mode: Optional[str] = None) -> int:
+        """
+        Store a new fingerprint in a free slot, or append it if there is none.
+
+        The slot freed last is reused first.
+
+        Args:
+            data: New fingerprint: a Fingerprint, a FingerprintView, or data
+                to hash as for add() that yields a single fingerprint
+            label: Label of the fingerprint
+            mode: None, or "packet" to hash binary data as a network packet
+
+        Returns:
+            Position of the fingerprint
+
+        Raises:
+            ValueError: If data does not yield exactly one fingerprint
+        """
+        source, index = self._source(data, mode)
+        return self._put(-1, source, index, label)
+
+    def compact(self) -> None:
+        """
+        Release the memory of removed and replaced fingerprints now.
+
+        Positions do not change; free slots stay free.
+
+        Raises:
+            MemoryError: If the compacted list cannot be allocated
+        """
+        self._compact()
+
     def __iadd__(self, other) -> 'FingerprintList':
         """Support += operator for adding data."""
         return self.add(other)
 
-    def hexdigest(self) -> str:
-        """Get string representation of all fingerprints."""
-        raw = lib.fpl_str(self._fpl)
-        if not raw:
-            return ""
-
-        try:
-            data = ctypes.string_at(raw)
-            return data.decode('utf-8', errors='replace')
-        finally:
-            lib.str_free(raw)
-
     def __str__(self) -> str:
         """String representation of fingerprint list."""
         return self.hexdigest()
 
-    def compare_all(self, threshold: int = 0) -> List[Comparison]:
+    def save(self, path: Union[str, os.PathLike]) -> None:
+        """
+        Save the list in the binary fingerprint database format.
+
+        The file holds a versioned header, the per-fingerprint metadata, the
+        name table and the raw Bloom filters, so it is about half the size of
+        the hexdigest text and can be loaded without parsing. Free slots are
+        saved as such, so positions survive a round trip; the memory of
+        removed and replaced fingerprints is not written.
+
+        The file is written next to path, synced and renamed over it, so a
+        crash never leaves a partial file and processes that have the old
+        file mapped keep reading it unchanged. A mapped list can be saved
+        over its own file.
+
+        Args:
+            path: Destination file path
+
+        Raises:
+            MRSHwError: If the file cannot be written
+        """
+        try:
+            self._save(path)
+        except OSError as e:
+            raise MRSHwError(f"Failed to save fingerprint list to {path}: {e.strerror}") from None
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike], mmap: bool = True) -> 'FingerprintList':
+        """
+        Load a list written by save().
+
+        With mmap=True the file is mapped read-only and comparisons run
+        directly against the mapped pages, so several processes loading the
+        same database share it through the page cache. Adding to, removing
+        from or replacing in a mapped list first copies it into private
+        memory.
+
+        Args:
+            path: Source file path
+            mmap: Map the file instead of reading it into memory
+
+        Returns:
+            The loaded FingerprintList
+
+        Raises:
+            MRSHwError: If the file cannot be read or is not a valid database
+        """
+        try:
+            return cls._load(path, bool(mmap))
+        except OSError as e:
+            reason = "not a valid fingerprint database" if e.errno == errno.EINVAL else e.strerror
+            raise MRSHwError(f"Failed to load fingerprint list from {path}: {reason}") from None
+
+    @classmethod
+    def from_digests(cls, digests: Union[str, List[str]]) -> 'FingerprintList':
+        """
+        Create a list from fingerprint digests.
+
+        All digests are parsed in a single native call, directly into the
+        list, so they can be compared against any number of fingerprints
+        without being parsed again.
+
+        Args:
+            digests: Iterable of digests as returned by Fingerprint.hexdigest(),
+                or a string of digests, one per line, as returned by hexdigest()
+
+        Returns:
+            The parsed FingerprintList
+
+        Raises:
+            ValueError: If a digest is malformed
+            TypeError: If a digest is not a str
+        """
+        if isinstance(digests, str):
+            digests = digests.splitlines()
+        elif not isinstance(digests, (list, tuple)):
+            digests = list(digests)
+
+        fpl = cls()
+        fpl._add_digests(digests)
+        return fpl
+
+    def compare_all(self, threshold: int = 0, workers: int = 1,
+                    top_k: Optional[int] = None, mode: str = "fragment") -> List[Comparison]:
         """
         Compare all fingerprints in the list against each other.
 
+        The comparison runs natively with the GIL released. With more than
+        one worker the pairs are split across native threads; the results
+        are identical to, and in the same order as, the serial run. Pairs
+        whose score provably cannot reach the threshold are abandoned early.
+
+        With top_k, only the best top_k matches of every fingerprint are
+        returned, best first. Each fingerprint is then matched against all
+        others, so a pair can be reported in both directions.
+
         Args:
             threshold: Similarity threshold (0-255)
+            workers: Number of native threads (0 uses every available CPU)
+            top_k: Best matches to keep per fingerprint (None keeps all)
+            mode: "fragment" or "file" scoring, see Fingerprint
 
         Returns:
             List of Comparison namedtuples
         """
-        cl_ptr = lib.cl_fpl_all(self._fpl, threshold)
-        try:
-            return _cl_to_list(cl_ptr)
-        finally:
-            if cl_ptr:
-                lib.cl_free(cl_ptr)
+        return self._compare(None, threshold, _check_top_k(top_k), mode, _check_workers(workers))
 
-    def compare_with(self, other: Union['Fingerprint', 'FingerprintList'], threshold: int = 0) -> List[Comparison]:
+    def compare_with(self, other: Union['Fingerprint', 'FingerprintList'], threshold: int = 0,
+                     workers: int = 1, top_k: Optional[int] = None,
+                     mode: str = "fragment") -> List[Comparison]:
         """
         Compare this fingerprint list with another fingerprint or list.
 
+        With top_k, only the best top_k matches are kept for the fingerprint,
+        or for every fingerprint of this list when comparing with a list,
+        ordered best first.
+
         Args:
             other: Fingerprint or FingerprintList to compare against
             threshold: Similarity threshold (0-255)
+            workers: Number of native threads (0 uses every available CPU)
+            top_k: Best matches to keep per query fingerprint (None keeps all)
+            mode: "fragment" or "file" scoring, see Fingerprint
 
         Returns:
             List of Comparison namedtuples
         """
-        cl_ptr = None
+        if not isinstance(other, (Fingerprint, FingerprintList)):
+            raise TypeError("Can only compare with Fingerprint or FingerprintList")
 
-        try:
-            if isinstance(other, Fingerprint):
-                cl_ptr = lib.cl_fp_vs_fpl(other._fp, self._fpl, threshold)
-            elif isinstance(other, FingerprintList):
-                cl_ptr = lib.cl_fpl_vs_fpl(self._fpl, other._fpl, threshold)
-            else:
-                raise TypeError("Can only compare with Fingerprint or FingerprintList")
+        return self._compare(other, threshold, _check_top_k(top_k), mode, _check_workers(workers))
+
+    def iter_compare_all(self, threshold: int = 0, workers: int = 1, top_k: Optional[int] = None,
+                         batch_size: int = 4096, arrays: bool = False,
+                         mode: str = "fragment") -> Iterator:
+        """
+        Lazily compare all fingerprints in the list against each other.
+
+        Yields the same results in the same order as compare_all(), but
+        computes them a few rows at a time and pulls them from the native
+        side in batches of batch_size, so memory stays flat however many
+        pairs match. The list must not be modified while iterating; the next
+        batch raises RuntimeError if it was.
+
+        With arrays=True every batch is yielded as a tuple of NumPy arrays
+        (index1, index2, score) holding list positions instead of names,
+        which skips building a Comparison per match. Requires NumPy.
+
+        Args:
+            threshold: Similarity threshold (0-255)
+            workers: Number of native threads (0 uses every available CPU)
+            top_k: Best matches to keep per fingerprint (None keeps all)
+            batch_size: Number of results fetched from the native side at a time
+            arrays: Yield (index1, index2, score) arrays per batch
+            mode: "fragment" or "file" scoring, see Fingerprint
 
-            return _cl_to_list(cl_ptr)
-        finally:
-            if cl_ptr:
-                lib.cl_free(cl_ptr)
+        Yields:
+            Comparison namedtuples, or tuples of NumPy arrays with arrays=True
+
+        Raises:
+            RuntimeError: If the list is modified during iteration
+        """
+        top_k = _check_top_k(top_k)
+        workers = _check_workers(workers)
+        return _iter_cursor(lambda: self._cursor(None, threshold, top_k, mode, workers),
+                            _check_batch_size(batch_size), arrays)
+
+    def iter_compare_with(self, other: Union['Fingerprint', 'FingerprintList'], threshold: int = 0,
+                          workers: int = 1, top_k: Optional[int] = None, batch_size: int = 4096,
+                          arrays: bool = False, mode: str = "fragment") -> Iterator:
+        """
+        Lazily compare this fingerprint list with another fingerprint or list.
+
+        The streaming counterpart of compare_with(), see iter_compare_all().
+        With arrays=True, index1 is the position in this list (0 for a single
+        Fingerprint) and index2 the position in other.
+
+        Args:
+            other: Fingerprint or FingerprintList to compare against
+            threshold: Similarity threshold (0-255)
+            workers: Number of native threads (0 uses every available CPU)
+            top_k: Best matches to keep per query fingerprint (None keeps all)
+            batch_size: Number of results fetched from the native side at a time
+            arrays: Yield (index1, index2, score) arrays per batch
+            mode: "fragment" or "file" scoring, see Fingerprint
+
+        Yields:
+            Comparison namedtuples, or tuples of NumPy arrays with arrays=True
+
+        Raises:
+            RuntimeError: If a list is modified during iteration
+        """
+        workers = _check_workers(workers)
+        top_k = _check_top_k(top_k)
+        batch_size = _check_batch_size(batch_size)
+
+        if not isinstance(other, (Fingerprint, FingerprintList)):
+            raise TypeError("Can only compare with Fingerprint or FingerprintList")
+
+        return _iter_cursor(lambda: self._cursor(other, threshold, top_k, mode, workers), batch_size,
+                            arrays)
+
+    async def acompare_all(self, threshold: int = 0, workers: int = 1, top_k: Optional[int] = None,
+                           mode: str = "fragment", batch_size: int = 4096) -> List[Comparison]:
+        """
+        Asynchronous compare_all(): compare on the executor of the aio module
+        without blocking the event loop.
+
+        The results are computed batch_size at a time, each batch in its own
+        native call, so cancelling the call stops the comparison after the
+        batch in flight. The list must not be modified until it completes.
+
+        Args:
+            threshold: Similarity threshold (0-255)
+            workers: Number of native threads per batch (0 uses every available CPU)
+            top_k: Best matches to keep per fingerprint (None keeps all)
+            mode: "fragment" or "file" scoring, see Fingerprint
+            batch_size: Number of results computed per native call
+
+        Returns:
+            List of Comparison namedtuples, as from compare_all()
+        """
+        from .aio import _compare
+        return await _compare(self, None, threshold, _check_workers(workers), _check_top_k(top_k), mode,
+                              batch_size)
+
+    async def acompare_with(self, other: Union['Fingerprint', 'FingerprintList'], threshold: int = 0,
+                            workers: int = 1, top_k: Optional[int] = None, mode: str = "fragment",
+                            batch_size: int = 4096) -> List[Comparison]:
+        """
+        Asynchronous compare_with(), see acompare_all().
+
+        Args:
+            other: Fingerprint or FingerprintList to compare against
+            threshold: Similarity threshold (0-255)
+            workers: Number of native threads per batch (0 uses every available CPU)
+            top_k: Best matches to keep per query fingerprint (None keeps all)
+            mode: "fragment" or "file" scoring, see Fingerprint
+            batch_size: Number of results computed per native call
+
+        Returns:
+            List of Comparison namedtuples, as from compare_with()
+        """
+        if not isinstance(other, (Fingerprint, FingerprintList)):
+            raise TypeError("Can only compare with Fingerprint or FingerprintList")
+
+        from .aio import _compare
+        return await _compare(self, other, threshold, _check_workers(workers), _check_top_k(top_k), mode,
+                              batch_size)
 
 
 # Convenience functions (similar to TLSH's hash() function)
-def hash(data: Union[str, bytes, Tuple[Union[str, bytes], str]]) -> str:
+def hash(data: Union[str, BytesLike, Tuple[Union[str, BytesLike], str]]) -> str:
     """
     Generate MRSHw hash for data.
 
     Args:
-        data: Data to hash (file path, bytes, or (data, label) tuple)
+        data: Data to hash (file path, bytes-like object, or (data, label) tuple)
 
     Returns:
         Hexadecimal hash string
@@ -454,7 +1089,8 @@ def hash(data: Union[str, bytes, Tuple[Union[str, bytes], str]]) -> str:
 
 def compare(entity1: Union[Fingerprint, FingerprintList, str],
            entity2: Union[Fingerprint, FingerprintList, str],
-           threshold: int = 0) -> Union[int, List[Comparison]]:
+           threshold: int = 0, workers: int = 1,
+           top_k: Optional[int] = None, mode: str = "fragment") -> Union[int, List[Comparison]]:
     """
     Compare two entities.
 
@@ -462,6 +1098,9 @@ def compare(entity1: Union[Fingerprint, FingerprintList, str],
         entity1: First entity (Fingerprint, FingerprintList, or hash string)
         entity2: Second entity (Fingerprint, FingerprintList, or hash string)
         threshold: Similarity threshold for list comparisons
+        workers: Number of native threads for list comparisons
+        top_k: Best matches to keep per query fingerprint in list comparisons
+        mode: "fragment" or "file" scoring, see Fingerprint
 
     Returns:
         For Fingerprint vs Fingerprint: similarity score (int)
@@ -469,36 +1108,52 @@ def compare(entity1: Union[Fingerprint, FingerprintList, str],
     """
     # Handle string hash comparisons
     if isinstance(entity1, str) and isinstance(entity2, str):
-        return diff(entity1, entity2)
+        return diff(entity1, entity2, mode)
 
     # Handle Fingerprint comparisons
     if isinstance(entity1, Fingerprint) and isinstance(entity2, Fingerprint):
-        return entity1.compare(entity2)
+        return entity1.compare(entity2, mode)
 
     # Handle mixed comparisons
     if isinstance(entity1, Fingerprint):
         if isinstance(entity2, FingerprintList):
-            return entity2.compare_with(entity1, threshold)
+            return entity2.compare_with(entity1, threshold, workers, top_k, mode)
     elif isinstance(entity1, FingerprintList):
-        return entity1.compare_with(entity2, threshold)
+        return entity1.compare_with(entity2, threshold, workers, top_k, mode)
 
     raise TypeError("Unsupported comparison types")
 
 
-def diff(hash1: str, hash2: str) -> int:
+def diff(hash1: str, hash2: str, mode: str = "fragment") -> int:
     """
     Calculate difference between two hash strings.
 
     Args:
         hash1: First hash string
         hash2: Second hash string
+        mode: "fragment" or "file" scoring, see Fingerprint
 
     Returns:
         Difference score
     """
-    # Create byte objects and assign them to variables
-    # This keeps them alive until the function returns
-    hash1_bytes = hash1.encode()
-    hash2_bytes = hash2.encode()
+    return _native.str_compare(hash1, hash2, mode)
 
-    return lib.str_compare(hash1_bytes, hash2_bytes)
+
+def diff_many(hash1: str, hashes: List[str], mode: str = "fragment") -> List[int]:
+    """
+    Calculate the difference between one hash string and many others.
+
+    hash1 is parsed only once, which makes this much faster than calling
+    diff() for every hash.
+
+    Args:
+        hash1: Hash string to compare
+        hashes: Hash strings to compare hash1 with
+        mode: "fragment" or "file" scoring, see Fingerprint
+
+    Returns:
+        Difference score for every hash in hashes (0 where a hash cannot be parsed)
+    """
+    if not isinstance(hashes, (list, tuple)):
+        hashes = list(hashes)
+    return _native.str_compare_many(hash1, hashes, mode)
@@ -0,0 +1,139 @@
+"""
+Candidate index for fast similarity lookups in large fingerprint lists.
+"""
+
+from typing import Union, List
+
+from . import _mrsh as _native
+from .core import (
+    Comparison,
+    Fingerprint,
+    FingerprintList,
+)
+
+
+# Bins per filter signature and the default banding, from fingerprintIndex.h
+INDEX_BINS = _native.INDEX_BINS
+DEFAULT_BANDS = _native.INDEX_DEFAULT_BANDS
+DEFAULT_ROWS = _native.INDEX_DEFAULT_ROWS
+
+
+class FingerprintIndex(_native.FingerprintIndex):
+    """
+    MinHash (LSH) index over the Bloom filters of a FingerprintList.
+
+    Instead of comparing a query against every fingerprint, the index looks
+    up the fingerprints that have a filter sharing a banded MinHash key with
+    one of the query's filters and computes the exact score only for those
+    candidates. Results therefore carry the same scores as compare_with(),
+    but a pair can be missed, see below.
+
+    Recall is tuned with bands and rows: a pair of filters whose bins agree
+    with probability J becomes a candidate with probability
+    1 - (1 - J**rows)**bands. More bands or fewer rows raise recall and the
+    number of candidates; bands * rows must not exceed INDEX_BINS (128).
+
+    The bins of two filters agree often only when the filters are about
+    equally full, so the index finds similar whole files, not fragments.
+    With the defaults, pairs of mutated 256 KB files scoring 50 or more are
+    all found, while 5-10 KB excerpts queried against the 64 KB files they
+    were cut from are found about 3% of the time, in either scoring mode.
+    64 bands of 2 rows find 97% of those excerpts, but then most pairs of
+    the list become candidates and a query is slower than compare_with().
+    Look up fragments with FingerprintList.compare_with() instead.
+
+    The index keeps a reference to its list. Fingerprints added to the list
+    later, and fingerprints replaced in it, are indexed automatically on the
+    next query; removed fingerprints are never returned.
+
+    Example:
+        db = FingerprintList.load("samples.mrsh")
+        index = FingerprintIndex.build(db)
+
+        for match in index.query(Fingerprint("suspicious.exe"), threshold=40):
+            print(match.hash2, match.score)
+    """
+
+    def __init__(self, fpl: FingerprintList, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS):
+        """
+        Index every fingerprint of a list.
+
+        Args:
+            fpl: FingerprintList to index
+            bands: Number of MinHash bands
+            rows: Number of bins per band
+
+        Raises:
+            TypeError: If fpl is not a FingerprintList
+            ValueError: If bands or rows are out of range
+            MRSHwError: If the index cannot be built
+        """
+        if not isinstance(fpl, FingerprintList):
+            raise TypeError("Can only index a FingerprintList")
+        if bands < 1 or rows < 1 or bands * rows > INDEX_BINS:
+            raise ValueError(f"bands and rows must be positive with bands * rows <= {INDEX_BINS}")
+
+        self._build(fpl, bands, rows)
+        self.bands = bands
+        self.rows = rows
+
+    @classmethod
+    def build(cls, fpl: FingerprintList, bands: int = DEFAULT_BANDS,
+              rows: int = DEFAULT_ROWS) -> 'FingerprintIndex':
+        """
+        Build an index over a fingerprint list.
+
+        Args:
+            fpl: FingerprintList to index
+            bands: Number of MinHash bands
+            rows: Number of bins per band
+
+        Returns:
+            The new FingerprintIndex
+        """
+        return cls(fpl, bands, rows)
+
+    # __len__ (the number of indexed fingerprints) is implemented natively
+
+    def __repr__(self) -> str:
+        """Detailed string representation."""
+        return f"FingerprintIndex(size={len(self)}, bands={self.bands}, rows={self.rows})"
+
+    def query(self, fp: Union[Fingerprint, FingerprintList], threshold: int,
+              mode: str = "fragment") -> List[Comparison]:
+        """
+        Find the indexed fingerprints similar to a fingerprint or list.
+
+        Candidates are rescored exactly, so every result is also in the
+        output of compare_with() for the same threshold and in the same order.
+        A threshold of 0 matches every pair and falls back to a full scan.
+
+        Args:
+            fp: Query Fingerprint, or FingerprintList to query every entry of
+            threshold: Minimum similarity score (0-255)
+            mode: "fragment" or "file" scoring, see Fingerprint
+
+        Returns:
+            List of Comparison namedtuples with the query as hash1
+        """
+        if not isinstance(fp, (Fingerprint, FingerprintList)):
+            raise TypeError("Can only query with Fingerprint or FingerprintList")
+
+        return self._query(fp, threshold, mode)
+
+    def compare_all(self, threshold: int, mode: str = "fragment") -> List[Comparison]:
+        """
+        Find the similar pairs within the indexed list.
+
+        The index counterpart of FingerprintList.compare_all(): only candidate
+        pairs are scored, and the results are a subset of the full sweep in
+        the same order.
+
+        Args:
+            threshold: Minimum similarity score (0-255)
+            mode: "fragment" or "file" scoring, see Fingerprint
+
+        Returns:
+            List of Comparison namedtuples
+        """
+        return self._compare_all(threshold, mode)
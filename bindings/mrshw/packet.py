@@ -0,0 +1,187 @@
+"""
+Streaming matching of network packets against known fingerprints.
+"""
+
+from collections import OrderedDict, deque
+from typing import Hashable, List, Optional, Sequence
+
+from .core import BytesLike, Comparison, FingerprintList, _check_batch_size, _check_workers
+
+
+# Packets per flow hashed together unless given
+DEFAULT_WINDOW = 4
+
+# Flows whose windows are kept unless given
+DEFAULT_MAX_FLOWS = 4096
+
+
+class PacketMatcher:
+    """
+    Match a stream of packets against a preloaded FingerprintList.
+
+    A single packet rarely holds enough chunks to be scored on its own, so
+    every flow keeps a sliding window of its most recent packets. Each new
+    packet is appended to the window of its flow, the payloads of the window
+    are hashed together in packet mode (see Fingerprint) and the result is
+    compared against the reference list. In-order packets of a transfer thus
+    score like the contiguous fragment of the file they carry.
+
+    Memory is bounded: a flow keeps at most window payloads, and only the
+    max_flows most recently seen flows are kept, the least recently seen
+    one is dropped first. Packets are best matched in batches with
+    match_many(), which hashes and compares a whole batch in one native
+    call each.
+
+    The matcher is not thread-safe.
+
+    Example:
+        known = FingerprintList.load("exfiltration-watchlist.mrsh")
+        matcher = PacketMatcher(known, threshold=40)
+
+        for payload, five_tuple in capture:
+            for match in matcher.match(payload, flow=five_tuple):
+                print(five_tuple, match.hash2, match.score)
+    """
+
+    def __init__(self, reference: FingerprintList, threshold: int = 40, window: int = DEFAULT_WINDOW,
+                 max_flows: int = DEFAULT_MAX_FLOWS, mode: str = "fragment", workers: int = 1,
+                 batch_size: int = 4096):
+        """
+        Create a matcher.
+
+        Args:
+            reference: FingerprintList the packets are matched against; it
+                may grow, but must not be modified during a call
+            threshold: Similarity threshold (0-255) of a match
+            window: Number of recent packets per flow hashed together
+            max_flows: Number of flows whose windows are kept
+            mode: "fragment" or "file" scoring, see Fingerprint
+            workers: Number of native threads (0 uses every available CPU)
+            batch_size: Number of results fetched from the native side at a time
+
+        Raises:
+            TypeError: If reference is not a FingerprintList
+            ValueError: If an argument is out of range
+        """
+        if not isinstance(reference, FingerprintList):
+            raise TypeError("Can only match against a FingerprintList")
+        if not 0 <= threshold <= 255:
+            raise ValueError("threshold must be between 0 and 255")
+        if window < 1:
+            raise ValueError("window must be a positive number")
+        if max_flows < 1:
+            raise ValueError("max_flows must be a positive number")
+        if mode not in ("fragment", "file"):
+            raise ValueError(f"mode must be 'fragment' or 'file', not {mode!r}")
+
+        self.reference = reference
+        self.threshold = threshold
+        self.window = window
+        self.max_flows = max_flows
+        self.mode = mode
+        self.workers = _check_workers(workers)
+        self.batch_size = _check_batch_size(batch_size)
+        self.packets = 0
+        self._flows = OrderedDict()
+        self._names = []
+        self._names_version = None
+
+    def _push(self, packet: BytesLike, flow: Hashable) -> bytes:
+        """Append a packet to the window of its flow and return the window's payloads."""
+        recent = self._flows.get(flow)
+        if recent is None:
+            recent = self._flows[flow] = deque(maxlen=self.window)
+            if len(self._flows) > self.max_flows:
+                self._flows.popitem(last=False)
+        else:
+            self._flows.move_to_end(flow)
+
+        # the caller may reuse its buffer for the next packet
+        packet = bytes(packet)
+        if packet:
+            recent.append(packet)
+        return b"".join(recent)
+
+    def _reference_names(self) -> List[str]:
+        """Names of the reference fingerprints, refreshed when the list changed."""
+        version = (self.reference._size(), self.reference._mutations())
+        if self._names_version != version:
+            self._names = self.reference._names()
+            self._names_version = version
+        return self._names
+
+    def match(self, packet: BytesLike, flow: Hashable = None, label: str = "n/a") -> List[Comparison]:
+        """
+        Match the next packet of a flow.
+
+        Args:
+            packet: Packet payload, any bytes-like object
+            flow: Hashable flow key, such as the 5-tuple of the packet; None
+                for a single stream
+            label: Label of the packet in the results
+
+        Returns:
+            Comparison namedtuples (label, reference name, score) of the
+            reference fingerprints the window ending at this packet matches,
+            in reference order
+        """
+        return self.match_many([packet], None if flow is None else [flow],
+                               None if label == "n/a" else [label])[0]
+
+    def match_many(self, packets: Sequence[BytesLike], flows: Optional[Sequence[Hashable]] = None,
+                   labels: Optional[Sequence[str]] = None) -> List[List[Comparison]]:
+        """
+        Match a batch of packets, in arrival order.
+
+        The result is the same as calling match() for every packet in turn.
+
+        Args:
+            packets: Packet payloads, bytes-like objects
+            flows: Flow key of every packet (None puts them all in one stream)
+            labels: Label of every packet (None labels them all "n/a")
+
+        Returns:
+            List with the matches of every packet, as returned by match()
+
+        Raises:
+            ValueError: If flows or labels do not match the packets
+            MRSHwError: If the packets cannot be hashed
+        """
+        count = len(packets)
+        if flows is not None and len(flows) != count:
+            raise ValueError(f"Expected {count} flows, got {len(flows)}")
+        if labels is not None and len(labels) != count:
+            raise ValueError(f"Expected {count} labels, got {len(labels)}")
+
+        windows = [self._push(packet, None if flows is None else flows[i]) for i, packet in enumerate(packets)]
+        self.packets += count
+
+        batch = FingerprintList().add_many(windows, labels, self.workers, mode="packet")
+        names = self._reference_names()
+        results = [[] for _ in range(count)]
+
+        cursor = batch._cursor(self.reference, self.threshold, 0, self.mode, self.workers)
+        try:
+            while True:
+                columns = cursor.fetch_columns(self.batch_size)
+                if columns is None:
+                    break
+                index1, index2, score = columns
+                for i, j, s in zip(memoryview(index1).cast("N"), memoryview(index2).cast("N"), score):
+                    results[i].append(Comparison(labels[i] if labels is not None else "n/a", names[j], s))
+        finally:
+            cursor.close()
+        return results
+
+    def forget(self, flow: Hashable) -> None:
+        """Drop the window of a flow, e.g. once the connection closed."""
+        self._flows.pop(flow, None)
+
+    def clear(self) -> None:
+        """Drop the windows of all flows."""
+        self._flows.clear()
+
+    @property
+    def flows(self) -> int:
+        """Number of flows whose windows are kept."""
+        return len(self._flows)
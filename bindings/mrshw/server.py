@@ -0,0 +1,457 @@
+"""
+Resident lookup server: keeps a reference list in memory and answers
+batched similarity queries over a local socket.
+
+The protocol is newline-delimited JSON. Every request is one JSON object on
+one line and is answered by one line, in the order the requests of a
+connection arrive. A request may carry an "id", which is copied into its
+response.
+
+    {"op": "query", "items": [{"digest": "..."}, {"data": "<base64>", "label": "x"}],
+     "threshold": 40, "mode": "fragment", "top_k": 5}
+    -> {"results": [[{"name": "sample.exe", "score": 87}], []]}
+
+    {"op": "reload"}                    -> {"size": 1234, "generation": 2}
+    {"op": "info"}                      -> {"size": ..., "generation": ..., "queries": ..., "stats": {...}}
+    {"op": "ping"}                      -> {}
+
+Failed requests are answered with {"error": "message"}.
+
+A reload over the protocol loads the server's own source again. Clients
+cannot name another source, since that would let them load or scan any
+path the server can read; switching sources is left to the Python API.
+"""
+
+import os
+import json
+import base64
+import signal
+import socket
+import asyncio
+import threading
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from .core import Fingerprint, FingerprintList, MRSHwError, _check_top_k, _check_workers
+from .index import DEFAULT_BANDS, DEFAULT_ROWS, FingerprintIndex
+from .stats import stats
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7531
+
+# Longest request line accepted, raw data included
+DEFAULT_MAX_REQUEST = 64 << 20
+
+# A loaded reference set; queries keep the one they started with across reloads
+_Reference = namedtuple('_Reference', ['fpl', 'index', 'generation', 'source'])
+
+Match = Dict[str, Union[str, int]]
+Source = Union[str, os.PathLike, FingerprintList]
+
+
+def _load_source(source: Source, mmap: bool, cache, workers: int) -> FingerprintList:
+    """The reference list of a source: a list, a saved list or a directory to scan."""
+    if isinstance(source, FingerprintList):
+        return source
+    if Path(source).is_dir():
+        from .utils import scan_directory
+        return scan_directory(source, workers=workers, cache=cache)
+    return FingerprintList.load(source, mmap=mmap)
+
+
+def _query_fingerprint(item: dict, position: int) -> Fingerprint:
+    """Fingerprint of a query item: {"digest": ...} or {"data": <base64>, "label": ...}."""
+    if not isinstance(item, dict):
+        raise ValueError(f"item {position} must be an object")
+    if "digest" in item:
+        return Fingerprint.from_digest(item["digest"])
+    if "data" in item:
+        try:
+            data = base64.b64decode(item["data"], validate=True)
+        except (TypeError, ValueError):
+            raise ValueError(f"item {position} holds invalid base64 data") from None
+        return Fingerprint((data, str(item.get("label", "n/a"))))
+    raise ValueError(f"item {position} needs a digest or data")
+
+
+class LookupServer:
+    """
+    Keep a reference list in memory and answer similarity lookups.
+
+    Lookups run on the executor of the aio module, so the server keeps
+    accepting and reading requests while the native code compares. A
+    reload loads the new reference set next to the old one and then
+    switches to it; lookups already running finish on the set they started
+    with, so no query is dropped or sees a half-loaded set.
+
+    Example:
+        server = LookupServer("samples.mrsh", threshold=40, index=True)
+        asyncio.run(server.serve(path="/run/mrsh.sock"))
+    """
+
+    def __init__(self, source: Source, threshold: int = 0, mode: str = "fragment",
+                 top_k: Optional[int] = None, workers: int = 1, index: bool = False,
+                 mmap: bool = False, cache=None, bands: int = DEFAULT_BANDS,
+                 rows: int = DEFAULT_ROWS):
+        """
+        Load the reference set.
+
+        Args:
+            source: FingerprintList, path of a list written by save(), or a
+                directory whose files are hashed
+            threshold: Default similarity threshold (0-255) of a lookup
+            mode: Default "fragment" or "file" scoring, see Fingerprint
+            top_k: Default number of best matches per item (None for all)
+            workers: Number of native threads per lookup (0 uses every CPU)
+            index: Look up candidates in a FingerprintIndex instead of
+                comparing every reference fingerprint; only suited to
+                whole-file lookups, since fragments are mostly missed (see
+                FingerprintIndex)
+            mmap: Map saved lists instead of reading them; the file must
+                then be replaced atomically, as FingerprintList.save() does,
+                never rewritten in place
+            cache: HashCache for directory sources, None for the default
+                cache, False for none
+            bands: Number of MinHash bands of the index
+            rows: Number of bins per band of the index
+
+        Raises:
+            ValueError: If an argument is out of range
+            MRSHwError: If the reference set cannot be loaded
+        """
+        self.threshold, self.mode, self.top_k = self._check_options(threshold, mode, top_k)
+        self.workers = _check_workers(workers)
+        self.use_index = index
+        self.bands = bands
+        self.rows = rows
+        self.mmap = mmap
+        self.cache = cache
+        self.queries = 0
+        # lookups run on executor threads, so the counter is only updated under the lock
+        self._queries_lock = threading.Lock()
+        self._reference = self._open(source, 1)
+        self._reload_lock = None
+
+    @staticmethod
+    def _check_options(threshold: int, mode: str, top_k: Optional[int]) -> Tuple[int, str, Optional[int]]:
+        """Validate the lookup options of the server or of a request."""
+        if not isinstance(threshold, int) or not 0 <= threshold <= 255:
+            raise ValueError("threshold must be between 0 and 255")
+        if mode not in ("fragment", "file"):
+            raise ValueError(f"mode must be 'fragment' or 'file', not {mode!r}")
+        if top_k is not None:
+            if not isinstance(top_k, int):
+                raise ValueError("top_k must be a positive number or None")
+            _check_top_k(top_k)
+        return threshold, mode, top_k
+
+    def _open(self, source: Source, generation: int) -> _Reference:
+        """Load a reference set, with its index if lookups use one."""
+        fpl = _load_source(source, self.mmap, self.cache, self.workers)
+        index = FingerprintIndex(fpl, self.bands, self.rows) if self.use_index else None
+        return _Reference(fpl, index, generation, source)
+
+    @property
+    def size(self) -> int:
+        """Number of fingerprints in the current reference set."""
+        return len(self._reference.fpl)
+
+    @property
+    def generation(self) -> int:
+        """Number of the current reference set, 1 for the initial one, increased by every reload."""
+        return self._reference.generation
+
+    async def reload(self, source: Optional[Source] = None) -> int:
+        """
+        Load a new reference set and switch to it.
+
+        Lookups already running finish on the previous set. Concurrent
+        reloads are applied one after the other.
+
+        Args:
+            source: New source, None to load the current source again
+
+        Returns:
+            Number of fingerprints in the new set
+
+        Raises:
+            MRSHwError: If the new set cannot be loaded; the previous one stays in use
+        """
+        from .aio import run
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+
+        async with self._reload_lock:
+            current = self._reference
+            self._reference = await run(self._open, current.source if source is None else source,
+                                        current.generation + 1)
+        return self.size
+
+    def lookup(self, items: List[dict], threshold: Optional[int] = None, mode: Optional[str] = None,
+               top_k: Optional[int] = None) -> List[List[Match]]:
+        """
+        Look up a batch of query items in the current reference set.
+
+        Blocks while comparing; serve() runs it on the aio executor.
+
+        Args:
+            items: Query items, {"digest": hexdigest} or {"data": base64, "label": name}
+            threshold: Similarity threshold, None for the server default
+            mode: "fragment" or "file" scoring, None for the server default
+            top_k: Best matches per item, None for the server default
+
+        Returns:
+            List with the matches of every item, {"name": ..., "score": ...}
+            ordered by descending score
+
+        Raises:
+            ValueError: If an item or option is invalid
+        """
+        threshold, mode, top_k = self._check_options(
+            self.threshold if threshold is None else threshold,
+            self.mode if mode is None else mode,
+            self.top_k if top_k is None else top_k)
+        if not isinstance(items, list):
+            raise ValueError("items must be a list")
+
+        # the items form one query list labelled by position, compared in one native call
+        reference = self._reference
+        queries = FingerprintList()
+        for position, item in enumerate(items):
+            queries.insert(_query_fingerprint(item, position), str(position))
+
+        groups = [[] for _ in items]
+        if items:
+            if reference.index is not None:
+                matches = reference.index.query(queries, threshold, mode)
+            else:
+                matches = queries.compare_with(reference.fpl, threshold, self.workers, top_k, mode)
+            for c in matches:
+                groups[int(c.hash1)].append(c)
+
+        results = []
+        for matches in groups:
+            matches = sorted(matches, key=lambda c: -c.score)[:top_k]
+            results.append([{"name": c.hash2, "score": c.score} for c in matches])
+
+        with self._queries_lock:
+            self.queries += len(items)
+        return results
+
+    async def handle(self, request: dict) -> dict:
+        """
+        Answer one decoded request.
+
+        Args:
+            request: Request object, see the module documentation
+
+        Returns:
+            Response object, with the request's id if it has one
+        """
+        from .aio import run
+        response = {}
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("request must be an object")
+            if "id" in request:
+                response["id"] = request["id"]
+
+            op = request.get("op", "query")
+            if op == "query":
+                response["results"] = await run(self.lookup, request.get("items"), request.get("threshold"),
+                                                request.get("mode"), request.get("top_k"))
+            elif op == "reload":
+                if "source" in request:
+                    raise ValueError("reload cannot change the source over the protocol")
+                response["size"] = await self.reload()
+                response["generation"] = self.generation
+            elif op == "info":
+                response.update(size=self.size, generation=self.generation, queries=self.queries,
+                                stats=stats())
+            elif op != "ping":
+                raise ValueError(f"unknown op: {op!r}")
+        except (ValueError, TypeError, MRSHwError) as e:
+            response["error"] = str(e)
+        return response
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one connection in order."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # longer than the limit: the rest of the line cannot be framed
+                    writer.write(b'{"error": "request too large"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"error": f"invalid JSON: {e}"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, path: Optional[str] = None,
+                    max_request: int = DEFAULT_MAX_REQUEST, ready=None) -> None:
+        """
+        Accept connections until cancelled.
+
+        SIGHUP reloads the current source, where the platform supports
+        signal handlers in the event loop.
+
+        Args:
+            host: TCP address to listen on, localhost by default
+            port: TCP port to listen on
+            path: Unix socket path; listens there instead of on TCP when given
+            max_request: Longest request line accepted, in bytes
+            ready: Optional callable invoked with the listening address once
+                connections are accepted
+        """
+        if path is not None:
+            if os.path.exists(path) and Path(path).is_socket():
+                os.unlink(path)
+            server = await asyncio.start_unix_server(self._client, path, limit=max_request)
+        else:
+            server = await asyncio.start_server(self._client, host, port, limit=max_request)
+
+        loop = asyncio.get_running_loop()
+        reloads = set()
+
+        def hangup():
+            task = loop.create_task(self.reload())
+            reloads.add(task)
+            task.add_done_callback(reloads.discard)
+
+        try:
+            loop.add_signal_handler(signal.SIGHUP, hangup)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass
+
+        try:
+            async with server:
+                if ready is not None:
+                    ready(path if path is not None else server.sockets[0].getsockname())
+                await server.serve_forever()
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGHUP)
+            except (NotImplementedError, AttributeError, RuntimeError):
+                pass
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+
+class LookupClient:
+    """
+    Blocking client of a LookupServer.
+
+    Example:
+        with LookupClient(path="/run/mrsh.sock") as client:
+            for matches in client.query(digests=[fp.hexdigest() for fp in batch], threshold=40):
+                print(matches)
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, path: Optional[str] = None,
+                 timeout: Optional[float] = None):
+        """
+        Connect to a server.
+
+        Args:
+            host: TCP address of the server
+            port: TCP port of the server
+            path: Unix socket path; connects there instead of over TCP when given
+            timeout: Socket timeout in seconds, None to wait indefinitely
+        """
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port), timeout)
+        self._file = self._socket.makefile("rwb")
+
+    def __enter__(self) -> 'LookupClient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection."""
+        self._file.close()
+        self._socket.close()
+
+    def request(self, request: dict) -> dict:
+        """
+        Send one request and wait for its response.
+
+        Raises:
+            MRSHwError: If the server answers with an error or closes the connection
+        """
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise MRSHwError("Lookup server closed the connection")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise MRSHwError(response["error"])
+        return response
+
+    def query(self, digests: Optional[List[str]] = None, data: Optional[List[bytes]] = None,
+              labels: Optional[List[str]] = None, threshold: Optional[int] = None,
+              mode: Optional[str] = None, top_k: Optional[int] = None) -> List[List[Match]]:
+        """
+        Look up a batch of digests and raw buffers.
+
+        Args:
+            digests: Hex digests to look up
+            data: Raw buffers to look up, hashed by the server
+            labels: Label of every buffer of data
+            threshold: Similarity threshold, None for the server default
+            mode: "fragment" or "file" scoring, None for the server default
+            top_k: Best matches per item, None for the server default
+
+        Returns:
+            Matches of every digest followed by those of every buffer, each
+            a list of {"name": ..., "score": ...} by descending score
+        """
+        items = [{"digest": digest} for digest in digests or []]
+        for position, buffer in enumerate(data or []):
+            item = {"data": base64.b64encode(buffer).decode("ascii")}
+            if labels is not None:
+                item["label"] = labels[position]
+            items.append(item)
+
+        request = {"op": "query", "items": items}
+        for name, value in (("threshold", threshold), ("mode", mode), ("top_k", top_k)):
+            if value is not None:
+                request[name] = value
+        return self.request(request)["results"]
+
+    def reload(self) -> int:
+        """
+        Make the server load its reference set again from its source.
+
+        Returns:
+            Number of fingerprints in the new set
+        """
+        return self.request({"op": "reload"})["size"]
+
+    def info(self) -> dict:
+        """Size and generation of the reference set, queries answered and instrumentation counters."""
+        return self.request({"op": "info"})
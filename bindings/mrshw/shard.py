@@ -0,0 +1,280 @@
+"""
+Sharded comparison of fingerprint lists too large to compare in one process.
+"""
+
+import os
+import csv
+import json
+import heapq
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Union, List, Iterator
+
+from .core import Comparison, FingerprintList, _check_batch_size, _check_workers
+
+
+# Number of fingerprints per shard unless given
+DEFAULT_SHARD_SIZE = 100_000
+
+# Bumped whenever the layout of the work directory changes
+MANIFEST_VERSION = 2
+MANIFEST = "manifest.json"
+RESULTS = "results.tsv"
+
+# Part and result files are tab separated, quoted where a name needs it
+_DIALECT = dict(delimiter="\t", lineterminator="\n")
+
+ListSource = Union[FingerprintList, str, os.PathLike]
+
+
+def _open_list(source: ListSource) -> FingerprintList:
+    """A FingerprintList as is, or the mapped list saved at a path."""
+    if isinstance(source, FingerprintList):
+        return source
+    return FingerprintList.load(source, mmap=True)
+
+
+def _replace(path: Path, write) -> None:
+    """Atomically create path with write(file), so a crash never leaves a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _list_digest(fpl: FingerprintList, shard_size: int) -> str:
+    """SHA-256 of the labels and digests of a list, hashed a shard at a time to bound memory."""
+    digest = hashlib.sha256()
+    size = fpl._size()
+    for start in range(0, size, shard_size):
+        digest.update(fpl._slice(start, min(start + shard_size, size)).hexdigest().encode())
+    return digest.hexdigest()
+
+
+def split_list(fpl: ListSource, directory: Union[str, os.PathLike], shard_size: int = DEFAULT_SHARD_SIZE,
+               prefix: str = "shard") -> List[Path]:
+    """
+    Save a fingerprint list as consecutive shards of shard_size fingerprints.
+
+    Each shard is an ordinary saved list, <prefix>-<n>.mrsh, that loads with
+    FingerprintList.load(). Only one shard is held in memory at a time, so a
+    mapped list larger than RAM can be split.
+
+    Args:
+        fpl: FingerprintList, or the path of a list written by save()
+        directory: Directory the shards are written to
+        shard_size: Number of fingerprints per shard
+        prefix: File name prefix of the shards
+
+    Returns:
+        Paths of the shards, in list order
+
+    Raises:
+        ValueError: If shard_size is not a positive number
+        MRSHwError: If the list cannot be loaded or a shard cannot be written
+    """
+    if shard_size < 1:
+        raise ValueError("shard_size must be a positive number")
+
+    fpl = _open_list(fpl)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    size = fpl._size()
+    paths = []
+    for start in range(0, size, shard_size):
+        path = directory / f"{prefix}-{len(paths):05d}.mrsh"
+        fpl._slice(start, min(start + shard_size, size)).save(path)
+        paths.append(path)
+    return paths
+
+
+def _compare_shards(left: str, right: Optional[str], part: str, offset1: int, offset2: int,
+                    threshold: int, mode: str, workers: int, batch_size: int) -> int:
+    """
+    Compare two shards, or a shard with itself when right is None, into a part file.
+
+    Runs in a worker process. Results are written with their positions in
+    the whole lists, in comparison order, and the part file only appears
+    once it is complete.
+    """
+    fpl1 = FingerprintList.load(left)
+    fpl2 = FingerprintList.load(right) if right else None
+    names1 = fpl1._names()
+    names2 = fpl2._names() if fpl2 is not None else names1
+    count = 0
+
+    def write(f):
+        nonlocal count
+        writer = csv.writer(f, **_DIALECT)
+        cursor = fpl1._cursor(fpl2, threshold, 0, mode, workers)
+        try:
+            while True:
+                columns = cursor.fetch_columns(batch_size)
+                if columns is None:
+                    return
+                index1, index2, score = columns
+                index1 = memoryview(index1).cast("N")
+                index2 = memoryview(index2).cast("N")
+                writer.writerows((i + offset1, j + offset2, s, names1[i], names2[j])
+                                 for i, j, s in zip(index1, index2, score))
+                count += len(score)
+        finally:
+            cursor.close()
+
+    _replace(Path(part), write)
+    return count
+
+
+def _read_part(path: Path) -> Iterator[tuple]:
+    """Rows of a part file as (index1, index2, score, name1, name2)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for index1, index2, score, name1, name2 in csv.reader(f, **_DIALECT):
+            yield int(index1), int(index2), int(score), name1, name2
+
+
+def compare_sharded(left: ListSource, right: Optional[ListSource] = None,
+                    directory: Union[str, os.PathLike] = "mrsh-shards", threshold: int = 0,
+                    mode: str = "fragment", shard_size: int = DEFAULT_SHARD_SIZE, processes: int = 0,
+                    workers: int = 1, output: Optional[Union[str, os.PathLike]] = None,
+                    batch_size: int = 4096) -> Path:
+    """
+    Compare fingerprint lists shard by shard over a pool of processes.
+
+    Both lists are split into shards of shard_size fingerprints in the work
+    directory, and every pair of shards (every pair with the first shard not
+    after the second when right is None) is compared by a worker process,
+    which loads only those two shards. Each comparison writes its thresholded
+    results to a part file, and the part files are finally merged into one
+    file in the order compare_all() / compare_with() return the results.
+
+    The work directory is the checkpoint: calling compare_sharded() again
+    with the same directory, lists and arguments after a crash or
+    interruption reuses the shards and every finished part, and only
+    compares the shard pairs that had not completed. The manifest records a
+    SHA-256 of the labels and digests of each list, so resuming reads both
+    lists once more to check that they did not change. The directory may
+    be removed once the results are read.
+
+    Args:
+        left: FingerprintList, or the path of a list written by save()
+        right: List to compare against, None to compare left with itself
+        directory: Work directory for shards, part files and the manifest
+        threshold: Similarity threshold (0-255)
+        mode: "fragment" or "file" scoring, see Fingerprint
+        shard_size: Number of fingerprints per shard
+        processes: Number of worker processes (0 uses every available CPU)
+        workers: Number of native threads per worker process
+        output: Result file, results.tsv in the work directory by default
+        batch_size: Number of results a worker fetches from the native side at a time
+
+    Returns:
+        Path of the result file, to be read with iter_sharded_results()
+
+    Raises:
+        ValueError: If an argument is out of range, or the work directory
+            holds a comparison started with different lists or arguments
+        MRSHwError: If a list cannot be loaded or a shard cannot be written
+    """
+    if not 0 <= threshold <= 255:
+        raise ValueError("threshold must be between 0 and 255")
+    if mode not in ("fragment", "file"):
+        raise ValueError(f"mode must be 'fragment' or 'file', not {mode!r}")
+    if shard_size < 1:
+        raise ValueError("shard_size must be a positive number")
+    if processes < 0:
+        raise ValueError("processes must be 0 (all CPUs) or a positive number")
+    workers = _check_workers(workers)
+    batch_size = _check_batch_size(batch_size)
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "parts").mkdir(exist_ok=True)
+
+    left = _open_list(left)
+    right = _open_list(right) if right is not None else None
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "threshold": threshold,
+        "mode": mode,
+        "shard_size": shard_size,
+        "left": left._size(),
+        "right": right._size() if right is not None else None,
+        "left_digest": _list_digest(left, shard_size),
+        "right_digest": _list_digest(right, shard_size) if right is not None else None,
+    }
+
+    # The manifest is written once all shards are, so its presence marks them complete
+    manifest_path = directory / MANIFEST
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            started = json.load(f)
+    except FileNotFoundError:
+        started = None
+
+    if started is None:
+        split_list(left, directory, shard_size, "left")
+        if right is not None:
+            split_list(right, directory, shard_size, "right")
+        _replace(manifest_path, lambda f: json.dump(manifest, f, indent=2))
+    elif started != manifest:
+        raise ValueError(f"{directory} holds a sharded comparison started with different lists or arguments")
+
+    def shards(prefix, size):
+        return [directory / f"{prefix}-{n:05d}.mrsh" for n in range((size + shard_size - 1) // shard_size)]
+
+    left_shards = shards("left", manifest["left"])
+    right_shards = shards("right", manifest["right"]) if right is not None else left_shards
+
+    # Part (a, b) holds the results of left shard a against right shard b
+    rows = []
+    for a in range(len(left_shards)):
+        first = a if right is None else 0
+        rows.append([(a, b, directory / "parts" / f"{a:05d}-{b:05d}.tsv")
+                     for b in range(first, len(right_shards))])
+
+    pending = [task for row in rows for task in row if not task[2].exists()]
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(pending))) as pool:
+            futures = [
+                pool.submit(_compare_shards, str(left_shards[a]),
+                            None if right is None and a == b else str(right_shards[b]), str(part),
+                            a * shard_size, b * shard_size, threshold, mode, workers, batch_size)
+                for a, b, part in pending
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    # Within a row of parts, results are ordered by position in both lists
+    def write(f):
+        writer = csv.writer(f, **_DIALECT)
+        for row in rows:
+            for _, _, score, name1, name2 in heapq.merge(*(_read_part(part) for _, _, part in row)):
+                writer.writerow((name1, name2, score))
+
+    output = Path(output) if output is not None else directory / RESULTS
+    _replace(output, write)
+    return output
+
+
+def iter_sharded_results(path: Union[str, os.PathLike]) -> Iterator[Comparison]:
+    """
+    Read the result file written by compare_sharded().
+
+    Args:
+        path: Result file path
+
+    Yields:
+        Comparison namedtuples, in the order they were written
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        for name1, name2, score in csv.reader(f, **_DIALECT):
+            yield Comparison(name1, name2, int(score))
@@ -0,0 +1,117 @@
+"""
+Instrumentation counters of the native hashing and comparison code.
+"""
+
+import os
+from typing import Dict, Union
+
+from . import _mrsh as _native
+
+
+# Native times in nanoseconds, reported in seconds under these names
+_TIMES = {"hash_ns": "hash_time", "compare_ns": "compare_time", "io_ns": "io_time"}
+
+# Peaks rather than totals, not subtracted by StatsCollector
+_PEAKS = ("max_filters",)
+
+Stats = Dict[str, Union[int, float]]
+
+
+def _report(raw: Dict[str, int]) -> Stats:
+    """Counters with the native times converted to seconds."""
+    return {_TIMES.get(name, name): value / 1e9 if name in _TIMES else value
+            for name, value in raw.items()}
+
+
+def stats() -> Stats:
+    """
+    Get the instrumentation counters.
+
+    The counters are process-wide and only advance while collection is
+    enabled (see enable_stats()). Times are summed over all threads, so with
+    several workers they can exceed the elapsed time.
+
+    Returns:
+        Dict of
+            bytes_hashed: Bytes of input hashed
+            inputs_hashed: Files and buffers hashed
+            chunks: Chunk hashes emitted by the rolling hash
+            filters: Bloom filters started while hashing
+            max_filters: Most filters of a single fingerprint hashed
+            comparisons: Fingerprint pairs compared
+            pairs_pruned: Pairs given up early as unable to reach the threshold
+            filter_comparisons: Filter pairs scored (an upper bound)
+            hash_time: Seconds spent hashing
+            compare_time: Seconds spent comparing
+            io_time: Seconds spent reading files and loading or saving lists
+    """
+    return _report(_native._stats())
+
+
+def enable_stats(enabled: bool = True) -> bool:
+    """
+    Turn collection of the instrumentation counters on or off.
+
+    Collection is off unless the MRSH_STATS environment variable is set to a
+    non-empty value other than 0. While it is off the counters cost a single
+    branch each.
+
+    Args:
+        enabled: Whether to collect
+
+    Returns:
+        Whether collection was enabled before the call
+    """
+    return _native._stats_enable(enabled)
+
+
+def reset_stats() -> None:
+    """Set every instrumentation counter to zero."""
+    _native._stats_reset()
+
+
+class StatsCollector:
+    """
+    Context manager collecting the counters of the code it runs.
+
+    Collection is enabled for the duration of the block and restored to its
+    previous state afterwards. The stats attribute holds what the block added
+    to every counter; max_filters is the peak since the last reset.
+    Counters are process-wide, so work done by other threads during the
+    block is included.
+
+    Example:
+        with StatsCollector() as collector:
+            fpl.compare_all(threshold=40)
+
+        print(collector.stats["pairs_pruned"], collector.stats["compare_time"])
+    """
+
+    def __init__(self):
+        self._previous = None
+        self._start = None
+        self._end = None
+
+    def __enter__(self) -> 'StatsCollector':
+        self._previous = _native._stats_enable(True)
+        self._start = _native._stats()
+        self._end = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._end = _native._stats()
+        _native._stats_enable(self._previous)
+
+    @property
+    def stats(self) -> Stats:
+        """Counters added since the block was entered, up to its end once it has exited."""
+        if self._start is None:
+            raise RuntimeError("StatsCollector has not been entered")
+
+        end = self._end if self._end is not None else _native._stats()
+        return _report({name: value if name in _PEAKS else value - self._start[name]
+                        for name, value in end.items()})
+
+
+if os.environ.get("MRSH_STATS", "0") not in ("", "0"):
+    enable_stats()
@@ -10,7 +10,10 @@ from .core import FingerprintList
 
 def scan_directory(directory: Union[str, Path],
                   extensions: List[str] = None,
-                  recursive: bool = True) -> FingerprintList:
+                  recursive: bool = True,
+                  workers: int = 1,
+                  queue_size: int = 0,
+                  cache=None) -> FingerprintList:
     """
     Scan a directory and create fingerprints for all files.
 
@@ -18,6 +21,9 @@ def scan_directory(directory: Union[str, Path],
         directory: Directory path to scan
         extensions: List of file extensions to include (e.g., ['.exe', '.dll'])
         recursive: Whether to scan subdirectories
+        workers: Number of hashing threads (0 uses all CPUs)
+        queue_size: Maximum number of files in flight (0 for 4 per worker)
+        cache: HashCache to use, None for the default cache, False for none
 
     Returns:
         FingerprintList containing all scanned files
@@ -25,19 +31,10 @@ def scan_directory(directory: Union[str, Path],
     directory = Path(directory)
     fpl = FingerprintList()
 
-    if not directory.exists():
+    if not directory.is_dir():
         raise FileNotFoundError(f"Directory not found: {directory}")
 
-    pattern = "**/*" if recursive else "*"
-
-    for file_path in directory.glob(pattern):
-        if file_path.is_file():
-            if extensions is None or file_path.suffix.lower() in extensions:
-                try:
-                    fpl.add((str(file_path), file_path.name))
-                except Exception as e:
-                    print(f"Warning: Could not process {file_path}: {e}")
-
+    fpl.ingest(directory, recursive, extensions, workers, queue_size, cache)
     return fpl
 
 
@@ -2,11 +2,27 @@
 Setup script for MRSHw package.
 """
 
-from setuptools import setup
+from setuptools import setup, Extension
 import pathlib
 
 here = pathlib.Path(__file__).parent.resolve()
 
+# The extension is built from the C sources of the repository root
+core_sources = [
+    "util.c", "hashing.c", "bloomfilter.c", "fingerprint.c", "fingerprintList.c",
+    "fingerprintStore.c", "fingerprintIndex.c", "hashCache.c", "helper.c", "stats.c",
+]
+
+extension = Extension(
+    "mrsh._mrsh",
+    sources=[f"../src/{name}" for name in core_sources] + ["glue/mrsh_glue.c", "glue/mrsh_module.c"],
+    include_dirs=["../header", "glue"],
+    define_macros=[("_BSD_SOURCE", None)],
+    extra_compile_args=["-std=c99", "-O3", "-pthread", "-w"],
+    extra_link_args=["-pthread"],
+    libraries=["m"],
+)
+
 setup(
     name="mrshw",
     version="0.1.3",
@@ -16,11 +32,8 @@ setup(
     long_description=(here / "README.md").read_text(encoding="utf-8"),
     long_description_content_type="text/markdown",
     packages=["mrsh"],
-    include_package_data=True,
     package_dir={"mrsh": "mrshw"},
-    package_data={
-        "mrsh": ["libmrsh.so"],
-    },
+    ext_modules=[extension],
     entry_points={
         'console_scripts': [
             'mrsh=mrsh.cli:main',
@@ -44,6 +57,9 @@ setup(
         "Bug Tracker": "https://github.com/w4term3loon/mrsh/issues",
     },
     python_requires=">=3.7",
+    extras_require={
+        "numpy": ["numpy"],
+    },
     keywords="binary, analysis, python, binding, malware, hashing, similarity, detection, security, digital, forensics",
     license_files=["LICENSE"]
 )
@@ -17,6 +17,9 @@ typedef struct {
     
     // We store the number of blocks we add to each filter in count_added_blocks
     short int amount_of_blocks;
+
+    // Number of bits set to one, kept up to date while hashing and on load
+    unsigned short bits_set;
     
     // Pointer to next Bloomfilter
     struct BLOOMFILTER *next;
@@ -33,7 +36,7 @@ unsigned short  count_bits_set_to_one_of_BF(unsigned char *filter);
 unsigned short  bloom_common_bits(unsigned char *bit_array_one, unsigned char *bit_array_two);
 
 void            add_hash_to_bloomfilter(BLOOMFILTER *bf, uint64 hash_value);
-void            convert_hex_binary(const unsigned char *hex_string, BLOOMFILTER *bf);
+int             convert_hex_binary(const unsigned char *hex_string, BLOOMFILTER *bf);
 
 
 #endif	/* BLOOM_H */
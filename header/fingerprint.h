@@ -27,7 +27,7 @@ typedef struct FINGERPRINT {
 
    // File name and size of the original file
    char          file_name[200];
-   unsigned int  filesize;
+   uint64        filesize;
         
 }FINGERPRINT;
 
@@ -38,7 +38,7 @@ FINGERPRINT         *init_empty_fingerprint();
 FINGERPRINT         *init_fingerprint_for_file(FILE *handle, char *filename);
 int                 fingerprint_destroy(FINGERPRINT *fp);
 
-int                 fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2);
+int                 fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2, bool file_comparison);
 int                 bloom_max_score(BLOOMFILTER *bf, FINGERPRINT *fingerprint);
 void                add_hash_to_fingerprint(FINGERPRINT *fp, uint64 hash_value);
 double              compute_e_min(int blocks_in_bf1, int blocks_in_bf2);
@@ -0,0 +1,66 @@
+/*
+ * File:   fingerprintIndex.h
+ * Author: w4term3loon
+ *
+ * Banded MinHash index over the Bloom filters of a fingerprint store, used to
+ * find comparison candidates without scanning the whole store.
+ */
+
+#ifndef FINGERPRINTINDEX_H
+#define	FINGERPRINTINDEX_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "config.h"
+#include "fingerprintStore.h"
+
+// Every filter is cut into bins of INDEX_BIN_BITS bits; the MinHash value of
+// a bin is the position of its lowest set bit
+#define INDEX_BIN_BITS          16
+#define INDEX_BINS              (BLOOMFILTERBITSIZE / INDEX_BIN_BITS)
+
+// Defaults: a filter pair is found with probability 1 - (1 - J^5)^25, where J
+// is the chance that a bin of both filters has the same lowest set bit. J is
+// high for filters of similar density, i.e. files of similar size; a small
+// fragment hashed into a sparse filter rarely agrees with the dense filter of
+// the file holding it, so the index is meant for whole-file lookups
+#define INDEX_DEFAULT_BANDS     25
+#define INDEX_DEFAULT_ROWS      5
+
+#define INDEX_END               UINT32_MAX
+
+typedef struct {
+    uint64_t    key;                // band key, 0 marks an empty slot
+    uint32_t    head;               // first posting of the key
+} INDEX_BUCKET;
+
+typedef struct {
+    uint32_t    item;               // index of the fingerprint in the store
+    uint32_t    next;               // next posting of the same key
+} INDEX_POSTING;
+
+typedef struct {
+    const FINGERPRINT_STORE *store;
+    size_t          indexed;        // entries 0..indexed-1 of the store are indexed
+    size_t          changes_seen;   // entries of the change log of the store indexed so far
+    int             bands;
+    int             rows;
+
+    INDEX_BUCKET    *buckets;       // open addressing, capacity is a power of two
+    size_t          bucket_count;
+    size_t          bucket_capacity;
+
+    INDEX_POSTING   *postings;
+    size_t          posting_count;
+    size_t          posting_capacity;
+} FINGERPRINT_INDEX;
+
+FINGERPRINT_INDEX   *init_fingerprintIndex(const FINGERPRINT_STORE *store, int bands, int rows);
+int                 fingerprintIndex_destroy(FINGERPRINT_INDEX *index);
+long                fingerprintIndex_update(FINGERPRINT_INDEX *index);
+long                fingerprintIndex_candidates(const FINGERPRINT_INDEX *index,
+                                                const FINGERPRINT_STORE *store, size_t i,
+                                                uint32_t **candidates, size_t *capacity);
+
+#endif	/* FINGERPRINTINDEX_H */
@@ -0,0 +1,158 @@
+/*
+ * File:   fingerprintStore.h
+ * Author: w4term3loon
+ *
+ * Packed, array-backed storage for many fingerprints.
+ */
+
+#ifndef FINGERPRINTSTORE_H
+#define	FINGERPRINTSTORE_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "config.h"
+#include "fingerprint.h"
+
+// Filter data is aligned to a cache line
+#define STORE_ALIGNMENT         64
+
+// Entry flags
+#define STORE_ENTRY_DELETED     0x0001  // removed, the slot is free for reuse
+
+// Bucket of the label table that is not in use
+#define STORE_LABEL_EMPTY       UINT32_MAX
+
+/*
+ * Per-fingerprint metadata. The filters of a fingerprint are stored back to
+ * back in the filter buffer; all but the last one hold MAXBLOCKS blocks. A
+ * removed entry keeps its slot, so the positions of the others do not
+ * change, but has no filters and never scores.
+ */
+typedef struct {
+    uint64_t    filter_offset;      // index of the first filter in the filter buffer
+    uint64_t    name_offset;        // offset of the NUL-terminated name in the name table
+    uint64_t    filesize;
+    uint32_t    filter_count;
+    uint16_t    last_blocks;        // blocks in the last filter
+    uint16_t    flags;              // STORE_ENTRY_* bits
+} STORE_ENTRY;
+
+/*
+ * Bucket of the label table, which maps every label to the first live entry
+ * carrying it. Buckets are probed linearly from the label hash.
+ */
+typedef struct {
+    uint32_t    hash;
+    uint32_t    index;              // first live entry with the label, STORE_LABEL_EMPTY if unused
+    uint32_t    count;              // live entries with the label
+} STORE_LABEL;
+
+typedef struct {
+    // filter_count * FILTERSIZE bytes, STORE_ALIGNMENT aligned
+    unsigned char   *filters;
+    // bits set to one per filter, cached when the filter is added
+    uint16_t        *bits;
+    size_t          filter_count;
+    size_t          filter_capacity;
+
+    STORE_ENTRY     *entries;
+    size_t          size;
+    size_t          capacity;
+
+    char            *names;
+    size_t          names_size;
+    size_t          names_capacity;
+
+    // set when the arrays above point into a read-only mapping of a store file
+    void            *map;
+    size_t          map_size;
+
+    // removed entries; their slots are reused by fingerprintStore_insert()
+    size_t          deleted;
+    size_t          *free_slots;
+    size_t          free_count;
+    size_t          free_capacity;
+
+    // filters and name bytes no entry refers to any more, reclaimed by
+    // fingerprintStore_compact()
+    size_t          dead_filters;
+    size_t          dead_names;
+
+    // label table, built by the first lookup; entries 0..labeled-1 are in it
+    STORE_LABEL     *labels;
+    size_t          label_count;
+    size_t          label_capacity;
+    size_t          labeled;
+
+    // removals and replacements so far
+    uint64_t        mutations;
+    // positions of the removed and replaced entries, kept while an index
+    // follows the store so it can index the new contents
+    size_t          *changes;
+    size_t          change_count;
+    size_t          change_capacity;
+    int             followers;
+} FINGERPRINT_STORE;
+
+/*
+ * On-disk layout written by fingerprintStore_save(), all values in host byte
+ * order: the header, the entry array, the name table, the per-filter bit
+ * counts and finally the raw filters, which start at a STORE_ALIGNMENT
+ * aligned offset so a mapped file can be compared without copying.
+ */
+#define STORE_FILE_MAGIC        "MRSHFPS"
+#define STORE_FILE_VERSION      1
+#define STORE_FILE_BYTE_ORDER   0x01020304u
+
+typedef struct {
+    char        magic[8];
+    uint32_t    version;
+    uint32_t    byte_order;
+    uint32_t    header_size;
+    uint32_t    filtersize;         // FILTERSIZE the file was written with
+    uint32_t    subhashes;
+    uint32_t    maxblocks;
+    uint64_t    size;               // number of entries
+    uint64_t    filter_count;
+    uint64_t    names_size;
+    uint64_t    entries_offset;
+    uint64_t    names_offset;
+    uint64_t    bits_offset;
+    uint64_t    filters_offset;
+    uint64_t    reserved[3];
+} STORE_FILE_HEADER;
+
+#define STORE_FILTER(store, index)  ((store)->filters + (size_t)(index) * FILTERSIZE)
+#define STORE_NAME(store, entry)    ((store)->names + (entry)->name_offset)
+#define STORE_DELETED(entry)        (((entry)->flags & STORE_ENTRY_DELETED) != 0)
+#define STORE_LIVE(store)           ((store)->size - (store)->deleted)
+
+FINGERPRINT_STORE   *init_empty_fingerprintStore();
+int                 fingerprintStore_destroy(FINGERPRINT_STORE *store);
+long                add_fingerprint_to_store(FINGERPRINT_STORE *store, FINGERPRINT *fp);
+long                fingerprintStore_append(FINGERPRINT_STORE *store, const char *name, size_t name_len,
+                                            uint64_t filesize, uint32_t filter_count, uint16_t last_blocks);
+void                fingerprintStore_truncate(FINGERPRINT_STORE *store, size_t size);
+long                fingerprintStore_copy(FINGERPRINT_STORE *dst, const FINGERPRINT_STORE *src, size_t i,
+                                          const char *name);
+int                 fingerprintStore_find(FINGERPRINT_STORE *store, const char *name, size_t *index);
+int                 fingerprintStore_remove(FINGERPRINT_STORE *store, size_t i);
+long                fingerprintStore_replace(FINGERPRINT_STORE *dst, size_t i, const FINGERPRINT_STORE *src,
+                                             size_t j, const char *name);
+long                fingerprintStore_insert(FINGERPRINT_STORE *dst, const FINGERPRINT_STORE *src, size_t j,
+                                            const char *name);
+int                 fingerprintStore_compact(FINGERPRINT_STORE *store);
+void                fingerprintStore_follow(FINGERPRINT_STORE *store, size_t *seen);
+void                fingerprintStore_unfollow(FINGERPRINT_STORE *store);
+int                 fingerprintStore_compare(const FINGERPRINT_STORE *store1, size_t i,
+                                             const FINGERPRINT_STORE *store2, size_t j, bool file_comparison);
+int                 fingerprintStore_compare_min(const FINGERPRINT_STORE *store1, size_t i,
+                                                 const FINGERPRINT_STORE *store2, size_t j, int min_score,
+                                                 bool file_comparison);
+int                 fingerprintStore_save(const FINGERPRINT_STORE *store, const char *path);
+FINGERPRINT_STORE   *fingerprintStore_load(const char *path, int use_mmap);
+int                 store_bloom_max_score(const unsigned char *bf, int bf_bits, int bf_blocks,
+                                          const FINGERPRINT_STORE *store, const STORE_ENTRY *fp);
+
+#endif	/* FINGERPRINTSTORE_H */
@@ -0,0 +1,63 @@
+/*
+ * File:   hashCache.h
+ * Author: w4term3loon
+ *
+ * Persistent cache of file fingerprints keyed by file identity, used to skip
+ * re-hashing files that did not change since they were last hashed.
+ */
+
+#ifndef HASHCACHE_H
+#define	HASHCACHE_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <sys/stat.h>
+
+#include "config.h"
+#include "fingerprintStore.h"
+
+// Length of a key encoded as entry name: four 64 bit values in hex
+#define CACHE_KEY_NAME_LENGTH   64
+
+/*
+ * A file is considered unchanged as long as it is the same inode on the same
+ * device with the same size and modification time.
+ */
+typedef struct {
+    uint64_t    dev;
+    uint64_t    ino;
+    uint64_t    size;
+    int64_t     mtime_ns;
+} CACHE_KEY;
+
+typedef struct {
+    CACHE_KEY   key;
+    uint64_t    used;               // last use on the cache clock, 0 marks an empty slot
+    uint32_t    entry;              // index of the fingerprint in the cache store
+} CACHE_SLOT;
+
+/*
+ * The cached fingerprints live in a fingerprint store whose entry names are
+ * the encoded keys. On disk the cache is a regular store file written in
+ * least recently used order, so the order doubles as the LRU state.
+ */
+typedef struct {
+    FINGERPRINT_STORE   *store;
+
+    CACHE_SLOT          *slots;     // open addressing, capacity is a power of two
+    size_t              slot_count;
+    size_t              slot_capacity;
+    uint64_t            clock;
+} HASH_CACHE;
+
+CACHE_KEY           cache_key_from_stat(const struct stat *st);
+HASH_CACHE          *init_hashCache();
+HASH_CACHE          *hashCache_load(const char *path);
+int                 hashCache_destroy(HASH_CACHE *cache);
+long                hashCache_lookup(HASH_CACHE *cache, const CACHE_KEY *key);
+long                hashCache_insert(HASH_CACHE *cache, const CACHE_KEY *key,
+                                     const FINGERPRINT_STORE *store, size_t i);
+int                 hashCache_save(const HASH_CACHE *cache, const char *path,
+                                   size_t max_entries, uint64_t max_bytes);
+
+#endif	/* HASHCACHE_H */
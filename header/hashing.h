@@ -14,8 +14,33 @@
 #include "config.h"
 #include "fingerprint.h"
 #include "bloomfilter.h"
+#include "stats.h"
 
 
+// Size of the read buffer used when hashing a file
+#define HASH_BUFFER_SIZE        (64 * 1024)
+
+/*
+ * State of a streaming hash: the rolling hash, the FNV hash of the current
+ * chunk and the bytes held back after a chunk boundary.
+ */
+typedef struct {
+    uchar       window[ROLLING_WINDOW];
+    uint32      rhData[4];
+    uint64      chunk_hash;
+    uchar       pending[SKIPPED_BYTES];
+    uint32      pending_count;
+    bool        skipping;           // the bytes after a boundary are held back in pending
+    bool        packet;             // network packet: first and trailing chunk left out
+    bool        first;              // no boundary seen yet (packet mode)
+    uint64      length;             // bytes hashed so far
+    uint64      chunks;             // chunk hashes emitted so far
+} HASH_STATE;
+
+void        hash_state_init(HASH_STATE *state);
+void        hash_state_init_packet(HASH_STATE *state, bool packet);
+void        hash_state_update(HASH_STATE *state, FINGERPRINT *fingerprint, const unsigned char *data, size_t length);
+void        hash_state_final(HASH_STATE *state, FINGERPRINT *fingerprint);
 
 int         hashFileToFingerprint(FINGERPRINT *fingerprint, FILE *handle);
 uint32      roll_hashx(unsigned char c, uchar window[], uint32 rhData[]);
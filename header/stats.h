@@ -0,0 +1,50 @@
+/*
+ * File:   stats.h
+ * Author: w4term3loon
+ *
+ * Process-wide instrumentation counters of the hashing and comparison code.
+ */
+
+#ifndef STATS_H
+#define	STATS_H
+
+#include <stdint.h>
+
+/*
+ * Counters are only updated while collection is enabled; a disabled counter
+ * costs a single well-predicted branch. Updates are atomic, so the counters
+ * stay exact when several threads hash or compare at once. Times are summed
+ * over all threads, in nanoseconds.
+ */
+typedef struct {
+    uint64_t    bytes_hashed;
+    uint64_t    inputs_hashed;      // files and buffers hashed
+    uint64_t    chunks;             // chunk hashes emitted, including duplicates a filter ignores
+    uint64_t    filters;            // Bloom filters started while hashing
+    uint64_t    max_filters;        // most filters of a single hashed input
+    uint64_t    comparisons;        // fingerprint pairs compared
+    uint64_t    pairs_pruned;       // pairs given up as unable to reach the threshold
+    uint64_t    filter_comparisons; // filter pairs scored by bloom_max_score, at most
+    uint64_t    hash_ns;
+    uint64_t    compare_ns;
+    uint64_t    io_ns;              // reading files and fingerprint stores, mapping files
+} MRSH_STATS;
+
+extern int          stats_enabled;
+extern MRSH_STATS   stats;
+
+#define STATS_ON                (__builtin_expect(stats_enabled, 0))
+#define STATS_ADD(field, n)     do { if (STATS_ON) __atomic_fetch_add(&stats.field, (uint64_t)(n), __ATOMIC_RELAXED); } while (0)
+#define STATS_MAX(field, n)     do { if (STATS_ON) stats_max(&stats.field, (uint64_t)(n)); } while (0)
+
+// STATS_START(t) ... STATS_STOP(t, field) adds the time in between to field
+#define STATS_START(t)          uint64_t t = STATS_ON ? stats_clock() : 0
+#define STATS_STOP(t, field)    do { if (STATS_ON && t) STATS_ADD(field, stats_clock() - t); } while (0)
+
+void        stats_enable(int enabled);
+void        stats_reset(void);
+void        stats_snapshot(MRSH_STATS *out);
+uint64_t    stats_clock(void);
+void        stats_max(uint64_t *counter, uint64_t value);
+
+#endif	/* STATS_H */
@@ -12,10 +12,13 @@
 
 
 
-unsigned int	find_file_size(FILE *fh);
+uint64	        find_file_size(FILE *fh);
 //void        	fnv64Bit_old(char *hashstring, uint64 *hashv);
 //void 		fnv64Bit(char hashstring[], uint64 *hashv, int start, int end);
-uint64	 		fnv64Bit( unsigned char pBuffer[], int start, int end);
+uint64	 		fnv64Bit( const unsigned char pBuffer[], size_t start, size_t end);
+
+void            hex_encode(const unsigned char *bytes, size_t count, char *hex);
+int             hex_decode(const char *hex, size_t count, unsigned char *bytes);
 
 
 #endif	/* UTIL_H */
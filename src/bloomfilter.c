@@ -26,6 +26,7 @@ BLOOMFILTER *init_empty_BF(){
 	 }
 	bf->next = NULL;
 	bf->amount_of_blocks = 0;
+	bf->bits_set = 0;
 	return bf;
 }
 
@@ -65,40 +66,121 @@ void add_hash_to_bloomfilter(BLOOMFILTER *bf, uint64 hash_value){
 	//in worst case it is an attack
 	if(one_counter != SUBHASHES)
 		bf->amount_of_blocks++;
+
+	//every subhash that did not hit a one set a new bit
+	bf->bits_set += SUBHASHES - one_counter;
 }
 
 
 /*
- * computes the hamming weight (bits set to one) within an integer.
- * one should pass a unsigned char *array
+ * Fused AND + popcount kernels: count the bits two filters have in common
+ * without writing the intersection to memory. The best kernel for the CPU
+ * is selected once at startup, see select_common_bits_kernel().
  */
-unsigned short count_bits_set_to_one_of_BF(unsigned char filter[]) {
-    unsigned short  counted_bits=0;
-    int a,v;
-    int *tmp = filter;
-
-    for(a=0;a<FILTERSIZE/4;a++){
-    	v = tmp[a];
-    	v = v - ((v >> 1) & 0x55555555);                //put count of each 2 bits into those 2 bits
-    	v = (v & 0x33333333) + ((v >> 2) & 0x33333333); //put count of each 4 bits into those 4 bits
-    	counted_bits += ((v + (v >> 4) & 0xF0F0F0F) * 0x1010101) >> 24;
-    }
-    return counted_bits;
+typedef unsigned short (*common_bits_kernel)(const unsigned char *, const unsigned char *);
+
+static inline uint64_t load64(const unsigned char *p) {
+    uint64_t v;
+    memcpy(&v, p, sizeof(v));
+    return v;
 }
 
+static inline unsigned int popcount64(uint64_t v) {
+#if defined(__GNUC__)
+    return __builtin_popcountll(v);
+#else
+    v = v - ((v >> 1) & 0x5555555555555555ULL);                          //count of each 2 bits
+    v = (v & 0x3333333333333333ULL) + ((v >> 2) & 0x3333333333333333ULL); //count of each 4 bits
+    v = (v + (v >> 4)) & 0x0F0F0F0F0F0F0F0FULL;                           //count of each byte
+    return (unsigned int)((v * 0x0101010101010101ULL) >> 56);
+#endif
+}
 
+static unsigned short common_bits_portable(const unsigned char *one, const unsigned char *two) {
+    unsigned int counted_bits = 0;
+    for (int a = 0; a < FILTERSIZE; a += 8)
+        counted_bits += popcount64(load64(one + a) & load64(two + a));
+    return (unsigned short)counted_bits;
+}
 
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#include <immintrin.h>
 
+__attribute__((target("popcnt")))
+static unsigned short common_bits_popcnt(const unsigned char *one, const unsigned char *two) {
+    unsigned int counted_bits = 0;
+    for (int a = 0; a < FILTERSIZE; a += 8)
+        counted_bits += __builtin_popcountll(load64(one + a) & load64(two + a));
+    return (unsigned short)counted_bits;
+}
 
+/*
+ * Nibble lookup (pshufb) popcount. Every byte lane gains at most 8 per
+ * iteration, so the 8 iterations of a 256 byte filter cannot overflow.
+ */
+__attribute__((target("avx2")))
+static unsigned short common_bits_avx2(const unsigned char *one, const unsigned char *two) {
+    const __m256i lookup = _mm256_setr_epi8(0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
+                                            0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4);
+    const __m256i low_mask = _mm256_set1_epi8(0x0f);
+    __m256i acc = _mm256_setzero_si256();
+
+    for (int a = 0; a < FILTERSIZE; a += 32) {
+        __m256i v = _mm256_and_si256(_mm256_loadu_si256((const __m256i *)(one + a)),
+                                     _mm256_loadu_si256((const __m256i *)(two + a)));
+        __m256i lo = _mm256_and_si256(v, low_mask);
+        __m256i hi = _mm256_and_si256(_mm256_srli_epi16(v, 4), low_mask);
+        acc = _mm256_add_epi8(acc, _mm256_add_epi8(_mm256_shuffle_epi8(lookup, lo),
+                                                   _mm256_shuffle_epi8(lookup, hi)));
+    }
 
+    __m256i sums = _mm256_sad_epu8(acc, _mm256_setzero_si256());
+    return (unsigned short)(_mm256_extract_epi64(sums, 0) + _mm256_extract_epi64(sums, 1) +
+                            _mm256_extract_epi64(sums, 2) + _mm256_extract_epi64(sums, 3));
+}
+
+__attribute__((target("avx512f,avx512vpopcntdq")))
+static unsigned short common_bits_avx512(const unsigned char *one, const unsigned char *two) {
+    __m512i acc = _mm512_setzero_si512();
+    for (int a = 0; a < FILTERSIZE; a += 64) {
+        __m512i v = _mm512_and_si512(_mm512_loadu_si512((const void *)(one + a)),
+                                     _mm512_loadu_si512((const void *)(two + a)));
+        acc = _mm512_add_epi64(acc, _mm512_popcnt_epi64(v));
+    }
+    return (unsigned short)_mm512_reduce_add_epi64(acc);
+}
+#endif
+
+static common_bits_kernel common_bits_impl = common_bits_portable;
+
+__attribute__((constructor))
+static void select_common_bits_kernel(void) {
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+    __builtin_cpu_init();
+    if (__builtin_cpu_supports("avx512vpopcntdq"))
+        common_bits_impl = common_bits_avx512;
+    else if (__builtin_cpu_supports("avx2"))
+        common_bits_impl = common_bits_avx2;
+    else if (__builtin_cpu_supports("popcnt"))
+        common_bits_impl = common_bits_popcnt;
+#endif
+}
+
+
+/*
+ * computes the hamming weight (bits set to one) within a filter.
+ * one should pass a unsigned char *array
+ */
+unsigned short count_bits_set_to_one_of_BF(unsigned char filter[]) {
+    return common_bits_impl(filter, filter);
+}
 
-unsigned short bloom_common_bits(unsigned char bit_array_one[], unsigned char bit_array_two[]) {
-    unsigned char buffer[FILTERSIZE]={0};
-    int a;
-    for(a=0;a<FILTERSIZE;a++)
-        buffer[a] = bit_array_one[a] & bit_array_two[a];
 
-    return count_bits_set_to_one_of_BF(buffer);
+/*
+ * computes the number of bits set in both filters
+ */
+unsigned short bloom_common_bits(unsigned char bit_array_one[], unsigned char bit_array_two[]) {
+    return common_bits_impl(bit_array_one, bit_array_two);
 }
 
 
@@ -109,16 +191,14 @@ unsigned short bloom_common_bits(unsigned char bit_array_one[], unsigned char bi
 
 /*
  * Convert a hex string to a binary sequence (used for reading in hash lists)
+ * Returns 0 on success and -1 if the string holds a character that is not a
+ * hex digit; such digits read as 0.
  */
-void convert_hex_binary(const unsigned char *hex_string, BLOOMFILTER *bf)
+int convert_hex_binary(const unsigned char *hex_string, BLOOMFILTER *bf)
 {
-    unsigned int i=0;
-
-	//WARNING: no sanitization or error-checking whatsoever
-	for(i = 0; i < FILTERSIZE; i++) {
-	  	  sscanf(hex_string, "%2hhx", &bf->array[i]);
-	  	  hex_string += 2 * sizeof(char);
-	}
+	int err = hex_decode((const char *)hex_string, FILTERSIZE, bf->array);
+	bf->bits_set = count_bits_set_to_one_of_BF(bf->array);
+	return err;
 }
 
 
@@ -4,9 +4,12 @@
  * Email: Frank.Breitinger@cased.de
  */
 #include <stdio.h>
+#include <math.h>
 #include "../header/config.h"
 #include "../header/fingerprint.h"
 #include "../header/helper.h"
+#include "../header/util.h"
+#include "../header/stats.h"
 
 
 
@@ -81,6 +84,8 @@ void add_hash_to_fingerprint(FINGERPRINT *fp, uint64 hash_value){
 		add_new_bloomfilter(fp, bf);
 		lastBF = bf;
 	}
+	if(lastBF->amount_of_blocks == 0)
+		STATS_ADD(filters, 1);
 
 	add_hash_to_bloomfilter(lastBF, hash_value);
 }
@@ -99,11 +104,13 @@ void add_new_bloomfilter(FINGERPRINT *fp, BLOOMFILTER *bf){
 }
 
 
-// Compares two fingerprints and returns a match-score between 0 and 100
-int fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2) {
+// Compares two fingerprints and returns a match-score between 0 and 100. The score is relative
+// to the smaller fingerprint, or to the larger one in case of file comparison.
+int fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2, bool file_comparison) {
 
     int final_score = 0;
     int i, amount_of_BF;
+    STATS_START(start);
 
     FINGERPRINT *larger_fingerprint = fingerprint1;
     FINGERPRINT *smaller_fingerprint = fingerprint2;
@@ -117,7 +124,7 @@ int fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2) {
 
 
     //In case of file-comparsion we need the bigger value
-    if(mode->file_comparison){
+    if(file_comparison){
     	amount_of_BF =larger_fingerprint->amount_of_BF+1;
     	if(larger_fingerprint->bf_list_last_element->amount_of_blocks < MINBLOCKS)
     		amount_of_BF--;
@@ -146,6 +153,11 @@ int fingerprint_compare(FINGERPRINT *fingerprint1, FINGERPRINT *fingerprint2) {
     }
 
 
+    //i filters of the smaller fingerprint were scored against every filter of the larger one
+    STATS_ADD(comparisons, 1);
+    STATS_ADD(filter_comparisons, (uint64_t)i * (larger_fingerprint->amount_of_BF + 1));
+    STATS_STOP(start, compare_ns);
+
     //generate the score
     if(amount_of_BF < 1)
     	return 0;
@@ -161,7 +173,7 @@ int bloom_max_score(BLOOMFILTER *bf, FINGERPRINT *fingerprint) {
     int tmp_score = 0;
     int score     = 0;
 
-    int bitsSetOfBF1 = count_bits_set_to_one_of_BF(bf->array);
+    int bitsSetOfBF1 = bf->bits_set;
 
 
     BLOOMFILTER *tmp_bf = fingerprint->bf_list;
@@ -181,7 +193,7 @@ int bloom_max_score(BLOOMFILTER *bf, FINGERPRINT *fingerprint) {
            	e_min = compute_e_min(tmp_bf->amount_of_blocks, bf->amount_of_blocks);
         }
 
-       	e_max = MIN(bitsSetOfBF1, count_bits_set_to_one_of_BF(tmp_bf->array));
+       	e_max = MIN(bitsSetOfBF1, tmp_bf->bits_set);
    	    C = 0.3*(e_max - e_min)+e_min;
 
 
@@ -190,9 +202,6 @@ int bloom_max_score(BLOOMFILTER *bf, FINGERPRINT *fingerprint) {
        	//compute bits in common
         unsigned int numofbitsInCommon = bloom_common_bits(tmp_bf->array, bf->array);
 
-      	 if(numofbitsInCommon > C)
-      		 printf("");
-
         //if they are high enough we have a threshold
         if(numofbitsInCommon < C) {
             tmp_score = 0;
@@ -213,13 +222,35 @@ int bloom_max_score(BLOOMFILTER *bf, FINGERPRINT *fingerprint) {
 }
 
 
+/*
+ * PROBABILITY^(SUBHASHES*b) for every b compute_e_min() can see with valid
+ * block counts (b1, b2 and b1+b2 with 0 <= b1, b2 <= MAXBLOCKS).
+ * The values are the ones pow() returns, so the results do not change.
+ */
+static double e_min_pow[2 * MAXBLOCKS + 1];
+
+__attribute__((constructor))
+static void init_e_min_table(void){
+	for(int b = 0; b <= 2 * MAXBLOCKS; b++)
+		e_min_pow[b] = pow(PROBABILITY, SUBHASHES*b);
+}
+
+
 double compute_e_min(int blocks_in_bf1, int blocks_in_bf2){
 	int b1 = blocks_in_bf1;
 	int b2 = blocks_in_bf2;
+	double tmp1, tmp2, tmp3;
 
-	double tmp1 = pow(PROBABILITY, SUBHASHES*b1);
-	double tmp2 = pow(PROBABILITY, SUBHASHES*b2);
-	double tmp3 = pow(PROBABILITY, SUBHASHES*(b1+b2));
+	if(b1 >= 0 && b2 >= 0 && b1 <= MAXBLOCKS && b2 <= MAXBLOCKS) {
+		tmp1 = e_min_pow[b1];
+		tmp2 = e_min_pow[b2];
+		tmp3 = e_min_pow[b1+b2];
+	} else {
+		//block counts from a malformed digest
+		tmp1 = pow(PROBABILITY, SUBHASHES*b1);
+		tmp2 = pow(PROBABILITY, SUBHASHES*b2);
+		tmp3 = pow(PROBABILITY, SUBHASHES*(b1+b2));
+	}
 
 	return BLOOMFILTERBITSIZE*(1 - tmp1 - tmp2 + tmp3);
 	//return BLOOMFILTERBITSIZE * (1-pow(bloom->probability,5*blocks)-pow(bloom->probability,5*blocks)+pow(tmp_bf->probability,5*(blocks+tmp_bf->count_added_blocks[i])))
@@ -228,17 +259,17 @@ double compute_e_min(int blocks_in_bf1, int blocks_in_bf2){
 
 
 void print_fingerprint(FINGERPRINT *fp){
-    int j;
+    char hex[FILTERSIZE * 2];
     BLOOMFILTER *bf = fp->bf_list;
 
     /* FORMAT: filename:filesize:number of filters:blocks in last filter*/
-    printf("%s:%d:%d:%d", fp->file_name, fp->filesize, fp->amount_of_BF+1, fp->bf_list_last_element->amount_of_blocks);
+    printf("%s:%llu:%d:%d", fp->file_name, fp->filesize, fp->amount_of_BF+1, fp->bf_list_last_element->amount_of_blocks);
     printf(":");
 
     while(bf != NULL) {
     	//Print each Bloom filter as a 2-digit-hex value
-    	for(j=0;j<FILTERSIZE;j++)
-        	printf("%02X", bf->array[j]);
+    	hex_encode(bf->array, FILTERSIZE, hex);
+    	fwrite(hex, 1, sizeof(hex), stdout);
 
        //move to next Bloom filter
        bf = bf->next;
@@ -0,0 +1,286 @@
+/**
+ * AUTHOR: w4term3loon
+ *
+ * Candidate index for fingerprint stores. Every Bloom filter is summarised by
+ * a one-permutation MinHash signature: the filter is cut into INDEX_BINS bins
+ * and each bin contributes the position of its lowest set bit. The signature
+ * is split into bands of rows values and each band is hashed to a key. Two
+ * filters that share many bits agree on many bins and therefore collide on at
+ * least one band with high probability, unrelated filters rarely do.
+ *
+ * Only filters with at least MINBLOCKS blocks are indexed, the others never
+ * contribute to a score (see fingerprintStore_compare()).
+ */
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "../header/config.h"
+#include "../header/fingerprintIndex.h"
+
+
+/**
+ * Initializes an empty index over store. Entries of the store are indexed
+ * with fingerprintIndex_update(). Returns NULL on invalid parameters or if
+ * the index cannot be allocated.
+ */
+FINGERPRINT_INDEX *init_fingerprintIndex(const FINGERPRINT_STORE *store, int bands, int rows) {
+    if (!store || bands < 1 || rows < 1 || bands * rows > INDEX_BINS)
+        return NULL;
+
+    FINGERPRINT_INDEX *index = (FINGERPRINT_INDEX *)calloc(1, sizeof(FINGERPRINT_INDEX));
+    if (!index)
+        return NULL;
+
+    index->store = store;
+    index->bands = bands;
+    index->rows = rows;
+    // the store logs its in-place changes for the index, nothing else is modified
+    fingerprintStore_follow((FINGERPRINT_STORE *)store, &index->changes_seen);
+    return index;
+}
+
+
+/*
+ * Destroys the index, the store it was built over is left untouched
+ */
+int fingerprintIndex_destroy(FINGERPRINT_INDEX *index) {
+    if (!index)
+        return 0;
+
+    fingerprintStore_unfollow((FINGERPRINT_STORE *)index->store);
+    free(index->buckets);
+    free(index->postings);
+    free(index);
+    return 0;
+}
+
+
+static inline uint64_t mix64(uint64_t h) {
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    h *= 0xc4ceb9fe1a85ec53ULL;
+    h ^= h >> 33;
+    return h;
+}
+
+
+/*
+ * Computes the band keys of a filter. Bands in which every bin is empty say
+ * nothing about similarity and are left out. Returns the number of keys.
+ */
+static int filter_band_keys(const FINGERPRINT_INDEX *index, const unsigned char *filter, uint64_t *keys) {
+    int count = 0;
+
+    for (int band = 0; band < index->bands; band++) {
+        uint64_t h = 0x9e3779b97f4a7c15ULL * (uint64_t)(band + 1);
+        int empty = 1;
+
+        for (int row = 0; row < index->rows; row++) {
+            uint16_t bin;
+            memcpy(&bin, filter + (size_t)(band * index->rows + row) * sizeof(bin), sizeof(bin));
+
+            unsigned int value = bin ? (unsigned int)__builtin_ctz(bin) : INDEX_BIN_BITS;
+            empty &= !bin;
+            h = (h ^ value) * 0x100000001b3ULL;
+        }
+
+        if (empty)
+            continue;
+
+        h = mix64(h);
+        keys[count++] = h ? h : 1;
+    }
+    return count;
+}
+
+
+static int index_grow_buckets(FINGERPRINT_INDEX *index) {
+    size_t capacity = index->bucket_capacity ? index->bucket_capacity * 2 : 1024;
+    INDEX_BUCKET *buckets = (INDEX_BUCKET *)calloc(capacity, sizeof(INDEX_BUCKET));
+    if (!buckets)
+        return -1;
+
+    for (size_t b = 0; b < index->bucket_capacity; b++) {
+        INDEX_BUCKET *old = &index->buckets[b];
+        if (!old->key)
+            continue;
+        size_t slot = old->key & (capacity - 1);
+        while (buckets[slot].key)
+            slot = (slot + 1) & (capacity - 1);
+        buckets[slot] = *old;
+    }
+
+    free(index->buckets);
+    index->buckets = buckets;
+    index->bucket_capacity = capacity;
+    return 0;
+}
+
+
+static const INDEX_BUCKET *index_find(const FINGERPRINT_INDEX *index, uint64_t key) {
+    if (!index->bucket_capacity)
+        return NULL;
+
+    size_t slot = key & (index->bucket_capacity - 1);
+    while (index->buckets[slot].key) {
+        if (index->buckets[slot].key == key)
+            return &index->buckets[slot];
+        slot = (slot + 1) & (index->bucket_capacity - 1);
+    }
+    return NULL;
+}
+
+
+static int index_insert(FINGERPRINT_INDEX *index, uint64_t key, uint32_t item) {
+    // keep the load factor below one half
+    if ((index->bucket_count + 1) * 2 > index->bucket_capacity && index_grow_buckets(index) != 0)
+        return -1;
+
+    size_t slot = key & (index->bucket_capacity - 1);
+    while (index->buckets[slot].key && index->buckets[slot].key != key)
+        slot = (slot + 1) & (index->bucket_capacity - 1);
+
+    INDEX_BUCKET *bucket = &index->buckets[slot];
+
+    // the postings of one fingerprint are added together, so a repeated key
+    // of the same fingerprint is always at the head of the list
+    if (bucket->key && index->postings[bucket->head].item == item)
+        return 0;
+
+    if (index->posting_count == index->posting_capacity) {
+        size_t capacity = index->posting_capacity ? index->posting_capacity * 2 : 4096;
+        if (capacity >= INDEX_END)
+            return -1;
+        INDEX_POSTING *postings = (INDEX_POSTING *)realloc(index->postings, capacity * sizeof(INDEX_POSTING));
+        if (!postings)
+            return -1;
+        index->postings = postings;
+        index->posting_capacity = capacity;
+    }
+
+    uint32_t posting = (uint32_t)index->posting_count++;
+    index->postings[posting].item = item;
+    if (bucket->key) {
+        index->postings[posting].next = bucket->head;
+    } else {
+        index->postings[posting].next = INDEX_END;
+        bucket->key = key;
+        index->bucket_count++;
+    }
+    bucket->head = posting;
+    return 0;
+}
+
+
+// Only the last filter of a fingerprint can hold less than MAXBLOCKS blocks
+static inline int entry_filter_blocks(const STORE_ENTRY *entry, uint32_t k) {
+    return k + 1 == entry->filter_count ? entry->last_blocks : MAXBLOCKS;
+}
+
+
+// Inserts the band keys of every filter of entry i
+static int index_entry(FINGERPRINT_INDEX *index, size_t i) {
+    const FINGERPRINT_STORE *store = index->store;
+    const STORE_ENTRY *entry = &store->entries[i];
+    uint64_t keys[INDEX_BINS];
+
+    for (uint32_t k = 0; k < entry->filter_count; k++) {
+        if (entry_filter_blocks(entry, k) < MINBLOCKS)
+            break;
+
+        int count = filter_band_keys(index, STORE_FILTER(store, entry->filter_offset + k), keys);
+        for (int key = 0; key < count; key++) {
+            if (index_insert(index, keys[key], (uint32_t)i) != 0)
+                return -1;
+        }
+    }
+    return 0;
+}
+
+
+/*
+ * Indexes the store entries added since the last call, and the new contents
+ * of indexed entries replaced in place. The postings of replaced and removed
+ * contents stay behind; they only add candidates, which are rescored against
+ * the current contents anyway.
+ * Returns the number of newly indexed entries or -1 on failure.
+ */
+long fingerprintIndex_update(FINGERPRINT_INDEX *index) {
+    const FINGERPRINT_STORE *store = index->store;
+    size_t first = index->indexed;
+
+    if (store->size >= INDEX_END)
+        return -1;
+
+    for (; index->changes_seen < store->change_count; index->changes_seen++) {
+        size_t i = store->changes[index->changes_seen];
+        if (i < index->indexed && i < store->size && index_entry(index, i) != 0)
+            return -1;
+    }
+
+    for (size_t i = first; i < store->size; i++) {
+        if (index_entry(index, i) != 0)
+            return -1;
+        index->indexed = i + 1;
+    }
+    return (long)(index->indexed - first);
+}
+
+
+static int compare_uint32(const void *a, const void *b) {
+    uint32_t x = *(const uint32_t *)a, y = *(const uint32_t *)b;
+    return (x > y) - (x < y);
+}
+
+
+/*
+ * Collects the indexed entries that share at least one band key with entry i
+ * of store (which may be a different store than the indexed one). The result
+ * is written sorted and without duplicates to *candidates, a buffer of
+ * *capacity items that is grown as needed and owned by the caller.
+ * Returns the number of candidates or -1 on failure.
+ */
+long fingerprintIndex_candidates(const FINGERPRINT_INDEX *index,
+                                 const FINGERPRINT_STORE *store, size_t i,
+                                 uint32_t **candidates, size_t *capacity) {
+    const STORE_ENTRY *entry = &store->entries[i];
+    uint64_t keys[INDEX_BINS];
+    size_t count = 0;
+
+    for (uint32_t k = 0; k < entry->filter_count; k++) {
+        if (entry_filter_blocks(entry, k) < MINBLOCKS)
+            break;
+
+        int nkeys = filter_band_keys(index, STORE_FILTER(store, entry->filter_offset + k), keys);
+        for (int key = 0; key < nkeys; key++) {
+            const INDEX_BUCKET *bucket = index_find(index, keys[key]);
+            if (!bucket)
+                continue;
+
+            for (uint32_t p = bucket->head; p != INDEX_END; p = index->postings[p].next) {
+                if (count == *capacity) {
+                    size_t grown = *capacity ? *capacity * 2 : 256;
+                    uint32_t *buffer = (uint32_t *)realloc(*candidates, grown * sizeof(uint32_t));
+                    if (!buffer)
+                        return -1;
+                    *candidates = buffer;
+                    *capacity = grown;
+                }
+                (*candidates)[count++] = index->postings[p].item;
+            }
+        }
+    }
+
+    if (count == 0)
+        return 0;
+
+    qsort(*candidates, count, sizeof(uint32_t), compare_uint32);
+    size_t unique = 1;
+    for (size_t c = 1; c < count; c++) {
+        if ((*candidates)[c] != (*candidates)[unique - 1])
+            (*candidates)[unique++] = (*candidates)[c];
+    }
+    return (long)unique;
+}
@@ -4,6 +4,7 @@
  * Email: Frank.Breitinger@cased.de
  */
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h> 			//is important for strtok!!
 
 #include <unistd.h>
@@ -89,7 +90,7 @@ void all_against_all_comparsion(FINGERPRINT_LIST *fpl){
    while(tmp1 != NULL){
 	   FINGERPRINT *tmp2 = tmp1->next;
 	   while(tmp2 != NULL){
-		    score=fingerprint_compare(tmp1, tmp2);
+		    score=fingerprint_compare(tmp1, tmp2, mode->file_comparison);
 	         if(score >= mode->threshold)
 	               printf("%s | %s | %.3i \n", tmp1->file_name, tmp2->file_name, score);
 	         tmp2=tmp2->next;
@@ -109,7 +110,7 @@ void fingerprint_list_comparsion(FINGERPRINT_LIST *fpl1, FINGERPRINT_LIST *fpl2)
    while(tmp1 != NULL){
 	   FINGERPRINT *tmp2 = fpl2->list;
 	   while(tmp2 != NULL){
-		    score=fingerprint_compare(tmp1, tmp2);
+		    score=fingerprint_compare(tmp1, tmp2, mode->file_comparison);
 	         if(score >= mode->threshold)
 	               printf("%s | %s | %.3i \n", tmp1->file_name, tmp2->file_name, score);
 	         tmp2=tmp2->next;
@@ -126,7 +127,7 @@ void fingerprint_against_list_comparison(FINGERPRINT_LIST *fpl, FINGERPRINT *fp)
    FINGERPRINT *tmp1 = fpl->list;
 
    while(tmp1 != NULL){
-	     score=fingerprint_compare(tmp1, fp);
+	     score=fingerprint_compare(tmp1, fp, mode->file_comparison);
 	         if(score >= mode->threshold)
 	               printf("%s | %s | %.3i \n", tmp1->file_name, fp->file_name, score);
 	   tmp1=tmp1->next;
@@ -188,7 +189,7 @@ unsigned int read_fingerprint_file(FINGERPRINT_LIST *fpl, FILE *handle){
 
                     case 1:
                         /*get the filesize*/
-                        fp->filesize = atoi(tokenize); break;
+                        fp->filesize = strtoull(tokenize, NULL, 10); break;
 
                     case 2:
                         /*get the count of the filters*/
@@ -215,11 +216,20 @@ unsigned int read_fingerprint_file(FINGERPRINT_LIST *fpl, FILE *handle){
 
            if(hex_string!=NULL){
 
-        	   //Reset bf_list when we read in a LIST
-        	   fp->bf_list = NULL;
-        	   fp->bf_list_last_element = NULL;
+        	   //the filter count is only trusted as far as the digest actually goes
+        	   int filters = (int)(strcspn((char *)hex_string, "\r\n") / (FILTERSIZE*2));
+        	   if(filters < amount_of_BF || amount_of_BF < 1)
+        		   fprintf(stderr, "[*] Digest of %s holds %d of %d Bloom filters\n", fp->file_name, filters, amount_of_BF);
+        	   if(amount_of_BF < filters)
+        		   filters = amount_of_BF;
 
-        	   for(int i=0; i<=amount_of_BF;i++){
+        	   //Reset bf_list when we read in a LIST, keeping the empty filter if there is nothing to read
+        	   if(filters > 0) {
+        		   fp->bf_list = NULL;
+        		   fp->bf_list_last_element = NULL;
+        	   }
+
+        	   for(int i=0; i<filters;i++){
         		   //create a Bloom filter and add it to the fingerprint
         		   BLOOMFILTER *bf = init_empty_BF();
         		   add_new_bloomfilter(fp, bf);
@@ -227,13 +237,15 @@ unsigned int read_fingerprint_file(FINGERPRINT_LIST *fpl, FILE *handle){
         		   //fill Bloom filter with the hex digest
         		   //example: void * memcpy ( void * destination, const void * source, size_t num );
         		   memcpy(hex, &hex_string[FILTERSIZE*2*i], FILTERSIZE*2);
-        		   convert_hex_binary(hex, bf);
+        		   if(convert_hex_binary(hex, bf) != 0)
+        			   fprintf(stderr, "[*] Invalid hex digit in Bloom filter %d of %s\n", i, fp->file_name);
 
         		   bf->amount_of_blocks = MAXBLOCKS;
        		    }
 
         	   //The last Bloom filter may not have MAXBLOCKS --> update it
-        	   fp->bf_list_last_element->amount_of_blocks = blocks_in_last_bf;
+        	   if(filters > 0)
+        		   fp->bf_list_last_element->amount_of_blocks = blocks_in_last_bf;
 
         	   free(hex_string);
         	   hex_string=NULL;
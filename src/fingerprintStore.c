@@ -0,0 +1,1214 @@
+/**
+ * AUTHOR: w4term3loon
+ *
+ * Array-backed fingerprint storage: one contiguous, cache-line aligned buffer
+ * of Bloom filters plus a metadata entry per fingerprint. Compared to the
+ * linked FINGERPRINT/BLOOMFILTER lists this gives O(1) access to fingerprint
+ * i and keeps the filters of a comparison next to each other in memory.
+ */
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#include "../header/config.h"
+#include "../header/fingerprintStore.h"
+#include "../header/stats.h"
+
+
+/**
+ * Initializes an empty store, returns NULL if it cannot be allocated
+ */
+FINGERPRINT_STORE *init_empty_fingerprintStore() {
+    return (FINGERPRINT_STORE *)calloc(1, sizeof(FINGERPRINT_STORE));
+}
+
+
+/*
+ * Destroys the store and sets all memory free
+ */
+int fingerprintStore_destroy(FINGERPRINT_STORE *store) {
+    if (!store)
+        return 0;
+
+    if (store->map) {
+        munmap(store->map, store->map_size);
+    } else {
+        free(store->filters);
+        free(store->bits);
+        free(store->entries);
+        free(store->names);
+    }
+    free(store->free_slots);
+    free(store->labels);
+    free(store->changes);
+    free(store);
+    return 0;
+}
+
+
+/*
+ * Replaces the arrays of a mapped store with private heap copies so the store
+ * can grow. Does nothing for stores that are not mapped.
+ */
+static int store_detach(FINGERPRINT_STORE *store) {
+    if (!store->map)
+        return 0;
+
+    size_t filter_capacity = store->filter_count ? store->filter_count : 1;
+    size_t capacity = store->size ? store->size : 1;
+    size_t names_capacity = store->names_size ? store->names_size : 1;
+
+    void *filters = NULL;
+    uint16_t *bits = (uint16_t *)malloc(filter_capacity * sizeof(uint16_t));
+    STORE_ENTRY *entries = (STORE_ENTRY *)malloc(capacity * sizeof(STORE_ENTRY));
+    char *names = (char *)malloc(names_capacity);
+    if (!bits || !entries || !names ||
+        posix_memalign(&filters, STORE_ALIGNMENT, filter_capacity * FILTERSIZE) != 0) {
+        free(bits);
+        free(entries);
+        free(names);
+        return -1;
+    }
+
+    memcpy(filters, store->filters, store->filter_count * FILTERSIZE);
+    memcpy(bits, store->bits, store->filter_count * sizeof(uint16_t));
+    memcpy(entries, store->entries, store->size * sizeof(STORE_ENTRY));
+    memcpy(names, store->names, store->names_size);
+    munmap(store->map, store->map_size);
+
+    store->filters = (unsigned char *)filters;
+    store->bits = bits;
+    store->entries = entries;
+    store->names = names;
+    store->filter_capacity = filter_capacity;
+    store->capacity = capacity;
+    store->names_capacity = names_capacity;
+    store->map = NULL;
+    store->map_size = 0;
+    return 0;
+}
+
+
+/*
+ * Makes room for 'extra' more filters. The buffer is replaced by a larger
+ * aligned one because realloc() does not preserve the alignment.
+ */
+static int store_reserve_filters(FINGERPRINT_STORE *store, size_t extra) {
+    if (store->filter_count + extra <= store->filter_capacity)
+        return 0;
+
+    size_t capacity = store->filter_capacity ? store->filter_capacity : 64;
+    while (capacity < store->filter_count + extra)
+        capacity *= 2;
+
+    uint16_t *bits = (uint16_t *)realloc(store->bits, capacity * sizeof(uint16_t));
+    if (!bits)
+        return -1;
+    store->bits = bits;
+
+    void *filters = NULL;
+    if (posix_memalign(&filters, STORE_ALIGNMENT, capacity * FILTERSIZE) != 0)
+        return -1;
+
+    if (store->filters)
+        memcpy(filters, store->filters, store->filter_count * FILTERSIZE);
+    free(store->filters);
+
+    store->filters = (unsigned char *)filters;
+    store->filter_capacity = capacity;
+    return 0;
+}
+
+
+static int store_reserve_names(FINGERPRINT_STORE *store, size_t name_len) {
+    if (store->names_size + name_len + 1 > store->names_capacity) {
+        size_t capacity = store->names_capacity ? store->names_capacity : 1024;
+        while (capacity < store->names_size + name_len + 1)
+            capacity *= 2;
+        char *names = (char *)realloc(store->names, capacity);
+        if (!names)
+            return -1;
+        store->names = names;
+        store->names_capacity = capacity;
+    }
+    return 0;
+}
+
+
+static int store_reserve_entry(FINGERPRINT_STORE *store, size_t name_len) {
+    if (store->size == store->capacity) {
+        size_t capacity = store->capacity ? store->capacity * 2 : 64;
+        STORE_ENTRY *entries = (STORE_ENTRY *)realloc(store->entries, capacity * sizeof(STORE_ENTRY));
+        if (!entries)
+            return -1;
+        store->entries = entries;
+        store->capacity = capacity;
+    }
+    return store_reserve_names(store, name_len);
+}
+
+
+/*
+ * Copies a fingerprint into the store. The fingerprint itself is not
+ * modified and still has to be destroyed by the caller.
+ * Returns the index of the new entry or -1 on allocation failure.
+ */
+long add_fingerprint_to_store(FINGERPRINT_STORE *store, FINGERPRINT *fp) {
+    size_t count = 0;
+    for (BLOOMFILTER *bf = fp->bf_list; bf != NULL; bf = (BLOOMFILTER *)bf->next)
+        count++;
+
+    size_t name_len = strlen(fp->file_name);
+    if (count == 0 || store_detach(store) != 0 || store_reserve_filters(store, count) != 0 ||
+        store_reserve_entry(store, name_len) != 0)
+        return -1;
+
+    STORE_ENTRY *entry = &store->entries[store->size];
+    entry->filter_offset = store->filter_count;
+    entry->name_offset = store->names_size;
+    entry->filesize = fp->filesize;
+    entry->filter_count = (uint32_t)count;
+    entry->last_blocks = (uint16_t)fp->bf_list_last_element->amount_of_blocks;
+    entry->flags = 0;
+
+    for (BLOOMFILTER *bf = fp->bf_list; bf != NULL; bf = (BLOOMFILTER *)bf->next) {
+        memcpy(STORE_FILTER(store, store->filter_count), bf->array, FILTERSIZE);
+        store->bits[store->filter_count++] = bf->bits_set;
+    }
+
+    memcpy(store->names + store->names_size, fp->file_name, name_len + 1);
+    store->names_size += name_len + 1;
+
+    return (long)store->size++;
+}
+
+
+/*
+ * Appends an entry whose filters are filled in by the caller: filter_count
+ * filters are reserved from STORE_FILTER(store, entry->filter_offset) on, and
+ * their bit counts in store->bits have to be set as well. The name does not
+ * need to be NUL-terminated. Returns the index of the new entry or -1 on
+ * allocation failure.
+ */
+long fingerprintStore_append(FINGERPRINT_STORE *store, const char *name, size_t name_len,
+                             uint64_t filesize, uint32_t filter_count, uint16_t last_blocks) {
+    if (filter_count == 0 || store_detach(store) != 0 || store_reserve_filters(store, filter_count) != 0 ||
+        store_reserve_entry(store, name_len) != 0)
+        return -1;
+
+    STORE_ENTRY *entry = &store->entries[store->size];
+    entry->filter_offset = store->filter_count;
+    entry->name_offset = store->names_size;
+    entry->filesize = filesize;
+    entry->filter_count = filter_count;
+    entry->last_blocks = last_blocks;
+    entry->flags = 0;
+    store->filter_count += filter_count;
+
+    memcpy(store->names + store->names_size, name, name_len);
+    store->names[store->names_size + name_len] = '\0';
+    store->names_size += name_len + 1;
+
+    return (long)store->size++;
+}
+
+
+// FNV-1a of a label, folded to 32 bits
+static uint32_t label_hash(const char *name) {
+    uint64_t hash = 0xcbf29ce484222325ULL;
+    for (const unsigned char *c = (const unsigned char *)name; *c; c++) {
+        hash ^= *c;
+        hash *= 0x100000001b3ULL;
+    }
+    return (uint32_t)(hash ^ (hash >> 32));
+}
+
+
+// Bucket holding a label, or the empty bucket where it would be inserted
+static STORE_LABEL *label_bucket(const FINGERPRINT_STORE *store, const char *name, uint32_t hash) {
+    size_t mask = store->label_capacity - 1;
+    for (size_t b = hash & mask;; b = (b + 1) & mask) {
+        STORE_LABEL *bucket = &store->labels[b];
+        if (bucket->index == STORE_LABEL_EMPTY ||
+            (bucket->hash == hash && strcmp(STORE_NAME(store, &store->entries[bucket->index]), name) == 0))
+            return bucket;
+    }
+}
+
+
+/*
+ * Makes room for one more label, keeping the table at most half full so
+ * probe sequences stay short. label_add() cannot fail afterwards.
+ */
+static int label_reserve(FINGERPRINT_STORE *store) {
+    if ((store->label_count + 1) * 2 <= store->label_capacity)
+        return 0;
+
+    size_t capacity = store->label_capacity ? store->label_capacity * 2 : 1024;
+    STORE_LABEL *labels = (STORE_LABEL *)malloc(capacity * sizeof(STORE_LABEL));
+    if (!labels)
+        return -1;
+    for (size_t b = 0; b < capacity; b++)
+        labels[b].index = STORE_LABEL_EMPTY;
+
+    for (size_t b = 0; b < store->label_capacity; b++) {
+        if (store->labels[b].index == STORE_LABEL_EMPTY)
+            continue;
+        size_t c = store->labels[b].hash & (capacity - 1);
+        while (labels[c].index != STORE_LABEL_EMPTY)
+            c = (c + 1) & (capacity - 1);
+        labels[c] = store->labels[b];
+    }
+
+    free(store->labels);
+    store->labels = labels;
+    store->label_capacity = capacity;
+    return 0;
+}
+
+
+// Adds live entry i to the label table, after label_reserve()
+static void label_add(FINGERPRINT_STORE *store, size_t i) {
+    const char *name = STORE_NAME(store, &store->entries[i]);
+    uint32_t hash = label_hash(name);
+    STORE_LABEL *bucket = label_bucket(store, name, hash);
+
+    if (bucket->index == STORE_LABEL_EMPTY) {
+        bucket->hash = hash;
+        bucket->index = (uint32_t)i;
+        bucket->count = 1;
+        store->label_count++;
+    } else {
+        bucket->count++;
+        if (i < bucket->index)
+            bucket->index = (uint32_t)i;
+    }
+}
+
+
+// Removes live entry i from the label table, before its name changes
+static void label_drop(FINGERPRINT_STORE *store, size_t i) {
+    const char *name = STORE_NAME(store, &store->entries[i]);
+    STORE_LABEL *bucket = label_bucket(store, name, label_hash(name));
+    if (bucket->index == STORE_LABEL_EMPTY)
+        return;
+
+    if (--bucket->count > 0) {
+        // the label moves on to the next entry carrying it
+        if (bucket->index == i) {
+            for (size_t k = i + 1; k < store->labeled; k++) {
+                const STORE_ENTRY *entry = &store->entries[k];
+                if (!STORE_DELETED(entry) && strcmp(STORE_NAME(store, entry), name) == 0) {
+                    bucket->index = (uint32_t)k;
+                    break;
+                }
+            }
+        }
+        return;
+    }
+
+    // backward shift deletion: move later buckets of the probe sequence up
+    size_t mask = store->label_capacity - 1;
+    size_t hole = (size_t)(bucket - store->labels);
+    for (size_t b = (hole + 1) & mask; store->labels[b].index != STORE_LABEL_EMPTY; b = (b + 1) & mask) {
+        size_t home = store->labels[b].hash & mask;
+        if (((b - home) & mask) >= ((b - hole) & mask)) {
+            store->labels[hole] = store->labels[b];
+            hole = b;
+        }
+    }
+    store->labels[hole].index = STORE_LABEL_EMPTY;
+    store->label_count--;
+}
+
+
+// Adds the entries appended since the last lookup to the label table
+static int label_sync(FINGERPRINT_STORE *store) {
+    if (store->size >= STORE_LABEL_EMPTY)
+        return -1;
+
+    for (; store->labeled < store->size; store->labeled++) {
+        if (STORE_DELETED(&store->entries[store->labeled]))
+            continue;
+        if (label_reserve(store) != 0)
+            return -1;
+        label_add(store, store->labeled);
+    }
+    return 0;
+}
+
+
+static int store_reserve_free(FINGERPRINT_STORE *store) {
+    if (store->free_count < store->free_capacity)
+        return 0;
+
+    size_t capacity = store->free_capacity ? store->free_capacity * 2 : 64;
+    size_t *slots = (size_t *)realloc(store->free_slots, capacity * sizeof(size_t));
+    if (!slots)
+        return -1;
+    store->free_slots = slots;
+    store->free_capacity = capacity;
+    return 0;
+}
+
+
+// Makes room to log one more change while the store is followed
+static int store_reserve_change(FINGERPRINT_STORE *store) {
+    if (!store->followers || store->change_count < store->change_capacity)
+        return 0;
+
+    size_t capacity = store->change_capacity ? store->change_capacity * 2 : 64;
+    size_t *changes = (size_t *)realloc(store->changes, capacity * sizeof(size_t));
+    if (!changes)
+        return -1;
+    store->changes = changes;
+    store->change_capacity = capacity;
+    return 0;
+}
+
+
+// Records that entry i was removed or replaced, after store_reserve_change()
+static void store_changed(FINGERPRINT_STORE *store, size_t i) {
+    store->mutations++;
+    if (store->followers)
+        store->changes[store->change_count++] = i;
+}
+
+
+/*
+ * Drops the entries from index 'size' on, undoing the latest additions.
+ */
+void fingerprintStore_truncate(FINGERPRINT_STORE *store, size_t size) {
+    if (size >= store->size)
+        return;
+
+    for (; store->labeled > size; store->labeled--) {
+        if (!STORE_DELETED(&store->entries[store->labeled - 1]))
+            label_drop(store, store->labeled - 1);
+    }
+
+    store->filter_count = store->entries[size].filter_offset;
+    store->names_size = store->entries[size].name_offset;
+    store->size = size;
+}
+
+
+/*
+ * Copies entry i of store src into store dst under a new name; the stores
+ * may not be the same. Returns the index of the new entry or -1 on
+ * allocation failure.
+ */
+long fingerprintStore_copy(FINGERPRINT_STORE *dst, const FINGERPRINT_STORE *src, size_t i, const char *name) {
+    const STORE_ENTRY *from = &src->entries[i];
+    size_t count = from->filter_count;
+
+    size_t name_len = strlen(name);
+    if (store_detach(dst) != 0 || store_reserve_filters(dst, count) != 0 ||
+        store_reserve_entry(dst, name_len) != 0 || (STORE_DELETED(from) && store_reserve_free(dst) != 0))
+        return -1;
+
+    // a removed entry stays a free slot in the copy
+    if (STORE_DELETED(from)) {
+        dst->free_slots[dst->free_count++] = dst->size;
+        dst->deleted++;
+    }
+
+    STORE_ENTRY *entry = &dst->entries[dst->size];
+    *entry = *from;
+    entry->filter_offset = dst->filter_count;
+    entry->name_offset = dst->names_size;
+
+    memcpy(STORE_FILTER(dst, dst->filter_count), STORE_FILTER(src, from->filter_offset), count * FILTERSIZE);
+    memcpy(dst->bits + dst->filter_count, src->bits + from->filter_offset, count * sizeof(uint16_t));
+    dst->filter_count += count;
+
+    memcpy(dst->names + dst->names_size, name, name_len + 1);
+    dst->names_size += name_len + 1;
+
+    return (long)dst->size++;
+}
+
+
+/*
+ * Looks up the first live entry labelled name. The label table is built by
+ * the first lookup and kept up to date by the functions of this file.
+ * Returns 1 and sets *index if found, 0 if not, -1 on allocation failure.
+ */
+int fingerprintStore_find(FINGERPRINT_STORE *store, const char *name, size_t *index) {
+    if (label_sync(store) != 0)
+        return -1;
+    if (store->label_count == 0)
+        return 0;
+
+    STORE_LABEL *bucket = label_bucket(store, name, label_hash(name));
+    if (bucket->index == STORE_LABEL_EMPTY)
+        return 0;
+    *index = bucket->index;
+    return 1;
+}
+
+
+/*
+ * Compacts the store once at least half of its filters or names are no
+ * longer referenced, so the work is amortized over the changes that left
+ * them behind. A failure only leaves the space unreclaimed.
+ */
+static void store_reclaim(FINGERPRINT_STORE *store) {
+    if ((store->dead_filters >= 1024 && store->dead_filters * 2 >= store->filter_count) ||
+        (store->dead_names >= 65536 && store->dead_names * 2 >= store->names_size))
+        fingerprintStore_compact(store);
+}
+
+
+/*
+ * Removes live entry i. Its slot is kept, so the positions of the other
+ * entries do not change, and is reused by the next fingerprintStore_insert().
+ * Returns 0 on success, -1 if i is not a live entry or on allocation failure.
+ */
+int fingerprintStore_remove(FINGERPRINT_STORE *store, size_t i) {
+    if (i >= store->size || STORE_DELETED(&store->entries[i]))
+        return -1;
+    if (store_detach(store) != 0 || store_reserve_free(store) != 0 || store_reserve_change(store) != 0)
+        return -1;
+
+    STORE_ENTRY *entry = &store->entries[i];
+    if (i < store->labeled)
+        label_drop(store, i);
+
+    store->dead_filters += entry->filter_count;
+    store->dead_names += strlen(STORE_NAME(store, entry)) + 1;
+    entry->filesize = 0;
+    entry->filter_count = 0;
+    entry->last_blocks = 0;
+    entry->flags |= STORE_ENTRY_DELETED;
+
+    store->free_slots[store->free_count++] = i;
+    store->deleted++;
+    store_changed(store, i);
+    store_reclaim(store);
+    return 0;
+}
+
+
+/*
+ * Overwrites slot i of dst with entry j of src; the stores may not be the
+ * same. The filters and the name are written in place when they fit and
+ * appended otherwise. With name NULL a live entry keeps its name. Everything
+ * that can fail is done before the entry is touched.
+ */
+static int store_put(FINGERPRINT_STORE *dst, size_t i, const FINGERPRINT_STORE *src, size_t j,
+                     const char *name) {
+    const STORE_ENTRY *from = &src->entries[j];
+    bool deleted = STORE_DELETED(&dst->entries[i]);
+    size_t count = from->filter_count;
+    size_t name_len = name ? strlen(name) : 0;
+    bool relabel = name && (deleted || strcmp(name, STORE_NAME(dst, &dst->entries[i])) != 0);
+
+    if (store_detach(dst) != 0 || store_reserve_change(dst) != 0 ||
+        (count > dst->entries[i].filter_count && store_reserve_filters(dst, count) != 0) ||
+        (relabel && store_reserve_names(dst, name_len) != 0) ||
+        (relabel && i < dst->labeled && label_reserve(dst) != 0))
+        return -1;
+
+    STORE_ENTRY *entry = &dst->entries[i];
+    if (relabel && i < dst->labeled && !deleted)
+        label_drop(dst, i);
+
+    if (count <= entry->filter_count) {
+        dst->dead_filters += entry->filter_count - count;
+    } else {
+        dst->dead_filters += entry->filter_count;
+        entry->filter_offset = dst->filter_count;
+        dst->filter_count += count;
+    }
+    memcpy(STORE_FILTER(dst, entry->filter_offset), STORE_FILTER(src, from->filter_offset), count * FILTERSIZE);
+    memcpy(dst->bits + entry->filter_offset, src->bits + from->filter_offset, count * sizeof(uint16_t));
+
+    if (relabel) {
+        char *old = STORE_NAME(dst, entry);
+        size_t old_len = strlen(old);
+        if (!deleted && name_len <= old_len) {
+            dst->dead_names += old_len - name_len;
+        } else {
+            dst->dead_names += deleted ? 0 : old_len + 1;
+            entry->name_offset = dst->names_size;
+            dst->names_size += name_len + 1;
+        }
+        memcpy(STORE_NAME(dst, entry), name, name_len + 1);
+    }
+
+    entry->filesize = from->filesize;
+    entry->filter_count = from->filter_count;
+    entry->last_blocks = from->last_blocks;
+    entry->flags &= ~STORE_ENTRY_DELETED;
+
+    if (relabel && i < dst->labeled)
+        label_add(dst, i);
+    store_changed(dst, i);
+    return 0;
+}
+
+
+/*
+ * Replaces live entry i of dst with a copy of entry j of src, under a new
+ * name or, with name NULL, under its current one. The stores may not be the
+ * same. Returns i on success, -1 if i is not a live entry or on allocation
+ * failure.
+ */
+long fingerprintStore_replace(FINGERPRINT_STORE *dst, size_t i, const FINGERPRINT_STORE *src, size_t j,
+                              const char *name) {
+    if (i >= dst->size || STORE_DELETED(&dst->entries[i]) || store_put(dst, i, src, j, name) != 0)
+        return -1;
+    store_reclaim(dst);
+    return (long)i;
+}
+
+
+/*
+ * Copies entry j of src into dst under name, into the most recently freed
+ * slot if there is one and appended otherwise. The stores may not be the
+ * same. Returns the index of the entry or -1 on allocation failure.
+ */
+long fingerprintStore_insert(FINGERPRINT_STORE *dst, const FINGERPRINT_STORE *src, size_t j, const char *name) {
+    if (dst->free_count == 0)
+        return fingerprintStore_copy(dst, src, j, name);
+
+    size_t i = dst->free_slots[dst->free_count - 1];
+    if (store_put(dst, i, src, j, name) != 0)
+        return -1;
+
+    dst->free_count--;
+    dst->deleted--;
+    return (long)i;
+}
+
+
+/*
+ * Copies the filters and names the entries refer to into new, tightly sized
+ * arrays, keeping every entry at its position. Removed entries keep an empty
+ * name. Only the arrays and the removal count of the result are set.
+ */
+static FINGERPRINT_STORE *store_compacted(const FINGERPRINT_STORE *store) {
+    FINGERPRINT_STORE *out = init_empty_fingerprintStore();
+    if (!out)
+        return NULL;
+
+    size_t filter_count = store->filter_count - store->dead_filters;
+    // removed entries take an empty name each
+    size_t names_size = store->names_size - store->dead_names + store->deleted;
+    out->capacity = store->size ? store->size : 1;
+    out->names_capacity = names_size ? names_size : 1;
+    out->entries = (STORE_ENTRY *)malloc(out->capacity * sizeof(STORE_ENTRY));
+    out->names = (char *)malloc(out->names_capacity);
+    if (!out->entries || !out->names || store_reserve_filters(out, filter_count ? filter_count : 1) != 0) {
+        fingerprintStore_destroy(out);
+        return NULL;
+    }
+
+    for (size_t i = 0; i < store->size; i++) {
+        const STORE_ENTRY *from = &store->entries[i];
+        const char *name = STORE_DELETED(from) ? "" : STORE_NAME(store, from);
+        size_t name_len = strlen(name);
+        if (out->filter_count + from->filter_count > out->filter_capacity ||
+            out->names_size + name_len + 1 > out->names_capacity) {
+            // the dead counts do not match the entries
+            fingerprintStore_destroy(out);
+            return NULL;
+        }
+
+        STORE_ENTRY *entry = &out->entries[i];
+        *entry = *from;
+        entry->filter_offset = out->filter_count;
+        entry->name_offset = out->names_size;
+
+        memcpy(STORE_FILTER(out, out->filter_count), STORE_FILTER(store, from->filter_offset),
+               from->filter_count * FILTERSIZE);
+        memcpy(out->bits + out->filter_count, store->bits + from->filter_offset,
+               from->filter_count * sizeof(uint16_t));
+        out->filter_count += from->filter_count;
+
+        memcpy(out->names + out->names_size, name, name_len + 1);
+        out->names_size += name_len + 1;
+    }
+
+    out->size = store->size;
+    out->deleted = store->deleted;
+    return out;
+}
+
+
+/*
+ * Releases the space of removed and replaced fingerprints. Positions, the
+ * label table and the free slots are kept. Returns 0 on success, -1 on
+ * allocation failure, in which case the store is unchanged.
+ */
+int fingerprintStore_compact(FINGERPRINT_STORE *store) {
+    if (store->dead_filters == 0 && store->dead_names == 0)
+        return 0;
+
+    FINGERPRINT_STORE *compacted = store_compacted(store);
+    if (!compacted || store_detach(store) != 0) {
+        fingerprintStore_destroy(compacted);
+        return -1;
+    }
+
+    free(store->filters);
+    free(store->bits);
+    free(store->entries);
+    free(store->names);
+    store->filters = compacted->filters;
+    store->bits = compacted->bits;
+    store->entries = compacted->entries;
+    store->names = compacted->names;
+    store->filter_count = compacted->filter_count;
+    store->filter_capacity = compacted->filter_capacity;
+    store->capacity = compacted->capacity;
+    store->names_size = compacted->names_size;
+    store->names_capacity = compacted->names_capacity;
+    store->dead_filters = 0;
+    store->dead_names = 0;
+
+    free(compacted);
+    return 0;
+}
+
+
+/*
+ * Starts logging the positions of removed and replaced entries for a
+ * follower such as an index; *seen receives the current end of the log.
+ * The log is dropped when the last follower stops.
+ */
+void fingerprintStore_follow(FINGERPRINT_STORE *store, size_t *seen) {
+    store->followers++;
+    *seen = store->change_count;
+}
+
+
+void fingerprintStore_unfollow(FINGERPRINT_STORE *store) {
+    if (--store->followers > 0)
+        return;
+
+    free(store->changes);
+    store->changes = NULL;
+    store->change_count = 0;
+    store->change_capacity = 0;
+}
+
+
+// Only the last filter of a fingerprint can hold less than MAXBLOCKS blocks
+static inline int entry_blocks(const STORE_ENTRY *entry, uint32_t k) {
+    return k + 1 == entry->filter_count ? entry->last_blocks : MAXBLOCKS;
+}
+
+
+/*
+ * Compares fingerprint i of store1 with fingerprint j of store2 and returns a
+ * match-score between 0 and 100. Mirrors fingerprint_compare().
+ */
+int fingerprintStore_compare(const FINGERPRINT_STORE *store1, size_t i,
+                             const FINGERPRINT_STORE *store2, size_t j, bool file_comparison) {
+    return fingerprintStore_compare_min(store1, i, store2, j, 0, file_comparison);
+}
+
+
+/*
+ * Body of fingerprintStore_compare_min(). If filter_pairs is not NULL, the
+ * number of filter pairs scored is added to it.
+ */
+static int store_compare_min(const FINGERPRINT_STORE *store1, size_t i,
+                             const FINGERPRINT_STORE *store2, size_t j, int min_score,
+                             bool file_comparison, uint64_t *filter_pairs) {
+    int final_score = 0;
+    int amount_of_BF;
+    int usable;
+
+    // removed entries never score
+    if (STORE_DELETED(&store1->entries[i]) || STORE_DELETED(&store2->entries[j]))
+        return -1;
+
+    const FINGERPRINT_STORE *larger_store = store1, *smaller_store = store2;
+    const STORE_ENTRY *larger = &store1->entries[i];
+    const STORE_ENTRY *smaller = &store2->entries[j];
+
+    //Smaller fingerprint needs to be identified to generate the correct match score
+    if (larger->filter_count < smaller->filter_count) {
+        larger_store = store2;
+        smaller_store = store1;
+        larger = &store2->entries[j];
+        smaller = &store1->entries[i];
+    }
+
+    //In case of file-comparsion we need the bigger value
+    if (file_comparison) {
+        amount_of_BF = larger->filter_count;
+        if (larger->last_blocks < MINBLOCKS)
+            amount_of_BF--;
+    } else {
+        amount_of_BF = smaller->filter_count;
+        if (smaller->last_blocks < MINBLOCKS)
+            amount_of_BF--;
+    }
+
+    if (amount_of_BF < 1)
+        return min_score > 0 ? -1 : 0;
+
+    //only filters with at least MINBLOCKS blocks are scored
+    usable = smaller->filter_count;
+    if (smaller->last_blocks < MINBLOCKS)
+        usable--;
+    if (100 * usable / amount_of_BF < min_score)
+        return -1;
+
+    //run through all bloom filters of the smaller fingerprint and compare them
+    //to all filters of the larger one
+    for (int k = 0; k < usable; k++) {
+        uint64_t filter = smaller->filter_offset + k;
+        final_score += store_bloom_max_score(STORE_FILTER(smaller_store, filter), smaller_store->bits[filter],
+                                             entry_blocks(smaller, k), larger_store, larger);
+        if (filter_pairs)
+            *filter_pairs += larger->filter_count;
+
+        if ((final_score + 100 * (usable - k - 1)) / amount_of_BF < min_score)
+            return -1;
+    }
+
+    return final_score / amount_of_BF;
+}
+
+
+/*
+ * Like fingerprintStore_compare(), but gives up as soon as the score cannot
+ * reach min_score. Every filter contributes at most 100 points, so after each
+ * filter of the smaller fingerprint the score is bounded by what was summed so
+ * far plus 100 for every filter left. Returns the exact score if it is at
+ * least min_score, -1 otherwise.
+ */
+int fingerprintStore_compare_min(const FINGERPRINT_STORE *store1, size_t i,
+                                 const FINGERPRINT_STORE *store2, size_t j, int min_score,
+                                 bool file_comparison) {
+    if (!STATS_ON)
+        return store_compare_min(store1, i, store2, j, min_score, file_comparison, NULL);
+
+    uint64_t filter_pairs = 0;
+    STATS_START(start);
+    int score = store_compare_min(store1, i, store2, j, min_score, file_comparison, &filter_pairs);
+    STATS_STOP(start, compare_ns);
+
+    STATS_ADD(comparisons, 1);
+    STATS_ADD(filter_comparisons, filter_pairs);
+    if (score < 0)
+        STATS_ADD(pairs_pruned, 1);
+    return score;
+}
+
+
+/*
+ * Returns the best score of filter bf (with bf_bits bits set) against all
+ * filters of fingerprint fp. Mirrors bloom_max_score().
+ */
+int store_bloom_max_score(const unsigned char *bf, int bf_bits, int bf_blocks,
+                          const FINGERPRINT_STORE *store, const STORE_ENTRY *fp) {
+    int C, e_min, e_max;
+    int tmp_score = 0;
+    int score     = 0;
+
+    int bitsSetOfBF1 = bf_bits;
+
+    e_min = compute_e_min(bf_blocks, entry_blocks(fp, 0));
+
+    for (uint32_t i = 0; i < fp->filter_count; i++) {
+        const unsigned char *tmp_bf = STORE_FILTER(store, fp->filter_offset + i);
+        int blocks = entry_blocks(fp, i);
+
+        //Filters with less than MINBLOCKS elements are critical
+        if (blocks < MINBLOCKS)
+            return score;
+
+        //for the last Bloom filter we have to update the values
+        if (i + 1 == fp->filter_count)
+            e_min = compute_e_min(blocks, bf_blocks);
+
+        e_max = MIN(bitsSetOfBF1, store->bits[fp->filter_offset + i]);
+        C = 0.3 * (e_max - e_min) + e_min;
+
+        //the filters cannot share more bits than the sparser one has set,
+        //so below the threshold there is no need to count them
+        if (e_max < C) {
+            tmp_score = 0;
+            continue;
+        }
+
+        //compute bits in common
+        unsigned int numofbitsInCommon = bloom_common_bits((unsigned char *)tmp_bf, (unsigned char *)bf);
+
+        //if they are high enough we have a threshold
+        if (numofbitsInCommon < C) {
+            tmp_score = 0;
+        } else {
+            if ((e_max - C) >= 1)
+                tmp_score = 100 * (numofbitsInCommon - C) / (e_max - C);
+        }
+
+        if (score < tmp_score) {
+            score = tmp_score;
+            if (score == 100)
+                break;
+        }
+    }
+    return score;
+}
+
+
+static inline uint64_t align_up(uint64_t value, uint64_t alignment) {
+    return (value + alignment - 1) / alignment * alignment;
+}
+
+
+// Fills in the section layout of a store file for the given store
+static void store_file_layout(const FINGERPRINT_STORE *store, STORE_FILE_HEADER *header) {
+    memset(header, 0, sizeof(*header));
+    memcpy(header->magic, STORE_FILE_MAGIC, sizeof(STORE_FILE_MAGIC));
+    header->version = STORE_FILE_VERSION;
+    header->byte_order = STORE_FILE_BYTE_ORDER;
+    header->header_size = sizeof(STORE_FILE_HEADER);
+    header->filtersize = FILTERSIZE;
+    header->subhashes = SUBHASHES;
+    header->maxblocks = MAXBLOCKS;
+    header->size = store->size;
+    header->filter_count = store->filter_count;
+    header->names_size = store->names_size;
+
+    header->entries_offset = sizeof(STORE_FILE_HEADER);
+    header->names_offset = header->entries_offset + store->size * sizeof(STORE_ENTRY);
+    header->bits_offset = header->names_offset + store->names_size;
+    header->filters_offset = align_up(header->bits_offset + store->filter_count * sizeof(uint16_t),
+                                      STORE_ALIGNMENT);
+}
+
+
+static int write_section(FILE *file, uint64_t offset, const void *data, size_t bytes) {
+    static const char zeros[STORE_ALIGNMENT];
+    long position = ftell(file);
+    if (position < 0 || (uint64_t)position > offset)
+        return -1;
+    while ((uint64_t)position < offset) {
+        size_t pad = MIN(offset - position, sizeof(zeros));
+        if (fwrite(zeros, 1, pad, file) != pad)
+            return -1;
+        position += pad;
+    }
+    return bytes == 0 || fwrite(data, 1, bytes, file) == bytes ? 0 : -1;
+}
+
+
+static int store_write(const FINGERPRINT_STORE *store, int fd) {
+    STORE_FILE_HEADER header;
+    store_file_layout(store, &header);
+
+    FILE *file = fdopen(fd, "wb");
+    if (!file) {
+        int saved_errno = errno;
+        close(fd);
+        errno = saved_errno;
+        return -1;
+    }
+
+    int err = 0;
+    if (fwrite(&header, sizeof(header), 1, file) != 1 ||
+        write_section(file, header.entries_offset, store->entries, store->size * sizeof(STORE_ENTRY)) ||
+        write_section(file, header.names_offset, store->names, store->names_size) ||
+        write_section(file, header.bits_offset, store->bits, store->filter_count * sizeof(uint16_t)) ||
+        write_section(file, header.filters_offset, store->filters, store->filter_count * FILTERSIZE) ||
+        // on disk before it is renamed, so a crash never leaves a short file under the final name
+        fflush(file) != 0 || fsync(fd) != 0)
+        err = -1;
+
+    int saved_errno = errno;
+    if (fclose(file) != 0)
+        err = -1;
+    else
+        errno = saved_errno;
+    return err;
+}
+
+
+/*
+ * Creates a temporary file next to path with a name no other saver uses,
+ * path.<pid>.<n>.tmp, and stores that name in tmp_path.
+ * Returns the open descriptor, or -1 on failure (errno is set).
+ */
+static int store_temp_file(const char *path, char **tmp_path) {
+    static unsigned long counter = 0;
+    size_t length = strlen(path) + 48;
+
+    *tmp_path = (char *)malloc(length);
+    if (!*tmp_path) {
+        errno = ENOMEM;
+        return -1;
+    }
+
+    for (;;) {
+        unsigned long n = __atomic_fetch_add(&counter, 1, __ATOMIC_RELAXED);
+        snprintf(*tmp_path, length, "%s.%ld.%lu.tmp", path, (long)getpid(), n);
+        int fd = open(*tmp_path, O_WRONLY | O_CREAT | O_EXCL | O_CLOEXEC, 0666);
+        if (fd >= 0 || errno != EEXIST) {
+            if (fd < 0) {
+                int saved_errno = errno;
+                free(*tmp_path);
+                *tmp_path = NULL;
+                errno = saved_errno;
+            }
+            return fd;
+        }
+    }
+}
+
+
+/*
+ * Writes the store to path in the binary store format. The file is written
+ * to a temporary file next to path, synced and renamed over path, so a
+ * process that has the old file mapped keeps reading it, even if it is the
+ * store being saved, and concurrent saves to the same path do not mix.
+ * Returns 0 on success, -1 on failure (errno is set).
+ */
+int fingerprintStore_save(const FINGERPRINT_STORE *store, const char *path) {
+    // the space of removed and replaced fingerprints is not written
+    if (store->dead_filters || store->dead_names) {
+        FINGERPRINT_STORE *compacted = store_compacted(store);
+        if (!compacted) {
+            errno = ENOMEM;
+            return -1;
+        }
+        int err = fingerprintStore_save(compacted, path);
+        int saved_errno = errno;
+        fingerprintStore_destroy(compacted);
+        errno = saved_errno;
+        return err;
+    }
+
+    STATS_START(start);
+    char *tmp_path;
+    int fd = store_temp_file(path, &tmp_path);
+    if (fd < 0) {
+        STATS_STOP(start, io_ns);
+        return -1;
+    }
+
+    int err = store_write(store, fd);
+    if (err == 0 && rename(tmp_path, path) != 0)
+        err = -1;
+    if (err != 0) {
+        int saved_errno = errno;
+        remove(tmp_path);
+        errno = saved_errno;
+    }
+    STATS_STOP(start, io_ns);
+
+    free(tmp_path);
+    return err;
+}
+
+
+/*
+ * Checks a header and every entry against the size of the file so a damaged
+ * file is rejected here instead of crashing a later comparison.
+ */
+static int store_file_valid(const STORE_FILE_HEADER *header, uint64_t file_size) {
+    if (memcmp(header->magic, STORE_FILE_MAGIC, sizeof(STORE_FILE_MAGIC)) != 0 ||
+        header->version != STORE_FILE_VERSION || header->byte_order != STORE_FILE_BYTE_ORDER ||
+        header->header_size != sizeof(STORE_FILE_HEADER))
+        return 0;
+
+    // filters written with different parameters cannot be compared with ours
+    if (header->filtersize != FILTERSIZE || header->subhashes != SUBHASHES ||
+        header->maxblocks != MAXBLOCKS)
+        return 0;
+
+    if (header->size > file_size / sizeof(STORE_ENTRY) ||
+        header->filter_count > file_size / FILTERSIZE || header->names_size > file_size)
+        return 0;
+
+    STORE_FILE_HEADER expected;
+    FINGERPRINT_STORE shape = {0};
+    shape.size = header->size;
+    shape.filter_count = header->filter_count;
+    shape.names_size = header->names_size;
+    store_file_layout(&shape, &expected);
+
+    return header->entries_offset == expected.entries_offset &&
+           header->names_offset == expected.names_offset &&
+           header->bits_offset == expected.bits_offset &&
+           header->filters_offset == expected.filters_offset &&
+           expected.filters_offset + header->filter_count * FILTERSIZE <= file_size;
+}
+
+
+static int store_entries_valid(const FINGERPRINT_STORE *store) {
+    if (store->names_size > 0 && store->names[store->names_size - 1] != '\0')
+        return 0;
+
+    for (size_t i = 0; i < store->size; i++) {
+        const STORE_ENTRY *entry = &store->entries[i];
+        if ((entry->flags & ~STORE_ENTRY_DELETED) != 0 ||
+            (entry->filter_count == 0) != STORE_DELETED(entry) || entry->filter_offset > store->filter_count ||
+            entry->filter_count > store->filter_count - entry->filter_offset ||
+            entry->name_offset >= store->names_size || entry->last_blocks > MAXBLOCKS)
+            return 0;
+    }
+    return 1;
+}
+
+
+static int read_section(FILE *file, uint64_t offset, void *data, size_t bytes) {
+    if (bytes == 0)
+        return 0;
+    if (fseeko(file, (off_t)offset, SEEK_SET) != 0 || fread(data, 1, bytes, file) != bytes)
+        return -1;
+    return 0;
+}
+
+
+/*
+ * Collects the removed entries of a loaded store into its free slots and
+ * counts the filters no entry refers to. Returns 0 on success, -1 on
+ * allocation failure.
+ */
+static int store_scan_deleted(FINGERPRINT_STORE *store) {
+    size_t used = 0;
+    for (size_t i = 0; i < store->size; i++) {
+        const STORE_ENTRY *entry = &store->entries[i];
+        used += entry->filter_count;
+        if (!STORE_DELETED(entry))
+            continue;
+        if (store_reserve_free(store) != 0)
+            return -1;
+        store->free_slots[store->free_count++] = i;
+        store->deleted++;
+    }
+    store->dead_filters = store->filter_count - used;
+    return 0;
+}
+
+
+// Loads a store file into heap memory
+static FINGERPRINT_STORE *store_read(int fd, const STORE_FILE_HEADER *header) {
+    FINGERPRINT_STORE *store = init_empty_fingerprintStore();
+    FILE *file = fdopen(fd, "rb");
+    if (!store || !file) {
+        free(store);
+        if (file)
+            fclose(file);
+        else
+            close(fd);
+        return NULL;
+    }
+
+    int err = store_reserve_filters(store, header->filter_count ? header->filter_count : 1);
+    if (!err) {
+        store->capacity = header->size ? header->size : 1;
+        store->names_capacity = header->names_size ? header->names_size : 1;
+        store->entries = (STORE_ENTRY *)malloc(store->capacity * sizeof(STORE_ENTRY));
+        store->names = (char *)malloc(store->names_capacity);
+        err = !store->entries || !store->names;
+    }
+
+    if (!err)
+        err = read_section(file, header->entries_offset, store->entries, header->size * sizeof(STORE_ENTRY)) ||
+              read_section(file, header->names_offset, store->names, header->names_size) ||
+              read_section(file, header->bits_offset, store->bits, header->filter_count * sizeof(uint16_t)) ||
+              read_section(file, header->filters_offset, store->filters, header->filter_count * FILTERSIZE);
+    fclose(file);
+
+    store->size = header->size;
+    store->filter_count = header->filter_count;
+    store->names_size = header->names_size;
+    if (err || !store_entries_valid(store)) {
+        fingerprintStore_destroy(store);
+        errno = err ? EIO : EINVAL;
+        return NULL;
+    }
+    if (store_scan_deleted(store) != 0) {
+        fingerprintStore_destroy(store);
+        errno = ENOMEM;
+        return NULL;
+    }
+    return store;
+}
+
+
+// Maps a store file read-only; the arrays of the store point into the mapping
+static FINGERPRINT_STORE *store_map(int fd, const STORE_FILE_HEADER *header, uint64_t file_size) {
+    void *map = mmap(NULL, (size_t)file_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (map == MAP_FAILED)
+        return NULL;
+
+    FINGERPRINT_STORE *store = init_empty_fingerprintStore();
+    if (!store) {
+        munmap(map, (size_t)file_size);
+        return NULL;
+    }
+
+    unsigned char *base = (unsigned char *)map;
+    store->map = map;
+    store->map_size = (size_t)file_size;
+    store->entries = (STORE_ENTRY *)(base + header->entries_offset);
+    store->names = (char *)(base + header->names_offset);
+    store->bits = (uint16_t *)(base + header->bits_offset);
+    store->filters = base + header->filters_offset;
+    store->size = store->capacity = header->size;
+    store->filter_count = store->filter_capacity = header->filter_count;
+    store->names_size = store->names_capacity = header->names_size;
+
+    if (!store_entries_valid(store)) {
+        fingerprintStore_destroy(store);
+        errno = EINVAL;
+        return NULL;
+    }
+    if (store_scan_deleted(store) != 0) {
+        fingerprintStore_destroy(store);
+        errno = ENOMEM;
+        return NULL;
+    }
+    return store;
+}
+
+
+// Body of fingerprintStore_load()
+static FINGERPRINT_STORE *store_load(const char *path, int use_mmap) {
+    int fd = open(path, O_RDONLY);
+    if (fd < 0)
+        return NULL;
+
+    struct stat st;
+    STORE_FILE_HEADER header;
+    if (fstat(fd, &st) != 0 || pread(fd, &header, sizeof(header), 0) != (ssize_t)sizeof(header) ||
+        !store_file_valid(&header, (uint64_t)st.st_size)) {
+        close(fd);
+        errno = EINVAL;
+        return NULL;
+    }
+
+    if (use_mmap && header.size > 0)
+        return store_map(fd, &header, (uint64_t)st.st_size);
+    return store_read(fd, &header);
+}
+
+
+/*
+ * Loads a store written by fingerprintStore_save(). With use_mmap the file is
+ * mapped and compared in place, so processes loading the same file share its
+ * pages; the store is copied to the heap the first time it is modified.
+ * Returns NULL on failure (errno is set).
+ */
+FINGERPRINT_STORE *fingerprintStore_load(const char *path, int use_mmap) {
+    STATS_START(start);
+    FINGERPRINT_STORE *store = store_load(path, use_mmap);
+    STATS_STOP(start, io_ns);
+    return store;
+}
@@ -0,0 +1,307 @@
+/**
+ * AUTHOR: w4term3loon
+ *
+ * Persistent fingerprint cache. Files are identified by device, inode, size
+ * and modification time; any change to a file changes its key, so a stale
+ * fingerprint is never found again and is eventually evicted.
+ *
+ * The cache file is an ordinary store file (see fingerprintStore_save())
+ * whose entry names are the hex encoded keys, least recently used first.
+ * Eviction happens when the cache is saved: only the most recently used
+ * entries that fit the entry and byte limits are written.
+ */
+#include <errno.h>
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "../header/config.h"
+#include "../header/hashCache.h"
+
+
+CACHE_KEY cache_key_from_stat(const struct stat *st) {
+    CACHE_KEY key;
+    key.dev = (uint64_t)st->st_dev;
+    key.ino = (uint64_t)st->st_ino;
+    key.size = (uint64_t)st->st_size;
+    key.mtime_ns = (int64_t)st->st_mtim.tv_sec * 1000000000 + st->st_mtim.tv_nsec;
+    return key;
+}
+
+
+static void encode_key(const CACHE_KEY *key, char *name) {
+    snprintf(name, CACHE_KEY_NAME_LENGTH + 1, "%016" PRIx64 "%016" PRIx64 "%016" PRIx64 "%016" PRIx64,
+             key->dev, key->ino, key->size, (uint64_t)key->mtime_ns);
+}
+
+
+static int decode_key(const char *name, CACHE_KEY *key) {
+    uint64_t values[4];
+
+    if (strlen(name) != CACHE_KEY_NAME_LENGTH)
+        return -1;
+
+    for (int v = 0; v < 4; v++) {
+        values[v] = 0;
+        for (int c = 0; c < 16; c++) {
+            char ch = name[v * 16 + c];
+            int digit;
+            if (ch >= '0' && ch <= '9')
+                digit = ch - '0';
+            else if (ch >= 'a' && ch <= 'f')
+                digit = ch - 'a' + 10;
+            else
+                return -1;
+            values[v] = values[v] << 4 | (uint64_t)digit;
+        }
+    }
+
+    key->dev = values[0];
+    key->ino = values[1];
+    key->size = values[2];
+    key->mtime_ns = (int64_t)values[3];
+    return 0;
+}
+
+
+static inline uint64_t key_hash(const CACHE_KEY *key) {
+    uint64_t h = key->ino * 0x9e3779b97f4a7c15ULL;
+    h ^= key->dev + 0x7f4a7c159e3779b9ULL + (h << 6) + (h >> 2);
+    h ^= key->size * 0xff51afd7ed558ccdULL;
+    h ^= (uint64_t)key->mtime_ns * 0xc4ceb9fe1a85ec53ULL;
+    return h ^ (h >> 29);
+}
+
+
+static inline int key_equal(const CACHE_KEY *a, const CACHE_KEY *b) {
+    return a->dev == b->dev && a->ino == b->ino && a->size == b->size && a->mtime_ns == b->mtime_ns;
+}
+
+
+static CACHE_SLOT *cache_find(const HASH_CACHE *cache, const CACHE_KEY *key) {
+    if (!cache->slot_capacity)
+        return NULL;
+
+    size_t slot = key_hash(key) & (cache->slot_capacity - 1);
+    while (cache->slots[slot].used) {
+        if (key_equal(&cache->slots[slot].key, key))
+            return &cache->slots[slot];
+        slot = (slot + 1) & (cache->slot_capacity - 1);
+    }
+    return NULL;
+}
+
+
+static int cache_grow(HASH_CACHE *cache) {
+    size_t capacity = cache->slot_capacity ? cache->slot_capacity * 2 : 1024;
+    CACHE_SLOT *slots = (CACHE_SLOT *)calloc(capacity, sizeof(CACHE_SLOT));
+    if (!slots)
+        return -1;
+
+    for (size_t s = 0; s < cache->slot_capacity; s++) {
+        CACHE_SLOT *old = &cache->slots[s];
+        if (!old->used)
+            continue;
+        size_t slot = key_hash(&old->key) & (capacity - 1);
+        while (slots[slot].used)
+            slot = (slot + 1) & (capacity - 1);
+        slots[slot] = *old;
+    }
+
+    free(cache->slots);
+    cache->slots = slots;
+    cache->slot_capacity = capacity;
+    return 0;
+}
+
+
+/*
+ * Points key at entry of the cache store, adding a slot if needed, and marks
+ * it as the most recently used one.
+ */
+static int cache_set(HASH_CACHE *cache, const CACHE_KEY *key, uint32_t entry) {
+    CACHE_SLOT *found = cache_find(cache, key);
+    if (!found) {
+        // keep the load factor below one half
+        if ((cache->slot_count + 1) * 2 > cache->slot_capacity && cache_grow(cache) != 0)
+            return -1;
+
+        size_t slot = key_hash(key) & (cache->slot_capacity - 1);
+        while (cache->slots[slot].used)
+            slot = (slot + 1) & (cache->slot_capacity - 1);
+        found = &cache->slots[slot];
+        found->key = *key;
+        cache->slot_count++;
+    }
+
+    found->entry = entry;
+    found->used = ++cache->clock;
+    return 0;
+}
+
+
+/*
+ * Initializes an empty cache
+ */
+HASH_CACHE *init_hashCache() {
+    HASH_CACHE *cache = (HASH_CACHE *)calloc(1, sizeof(HASH_CACHE));
+    if (!cache)
+        return NULL;
+
+    cache->store = init_empty_fingerprintStore();
+    if (!cache->store) {
+        free(cache);
+        return NULL;
+    }
+    return cache;
+}
+
+
+/*
+ * Loads a cache written by hashCache_save(). A missing or unreadable cache
+ * file is not an error, the cache simply starts out empty. Returns NULL only
+ * if memory cannot be allocated.
+ */
+HASH_CACHE *hashCache_load(const char *path) {
+    HASH_CACHE *cache = (HASH_CACHE *)calloc(1, sizeof(HASH_CACHE));
+    if (!cache)
+        return NULL;
+
+    // mapped, so only the fingerprints that are hit are ever read
+    cache->store = fingerprintStore_load(path, 1);
+    if (!cache->store)
+        cache->store = init_empty_fingerprintStore();
+    if (!cache->store) {
+        free(cache);
+        return NULL;
+    }
+
+    for (size_t i = 0; i < cache->store->size; i++) {
+        CACHE_KEY key;
+        if (decode_key(STORE_NAME(cache->store, &cache->store->entries[i]), &key) != 0)
+            continue;
+        if (cache_set(cache, &key, (uint32_t)i) != 0) {
+            hashCache_destroy(cache);
+            return NULL;
+        }
+    }
+    return cache;
+}
+
+
+/*
+ * Destroys the cache and sets all memory free
+ */
+int hashCache_destroy(HASH_CACHE *cache) {
+    if (!cache)
+        return 0;
+
+    fingerprintStore_destroy(cache->store);
+    free(cache->slots);
+    free(cache);
+    return 0;
+}
+
+
+/*
+ * Looks up the fingerprint of a file and marks it as recently used.
+ * Returns the index of the fingerprint in cache->store or -1 on a miss.
+ */
+long hashCache_lookup(HASH_CACHE *cache, const CACHE_KEY *key) {
+    CACHE_SLOT *slot = cache_find(cache, key);
+    if (!slot)
+        return -1;
+
+    slot->used = ++cache->clock;
+    return (long)slot->entry;
+}
+
+
+/*
+ * Caches entry i of store as the fingerprint of the file with the given key.
+ * Returns the index in cache->store or -1 on allocation failure.
+ */
+long hashCache_insert(HASH_CACHE *cache, const CACHE_KEY *key,
+                      const FINGERPRINT_STORE *store, size_t i) {
+    char name[CACHE_KEY_NAME_LENGTH + 1];
+
+    CACHE_SLOT *slot = cache_find(cache, key);
+    if (slot) {
+        slot->used = ++cache->clock;
+        return (long)slot->entry;
+    }
+
+    if (cache->store->size >= UINT32_MAX)
+        return -1;
+
+    encode_key(key, name);
+    long entry = fingerprintStore_copy(cache->store, store, i, name);
+    if (entry < 0 || cache_set(cache, key, (uint32_t)entry) != 0)
+        return -1;
+    return entry;
+}
+
+
+static int compare_slot_used(const void *a, const void *b) {
+    uint64_t x = (*(const CACHE_SLOT **)a)->used, y = (*(const CACHE_SLOT **)b)->used;
+    return (x > y) - (x < y);
+}
+
+
+/*
+ * Writes the most recently used entries to path, least recently used first.
+ * Entries are kept, newest first, while they fit max_entries and the file
+ * stays below max_bytes; 0 disables a limit. The file is replaced
+ * atomically. Returns 0 on success, -1 on failure (errno is set).
+ */
+int hashCache_save(const HASH_CACHE *cache, const char *path,
+                   size_t max_entries, uint64_t max_bytes) {
+    const FINGERPRINT_STORE *store = cache->store;
+    CACHE_SLOT **order = (CACHE_SLOT **)malloc((cache->slot_count ? cache->slot_count : 1) * sizeof(CACHE_SLOT *));
+    FINGERPRINT_STORE *kept = init_empty_fingerprintStore();
+    if (!order || !kept) {
+        free(order);
+        fingerprintStore_destroy(kept);
+        errno = ENOMEM;
+        return -1;
+    }
+
+    size_t count = 0;
+    for (size_t s = 0; s < cache->slot_capacity; s++) {
+        if (cache->slots[s].used)
+            order[count++] = &cache->slots[s];
+    }
+    qsort(order, count, sizeof(CACHE_SLOT *), compare_slot_used);
+
+    // walk from the newest entry back while the limits allow
+    uint64_t bytes = sizeof(STORE_FILE_HEADER) + STORE_ALIGNMENT;
+    size_t first = count;
+    while (first > 0) {
+        const STORE_ENTRY *entry = &store->entries[order[first - 1]->entry];
+        uint64_t entry_bytes = sizeof(STORE_ENTRY) + CACHE_KEY_NAME_LENGTH + 1 +
+                               (uint64_t)entry->filter_count * (FILTERSIZE + sizeof(uint16_t));
+        if ((max_entries && count - first + 1 > max_entries) ||
+            (max_bytes && bytes + entry_bytes > max_bytes))
+            break;
+        bytes += entry_bytes;
+        first--;
+    }
+
+    int result = 0;
+    for (size_t o = first; o < count && result == 0; o++) {
+        size_t i = order[o]->entry;
+        if (fingerprintStore_copy(kept, store, i, STORE_NAME(store, &store->entries[i])) < 0) {
+            errno = ENOMEM;
+            result = -1;
+        }
+    }
+
+    // fingerprintStore_save() replaces the file atomically
+    if (result == 0)
+        result = fingerprintStore_save(kept, path);
+
+    free(order);
+    fingerprintStore_destroy(kept);
+    return result;
+}
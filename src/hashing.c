@@ -2,6 +2,8 @@
 #include "../header/config.h"
 #include "../header/util.h"
 #include <stdio.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 #include <openssl/md5.h>
 
 
@@ -43,111 +45,245 @@ uint32 djb2x(unsigned char c, uchar window[], unsigned int n)
 }
 
 
-int hashFileToFingerprint(FINGERPRINT *fingerprint, FILE *handle)
+#define FNV64_INIT      0xcbf29ce484222325ULL
+#define FNV64_PRIME     0x00000100000001b3ULL
+
+/*
+ * r % BLOCK_SIZE == BLOCK_SIZE-1 implies that the low bits of r covered by the
+ * power of two dividing BLOCK_SIZE equal those of BLOCK_SIZE-1. Testing them
+ * first rejects most positions with a mask instead of a division.
+ */
+#define BOUNDARY_MASK   ((BLOCK_SIZE & -BLOCK_SIZE) - 1)
+#define BOUNDARY_BITS   ((BLOCK_SIZE - 1) & BOUNDARY_MASK)
+#define IS_BOUNDARY(r)  (((r) & BOUNDARY_MASK) == BOUNDARY_BITS && (r) % BLOCK_SIZE == BLOCK_SIZE-1)
+
+
+/*
+ * Streaming hashing engine. The chunk hash is FNV-64 over the bytes of the
+ * chunk, the same as fnv64Bit(), but computed while the bytes pass by so no
+ * chunk has to stay in memory. After a chunk boundary the next SKIPPED_BYTES
+ * bytes are not rolled, unless the input ends before them. Until that is known
+ * they wait in state->pending, so feeding the input in any number of pieces
+ * gives exactly the blocks of hashing it in one go.
+ *
+ * state->rhData is the state of roll_hashx(), except that rhData[0] is kept
+ * as the window position modulo ROLLING_WINDOW, which roll_hashx() accepts
+ * just the same.
+ *
+ * In packet mode the chunk before the first boundary and the one after the
+ * last boundary are left out, as a packet cuts them off at arbitrary bytes.
+ * Builds with -Dnetwork hash in packet mode unless told otherwise.
+ */
+void hash_state_init_packet(HASH_STATE *state, bool packet)
 {
-    unsigned long  bytes_read;   //stores the number of characters read from input file
-    unsigned int   i;
-    unsigned char  *byte_buffer     = NULL;
-    unsigned int last_block_index = 0;
-    uint64 rValue, hashvalue=0;
-
-
-    /*we need this arrays for our extended rollhash function*/
-    uchar window[ROLLING_WINDOW] = {0};
-    uint32 rhData[4]             = {0};
+    memset(state, 0, sizeof(HASH_STATE));
+    state->chunk_hash = FNV64_INIT;
+    state->packet = packet;
+    state->first = 1;
+}
 
+void hash_state_init(HASH_STATE *state)
+{
+    #ifdef network
+    hash_state_init_packet(state, 1);
+    #else
+    hash_state_init_packet(state, 0);
+    #endif
+}
 
-    if((byte_buffer = (unsigned char*)malloc(sizeof(unsigned char)*fingerprint->filesize))==NULL)
-        return -1;
+static void hash_state_boundary(HASH_STATE *state, FINGERPRINT *fingerprint)
+{
+    if (state->packet && state->first){
+        state->first = 0;
+        state->chunk_hash = FNV64_INIT;
+        return;
+    }
 
-    // bytes_read stores the number of characters we read from our file
-    fseek(handle,0L, SEEK_SET);	
-    if((bytes_read = fread(byte_buffer,sizeof(unsigned char),fingerprint->filesize,handle))==0)
-        return -1;
+    add_hash_to_fingerprint(fingerprint, state->chunk_hash);
+    state->chunk_hash = FNV64_INIT;
+    state->chunks++;
+}
 
-    short first = 1;
+void hash_state_update(HASH_STATE *state, FINGERPRINT *fingerprint, const unsigned char *data, size_t length)
+{
+    size_t i = 0;
+    state->length += length;
+    STATS_START(start);
 
-    for(i=0; i<bytes_read; i++)
+    while (i < length)
     {
-        /*  
-         * rValue = djb2x(byte_buffer[i],window,i);  
-         */ 
-        rValue  = roll_hashx(byte_buffer[i], window, rhData);  
+        if (state->skipping)
+        {
+            size_t take = MIN(SKIPPED_BYTES - state->pending_count, length - i);
+            memcpy(state->pending + state->pending_count, data + i, take);
+            state->pending_count += take;
+            i += take;
+
+            // enough input followed the boundary, so the bytes are skipped by
+            // the rolling hash but still belong to the next chunk
+            if (state->pending_count == SKIPPED_BYTES)
+            {
+                for (unsigned int p = 0; p < SKIPPED_BYTES; p++)
+                    state->chunk_hash = (state->chunk_hash ^ state->pending[p]) * FNV64_PRIME;
+                state->pending_count = 0;
+                state->skipping = 0;
+            }
+            continue;
+        }
 
-        if (rValue % BLOCK_SIZE == BLOCK_SIZE-1) // || chunk_index >= BLOCK_SIZE_MAX)
+        // roll_hashx() and the chunk hash up to the next boundary, with the
+        // state held in locals and a ring index instead of a modulo per byte
+        uchar  window[ROLLING_WINDOW];
+        uint32 pos = state->rhData[0] % ROLLING_WINDOW;
+        uint32 h1 = state->rhData[1], h2 = state->rhData[2], h3 = state->rhData[3];
+        uint64 chunk_hash = state->chunk_hash;
+        int    boundary = 0;
+
+        memcpy(window, state->window, ROLLING_WINDOW);
+        while (i < length)
         {
+            unsigned char c = data[i++];
+
+            h2 -= h1;
+            h2 += ROLLING_WINDOW * c;
+            h1 += c;
+            h1 -= window[pos];
+            window[pos] = c;
+            if (++pos == ROLLING_WINDOW)
+                pos = 0;
+            h3 = (h3 << 5) ^ c;
+            chunk_hash = (chunk_hash ^ c) * FNV64_PRIME;
+
+            uint32 rValue = h1 + h2 + h3;
+            if (IS_BOUNDARY(rValue))
+            {
+                boundary = 1;
+                break;
+            }
+        }
 
-        	#ifdef network
-        	if (first == 1){
-        		first=0;
-        		last_block_index = i+1;
-        		if(i+SKIPPED_BYTES < bytes_read)
-        		       i += SKIPPED_BYTES;
-        		continue;
-        	}
-			#endif
+        memcpy(state->window, window, ROLLING_WINDOW);
+        state->rhData[0] = pos;
+        state->rhData[1] = h1;
+        state->rhData[2] = h2;
+        state->rhData[3] = h3;
+        state->chunk_hash = chunk_hash;
 
-        	hashvalue = fnv64Bit(byte_buffer, last_block_index, i); //,current_index, FNV1_64_INIT);
-        	add_hash_to_fingerprint(fingerprint, hashvalue); //printf("%i %llu \n", i, hashvalue);
+        if (boundary)
+        {
+            hash_state_boundary(state, fingerprint);
+            state->skipping = 1;
+        }
+    }
 
-            last_block_index = i+1;
+    STATS_ADD(bytes_hashed, length);
+    STATS_STOP(start, hash_ns);
+}
+
+void hash_state_final(HASH_STATE *state, FINGERPRINT *fingerprint)
+{
+    // the input ended within SKIPPED_BYTES of the last boundary, those bytes
+    // are hashed normally and nothing is skipped anymore
+    if (state->skipping)
+    {
+        state->skipping = 0;
+        for (unsigned int p = 0; p < state->pending_count; p++)
+        {
+            unsigned char c = state->pending[p];
+            uint32 rValue = roll_hashx(c, state->window, state->rhData);
+            state->chunk_hash = (state->chunk_hash ^ c) * FNV64_PRIME;
 
-            if(i+SKIPPED_BYTES < bytes_read)
-            	i += SKIPPED_BYTES;
+            if (IS_BOUNDARY(rValue))
+                hash_state_boundary(state, fingerprint);
         }
+        state->pending_count = 0;
     }
 
-    #ifndef network
-    	hashvalue = fnv64Bit(byte_buffer, last_block_index, bytes_read-1);
-    	add_hash_to_fingerprint(fingerprint, hashvalue);
-	#endif
+    if (!state->packet)
+    {
+        add_hash_to_fingerprint(fingerprint, state->chunk_hash);
+        state->chunks++;
+    }
+    state->chunk_hash = FNV64_INIT;
 
-    free(byte_buffer);
-    return 1;	
+    STATS_ADD(inputs_hashed, 1);
+    STATS_ADD(chunks, state->chunks);
+    STATS_MAX(max_filters, fingerprint->amount_of_BF + 1);
 }
 
-int hashPacketBuffer(FINGERPRINT *fingerprint, const unsigned char *packet, const size_t length)
+
+/*
+ * Hashes a regular file straight from a read-only mapping, so the data is
+ * never copied. Returns 0 if the file cannot be mapped, the caller then
+ * falls back to reading it.
+ */
+static int hashMappedFile(FINGERPRINT *fingerprint, FILE *handle, HASH_STATE *state)
 {
-    unsigned int i;
-    unsigned int last_block_index = 0;
-    uint64 rValue, hashvalue=0;
-    bool first = 1;
+    struct stat st;
+    int fd = fileno(handle);
+
+    if (fd < 0 || fstat(fd, &st) != 0 || !S_ISREG(st.st_mode) || st.st_size <= 0 ||
+        (uint64)st.st_size > (uint64)SIZE_MAX)
+        return 0;
+
+    // the pages are read while they are hashed, which counts as hashing time
+    STATS_START(io);
+    size_t size = (size_t)st.st_size;
+    unsigned char *map = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (map == MAP_FAILED)
+        return 0;
+
+    madvise(map, size, MADV_SEQUENTIAL);
+    STATS_STOP(io, io_ns);
+    hash_state_update(state, fingerprint, map, size);
+
+    STATS_START(unmap);
+    munmap(map, size);
+    STATS_STOP(unmap, io_ns);
+    return 1;
+}
 
-    uchar window[ROLLING_WINDOW] = {0};
-    uint32 rhData[4]             = {0};
+int hashFileToFingerprint(FINGERPRINT *fingerprint, FILE *handle)
+{
+    unsigned char  byte_buffer[HASH_BUFFER_SIZE];
+    size_t         bytes_read;
+    HASH_STATE     state;
 
+    hash_state_init(&state);
 
-    for(i=0; i<length;i++)
+    if (hashMappedFile(fingerprint, handle, &state))
     {
-        rValue  = roll_hashx(packet[i], window, rhData);  
-
-        if (rValue % BLOCK_SIZE == BLOCK_SIZE-1) 
-        {
+        hash_state_final(&state, fingerprint);
+        return 1;
+    }
 
-			#ifdef network
-        	if (first == 1){
-        		first=0;
-        		last_block_index = i+1;
-        		if(i+SKIPPED_BYTES < length)
-        		       i += SKIPPED_BYTES;
-        		continue;
-        	}
-			#endif
-        		hashvalue = fnv64Bit(packet, last_block_index, i); //,current_index, FNV1_64_INIT);
-        		add_hash_to_fingerprint(fingerprint, hashvalue);
-
-        		last_block_index = i+1;
-
-            if(i+SKIPPED_BYTES < length)
-            	i += SKIPPED_BYTES;
-        }
+    // pipes and special files are read in pieces so memory use does not
+    // depend on their size
+    fseek(handle, 0L, SEEK_SET);
+    for (;;)
+    {
+        STATS_START(io);
+        bytes_read = fread(byte_buffer, sizeof(unsigned char), HASH_BUFFER_SIZE, handle);
+        STATS_STOP(io, io_ns);
+        if (bytes_read == 0)
+            break;
+        hash_state_update(&state, fingerprint, byte_buffer, bytes_read);
     }
 
-#ifndef network
-    	hashvalue = fnv64Bit(packet, last_block_index, length-1);
-    	add_hash_to_fingerprint(fingerprint, hashvalue);
-#endif
+    if (state.length == 0)
+        return -1;
+
+    hash_state_final(&state, fingerprint);
+    return 1;
+}
+
+int hashPacketBuffer(FINGERPRINT *fingerprint, const unsigned char *packet, const size_t length)
+{
+    HASH_STATE state;
 
+    hash_state_init_packet(&state, 1);
+    hash_state_update(&state, fingerprint, packet, length);
+    hash_state_final(&state, fingerprint);
     return 1;
 }
 
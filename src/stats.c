@@ -0,0 +1,49 @@
+/**
+ * AUTHOR: w4term3loon
+ *
+ * Instrumentation counters, see stats.h.
+ */
+#include <string.h>
+#include <time.h>
+
+#include "../header/stats.h"
+
+
+int         stats_enabled = 0;
+MRSH_STATS  stats;
+
+
+void stats_enable(int enabled) {
+    __atomic_store_n(&stats_enabled, enabled ? 1 : 0, __ATOMIC_RELAXED);
+}
+
+
+void stats_reset(void) {
+    uint64_t *counter = (uint64_t *)&stats;
+    for (size_t i = 0; i < sizeof(MRSH_STATS) / sizeof(uint64_t); i++)
+        __atomic_store_n(&counter[i], 0, __ATOMIC_RELAXED);
+}
+
+
+void stats_snapshot(MRSH_STATS *out) {
+    const uint64_t *counter = (const uint64_t *)&stats;
+    uint64_t *copy = (uint64_t *)out;
+    for (size_t i = 0; i < sizeof(MRSH_STATS) / sizeof(uint64_t); i++)
+        copy[i] = __atomic_load_n(&counter[i], __ATOMIC_RELAXED);
+}
+
+
+// Monotonic clock in nanoseconds, never 0
+uint64_t stats_clock(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000u + (uint64_t)ts.tv_nsec + 1;
+}
+
+
+void stats_max(uint64_t *counter, uint64_t value) {
+    uint64_t current = __atomic_load_n(counter, __ATOMIC_RELAXED);
+    while (current < value &&
+           !__atomic_compare_exchange_n(counter, &current, value, 1, __ATOMIC_RELAXED, __ATOMIC_RELAXED))
+        ;
+}
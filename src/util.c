@@ -9,16 +9,16 @@ int readcommandline(char *argument,char *option)
    return 0;
 }
 
-unsigned int find_file_size(FILE *fh) 
+uint64 find_file_size(FILE *fh) 
 {
-  unsigned int size;
+  uint64 size;
   if(fh != NULL)
    {
-    if( fseek(fh, 0, SEEK_END) )
+    if( fseeko(fh, 0, SEEK_END) )
     {
       return -1;
     }
-    size = ftell(fh);
+    size = ftello(fh);
     //printf("FILE SIZE: %d \n", size);
     return size;
    }
@@ -27,12 +27,12 @@ unsigned int find_file_size(FILE *fh)
 
 
 
-uint64 fnv64Bit( unsigned char pBuffer[], int start, int end)
+uint64 fnv64Bit( const unsigned char pBuffer[], size_t start, size_t end)
  {
    uint64 nHashVal    = 0xcbf29ce484222325ULL,
           nMagicPrime = 0x00000100000001b3ULL;
 
-   int i = start;
+   size_t i = start;
    while( i <= end ) {
 	   nHashVal ^= pBuffer[i++];
 	   nHashVal *= nMagicPrime;
@@ -41,6 +41,54 @@ uint64 fnv64Bit( unsigned char pBuffer[], int start, int end)
  }
 
 
+/*
+ * Table driven hex codec for digests; both directions work on whole
+ * filters at a time instead of one printf/scanf call per byte.
+ */
+static const char hex_digits[16] = "0123456789ABCDEF";
+
+// value of a hex digit plus one, 0 for anything that is not a hex digit
+static const unsigned char hex_values[256] = {
+    ['0'] = 1, ['1'] = 2, ['2'] = 3, ['3'] = 4, ['4'] = 5,
+    ['5'] = 6, ['6'] = 7, ['7'] = 8, ['8'] = 9, ['9'] = 10,
+    ['A'] = 11, ['B'] = 12, ['C'] = 13, ['D'] = 14, ['E'] = 15, ['F'] = 16,
+    ['a'] = 11, ['b'] = 12, ['c'] = 13, ['d'] = 14, ['e'] = 15, ['f'] = 16,
+};
+
+
+/*
+ * Writes count bytes as 2 * count upper case hex digits (not NUL terminated)
+ */
+void hex_encode(const unsigned char *bytes, size_t count, char *hex)
+{
+    for (size_t i = 0; i < count; i++) {
+        hex[2 * i] = hex_digits[bytes[i] >> 4];
+        hex[2 * i + 1] = hex_digits[bytes[i] & 0x0F];
+    }
+}
+
+
+/*
+ * Reads count bytes from 2 * count hex digits of either case. Returns 0 on
+ * success and -1 if a character is not a hex digit; bytes is filled either
+ * way, with such characters read as 0 so they never set a filter bit.
+ */
+int hex_decode(const char *hex, size_t count, unsigned char *bytes)
+{
+    const unsigned char *in = (const unsigned char *)hex;
+    unsigned char invalid = 0;
+
+    for (size_t i = 0; i < count; i++) {
+        unsigned char high = hex_values[in[2 * i]];
+        unsigned char low = hex_values[in[2 * i + 1]];
+        invalid |= (high == 0) | (low == 0);
+        // an invalid digit reads as 0 instead of wrapping around to 0xF
+        bytes[i] = (unsigned char)((high ? high - 1 : 0) << 4 | (low ? low - 1 : 0));
+    }
+    return invalid ? -1 : 0;
+}
+
+
 /*
 void fnv64Bit(char hashstring[], uint64 *hashv, int start, int end)
 {
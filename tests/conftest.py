@@ -0,0 +1,34 @@
+"""
+Shared setup of the test suite.
+
+The Python tests use the installed mrsh package, or else the in-tree
+bindings built by `make ext`. The CLI tests use the binary built by
+`make mrsh`.
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+try:
+    import mrsh  # noqa: F401
+except ImportError:
+    package = ROOT / "bindings" / "mrshw"
+    spec = importlib.util.spec_from_file_location("mrsh", package / "__init__.py",
+                                                  submodule_search_locations=[str(package)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mrsh"] = module
+    spec.loader.exec_module(module)
+
+
+@pytest.fixture(scope="session")
+def cli():
+    """Path of the mrsh command line tool."""
+    path = ROOT / "mrsh"
+    if not path.exists():
+        pytest.skip("build the command line tool with `make mrsh`")
+    return path
@@ -0,0 +1,92 @@
+"""
+The command line tool must score digests read back from a list (-L, -l)
+exactly as it scores the files themselves (-g, -c), which is what the
+baseline tool does for files.
+"""
+
+import random
+import subprocess
+
+import pytest
+
+
+def _corpus(directory):
+    """Mutated copies and excerpts of two random files, plus unrelated files."""
+    rng = random.Random(14)
+    bases = [rng.randbytes(300000), rng.randbytes(200000)]
+    names = []
+    for i in range(8):
+        data = bytearray(bases[i % 2])
+        for _ in range(i * 300):
+            data[rng.randrange(len(data))] = rng.randrange(256)
+        if i % 3 == 2:
+            data = data[rng.randrange(1000):rng.randrange(100000, len(data))]
+        names.append(f"f{i:02d}")
+        (directory / names[-1]).write_bytes(bytes(data))
+    for i in range(2):
+        names.append(f"r{i:02d}")
+        (directory / names[-1]).write_bytes(rng.randbytes(rng.randrange(5000, 150000)))
+    return names
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    files = tmp_path / "files"
+    files.mkdir()
+    return files, _corpus(files)
+
+
+def _run(cli, cwd, *args):
+    # the tool exits with status 1 after a normal run, only a signal means it failed
+    result = subprocess.run([str(cli), *args], cwd=cwd, capture_output=True, text=True)
+    assert result.returncode >= 0, result.stderr
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def _write_list(cli, files, names, path):
+    path.write_text("\n".join(_run(cli, files, "-p", *names)) + "\n")
+
+
+def test_compare_list_matches_files(cli, corpus):
+    files, names = corpus
+    _write_list(cli, files, names, files.parent / "list.txt")
+
+    from_list = _run(cli, files, "-t", "0", "-L", "../list.txt")
+    from_files = _run(cli, files, "-t", "0", "-g", *names)
+    assert from_list == from_files
+    assert any(line.endswith("| 000") for line in from_list)
+
+
+def test_list_against_files_matches_files(cli, corpus):
+    files, names = corpus
+    _write_list(cli, files, names, files.parent / "list.txt")
+
+    from_list = _run(cli, files, "-t", "0", "-l", "../list.txt", *names)
+    from_files = _run(cli, files.parent, "-t", "0", "-c", "files", "files")
+    assert sorted(from_list) == sorted(from_files)
+
+
+def test_unrelated_digests_do_not_match(cli, corpus):
+    files, names = corpus
+    _write_list(cli, files, ["f00", "r00", "r01"], files.parent / "list.txt")
+
+    scores = {tuple(part.strip() for part in line.split("|")[:2]): int(line.split("|")[2])
+              for line in _run(cli, files, "-t", "0", "-L", "../list.txt")}
+    assert scores[("f00", "r00")] == 0
+    assert scores[("f00", "r01")] == 0
+
+
+def test_malformed_digest_is_read_safely(cli, corpus):
+    files, names = corpus
+    digests = _run(cli, files, "-p", "f00", "f02")
+    name, size, filters, blocks, hex_digest = digests[0].split(":")
+    # one filter more than the digest holds, and a digit that is not hex
+    damaged = ":".join([name, size, str(int(filters) + 1), blocks, "Z" + hex_digest[1:]])
+    (files.parent / "list.txt").write_text(damaged + "\n" + digests[1] + "\n")
+
+    result = subprocess.run([str(cli), "-t", "0", "-L", "../list.txt"], cwd=files,
+                            capture_output=True, text=True)
+    assert result.returncode >= 0
+    expected = _run(cli, files, "-t", "0", "-g", "f00", "f02")
+    assert [line.strip() for line in result.stdout.splitlines() if line.strip()] == expected
+    assert "Bloom filter" in result.stderr
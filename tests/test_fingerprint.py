@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import mrsh
+
+
+def _data(seed, size=40000):
+    return random.Random(seed).randbytes(size)
+
+
+@pytest.fixture
+def pair():
+    data = _data(1)
+    return mrsh.Fingerprint((data, "whole")), mrsh.Fingerprint((data[:25000], "part"))
+
+
+def test_compare_accepts_keywords(pair):
+    a, b = pair
+    score = a.compare(b)
+    assert score > 0
+    assert a.compare(other=b) == score
+    assert a.compare(other=b, mode="fragment") == score
+    assert a.compare(mode="file", other=b) == a.compare(b, "file")
+
+
+def test_compare_rejects_bad_arguments(pair):
+    a, b = pair
+    with pytest.raises(TypeError):
+        a.compare()
+    with pytest.raises(TypeError):
+        a.compare(b, other=b)
+    with pytest.raises(TypeError):
+        a.compare(b, "file", mode="file")
+    with pytest.raises(TypeError):
+        a.compare(b, threshold=1)
+    with pytest.raises(TypeError):
+        a.compare("not a fingerprint")
+
+
+def test_list_len_counts_fingerprints_and_slots_positions():
+    fpl = mrsh.FingerprintList()
+    for i in range(4):
+        fpl.insert((_data(10 + i), f"f{i}"), f"f{i}")
+    del fpl["f1"]
+    del fpl["f3"]
+    assert len(fpl) == 2
+    assert fpl.slots == 4
+    assert [fp.label for fp in fpl] == ["f0", "f2"]
+    assert fpl[2].label == fpl[2 - fpl.slots].label == "f2"
+    with pytest.raises(IndexError):
+        fpl[-1]
+    with pytest.raises(IndexError):
+        fpl[fpl.slots]